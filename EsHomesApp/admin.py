@@ -1,17 +1,42 @@
+import json
+
 from django.contrib import admin
 from django.contrib.auth.admin import UserAdmin
+from django.core.exceptions import PermissionDenied
+from django.db.models import Sum
+from django.http import HttpResponseNotAllowed, JsonResponse, StreamingHttpResponse
+from django.shortcuts import get_object_or_404
+from django.urls import path, reverse
+from django.utils import timezone
+from . import exports, uploads
 from .models import (
     CustomUser, Apartment, ApartmentImage,
-    Amenity, Booking, Review, Transaction   
+    Amenity, Booking, Review, Transaction, Job, ApartmentMonthStats,
+    ExternalCalendar, ExternalBlock, ArchivedBooking, ArchivedTransaction, ExchangeRate, ImageUpload,
 )
+from .rollups import months_back, next_month
+
 
-admin.site.register(Transaction)
+def export_response(kind, queryset, fmt):
+    """Stream the selected rows (or, with "select all", everything the changelist filters match)."""
+    response = StreamingHttpResponse(
+        exports.stream(kind, exports.export_queryset(kind, queryset), fmt),
+        content_type=exports.FORMATS[fmt],
+    )
+    response['Content-Disposition'] = f'attachment; filename="{exports.filename(kind, fmt)}"'
+    return response
 
 class ApartmentImageInline(admin.TabularInline):
     model = ApartmentImage
     extra = 1
     fields = ['image', 'is_primary', 'caption']
 
+class ExternalCalendarInline(admin.TabularInline):
+    model = ExternalCalendar
+    extra = 0
+    fields = ['name', 'url', 'active', 'last_synced_at', 'last_error']
+    readonly_fields = ['last_synced_at', 'last_error']
+
 class BookingInline(admin.TabularInline):
     model = Booking
     extra = 0
@@ -42,9 +67,9 @@ class ApartmentAdmin(admin.ModelAdmin):
     list_filter = ['status', 'apartment_type', 'featured']
     search_fields = ['name', 'description']
     filter_horizontal = ['amenities']
-    inlines = [ApartmentImageInline, BookingInline, ReviewInline]
+    inlines = [ApartmentImageInline, ExternalCalendarInline, BookingInline, ReviewInline]
     list_editable = ['status', 'featured']
-    readonly_fields = ['created_at', 'updated_at']
+    readonly_fields = ['created_at', 'updated_at', 'geohash']
     fieldsets = (
         ('Basic Information', {
             'fields': ('name', 'apartment_type', 'description', 'featured')
@@ -52,6 +77,9 @@ class ApartmentAdmin(admin.ModelAdmin):
         ('Specifications', {
             'fields': ('price_per_night', 'size_sqft', 'max_occupancy', 'bedrooms', 'bathrooms')
         }),
+        ('Location', {
+            'fields': ('address', 'latitude', 'longitude', 'geohash')
+        }),
         ('Status & Dates', {
             'fields': ('status', 'created_at', 'updated_at')
         }),
@@ -59,6 +87,69 @@ class ApartmentAdmin(admin.ModelAdmin):
             'fields': ('amenities',)
         })
     )
+    # Adds the drag-and-drop photo upload box (uploads.py) to the change form
+    change_form_template = 'admin/EsHomesApp/apartment/change_form.html'
+
+    class Media:
+        css = {'all': ['css/admin/photo-uploads.css']}
+        js = ['js/admin/photo-uploads.js']
+
+    def get_urls(self):
+        def upload_endpoint(view, method):
+            def handle(request, apartment_id, **kwargs):
+                if request.method != method:
+                    return HttpResponseNotAllowed([method])
+                apartment = get_object_or_404(Apartment, pk=apartment_id)
+                if not self.has_change_permission(request, apartment):
+                    raise PermissionDenied
+                try:
+                    return view(request, apartment, **kwargs)
+                except uploads.UploadError as error:
+                    return JsonResponse({'error': str(error)}, status=400)
+            # A gallery is hundreds of chunk requests; staff aren't held to the site-wide ceiling
+            handle.ratelimit_exempt = lambda request: request.user.is_staff
+            return self.admin_site.admin_view(handle)
+
+        prefix = '<int:apartment_id>/uploads/'
+        return [
+            path(prefix, upload_endpoint(self.upload_start_view, 'POST'),
+                 name='EsHomesApp_apartment_upload_start'),
+            path(f'{prefix}<uuid:upload_id>/', upload_endpoint(self.upload_status_view, 'GET'),
+                 name='EsHomesApp_apartment_upload'),
+            path(f'{prefix}<uuid:upload_id>/chunks/<int:index>/', upload_endpoint(self.upload_chunk_view, 'PUT'),
+                 name='EsHomesApp_apartment_upload_chunk'),
+            path(f'{prefix}<uuid:upload_id>/complete/', upload_endpoint(self.upload_complete_view, 'POST'),
+                 name='EsHomesApp_apartment_upload_complete'),
+        ] + super().get_urls()
+
+    def upload_start_view(self, request, apartment):
+        """Declare a photo (JSON: filename, size, sha256). Answers with the chunks to send."""
+        try:
+            declared = json.loads(request.body)
+            upload = uploads.start(
+                apartment, declared.get('filename'), declared.get('size'), declared.get('sha256'), request.user,
+            )
+        except (ValueError, AttributeError):
+            return JsonResponse({'error': 'Expected a JSON object with filename, size and sha256.'}, status=400)
+        return JsonResponse({
+            **uploads.describe(upload),
+            'url': reverse('admin:EsHomesApp_apartment_upload', args=[apartment.pk, upload.pk]),
+        })
+
+    def upload_status_view(self, request, apartment, upload_id):
+        upload = get_object_or_404(ImageUpload, pk=upload_id, apartment=apartment)
+        return JsonResponse(uploads.describe(upload))
+
+    def upload_chunk_view(self, request, apartment, upload_id, index):
+        """The raw chunk is the request body, streamed to disk as it's read."""
+        upload = get_object_or_404(ImageUpload, pk=upload_id, apartment=apartment)
+        uploads.write_chunk(upload, index, request)
+        return JsonResponse({'index': index})
+
+    def upload_complete_view(self, request, apartment, upload_id):
+        upload = get_object_or_404(ImageUpload, pk=upload_id, apartment=apartment)
+        image = uploads.finish(upload)
+        return JsonResponse({'id': image.pk, 'url': image.image.url}, status=201)
 
 @admin.register(ApartmentImage)
 class ApartmentImageAdmin(admin.ModelAdmin):
@@ -69,8 +160,9 @@ class ApartmentImageAdmin(admin.ModelAdmin):
 
 @admin.register(Amenity)
 class AmenityAdmin(admin.ModelAdmin):
-    list_display = ['name', 'icon']
+    list_display = ['name', 'slug', 'icon']
     search_fields = ['name', 'description']
+    prepopulated_fields = {'slug': ['name']}
 
 @admin.register(Booking)
 class BookingAdmin(admin.ModelAdmin):
@@ -78,6 +170,8 @@ class BookingAdmin(admin.ModelAdmin):
     list_filter = ['status', 'check_in_date', 'check_out_date']
     search_fields = ['user__username', 'user__email', 'apartment__name']
     readonly_fields = ['booking_date', 'last_updated']
+    date_hierarchy = 'booking_date'
+    actions = ['export_csv', 'export_xlsx']
     fieldsets = (
         ('Booking Information', {
             'fields': ('user', 'apartment', 'status')
@@ -90,15 +184,43 @@ class BookingAdmin(admin.ModelAdmin):
         })
     )
 
+    @admin.action(description="Export selected bookings (CSV)", permissions=['view'])
+    def export_csv(self, request, queryset):
+        return export_response('bookings', queryset, 'csv')
+
+    @admin.action(description="Export selected bookings (XLSX)", permissions=['view'])
+    def export_xlsx(self, request, queryset):
+        return export_response('bookings', queryset, 'xlsx')
+
+@admin.register(Transaction)
+class TransactionAdmin(admin.ModelAdmin):
+    list_display = ['tx_ref', 'user', 'booking', 'amount', 'transaction_status', 'created_at']
+    list_filter = ['transaction_status']
+    search_fields = ['tx_ref', 'flw_transaction_id', 'user__username', 'user__email']
+    readonly_fields = ['created_at', 'updated_at']
+    date_hierarchy = 'created_at'
+    list_select_related = ['user', 'booking__apartment', 'booking__user']
+    raw_id_fields = ['user', 'booking']
+    actions = ['export_csv', 'export_xlsx']
+
+    @admin.action(description="Export selected transactions (CSV)", permissions=['view'])
+    def export_csv(self, request, queryset):
+        return export_response('transactions', queryset, 'csv')
+
+    @admin.action(description="Export selected transactions (XLSX)", permissions=['view'])
+    def export_xlsx(self, request, queryset):
+        return export_response('transactions', queryset, 'xlsx')
+
 @admin.register(Review)
 class ReviewAdmin(admin.ModelAdmin):
     list_display = ['user', 'apartment', 'rating', 'created_at', 'helpful_votes']
     list_filter = ['rating', 'created_at']
     search_fields = ['user__username', 'apartment__name', 'comment']
-    readonly_fields = ['created_at', 'updated_at']
+    # helpful_votes is counted up by reviews.apply_votes(); saving the form would overwrite increments
+    readonly_fields = ['created_at', 'updated_at', 'archived_booking', 'helpful_votes']
     fieldsets = (
         ('Review Information', {
-            'fields': ('user', 'apartment', 'booking')
+            'fields': ('user', 'apartment', 'booking', 'archived_booking')
         }),
         ('Ratings', {
             'fields': ('rating', 'cleanliness_rating', 'location_rating', 'value_rating')
@@ -112,4 +234,163 @@ class ReviewAdmin(admin.ModelAdmin):
         ('Timestamps', {
             'fields': ('created_at', 'updated_at')
         })
-    )
\ No newline at end of file
+    )
+
+@admin.register(Job)
+class JobAdmin(admin.ModelAdmin):
+    list_display = ['id', 'task', 'queue', 'status', 'attempts', 'run_at', 'finished_at']
+    list_filter = ['status', 'queue', 'task']
+    search_fields = ['task', 'unique_key', 'last_error']
+    readonly_fields = ['created_at', 'updated_at', 'locked_by', 'locked_at', 'finished_at', 'last_error']
+    actions = ['retry_jobs']
+
+    @admin.action(description="Retry selected jobs now")
+    def retry_jobs(self, request, queryset):
+        updated = queryset.exclude(status='running').update(
+            status='queued', run_at=timezone.now(), attempts=0, last_error='',
+        )
+        self.message_user(request, f"{updated} job(s) queued.")
+
+
+@admin.register(ApartmentMonthStats)
+class ApartmentMonthStatsAdmin(admin.ModelAdmin):
+    """Management dashboard. Reads only the rollup table, never Booking/Transaction."""
+    change_list_template = 'admin/EsHomesApp/apartmentmonthstats/change_list.html'
+    list_display = ['apartment', 'month', 'nights_sold', 'occupancy', 'confirmed_revenue', 'cancellations', 'average_length_of_stay']
+    list_filter = ['apartment']
+    date_hierarchy = 'month'
+    list_select_related = ['apartment']
+
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+    def has_delete_permission(self, request, obj=None):
+        return False
+
+    @admin.display(description='Occupancy')
+    def occupancy(self, obj):
+        return f"{obj.occupancy_rate:.0%}"
+
+    @admin.display(description='Avg. stay (nights)')
+    def average_length_of_stay(self, obj):
+        return f"{obj.average_stay:.1f}"
+
+    def changelist_view(self, request, extra_context=None):
+        months = months_back(12)
+        totals = {
+            row['month']: row
+            for row in ApartmentMonthStats.objects.filter(month__gte=months[0])
+            .values('month')
+            .annotate(nights=Sum('nights_sold'), revenue=Sum('confirmed_revenue'))
+        }
+        apartment_count = Apartment.objects.count() or 1
+        chart = []
+        for month in months:
+            row = totals.get(month, {})
+            nights = row.get('nights') or 0
+            chart.append({
+                'month': month,
+                'revenue': row.get('revenue') or 0,
+                'occupancy': nights / (apartment_count * (next_month(month) - month).days),
+            })
+        top_revenue = max(entry['revenue'] for entry in chart) or 1
+        for entry in chart:
+            entry['revenue_pct'] = round(float(entry['revenue'] / top_revenue) * 100)
+            entry['occupancy_pct'] = round(entry['occupancy'] * 100)
+
+        extra_context = extra_context or {}
+        extra_context['chart'] = chart
+        return super().changelist_view(request, extra_context=extra_context)
+
+
+@admin.register(ExternalCalendar)
+class ExternalCalendarAdmin(admin.ModelAdmin):
+    list_display = ['name', 'apartment', 'active', 'last_synced_at', 'last_error']
+    list_filter = ['active', 'name']
+    search_fields = ['apartment__name', 'url']
+    readonly_fields = ['etag', 'last_modified', 'last_synced_at', 'last_error']
+    actions = ['sync_now']
+
+    @admin.action(description="Sync selected calendars now")
+    def sync_now(self, request, queryset):
+        from .tasks import sync_external_calendars
+        sync_external_calendars.delay(list(queryset.values_list('pk', flat=True)))
+        self.message_user(request, "Calendar sync queued.")
+
+
+@admin.register(ExternalBlock)
+class ExternalBlockAdmin(admin.ModelAdmin):
+    list_display = ['apartment', 'calendar', 'start_date', 'end_date', 'summary']
+    list_filter = ['calendar__name', 'apartment']
+    date_hierarchy = 'start_date'
+
+
+class ReadOnlyAdmin(admin.ModelAdmin):
+    """History: viewable and exportable, never edited."""
+
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+    def has_delete_permission(self, request, obj=None):
+        return False
+
+
+class ArchivedTransactionInline(admin.StackedInline):
+    model = ArchivedTransaction
+    extra = 0
+    can_delete = False
+
+    def has_add_permission(self, request, obj=None):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+
+@admin.register(ArchivedBooking)
+class ArchivedBookingAdmin(ReadOnlyAdmin):
+    list_display = ['id', 'user', 'apartment', 'check_in_date', 'check_out_date', 'status', 'archived_at']
+    list_filter = ['status']
+    search_fields = ['user__username', 'user__email', 'apartment__name']
+    date_hierarchy = 'booking_date'
+    list_select_related = ['user', 'apartment']
+    inlines = [ArchivedTransactionInline]
+    actions = ['export_csv', 'export_xlsx']
+
+    @admin.action(description="Export selected archived bookings (CSV)", permissions=['view'])
+    def export_csv(self, request, queryset):
+        return export_response('archived_bookings', queryset, 'csv')
+
+    @admin.action(description="Export selected archived bookings (XLSX)", permissions=['view'])
+    def export_xlsx(self, request, queryset):
+        return export_response('archived_bookings', queryset, 'xlsx')
+
+
+@admin.register(ArchivedTransaction)
+class ArchivedTransactionAdmin(ReadOnlyAdmin):
+    list_display = ['tx_ref', 'user', 'booking', 'amount', 'transaction_status', 'created_at']
+    list_filter = ['transaction_status']
+    search_fields = ['tx_ref', 'flw_transaction_id', 'user__username', 'user__email']
+    date_hierarchy = 'created_at'
+    list_select_related = ['user', 'booking__apartment', 'booking__user']
+    actions = ['export_csv', 'export_xlsx']
+
+    @admin.action(description="Export selected archived transactions (CSV)", permissions=['view'])
+    def export_csv(self, request, queryset):
+        return export_response('archived_transactions', queryset, 'csv')
+
+    @admin.action(description="Export selected archived transactions (XLSX)", permissions=['view'])
+    def export_xlsx(self, request, queryset):
+        return export_response('archived_transactions', queryset, 'xlsx')
+
+
+@admin.register(ExchangeRate)
+class ExchangeRateAdmin(admin.ModelAdmin):
+    list_display = ['currency', 'rate', 'updated_at']
+    readonly_fields = ['updated_at']
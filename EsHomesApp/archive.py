@@ -0,0 +1,85 @@
+"""
+Archival of finished bookings, to keep the hot tables small.
+
+Booking and Transaction only grow, and every overlap check, hold sweep and
+admin changelist works through indexes that are mostly long-finished stays.
+``archive()`` moves completed and cancelled bookings whose stay ended more
+than ARCHIVE_AFTER_DAYS ago into ``ArchivedBooking``, with their transactions
+(``ArchivedTransaction``), keeping their ids. Reviews of a moved booking are
+re-pointed from ``Review.booking`` to ``Review.archived_booking``.
+
+Work goes ARCHIVE_BATCH bookings at a time, each batch in its own DB
+transaction: the rows are re-read (a booking that changed since it was picked
+is left alone), copied, re-linked and deleted together, so a failed batch
+leaves nothing half-moved. The archive tables live in the same database for
+exactly that reason; a separate SQLite file couldn't share the transaction.
+
+Archived bookings stay readable: ``booking_history()`` merges them into the
+profile page, they have admin pages of their own, and the monthly rollups
+count them as before.
+"""
+import time
+from collections import Counter
+from datetime import timedelta
+from itertools import chain
+from operator import attrgetter
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import F
+from django.utils import timezone
+
+from .models import ArchivedBooking, ArchivedTransaction, Booking, Review, Transaction
+
+ARCHIVED_STATUSES = ('completed', 'cancelled')
+
+BOOKING_FIELDS = [field.attname for field in ArchivedBooking._meta.concrete_fields if field.name != 'archived_at']
+TRANSACTION_FIELDS = [field.attname for field in ArchivedTransaction._meta.concrete_fields if field.name != 'archived_at']
+
+
+def archivable(today=None):
+    cutoff = (today or timezone.localdate()) - timedelta(days=settings.ARCHIVE_AFTER_DAYS)
+    return Booking.objects.filter(status__in=ARCHIVED_STATUSES, check_out_date__lt=cutoff)
+
+
+def archive(limit=None, today=None):
+    """
+    Archive every archivable booking (or the first ``limit``). Returns a report
+    dict: ``bookings``, ``transactions`` and ``reviews`` moved, ``seconds``.
+    """
+    started = time.monotonic()
+    today = today or timezone.localdate()
+    report = Counter(bookings=0, transactions=0, reviews=0)
+    batch_size = settings.ARCHIVE_BATCH
+    while limit is None or report['bookings'] < limit:
+        size = batch_size if limit is None else min(batch_size, limit - report['bookings'])
+        ids = list(archivable(today).order_by('pk').values_list('pk', flat=True)[:size])
+        if not ids:
+            break
+        report.update(move(ids, today))
+        if len(ids) < size:
+            break
+    report['seconds'] = time.monotonic() - started
+    return dict(report)
+
+
+def move(ids, today=None):
+    """Move the bookings ``ids`` that are still archivable, in one DB transaction."""
+    now = timezone.now()
+    with transaction.atomic():
+        bookings = list(archivable(today).filter(pk__in=ids).values(*BOOKING_FIELDS))
+        ids = [row['id'] for row in bookings]
+        transactions = list(Transaction.objects.filter(booking_id__in=ids).values(*TRANSACTION_FIELDS))
+        ArchivedBooking.objects.bulk_create([ArchivedBooking(archived_at=now, **row) for row in bookings])
+        ArchivedTransaction.objects.bulk_create([ArchivedTransaction(archived_at=now, **row) for row in transactions])
+        reviews = Review.objects.filter(booking_id__in=ids).update(archived_booking_id=F('booking_id'), booking=None)
+        Transaction.objects.filter(booking_id__in=ids).delete()
+        Booking.objects.filter(pk__in=ids).delete()
+    return {'bookings': len(bookings), 'transactions': len(transactions), 'reviews': reviews}
+
+
+def booking_history(user):
+    """The user's bookings, live and archived, newest first. Archived ones have ``is_archived`` set."""
+    live = Booking.objects.filter(user=user).select_related('apartment')
+    archived = ArchivedBooking.objects.filter(user=user).select_related('apartment')
+    return sorted(chain(live, archived), key=attrgetter('booking_date'), reverse=True)
@@ -0,0 +1,242 @@
+"""
+Async versions of the hot views, routed in place of the sync ones when
+ASYNC_VIEWS is on (see urls.py).
+
+Under an ASGI server these don't tie up a worker thread while they wait:
+queries go through the async ORM API and Flutterwave verification through
+an ``httpx.AsyncClient``, so a slow gateway only holds the request that is
+waiting on it.
+
+Templates must not trigger queries while rendering (that would be a sync DB
+call on the event loop), so every relation they touch is prefetched and
+``request.user`` is resolved up front. The page logic is shared with
+views.py.
+"""
+import asyncio
+import json
+import logging
+import weakref
+
+import httpx
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.contrib import messages
+from django.contrib.auth.decorators import login_required
+from django.core.paginator import Paginator
+from django.http import HttpResponse
+from django.shortcuts import aget_object_or_404, redirect, render
+from django.urls import reverse
+from django.views.decorators.csrf import csrf_exempt
+from django.views.decorators.http import require_http_methods
+
+from . import currency, recommender, reviews
+from .forms import BookingForm
+from .models import Amenity, Apartment, Transaction
+from .views import (
+    REFUND_DUE_MESSAGE, apartment_data_json, bedroom_choices, featured_apartments, filter_apartments,
+    locate_apartments, payment_verified, settle_payment, verification_request, with_distances,
+)
+
+logger = logging.getLogger(__name__)
+
+
+async def arender(request, template_name, context=None):
+    # The auth context processor would otherwise load the user lazily, mid-render
+    request.user = await request.auser()
+    return render(request, template_name, context)
+
+
+async def home(request):
+    display_currency = await currency.aselected(request)
+    context = {
+        # The cache backend may be the database too, and so may the rates
+        'featured_apartments': await sync_to_async(
+            lambda: currency.convert(featured_apartments(), display_currency)
+        )(),
+    }
+    return await arender(request, 'EsHomesApp/index.html', context)
+
+
+async def apartments(request):
+    # Resolving amenity slugs to bits is a query
+    apartments, filters = await sync_to_async(filter_apartments)(request)
+    amenity_choices = [amenity async for amenity in Amenity.objects.order_by('name')]
+
+    located, location_filters = await sync_to_async(locate_apartments)(request, apartments)
+    if located is None:
+        paginator = Paginator(apartments.prefetch_related('images'), 6)
+        # Count up front so the paginator doesn't run its own (sync) COUNT query
+        paginator.count = await apartments.acount()
+        page_obj = paginator.get_page(request.GET.get('page', 1))
+        page_obj.object_list = [apartment async for apartment in page_obj.object_list]
+    else:
+        page_obj = Paginator(located, 6).get_page(request.GET.get('page', 1))
+        page_obj.object_list = with_distances(
+            page_obj.object_list,
+            await apartments.prefetch_related('images').ain_bulk([pk for pk, _ in page_obj.object_list]),
+        )
+    # The whole page at once
+    await sync_to_async(currency.convert)(page_obj.object_list, await currency.aselected(request))
+
+    context = {
+        'apartments': page_obj,
+        'bedroom_choices': await sync_to_async(bedroom_choices)(),
+        'amenity_choices': amenity_choices,
+        'page_obj': page_obj,
+        **filters,
+        **location_filters,
+    }
+    return await arender(request, 'EsHomesApp/apartments.html', context)
+
+
+async def apartment_detail(request, pk):
+    apartment = await aget_object_or_404(
+        Apartment.objects.prefetch_related('images', 'amenities'), pk=pk,
+    )
+    similar_apartments = [
+        similar async for similar in recommender.similar_apartments(pk).prefetch_related('images')[:2]
+    ]
+    if not similar_apartments:
+        similar_apartments = [
+            similar async for similar in Apartment.objects.filter(
+                bedrooms=apartment.bedrooms, status='available',
+            ).exclude(pk=pk).prefetch_related('images')[:2]
+        ]
+
+    display_currency = await currency.aselected(request)
+    await sync_to_async(currency.convert)([apartment, *similar_apartments], display_currency)
+
+    # BookingForm queries the apartment choices when it is built
+    form = await sync_to_async(BookingForm)(initial={'apartment': apartment}, display_currency=display_currency)
+    form.fields['apartment'].widget.attrs['data-apartments'] = apartment_data_json(apartment)
+
+    review_page = await sync_to_async(reviews.page)(
+        pk, request.GET.get('review_sort'), request.GET.get('review_page', 1), await request.auser(),
+    )
+
+    context = {
+        'apartment': apartment,
+        'similar_apartments': similar_apartments,
+        'form': form,
+        **review_page,
+    }
+    return await arender(request, 'EsHomesApp/apartment-detail.html', context)
+
+
+@login_required(login_url='/login_user')
+async def initiate_payment(request, transaction_id):
+    user = await request.auser()
+    transaction = await aget_object_or_404(
+        Transaction.objects.select_related('booking__apartment').prefetch_related('booking__apartment__images'),
+        id=transaction_id, user=user,
+    )
+    context = {
+        'transaction': transaction,
+        'booking': transaction.booking,
+        'public_key': settings.FLUTTERWAVE_PUBLIC_KEY,
+        'redirect_url': request.build_absolute_uri(reverse('payment_callback')),
+        'customer': {
+            'name': f"{user.first_name} {user.last_name}",
+            'email': user.email,
+        },
+    }
+    return await arender(request, 'EsHomesApp/initiate_payment.html', context)
+
+
+# One pooled client per event loop: building a client (and its SSL context)
+# per request costs more than a verification round trip to a nearby gateway
+_gateway_clients = weakref.WeakKeyDictionary()
+
+
+def gateway_client():
+    loop = asyncio.get_running_loop()
+    client = _gateway_clients.get(loop)
+    if client is None:
+        client = _gateway_clients[loop] = httpx.AsyncClient(timeout=settings.FLUTTERWAVE_TIMEOUT)
+    return client
+
+
+async def averify_transaction(flw_transaction_id):
+    url, headers = verification_request(flw_transaction_id)
+    response = await gateway_client().get(url, headers=headers)
+    return response.json()
+
+
+async def confirm_payment(transaction, flw_transaction_id):
+    # Row locks and the availability check in one DB transaction, on one thread
+    return await sync_to_async(settle_payment)(transaction, flw_transaction_id)
+
+
+async def decline_payment(transaction):
+    transaction.transaction_status = 'declined'
+    await transaction.asave()
+
+
+async def get_transaction(tx_ref):
+    return await Transaction.objects.select_related('booking__apartment').aget(tx_ref=tx_ref)
+
+
+@csrf_exempt
+@require_http_methods(["GET", "POST"])
+async def payment_callback(request):
+    if request.method == "POST":
+        # Handle webhook
+        tx_ref = None
+        try:
+            webhook_data = json.loads(request.body)
+            event_type = webhook_data.get('event')
+            transaction_data = webhook_data.get('data', {})
+            tx_ref = transaction_data.get('tx_ref')
+            flw_transaction_id = transaction_data.get('id')
+            status = transaction_data.get('status')
+
+            transaction = await get_transaction(tx_ref)
+
+            if event_type == 'charge.completed' and status in ['successful', 'completed']:
+                verification_response = await averify_transaction(flw_transaction_id)
+                if payment_verified(verification_response, transaction):
+                    await confirm_payment(transaction, flw_transaction_id)
+                    return HttpResponse(status=200)
+                await decline_payment(transaction)
+                return HttpResponse(status=400)
+            elif status == 'failed':
+                await decline_payment(transaction)
+                return HttpResponse(status=200)
+            return HttpResponse(status=400)
+        except Exception as e:
+            logger.warning("Webhook error: %s", e, extra={'tx_ref': tx_ref}, exc_info=True)
+            return HttpResponse(status=400)
+
+    # Handle redirect
+    status = request.GET.get('status')
+    tx_ref = request.GET.get('tx_ref')
+    flw_transaction_id = request.GET.get('transaction_id')
+
+    try:
+        transaction = await get_transaction(tx_ref)
+    except Transaction.DoesNotExist:
+        messages.error(request, "Transaction not found.")
+        return redirect('profile')
+
+    if status in ['successful', 'completed']:
+        verification_response = await averify_transaction(flw_transaction_id)
+        if payment_verified(verification_response, transaction):
+            if await confirm_payment(transaction, flw_transaction_id) == 'refund_due':
+                messages.error(request, REFUND_DUE_MESSAGE)
+                return redirect('profile')
+            messages.success(request, "Payment successful! Your booking is confirmed.")
+            return redirect('thank_you', transaction_id=transaction.id)
+        await decline_payment(transaction)
+        messages.error(request, "Payment verification failed.")
+    elif status == 'cancelled':
+        await decline_payment(transaction)
+        messages.error(request, "Payment was cancelled.")
+    else:
+        messages.error(request, f"Payment failed with status: {status}. Please try again.")
+
+    # On failure/cancel, update booking to cancelled
+    booking = transaction.booking
+    booking.status = 'cancelled'
+    await booking.asave()
+
+    return redirect('profile')
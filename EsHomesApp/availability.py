@@ -0,0 +1,88 @@
+"""
+Whether an apartment is free for a stay, and a cache version per apartment
+that changes whenever the answer might.
+
+Bookings invalidate through signals.py; bulk updates that skip signals (the
+hold sweeper, reconciliation) and calendar syncs call ``changed()``
+themselves. A hold that runs out only frees its dates once the sweeper has
+cancelled it, so cached answers can be up to a sweep interval too cautious,
+never too optimistic.
+
+``booked_nights()`` answers for whole months at once, for date pickers: one
+overlap query over the (check_in_date, check_out_date) index for all the
+apartments asked about, plus their channel blocks.
+"""
+from datetime import date
+
+from . import caching
+from .models import Booking, ExternalBlock
+
+
+def namespace(apartment_id):
+    return f"availability:{apartment_id}"
+
+
+def version(apartment_id):
+    return caching.namespace_version(namespace(apartment_id))
+
+
+def changed(apartment_ids):
+    caching.changed(*(namespace(pk) for pk in set(apartment_ids)))
+
+
+def is_available(apartment_id, check_in_date, check_out_date):
+    """True if no booking or external channel block overlaps the stay."""
+    booked = Booking.objects.filter(
+        apartment_id=apartment_id,
+    ).blocking().overlapping(check_in_date, check_out_date).exists()
+    if booked:
+        return False
+    return not ExternalBlock.objects.filter(
+        apartment_id=apartment_id,
+        start_date__lt=check_out_date,
+        end_date__gt=check_in_date,
+    ).exists()
+
+
+def add_months(month, count):
+    """The first day of the month ``count`` months after ``month``'s."""
+    index = month.year * 12 + month.month - 1 + count
+    return date(index // 12, index % 12 + 1, 1)
+
+
+def booked_nights(apartment_ids, start, end, today=None):
+    """
+    ``{apartment_id: bytearray}`` with one byte per night from ``start`` up to
+    ``end``: 1 if the night can't be booked (taken, blocked or already past).
+    """
+    today = today or date.today()
+    days = (end - start).days
+    past = max(min((today - start).days, days), 0)
+    nights = {pk: bytearray(b'\x01' * past + b'\x00' * (days - past)) for pk in apartment_ids}
+
+    stays = Booking.objects.filter(apartment_id__in=apartment_ids).blocking().overlapping(start, end)
+    blocks = ExternalBlock.objects.filter(apartment_id__in=apartment_ids, start_date__lt=end, end_date__gt=start)
+    for rows in (
+        stays.values_list('apartment_id', 'check_in_date', 'check_out_date'),
+        blocks.values_list('apartment_id', 'start_date', 'end_date'),
+    ):
+        for apartment_id, first, last in rows:
+            first, last = max((first - start).days, 0), min((last - start).days, days)
+            nights[apartment_id][first:last] = b'\x01' * (last - first)
+    return nights
+
+
+def encode_bits(nights):
+    return ''.join('1' if night else '0' for night in nights)
+
+
+def encode_runs(nights):
+    """Alternating run lengths, starting with a (possibly empty) run of free nights."""
+    runs, current, length = [], 0, 0
+    for night in nights:
+        if night != current:
+            runs.append(length)
+            current, length = night, 0
+        length += 1
+    runs.append(length)
+    return runs
@@ -0,0 +1,238 @@
+"""
+Performance budgets for every named route in urls.py, enforced by
+``PerformanceBudgetTests``.
+
+Each route declares the most SQL queries, kilobytes and milliseconds one
+cold request (empty caches) may take, plus how to request it: URL kwargs,
+query string or POST data (formatted with the seeded objects, e.g.
+``'{apartment.pk}'``) and whether to log in first. Routes without a budget
+fail the tests, so a new view can't slip in without one.
+
+The tests seed the database at two scales and request every route at both.
+A route fails if it takes more queries on the bigger data set (an N+1 query
+somewhere), or goes over any of its budgets. Each query is attributed to the
+line that ran it: the template tag if a template triggered it, otherwise
+the innermost app frame, so failures say where the extra queries come from.
+Render-time budgets are scaled by PERF_BUDGET_TIME_FACTOR in the environment,
+for slow CI machines.
+"""
+import os
+import sys
+import time
+from collections import Counter
+from datetime import timedelta
+from decimal import Decimal
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import connection
+from django.template.base import Node
+from django.urls import reverse
+from django.utils import timezone
+
+from .models import (
+    Amenity, Apartment, ApartmentImage, Booking, CustomUser, ExternalBlock, ExternalCalendar, Review,
+    SimilarApartment, Transaction,
+)
+
+BUDGETS = {
+    'home': {'queries': 2, 'kb': 30, 'ms': 150},
+    'about': {'queries': 0, 'kb': 25, 'ms': 100},
+    'contact': {'queries': 0, 'kb': 20, 'ms': 100},
+    'apartments': {'queries': 5, 'kb': 35, 'ms': 250},
+    'apartment_detail': {'queries': 9, 'kb': 35, 'ms': 200, 'kwargs': {'pk': '{apartment.pk}'}},
+    'review_helpful': {
+        'queries': 6, 'kb': 1, 'ms': 100, 'login': True, 'method': 'post', 'status': 302,
+        'kwargs': {'pk': '{review.pk}'}, 'data': {'review_sort': 'helpful', 'review_page': '1'},
+    },
+    'set_currency': {'queries': 4, 'kb': 1, 'ms': 100, 'status': 302, 'kwargs': {'code': 'USD'}, 'params': {'next': '/'}},
+    'apartment_calendar': {'queries': 3, 'kb': 5, 'ms': 100, 'kwargs': {'pk': '{apartment.pk}'}},
+    'availability_calendar': {
+        'queries': 3, 'kb': 5, 'ms': 100,
+        'params': {'apartments': '{apartment.pk},{free_apartment.pk}'},
+    },
+    'booking': {'queries': 7, 'kb': 25, 'ms': 250, 'login': True, 'params': {'apartment': '{apartment.pk}'}},
+    'booking_quote': {
+        'queries': 3, 'kb': 2, 'ms': 100,
+        'params': {'apartment': '{free_apartment.pk}', 'check_in': '{check_in}', 'check_out': '{check_out}'},
+    },
+    'create_booking': {
+        'queries': 7, 'kb': 1, 'ms': 150, 'login': True, 'method': 'post', 'status': 302,
+        'kwargs': {'pk': '{free_apartment.pk}'},
+        'data': {'check_in': '{check_in}', 'check_out': '{check_out}', 'guests': '1'},
+    },
+    'initiate_payment': {
+        'queries': 4, 'kb': 15, 'ms': 150, 'login': True, 'kwargs': {'transaction_id': '{pending_transaction.pk}'},
+    },
+    'payment_callback': {
+        'queries': 4, 'kb': 1, 'ms': 150, 'status': 302,
+        'params': {'status': 'cancelled', 'tx_ref': '{pending_transaction.tx_ref}'},
+    },
+    'thank_you': {
+        'queries': 5, 'kb': 10, 'ms': 150, 'login': True, 'kwargs': {'transaction_id': '{paid_transaction.pk}'},
+    },
+    'profile': {'queries': 4, 'kb': 30, 'ms': 150, 'login': True},
+    'user_login': {'queries': 0, 'kb': 10, 'ms': 100},
+    'login_user': {'queries': 0, 'kb': 10, 'ms': 100},
+    'register': {'queries': 0, 'kb': 15, 'ms': 100},
+    'logout_user': {'queries': 4, 'kb': 1, 'ms': 100, 'login': True, 'status': 302},
+}
+
+# Data set sizes the routes are measured at: apartments, amenities, bookings
+# per guest and reviews per apartment all grow with the scale
+SCALES = {'small': 2, 'large': 12}
+
+_APP_DIR = os.path.dirname(os.path.abspath(__file__))
+
+
+def query_site():
+    """Where the query being executed comes from: 'template.html:12' or 'views.py:34 in profile'."""
+    frame, app_frame = sys._getframe(1), None
+    while frame is not None:
+        node = frame.f_locals.get('self')
+        # type(), not isinstance(): that would evaluate lazy objects (request.user), running more queries
+        if issubclass(type(node), Node) and node.token is not None and node.origin is not None:
+            return f"{node.origin.template_name}:{node.token.lineno} {{% {node.token.contents[:60]} %}}"
+        filename = frame.f_code.co_filename
+        if app_frame is None and filename.startswith(_APP_DIR) and filename != __file__:
+            app_frame = frame
+        frame = frame.f_back
+    if app_frame is None:
+        return 'django'
+    return f"{os.path.relpath(app_frame.f_code.co_filename, _APP_DIR)}:{app_frame.f_lineno} in {app_frame.f_code.co_name}"
+
+
+class QueryRecorder:
+    """Collects the site of every query run on the default connection while active."""
+
+    def __init__(self):
+        self.sites = []
+
+    def __call__(self, execute, sql, params, many, context):
+        self.sites.append(query_site())
+        return execute(sql, params, many, context)
+
+    def __enter__(self):
+        self._wrapper = connection.execute_wrapper(self)
+        self._wrapper.__enter__()
+        return self
+
+    def __exit__(self, *exc_info):
+        self._wrapper.__exit__(*exc_info)
+
+
+def seed(scale):
+    """Objects the budgets refer to, with ``scale`` of everything that can grow."""
+    guest = CustomUser.objects.create_user(
+        username='budget', email='budget@example.com', password='budget-pass', phone_number='budget',
+        first_name='Budget', last_name='Guest',
+    )
+    reviewers = [
+        CustomUser.objects.create_user(username=f'reviewer{i}', email=f'reviewer{i}@example.com',
+                                       password=None, phone_number=f'reviewer{i}')
+        for i in range(scale)
+    ]
+    amenities = [Amenity.objects.create(name=f'Amenity {i}', icon='fas fa-check') for i in range(scale)]
+    apartments = []
+    for i in range(scale + 2):
+        apartment = Apartment.objects.create(
+            name=f'Budget Apartment {i}', apartment_type='studio', description='A budget apartment. ' * 20,
+            price_per_night=Decimal(100 + i), size_sqft=500, max_occupancy=4, bedrooms=2, bathrooms=Decimal('1.0'),
+            featured=True, latitude=6.45 + i / 100, longitude=3.40 + i / 100,
+        )
+        apartment.amenities.set(amenities)
+        ApartmentImage.objects.bulk_create([
+            ApartmentImage(apartment=apartment, image=f'apartment_images/budget-{i}-{j}.jpg') for j in range(3)
+        ])
+        apartments.append(apartment)
+    apartment, free_apartment = apartments[0], apartments[-1]
+    SimilarApartment.objects.bulk_create([
+        SimilarApartment(apartment=apartment, similar=other, rank=rank, distance=float(rank))
+        for rank, other in enumerate(apartments[1:], 1)
+    ])
+
+    today = timezone.localdate()
+    transactions = []
+    for i in range(scale):
+        booking = Booking.objects.create(
+            user=guest, apartment=apartments[i % (scale + 1)], check_in_date=today + timedelta(days=30 + 3 * i),
+            check_out_date=today + timedelta(days=32 + 3 * i), guests=2, total_price=Decimal('200.00'),
+            status='confirmed',
+        )
+        transactions.append(Transaction.objects.create(
+            user=guest, booking=booking, amount=booking.total_price, tx_ref=f'BUDGET-{i}',
+            transaction_status='completed',
+        ))
+        for reviewer in reviewers:
+            Review.objects.create(
+                user=reviewer, apartment=booking.apartment, rating=5, comment='Lovely stay.',
+                cleanliness_rating=5, location_rating=5, value_rating=5,
+            )
+    pending = Booking.objects.create(
+        user=guest, apartment=apartment, check_in_date=today + timedelta(days=5), check_out_date=today + timedelta(days=7),
+        guests=2, total_price=Decimal('200.00'),
+    )
+    pending_transaction = Transaction.objects.create(
+        user=guest, booking=pending, amount=pending.total_price, tx_ref='BUDGET-PENDING',
+    )
+    calendar = ExternalCalendar.objects.create(apartment=apartment, name='Airbnb', url='https://example.com/a.ics')
+    ExternalBlock.objects.bulk_create([
+        ExternalBlock(calendar=calendar, apartment=apartment, uid=f'block-{i}',
+                      start_date=today + timedelta(days=100 + 2 * i), end_date=today + timedelta(days=101 + 2 * i))
+        for i in range(scale)
+    ])
+    return {
+        'guest': guest,
+        'apartment': apartment,
+        'review': apartment.reviews.earliest('pk'),
+        'free_apartment': free_apartment,
+        'pending_transaction': pending_transaction,
+        'paid_transaction': transactions[0],
+        'check_in': (today + timedelta(days=60 + 3 * scale)).isoformat(),
+        'check_out': (today + timedelta(days=62 + 3 * scale)).isoformat(),
+    }
+
+
+def _format(values, objects):
+    return {key: value.format(**objects) for key, value in values.items()}
+
+
+def measure(client, name, objects):
+    """
+    Request route ``name`` cold, the way its budget says. Returns ``status``,
+    ``sites`` (one per query), ``kb`` and ``ms``.
+    """
+    budget = BUDGETS[name]
+    client.logout()
+    if budget.get('login'):
+        client.force_login(objects['guest'])
+    url = reverse(name, kwargs=_format(budget.get('kwargs', {}), objects))
+    request = getattr(client, budget.get('method', 'get'))
+    payload = _format(budget.get('data', budget.get('params', {})), objects)
+
+    for alias in settings.CACHES:
+        caches[alias].clear()
+    with QueryRecorder() as recorder:
+        started = time.perf_counter()
+        response = request(url, payload)
+        content = b''.join(response.streaming_content) if response.streaming else response.content
+        elapsed = time.perf_counter() - started
+    return {
+        'status': response.status_code,
+        'sites': recorder.sites,
+        'kb': len(content) / 1024,
+        'ms': elapsed * 1000,
+    }
+
+
+def time_factor():
+    return float(os.environ.get('PERF_BUDGET_TIME_FACTOR', '1'))
+
+
+def describe_sites(sites, limit=8):
+    return '\n'.join(f"    {count:>3} x {site}" for site, count in Counter(sites).most_common(limit))
+
+
+def growth(small_sites, large_sites):
+    """Sites that ran more queries on the bigger data set, with how many more."""
+    return Counter(large_sites) - Counter(small_sites)
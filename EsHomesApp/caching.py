@@ -0,0 +1,181 @@
+"""
+Stampede-protected caching for hot computed values.
+
+``get_or_compute(namespace, key, compute)`` returns a cached ``compute()``
+without letting an expiring entry send every concurrent request to the
+database at once:
+
+- Per-key locks. Only the request holding a key's lock recomputes it: a
+  thread lock of the key's own within the process (kept only while someone
+  holds or waits for it), plus a lock entry taken with ``cache.add()``
+  across processes. Misses on different keys never wait for each other. Requests that find nothing cached wait
+  for the holder (up to COMPUTED_CACHE_LOCK_TIMEOUT) instead of computing too.
+- Probabilistic early expiration ("XFetch"). Each read may refresh an entry
+  a little before it goes stale, more likely the closer it is and the longer
+  the value took to compute, so a busy key is usually refreshed by one
+  request before it expires.
+- Stale-while-revalidate. For COMPUTED_CACHE_STALE_TIMEOUT seconds after
+  going stale an entry is still served to everyone but the lock holder.
+- Versioned namespaces. Keys embed their namespace's version, and
+  ``invalidate(namespace)`` bumps it; the orphaned entries just age out.
+  Code that changes data calls ``changed(namespace)`` instead, which also
+  bumps it again once the DB transaction commits.
+
+Every lookup sends ``cache_event`` (``event`` is 'hit', 'stale', 'miss' or
+'recompute'; recomputes carry their ``duration``) with the namespace as
+sender, for metrics.
+
+Works with any cache backend. ``cache.add()`` is atomic on the local-memory,
+database, Redis and Memcached backends but not the file-based one, where two
+processes may occasionally both recompute a key.
+"""
+import math
+import random
+import threading
+import time
+import uuid
+import weakref
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import transaction
+from django.dispatch import Signal
+
+# Apartments and their images, bumped whenever they change (see signals.py)
+INVENTORY = 'inventory'
+
+cache_event = Signal()
+
+# cache key -> its _KeyLock, for as long as a request holds or waits for it:
+# versioned keys come and go, and their locks mustn't pile up
+_LOCKS = weakref.WeakValueDictionary()
+_LOCKS_GUARD = threading.Lock()
+LOCK_POLL_INTERVAL = 0.05
+
+
+class _KeyLock:
+    """A thread lock that can be weakly referenced (``threading.Lock`` can't)."""
+
+    __slots__ = ('lock', '__weakref__')
+
+    def __init__(self):
+        self.lock = threading.Lock()
+
+
+def _key_lock(cache_key):
+    with _LOCKS_GUARD:
+        local = _LOCKS.get(cache_key)
+        if local is None:
+            local = _LOCKS[cache_key] = _KeyLock()
+        return local
+
+
+def get_cache():
+    return caches[settings.COMPUTED_CACHE]
+
+
+def namespace_version(namespace, cache=None):
+    cache = cache or get_cache()
+    version_key = f"cv:{namespace}"
+    version = cache.get(version_key)
+    if version is None:
+        # Seeded from the clock, so a version evicted from the cache can't come back as an old one
+        cache.add(version_key, time.time_ns() // 1000, None)
+        version = cache.get(version_key)
+    return version
+
+
+def invalidate(namespace):
+    """Orphan every entry in the namespace."""
+    cache = get_cache()
+    try:
+        cache.incr(f"cv:{namespace}")
+    except ValueError:
+        # Not cached: whichever version gets seeded next is already a new one
+        pass
+
+
+def changed(*namespaces):
+    """
+    Invalidate now, so this request reads its own change, and again after
+    commit, so nothing recomputed from the old rows in between survives.
+    """
+    for namespace in namespaces:
+        invalidate(namespace)
+    transaction.on_commit(lambda: [invalidate(namespace) for namespace in namespaces])
+
+
+def get_or_compute(namespace, key, compute, timeout=None, stale_timeout=None, beta=None):
+    """
+    The cached value of ``compute()`` for ``key``, fresh for ``timeout``
+    seconds and served stale for ``stale_timeout`` more while it is
+    recomputed. ``beta`` > 1 favours earlier refreshes, 0 disables them.
+    """
+    cache = get_cache()
+    timeout = settings.COMPUTED_CACHE_TIMEOUT if timeout is None else timeout
+    stale_timeout = settings.COMPUTED_CACHE_STALE_TIMEOUT if stale_timeout is None else stale_timeout
+    beta = settings.COMPUTED_CACHE_BETA if beta is None else beta
+    cache_key = f"c:{namespace}:{namespace_version(namespace, cache)}:{key}"
+
+    entry = cache.get(cache_key)
+    if entry is not None:
+        value, stale_at, duration = entry
+        now = time.time()
+        # -log(U) is exponentially distributed: usually tiny, occasionally a few compute-durations early
+        if now - duration * beta * math.log(1 - random.random()) < stale_at:
+            cache_event.send(sender=namespace, event='hit', key=key)
+            return value
+        release = _acquire(cache, cache_key, wait=False)
+        if release is None:
+            # Someone else is already refreshing it
+            cache_event.send(sender=namespace, event='hit' if now < stale_at else 'stale', key=key)
+            return value
+        try:
+            return _recompute(cache, cache_key, namespace, key, compute, timeout, stale_timeout)
+        finally:
+            release()
+
+    cache_event.send(sender=namespace, event='miss', key=key)
+    release = _acquire(cache, cache_key, wait=True)
+    try:
+        if release is not None:
+            # Whoever held the lock before us has probably filled it in
+            entry = cache.get(cache_key)
+            if entry is not None:
+                return entry[0]
+        # Otherwise the holder outlived the lock timeout; compute without it rather than wait longer
+        return _recompute(cache, cache_key, namespace, key, compute, timeout, stale_timeout)
+    finally:
+        if release is not None:
+            release()
+
+
+def _recompute(cache, cache_key, namespace, key, compute, timeout, stale_timeout):
+    started = time.monotonic()
+    value = compute()
+    duration = time.monotonic() - started
+    cache.set(cache_key, (value, time.time() + timeout, duration), timeout + stale_timeout)
+    cache_event.send(sender=namespace, event='recompute', key=key, duration=duration)
+    return value
+
+
+def _acquire(cache, cache_key, wait):
+    """Take the key's lock, returning a function that releases it, or None if it is held elsewhere."""
+    lock_timeout = settings.COMPUTED_CACHE_LOCK_TIMEOUT
+    local = _key_lock(cache_key)
+    if not local.lock.acquire(blocking=wait, timeout=lock_timeout if wait else -1):
+        return None
+
+    lock_key, token = f"lock:{cache_key}", uuid.uuid4().hex
+    deadline = time.monotonic() + (lock_timeout if wait else 0)
+    while not cache.add(lock_key, token, lock_timeout):
+        if time.monotonic() >= deadline:
+            local.lock.release()
+            return None
+        time.sleep(LOCK_POLL_INTERVAL)
+
+    def release():
+        if cache.get(lock_key) == token:
+            cache.delete(lock_key)
+        local.lock.release()
+    return release
@@ -0,0 +1,127 @@
+"""
+Prices in the visitor's currency.
+
+Everything is stored, charged and verified in BASE_CURRENCY (naira); this
+module only changes how prices are shown. A visitor picks a display currency
+(``set_currency`` view), kept in their session. Pages convert what they list
+with ``convert()``, in one pass per page: one rate lookup, then a
+multiplication per object, no per-card template work.
+
+Rates live in ``ExchangeRate`` (units of the currency per unit of
+BASE_CURRENCY), refreshed hourly from FX_RATES_URL by the
+refresh_exchange_rates task or kept by hand in the admin. Each process
+holds the whole table in memory for FX_CACHE_SECONDS, so converting costs
+one small query per process every few minutes. A currency without a rate
+is shown in BASE_CURRENCY instead.
+
+Amounts that are paid or checked (booking totals, ``Transaction.amount``,
+the quote, Flutterwave verification) are never converted.
+"""
+import threading
+import time
+from decimal import ROUND_HALF_UP, Decimal
+
+from django.conf import settings
+from django.utils import timezone
+from django.utils.functional import SimpleLazyObject
+
+from .models import ExchangeRate
+
+SESSION_KEY = 'display_currency'
+
+# (expires at, {currency: rate}), replaced whole
+_table = None
+_lock = threading.Lock()
+
+
+def rates():
+    """``{currency: units per BASE_CURRENCY}``, the base currency included."""
+    global _table
+    table = _table
+    if table is None or time.monotonic() >= table[0]:
+        with _lock:
+            table = _table
+            if table is None or time.monotonic() >= table[0]:
+                loaded = dict(ExchangeRate.objects.values_list('currency', 'rate'))
+                loaded[settings.BASE_CURRENCY] = Decimal(1)
+                table = _table = (time.monotonic() + settings.FX_CACHE_SECONDS, loaded)
+    return table[1]
+
+
+def clear():
+    """Drop this process's copy of the rates, so the next lookup reloads them."""
+    global _table
+    _table = None
+
+
+def selected(request):
+    """The request's display currency: the session's choice, else BASE_CURRENCY."""
+    if not hasattr(request, 'display_currency'):
+        request.display_currency = _valid(request.session.get(SESSION_KEY))
+    return request.display_currency
+
+
+async def aselected(request):
+    if not hasattr(request, 'display_currency'):
+        request.display_currency = _valid(await request.session.aget(SESSION_KEY))
+    return request.display_currency
+
+
+def _valid(code):
+    return code if code in settings.DISPLAY_CURRENCIES else settings.BASE_CURRENCY
+
+
+def context_processor(request):
+    # Lazy: pages that don't show the switcher don't touch the session
+    return {
+        'display_currency': SimpleLazyObject(lambda: selected(request)),
+        'display_currencies': list(settings.DISPLAY_CURRENCIES),
+    }
+
+
+def format_amount(amount, code):
+    spec = settings.DISPLAY_CURRENCIES[code]
+    return f"{spec['symbol']}{amount.quantize(Decimal(1).scaleb(-spec['decimals']), ROUND_HALF_UP):,}"
+
+
+def effective(code):
+    """The currency prices are shown in when ``code`` is asked for, and its rate."""
+    rate = Decimal(1) if code == settings.BASE_CURRENCY else rates().get(code)
+    if rate is None:
+        return settings.BASE_CURRENCY, Decimal(1)
+    return code, rate
+
+
+def convert(objects, code, field='price_per_night', attr='display_price'):
+    """
+    Set ``attr`` on each of ``objects`` to its ``field`` amount in currency
+    ``code``, formatted for display. Returns ``objects``.
+    """
+    code, rate = effective(code)
+    for obj in objects:
+        setattr(obj, attr, format_amount(getattr(obj, field) * rate, code))
+    return objects
+
+
+def refresh_rates():
+    """Store the latest rates from FX_RATES_URL. Returns how many were stored."""
+    if not settings.FX_RATES_URL:
+        return 0
+    import requests
+
+    response = requests.get(
+        settings.FX_RATES_URL, params={'base': settings.BASE_CURRENCY}, timeout=settings.FX_FETCH_TIMEOUT,
+    )
+    response.raise_for_status()
+    quoted = response.json()['rates']
+    now = timezone.now()
+    rows = []
+    for code in settings.DISPLAY_CURRENCIES:
+        rate = Decimal(str(quoted.get(code, 0)))
+        if code != settings.BASE_CURRENCY and rate > 0:
+            rows.append(ExchangeRate(currency=code, rate=rate, updated_at=now))
+    ExchangeRate.objects.bulk_create(
+        rows, update_conflicts=True, unique_fields=['currency'], update_fields=['rate', 'updated_at'],
+    )
+    clear()
+    return len(rows)
@@ -0,0 +1,295 @@
+"""
+CSV and XLSX exports of bookings and transactions, for accounting.
+
+Exports are generators of bytes, so they can feed a ``StreamingHttpResponse``
+(the admin actions) or a file (``manage.py export_records``) without ever
+holding more than one chunk in memory, however many rows there are. Rows come
+from ``.iterator(chunk_size=EXPORT_CHUNK_SIZE)`` with the user and apartment
+joined in (and only the exported columns loaded), so an export is one query
+whatever its size.
+
+``export_queryset()`` applies the date-range and status filters the way the
+(status, booking_date) and (transaction_status, created_at) indexes can
+answer them: a status list is always given (every status if none was asked
+for) and rows come out in index order, by status then date.
+
+XLSX is written by hand with zipfile (a single sheet of inline strings), which
+needs no extra dependency and, unlike a seekable workbook writer, streams.
+
+Guest names, emails and cancellation reasons are typed in by anyone, and a
+spreadsheet runs text like ``=HYPERLINK(...)`` as a formula. In CSV such text
+is prefixed with an apostrophe, which Excel and LibreOffice read as "this is
+text"; an XLSX inline string is never evaluated, so it goes in unchanged.
+"""
+import csv
+import io
+import zipfile
+from datetime import date, datetime, time, timedelta
+from decimal import Decimal
+from xml.sax.saxutils import escape
+
+from django.conf import settings
+from django.utils import timezone
+
+from .models import ArchivedBooking, ArchivedTransaction, Booking, Transaction
+
+FORMATS = {
+    'csv': 'text/csv; charset=utf-8',
+    'xlsx': 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet',
+}
+
+EXPORTS = {
+    'bookings': {
+        'model': Booking,
+        'date_field': 'booking_date',
+        'status_field': 'status',
+        'select_related': ['user', 'apartment'],
+        'only': [
+            'booking_date', 'status', 'check_in_date', 'check_out_date', 'guests', 'total_price',
+            'cancellation_reason', 'user__username', 'user__email', 'apartment__name',
+        ],
+        'columns': [
+            ('Booking ID', lambda b: b.pk),
+            ('Booked at', lambda b: b.booking_date),
+            ('Status', lambda b: b.status),
+            ('Check-in', lambda b: b.check_in_date),
+            ('Check-out', lambda b: b.check_out_date),
+            ('Nights', lambda b: (b.check_out_date - b.check_in_date).days),
+            ('Guests', lambda b: b.guests),
+            ('Total price (NGN)', lambda b: b.total_price),
+            ('Guest', lambda b: b.user.username),
+            ('Guest email', lambda b: b.user.email),
+            ('Apartment ID', lambda b: b.apartment_id),
+            ('Apartment', lambda b: b.apartment.name),
+            ('Cancellation reason', lambda b: b.cancellation_reason),
+        ],
+    },
+    'transactions': {
+        'model': Transaction,
+        'date_field': 'created_at',
+        'status_field': 'transaction_status',
+        'select_related': ['user', 'booking__apartment'],
+        'only': [
+            'created_at', 'updated_at', 'transaction_status', 'amount', 'tx_ref', 'flw_transaction_id',
+            'user__username', 'user__email', 'booking__check_in_date', 'booking__check_out_date',
+            'booking__apartment__name',
+        ],
+        'columns': [
+            ('Transaction ID', lambda t: t.pk),
+            ('Created at', lambda t: t.created_at),
+            ('Updated at', lambda t: t.updated_at),
+            ('Status', lambda t: t.transaction_status),
+            ('Amount (NGN)', lambda t: t.amount),
+            ('Reference', lambda t: t.tx_ref),
+            ('Flutterwave ID', lambda t: t.flw_transaction_id),
+            ('Guest', lambda t: t.user.username),
+            ('Guest email', lambda t: t.user.email),
+            ('Booking ID', lambda t: t.booking_id),
+            ('Apartment', lambda t: t.booking.apartment.name if t.booking else None),
+            ('Check-in', lambda t: t.booking.check_in_date if t.booking else None),
+            ('Check-out', lambda t: t.booking.check_out_date if t.booking else None),
+        ],
+    },
+}
+# The archive tables (archive.py) have the same columns and indexes
+EXPORTS['archived_bookings'] = {**EXPORTS['bookings'], 'model': ArchivedBooking}
+EXPORTS['archived_transactions'] = {**EXPORTS['transactions'], 'model': ArchivedTransaction}
+
+
+def statuses(kind):
+    export = EXPORTS[kind]
+    return [value for value, _ in export['model']._meta.get_field(export['status_field']).choices]
+
+
+def export_queryset(kind, queryset=None, date_from=None, date_to=None, status=None):
+    """
+    The rows of export ``kind``: ``queryset`` (default: all of them) made on
+    ``date_from`` to ``date_to`` inclusive (local dates) and in ``status``
+    (a list; default every status).
+    """
+    export = EXPORTS[kind]
+    date_field, status_field = export['date_field'], export['status_field']
+    if queryset is None:
+        queryset = export['model'].objects.all()
+    queryset = queryset.filter(**{f'{status_field}__in': status or statuses(kind)})
+    if date_from:
+        queryset = queryset.filter(**{f'{date_field}__gte': _local_midnight(date_from)})
+    if date_to:
+        queryset = queryset.filter(**{f'{date_field}__lt': _local_midnight(date_to + timedelta(days=1))})
+    # select_related(None): drop the changelist's joins, which may reach columns only() defers
+    return (
+        queryset.select_related(None).select_related(*export['select_related'])
+        .only(*export['only'])
+        .order_by(status_field, date_field, 'pk')
+    )
+
+
+def _local_midnight(day):
+    return timezone.make_aware(datetime.combine(day, time.min))
+
+
+def rows(kind, queryset):
+    """The header, then one list of values per object."""
+    columns = EXPORTS[kind]['columns']
+    yield [header for header, _ in columns]
+    for obj in queryset.iterator(chunk_size=settings.EXPORT_CHUNK_SIZE):
+        yield [value(obj) for _, value in columns]
+
+
+def filename(kind, fmt):
+    return f"{kind}-{timezone.localdate().isoformat()}.{fmt}"
+
+
+def stream(kind, queryset, fmt):
+    """The export as an iterator of bytes chunks in format ``fmt`` ('csv' or 'xlsx')."""
+    writer = stream_csv if fmt == 'csv' else stream_xlsx
+    return writer(rows(kind, queryset))
+
+
+# Text starting with one of these is a formula to a spreadsheet
+FORMULA_PREFIXES = ('=', '+', '-', '@', '\t', '\r')
+
+
+def _text(value, tz):
+    if isinstance(value, datetime):
+        if timezone.is_aware(value):
+            value = value.astimezone(tz)
+        return value.isoformat(sep=' ', timespec='seconds')
+    if value is None:
+        return ''
+    if isinstance(value, str) and value.startswith(FORMULA_PREFIXES):
+        return "'" + value
+    return value
+
+
+def stream_csv(rows):
+    tz = timezone.get_current_timezone()
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    # A BOM, so Excel opens the file as UTF-8
+    buffer.write('\ufeff')
+    for i, row in enumerate(rows, 1):
+        writer.writerow([_text(value, tz) for value in row])
+        if i % settings.EXPORT_CHUNK_SIZE == 0:
+            yield buffer.getvalue().encode()
+            buffer.seek(0)
+            buffer.truncate()
+    yield buffer.getvalue().encode()
+
+
+class _Chunks:
+    """A write-only, unseekable file that hands back whatever was written since the last ``take()``."""
+
+    def __init__(self):
+        self.parts = []
+
+    def write(self, data):
+        self.parts.append(bytes(data))
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def take(self):
+        data, self.parts = b''.join(self.parts), []
+        return data
+
+
+XLSX_PARTS = {
+    '[Content_Types].xml': (
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+        '<Types xmlns="http://schemas.openxmlformats.org/package/2006/content-types">'
+        '<Default Extension="rels" ContentType="application/vnd.openxmlformats-package.relationships+xml"/>'
+        '<Default Extension="xml" ContentType="application/xml"/>'
+        '<Override PartName="/xl/workbook.xml" '
+        'ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet.main+xml"/>'
+        '<Override PartName="/xl/worksheets/sheet1.xml" '
+        'ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.worksheet+xml"/>'
+        '<Override PartName="/xl/styles.xml" '
+        'ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.styles+xml"/>'
+        '</Types>'
+    ),
+    '_rels/.rels': (
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+        '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+        '<Relationship Id="rId1" '
+        'Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/officeDocument" '
+        'Target="xl/workbook.xml"/>'
+        '</Relationships>'
+    ),
+    'xl/workbook.xml': (
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+        '<workbook xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main" '
+        'xmlns:r="http://schemas.openxmlformats.org/officeDocument/2006/relationships">'
+        '<sheets><sheet name="Export" sheetId="1" r:id="rId1"/></sheets>'
+        '</workbook>'
+    ),
+    'xl/_rels/workbook.xml.rels': (
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+        '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+        '<Relationship Id="rId1" '
+        'Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/worksheet" '
+        'Target="worksheets/sheet1.xml"/>'
+        '<Relationship Id="rId2" '
+        'Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/styles" '
+        'Target="styles.xml"/>'
+        '</Relationships>'
+    ),
+    # Cell styles: 0 plain, 1 date (built-in format 14), 2 date and time (22)
+    'xl/styles.xml': (
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+        '<styleSheet xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main">'
+        '<fonts count="1"><font/></fonts>'
+        '<fills count="1"><fill/></fills>'
+        '<borders count="1"><border/></borders>'
+        '<cellStyleXfs count="1"><xf/></cellStyleXfs>'
+        '<cellXfs count="3"><xf/><xf numFmtId="14" applyNumberFormat="1"/><xf numFmtId="22" applyNumberFormat="1"/></cellXfs>'
+        '</styleSheet>'
+    ),
+}
+
+SHEET_START = (
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+    '<worksheet xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main"><sheetData>'
+)
+SHEET_END = '</sheetData></worksheet>'
+
+EXCEL_EPOCH = datetime(1899, 12, 30)
+
+# Control characters XML 1.0 can't carry, even escaped
+_XML_ILLEGAL = dict.fromkeys(c for c in range(32) if c not in (9, 10, 13))
+
+
+def _cell(value, tz):
+    if value is None or value == '':
+        return '<c/>'
+    if isinstance(value, bool):
+        return f'<c t="b"><v>{int(value)}</v></c>'
+    if isinstance(value, (int, float, Decimal)):
+        return f'<c><v>{value}</v></c>'
+    if isinstance(value, datetime):
+        if timezone.is_aware(value):
+            value = value.astimezone(tz).replace(tzinfo=None)
+        return f'<c s="2"><v>{(value - EXCEL_EPOCH) / timedelta(days=1):.8f}</v></c>'
+    if isinstance(value, date):
+        return f'<c s="1"><v>{(value - EXCEL_EPOCH.date()).days}</v></c>'
+    # Inline strings are never evaluated: text that looks like a formula stays text
+    text = escape(str(value).translate(_XML_ILLEGAL))
+    return f'<c t="inlineStr"><is><t xml:space="preserve">{text}</t></is></c>'
+
+
+def stream_xlsx(rows):
+    tz = timezone.get_current_timezone()
+    out = _Chunks()
+    with zipfile.ZipFile(out, 'w', zipfile.ZIP_DEFLATED) as workbook:
+        for name, content in XLSX_PARTS.items():
+            workbook.writestr(name, content)
+        # force_zip64: the sheet's size isn't known until it's written
+        with workbook.open('xl/worksheets/sheet1.xml', 'w', force_zip64=True) as sheet:
+            sheet.write(SHEET_START.encode())
+            for i, row in enumerate(rows, 1):
+                sheet.write(f"<row>{''.join(_cell(value, tz) for value in row)}</row>".encode())
+                if i % settings.EXPORT_CHUNK_SIZE == 0:
+                    yield out.take()
+            sheet.write(SHEET_END.encode())
+    yield out.take()
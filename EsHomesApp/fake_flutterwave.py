@@ -0,0 +1,134 @@
+"""
+A local stand-in for Flutterwave's verify endpoint, for tests and benchmarks.
+
+    with FakeFlutterwave(latency=0.5) as gateway:
+        gateway.charge('123', amount=100.0)
+        with override_settings(FLUTTERWAVE_API_URL=gateway.url):
+            ...
+
+``GET /transactions/<id>/verify`` and
+``GET /transactions/verify_by_reference?tx_ref=...`` answer like the real
+API: the registered charge (status, amount, currency) or an error payload for
+unknown ones, after sleeping ``latency`` seconds. Each request is served on its own thread, so
+slow responses overlap the way they would against the real gateway.
+
+For load tests, ``jitter`` adds up to that many seconds more per request,
+and a ``failure_rate`` fraction of verifications fail with a 503 instead.
+
+    FakeFlutterwave(latency=0.3, jitter=0.5, failure_rate=0.02, seed=1)
+"""
+import json
+import random
+import re
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlsplit
+
+VERIFY_PATH = re.compile(r'^/transactions/(?P<id>[^/]+)/verify/?$')
+VERIFY_BY_REFERENCE_PATH = '/transactions/verify_by_reference'
+
+
+class FakeFlutterwave:
+    def __init__(self, latency=0.0, host='127.0.0.1', port=0, jitter=0.0, failure_rate=0.0, seed=None):
+        self.latency = latency
+        self.jitter = jitter
+        self.failure_rate = failure_rate
+        self.charges = {}
+        self.charges_by_reference = {}
+        self.requests = 0
+        self.failures = 0
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        self._server = ThreadingHTTPServer((host, port), self._handler())
+        self._server.daemon_threads = True
+        self._thread = None
+
+    @property
+    def url(self):
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def charge(self, flw_transaction_id, amount, currency='NGN', status='successful', tx_ref=''):
+        """Register a charge for the verify endpoints to report."""
+        charge = {
+            'id': flw_transaction_id,
+            'tx_ref': tx_ref,
+            'amount': float(amount),
+            'currency': currency,
+            'status': status,
+        }
+        self.charges[str(flw_transaction_id)] = charge
+        if tx_ref:
+            self.charges_by_reference[tx_ref] = charge
+
+    def start(self):
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc_info):
+        self.stop()
+
+    def verify(self, flw_transaction_id):
+        """The (status code, payload) the verify endpoint returns for an id."""
+        return self._verification(self.charges.get(flw_transaction_id))
+
+    def verify_by_reference(self, tx_ref):
+        return self._verification(self.charges_by_reference.get(tx_ref))
+
+    def delay_and_fail(self):
+        """Seconds to wait before answering, and whether to fail this request."""
+        with self._lock:
+            delay = self.latency + (self._random.uniform(0, self.jitter) if self.jitter else 0.0)
+            fail = self._random.random() < self.failure_rate
+            if fail:
+                self.failures += 1
+        return delay, fail
+
+    def _verification(self, charge):
+        if charge is None:
+            return 400, {'status': 'error', 'message': 'No transaction was found for this id', 'data': None}
+        return 200, {'status': 'success', 'message': 'Transaction fetched successfully', 'data': charge}
+
+    def _handler(self):
+        gateway = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+
+            def do_GET(self):
+                with gateway._lock:
+                    gateway.requests += 1
+                url = urlsplit(self.path)
+                match = VERIFY_PATH.match(url.path)
+                if match or url.path == VERIFY_BY_REFERENCE_PATH:
+                    delay, fail = gateway.delay_and_fail()
+                    if delay:
+                        time.sleep(delay)
+                    if fail:
+                        status, payload = 503, {'status': 'error', 'message': 'Service unavailable', 'data': None}
+                    elif match:
+                        status, payload = gateway.verify(match['id'])
+                    else:
+                        status, payload = gateway.verify_by_reference(parse_qs(url.query).get('tx_ref', [''])[0])
+                else:
+                    status, payload = 404, {'status': 'error', 'message': 'Not found'}
+                body = json.dumps(payload).encode()
+                self.send_response(status)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass
+
+        return Handler
@@ -0,0 +1,326 @@
+import mimetypes
+import os
+import re
+import stat
+from collections import namedtuple
+from functools import lru_cache
+
+from django.conf import settings
+from django.contrib.staticfiles import finders
+from django.core.exceptions import SuspiciousFileOperation
+from django.http import Http404, HttpResponse, HttpResponseNotModified, StreamingHttpResponse
+from django.utils._os import safe_join
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date, parse_http_date_safe, quote_etag
+
+# Matches the hash ManifestStaticFilesStorage inserts before the extension,
+# e.g. css/style.3f2a1c9e8b7d.css
+HASHED_NAME_RE = re.compile(r'\.[0-9a-f]{12}\.[^/.]+$')
+
+RANGE_RE = re.compile(r'^bytes=(\d*)-(\d*)$')
+
+# Precompressed siblings written by CompressedManifestStaticStorage, in order
+# of preference.
+ENCODINGS = [('br', '.br'), ('gzip', '.gz')]
+
+CHUNK_SIZE = 64 * 1024
+
+# What a response needs to know about a file, worked out once per version of
+# it rather than on every request
+FileInfo = namedtuple('FileInfo', 'path size mtime content_type etag last_modified')
+
+# full path -> (FileInfo, {encoding: FileInfo of the precompressed sibling}).
+# Hashed static names never change content, so they are also kept by name in
+# _immutable and served without a stat() or safe_join() until the file is opened.
+FILE_CACHE_SIZE = 2048
+_files = {}
+_immutable = {}
+
+
+def serve_static(request, path):
+    """Serve a collected static file from STATIC_ROOT."""
+    immutable = HASHED_NAME_RE.search(path) is not None
+    key = (settings.STATIC_ROOT, path)
+    entry = _immutable.get(key) if immutable else None
+    if entry is None:
+        resolved = _resolve(settings.STATIC_ROOT, path)
+        if resolved is None and settings.DEBUG:
+            # Nothing collected yet during development, look in the app dirs
+            found = finders.find(path)
+            resolved = _resolve(os.path.dirname(found), os.path.basename(found)) if found else None
+        if resolved is None:
+            raise Http404(f'"{path}" does not exist')
+        entry = _lookup(*resolved, precompressed=True)
+        if immutable and not settings.DEBUG:
+            _remember(_immutable, key, entry)
+
+    if immutable:
+        cache_control = f'public, max-age={settings.STATIC_CACHE_MAX_AGE}, immutable'
+    else:
+        cache_control = f'public, max-age={settings.STATIC_CACHE_MAX_AGE_UNHASHED}'
+    return _respond(request, entry, cache_control, precompressed=True)
+
+
+def serve_media(request, path):
+    """Serve an uploaded file from MEDIA_ROOT, optionally through the web server."""
+    resolved = _resolve(settings.MEDIA_ROOT, path)
+    if resolved is None:
+        raise Http404(f'"{path}" does not exist')
+
+    cache_control = f'public, max-age={settings.MEDIA_CACHE_MAX_AGE}'
+    backend = settings.MEDIA_SENDFILE_BACKEND
+    if backend:
+        return _offload(request, resolved[0], path, backend, cache_control)
+    return _respond(request, _lookup(*resolved, precompressed=False), cache_control, precompressed=False)
+
+
+def serve_file(request, full_path, cache_control, precompressed=False):
+    """
+    Build a response for a file on disk.
+
+    Handles conditional GET (ETag / Last-Modified -> 304), single byte ranges
+    and, when ``precompressed`` is set, picks a ``.br``/``.gz`` sibling that
+    the client accepts. Files bigger than CHUNK_SIZE are streamed in chunks,
+    never read whole.
+    """
+    entry = _lookup(full_path, os.stat(full_path), precompressed)
+    return _respond(request, entry, cache_control, precompressed)
+
+
+def _respond(request, entry, cache_control, precompressed):
+    # request.META rather than request.headers: building the headers mapping
+    # costs more than the rest of a 304
+    meta = request.META
+    info, variants = entry
+    content_encoding = None
+    if variants:
+        for name in _acceptable_encodings(meta.get('HTTP_ACCEPT_ENCODING', '')):
+            if name in variants:
+                info, content_encoding = variants[name], name
+                break
+
+    headers = {
+        'Cache-Control': cache_control,
+        'Last-Modified': info.last_modified,
+        'ETag': info.etag,
+    }
+    if precompressed:
+        headers['Vary'] = 'Accept-Encoding'
+
+    precondition = _precondition(request, info)
+    if precondition == 304:
+        return HttpResponseNotModified(headers=headers)
+    if precondition is not None:
+        return HttpResponse(status=precondition, headers=headers)
+
+    start, end = 0, info.size - 1
+    status = 200
+    if content_encoding is None:
+        headers['Accept-Ranges'] = 'bytes'
+        byte_range = _parse_range(request, info.size, info.etag, info.mtime)
+        if byte_range == 'unsatisfiable':
+            response = HttpResponse(status=416)
+            response['Content-Range'] = f'bytes */{info.size}'
+            return response
+        if byte_range is not None:
+            start, end = byte_range
+            status = 206
+            headers['Content-Range'] = f'bytes {start}-{end}/{info.size}'
+    else:
+        headers['Content-Encoding'] = content_encoding
+
+    length = end - start + 1
+    headers['Content-Length'] = str(length)
+    if request.method == 'HEAD':
+        return HttpResponse(status=status, content_type=info.content_type, headers=headers)
+    if length <= CHUNK_SIZE:
+        # Most static files: one read, no generator
+        try:
+            with open(info.path, 'rb') as f:
+                f.seek(start)
+                content = f.read(length)
+        except FileNotFoundError:
+            _forget(info.path)
+            raise Http404('The file is gone')
+        return HttpResponse(content, status=status, content_type=info.content_type, headers=headers)
+    return StreamingHttpResponse(
+        _read_chunks(info.path, start, length),
+        status=status,
+        content_type=info.content_type,
+        headers=headers,
+    )
+
+
+def _lookup(full_path, st, precompressed):
+    """The cached ``(FileInfo, variants)`` for ``full_path``, refreshed if the file changed."""
+    entry = _files.get(full_path)
+    if entry is not None and entry[0].mtime == st.st_mtime and entry[0].size == st.st_size:
+        return entry
+
+    content_type, encoding = mimetypes.guess_type(full_path)
+    content_type = content_type or 'application/octet-stream'
+    variants = {}
+    if precompressed and encoding is None:
+        for name, suffix in ENCODINGS:
+            try:
+                variant = os.stat(full_path + suffix)
+            except OSError:
+                continue
+            variants[name] = _info(full_path + suffix, variant, content_type, name)
+    entry = (_info(full_path, st, content_type, None), variants)
+    _remember(_files, full_path, entry)
+    return entry
+
+
+def _info(path, st, content_type, content_encoding):
+    return FileInfo(
+        path, st.st_size, st.st_mtime, content_type, _etag(st, content_encoding), http_date(st.st_mtime),
+    )
+
+
+def _remember(cache, key, entry):
+    # Crude but bounded: a flood of distinct paths can't grow the cache forever
+    if len(cache) >= FILE_CACHE_SIZE:
+        cache.clear()
+    cache[key] = entry
+
+
+def _forget(full_path):
+    _files.pop(full_path, None)
+    for key, (info, variants) in list(_immutable.items()):
+        if info.path == full_path or any(v.path == full_path for v in variants.values()):
+            _immutable.pop(key, None)
+
+
+@lru_cache(maxsize=256)
+def _acceptable_encodings(header):
+    """
+    The ENCODINGS an Accept-Encoding header allows, best first: by q-value,
+    then by our preference. ``gzip;q=0`` refuses gzip; ``*`` covers the rest.
+    """
+    qualities = {}
+    for part in header.split(','):
+        coding, _, params = part.partition(';')
+        coding = coding.strip().lower()
+        if coding == 'x-gzip':
+            coding = 'gzip'
+        if not coding:
+            continue
+        quality = 1.0
+        for param in params.split(';'):
+            name, _, value = param.partition('=')
+            if name.strip().lower() == 'q':
+                try:
+                    quality = float(value)
+                except ValueError:
+                    quality = 0.0
+        qualities[coding] = quality
+    wildcard = qualities.get('*', 0.0)
+    ranked = sorted(
+        ((qualities.get(name, wildcard), -preference, name) for preference, (name, _) in enumerate(ENCODINGS)),
+        reverse=True,
+    )
+    return tuple(name for quality, _, name in ranked if quality > 0)
+
+
+def _precondition(request, info):
+    """304 or 412 if the request's conditional headers call for it, else None."""
+    meta = request.META
+    if request.method not in ('GET', 'HEAD') or 'HTTP_IF_MATCH' in meta or 'HTTP_IF_UNMODIFIED_SINCE' in meta:
+        # Rare here; Django's full precondition handling answers these
+        response = get_conditional_response(request, etag=info.etag, last_modified=int(info.mtime))
+        return None if response is None else response.status_code
+    if_none_match = meta.get('HTTP_IF_NONE_MATCH')
+    if if_none_match is not None:
+        # Weak comparison, as RFC 9110 asks for If-None-Match
+        matched = if_none_match.strip() == '*' or info.etag in _etags(if_none_match)
+    elif 'HTTP_IF_MODIFIED_SINCE' in meta:
+        since = parse_http_date_safe(meta['HTTP_IF_MODIFIED_SINCE'])
+        matched = since is not None and int(info.mtime) <= since
+    else:
+        return None
+    return 304 if matched else None
+
+
+@lru_cache(maxsize=256)
+def _etags(header):
+    return {tag.strip().removeprefix('W/') for tag in header.split(',')}
+
+
+def _offload(request, full_path, path, backend, cache_control):
+    # Let Apache (mod_xsendfile) or nginx (internal location) send the bytes.
+    # They take care of ranges and conditional requests themselves.
+    content_type, _ = mimetypes.guess_type(full_path)
+    response = HttpResponse(content_type=content_type or 'application/octet-stream')
+    if backend == 'x-sendfile':
+        response['X-Sendfile'] = full_path
+    elif backend == 'x-accel-redirect':
+        response['X-Accel-Redirect'] = settings.MEDIA_ACCEL_REDIRECT_PREFIX + path
+    else:
+        raise ValueError(f'Unknown MEDIA_SENDFILE_BACKEND: {backend!r}')
+    response['Cache-Control'] = cache_control
+    return response
+
+
+def _resolve(root, path):
+    try:
+        full_path = safe_join(root, path)
+    except SuspiciousFileOperation:
+        # Path traversal attempt
+        return None
+    try:
+        st = os.stat(full_path)
+    except OSError:
+        return None
+    return (full_path, st) if stat.S_ISREG(st.st_mode) else None
+
+
+def _etag(st, content_encoding):
+    tag = f'{st.st_mtime_ns:x}-{st.st_size:x}'
+    if content_encoding:
+        tag += f'-{content_encoding}'
+    return quote_etag(tag)
+
+
+def _parse_range(request, size, etag, mtime):
+    """
+    Return ``(start, end)`` for a satisfiable single range, ``'unsatisfiable'``
+    or None when the whole file should be sent.
+    """
+    header = request.META.get('HTTP_RANGE')
+    if not header or request.method not in ('GET', 'HEAD'):
+        return None
+    if_range = request.META.get('HTTP_IF_RANGE')
+    if if_range and if_range != etag and if_range != http_date(mtime):
+        # The client's partial copy is stale, send everything
+        return None
+
+    match = RANGE_RE.match(header.strip())
+    if not match:
+        # Multiple or malformed ranges: falling back to 200 is allowed
+        return None
+    first, last = match.groups()
+    if not first and not last:
+        return None
+    if not first:
+        # Suffix range: the last N bytes
+        length = int(last)
+        if length == 0:
+            return 'unsatisfiable'
+        return max(size - length, 0), size - 1
+    start = int(first)
+    end = min(int(last), size - 1) if last else size - 1
+    if start >= size or start > end:
+        return 'unsatisfiable'
+    return start, end
+
+
+def _read_chunks(full_path, start, length):
+    with open(full_path, 'rb') as f:
+        f.seek(start)
+        while length > 0:
+            chunk = f.read(min(CHUNK_SIZE, length))
+            if not chunk:
+                break
+            length -= len(chunk)
+            yield chunk
@@ -1,5 +1,8 @@
 from django import forms
+from django.conf import settings
 from django.contrib.auth.forms import UserCreationForm
+from .availability import is_available
+from .currency import convert, effective
 from .models import CustomUser, Booking
 from datetime import date
 
@@ -43,32 +46,54 @@ class BookingForm(forms.ModelForm):
             'apartment': forms.Select(attrs={'class': 'form-control'}),
         }
         
-    def __init__(self, *args, **kwargs):
+    def __init__(self, *args, display_currency=None, **kwargs):
         super().__init__(*args, **kwargs)
         # Add price data to each apartment option
         if self.fields['apartment'].queryset.exists():
+            apartments = list(self.fields['apartment'].queryset)
+            # Stays are charged (and booking.js totals them) in naira; another currency is only a guide
+            display_currency, _ = effective(display_currency or settings.BASE_CURRENCY)
+            if display_currency != settings.BASE_CURRENCY:
+                convert(apartments, display_currency)
             choices = []
-            for apartment in self.fields['apartment'].queryset:
+            for apartment in apartments:
                 option_label = f"{apartment.name} - ₦{apartment.price_per_night}/night"
+                if display_currency != settings.BASE_CURRENCY:
+                    option_label += f" (≈ {apartment.display_price})"
                 choices.append((apartment.id, option_label))
             self.fields['apartment'].choices = choices
 
     def clean(self):
         cleaned_data = super().clean()
-        check_in_date = cleaned_data.get('check_in_date')
-        check_out_date = cleaned_data.get('check_out_date')
-        apartment = cleaned_data.get('apartment')
-        guests = cleaned_data.get('guests')
+        errors = booking_errors(
+            cleaned_data.get('apartment'), cleaned_data.get('check_in_date'),
+            cleaned_data.get('check_out_date'), cleaned_data.get('guests'),
+        )
+        if errors:
+            raise forms.ValidationError(errors[0])
+        return cleaned_data
 
-        if check_in_date and check_out_date:
-            if check_in_date < date.today():
-                raise forms.ValidationError("Check-in date cannot be in the past.")
-            if check_out_date <= check_in_date:
-                raise forms.ValidationError("Check-out date must be after check-in date.")
 
-        if apartment and guests:
-            if guests > apartment.max_occupancy:
-                raise forms.ValidationError(f"Number of guests cannot exceed {apartment.max_occupancy} for this apartment.")
+def booking_errors(apartment, check_in_date, check_out_date, guests):
+    """Everything wrong with a stay, in the order BookingForm.clean checks (and reports the first of) them."""
+    errors = []
+    if check_in_date and check_out_date:
+        if check_in_date < date.today():
+            errors.append("Check-in date cannot be in the past.")
+        if check_out_date <= check_in_date:
+            errors.append("Check-out date must be after check-in date.")
+        # Other bookings' holds and dates blocked on other channels, as create_booking checks
+        elif apartment and not is_available(apartment.pk, check_in_date, check_out_date):
+            errors.append("This apartment is not available for the selected dates.")
 
-        return cleaned_data
+    if apartment and apartment.status != 'available':
+        errors.append("This apartment is not available for booking.")
+
+    if guests is not None:
+        if guests < 1:
+            errors.append("A booking needs at least one guest.")
+        elif apartment and guests > apartment.max_occupancy:
+            errors.append(f"Number of guests cannot exceed {apartment.max_occupancy} for this apartment.")
+
+    return errors
         
\ No newline at end of file
@@ -0,0 +1,145 @@
+"""
+"Near me" search without spatial extensions.
+
+Every apartment with coordinates stores its geohash (``Apartment.geohash``,
+indexed). A search turns its radius or bounding box into the handful of
+geohash cells covering it, fetches the apartments whose hash starts with
+one of those cells (index range scans, no table scan), then computes exact
+great-circle distances for the candidates in one vectorized NumPy pass and
+drops the ones outside the area. Searches wider than
+GEO_PRUNING_MAX_RADIUS_KM, whose cells would cover most of a city anyway,
+skip the pruning and scan the lat/lon box instead: the geohash subquery only
+adds to their cost.
+
+On SQLite the planner only prefers the geohash index over the status index
+once ``ANALYZE`` has told it how unselective ``status`` is.
+
+NumPy is imported by the functions that need it, so that processes which
+never search (commands, the job worker) don't pay for loading it.
+"""
+import math
+from functools import reduce
+from operator import or_
+
+from django.conf import settings
+from django.db.models import Q
+
+BASE32 = '0123456789bcdefghjkmnpqrstuvwxyz'
+EARTH_RADIUS_KM = 6371.0088
+# On the same sphere as haversine_km, so a radius's box never cuts its circle
+KM_PER_DEGREE_LAT = EARTH_RADIUS_KM * math.pi / 180
+
+# Stored hashes are this long (about 5m x 5m cells); searches use a shorter prefix
+HASH_PRECISION = 9
+# Coarser cells (precision 4 is about 39km x 20km) make index lookups dearer than a scan
+MIN_PRUNING_PRECISION = 5
+
+
+def encode(latitude, longitude, precision=HASH_PRECISION):
+    lat_range, lon_range = [-90.0, 90.0], [-180.0, 180.0]
+    chars, bits, bit_count, even = [], 0, 0, True
+    while len(chars) < precision:
+        # Bits alternate longitude, latitude, starting with longitude
+        value, window = (longitude, lon_range) if even else (latitude, lat_range)
+        middle = (window[0] + window[1]) / 2
+        bits <<= 1
+        if value >= middle:
+            bits |= 1
+            window[0] = middle
+        else:
+            window[1] = middle
+        even = not even
+        bit_count += 1
+        if bit_count == 5:
+            chars.append(BASE32[bits])
+            bits, bit_count = 0, 0
+    return ''.join(chars)
+
+
+def cell_size(precision):
+    """(height, width) in degrees of a geohash cell of the given length."""
+    lon_bits = (5 * precision + 1) // 2
+    lat_bits = 5 * precision // 2
+    return 180.0 / 2 ** lat_bits, 360.0 / 2 ** lon_bits
+
+
+def covering_cells(south, west, north, east, precision):
+    """The geohash cells of ``precision`` characters that together cover the box."""
+    height, width = cell_size(precision)
+    cells = []
+    row = math.floor((south + 90) / height)
+    while row * height - 90 <= north and row * height < 180:
+        column = math.floor((west + 180) / width)
+        while column * width - 180 <= east and column * width < 360:
+            cells.append(encode(row * height - 90 + height / 2, column * width - 180 + width / 2, precision))
+            column += 1
+        row += 1
+    return cells
+
+
+def cells_for_box(south, west, north, east):
+    """The longest-prefix covering that needs at most GEO_MAX_CELLS cells, or None if too coarse to help."""
+    for precision in range(HASH_PRECISION - 2, MIN_PRUNING_PRECISION - 1, -1):
+        height, width = cell_size(precision)
+        estimate = (math.floor((north + 90) / height) - math.floor((south + 90) / height) + 1) * \
+                   (math.floor((east + 180) / width) - math.floor((west + 180) / width) + 1)
+        if estimate <= settings.GEO_MAX_CELLS:
+            return covering_cells(south, west, north, east, precision)
+    return None
+
+
+def radius_box(latitude, longitude, radius_km):
+    """(south, west, north, east) of the box around a circle."""
+    dlat = radius_km / KM_PER_DEGREE_LAT
+    dlon = radius_km / (KM_PER_DEGREE_LAT * max(math.cos(math.radians(latitude)), 1e-6))
+    return (max(latitude - dlat, -90.0), max(longitude - dlon, -180.0),
+            min(latitude + dlat, 90.0), min(longitude + dlon, 180.0))
+
+
+def haversine_km(latitude, longitude, latitudes, longitudes):
+    """Great-circle distances from one point to arrays of points."""
+    import numpy as np
+
+    lat1, lon1 = math.radians(latitude), math.radians(longitude)
+    lat2, lon2 = np.radians(latitudes), np.radians(longitudes)
+    a = np.sin((lat2 - lat1) / 2) ** 2 + math.cos(lat1) * np.cos(lat2) * np.sin((lon2 - lon1) / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * np.arcsin(np.sqrt(np.minimum(a, 1.0)))
+
+
+def prefix_filter(cells):
+    # A prefix match as an index range: every base32 character sorts below '~'
+    return reduce(or_, (Q(geohash__gte=cell, geohash__lt=cell + '~') for cell in cells))
+
+
+def search(queryset, latitude, longitude, radius_km=None, box=None, sort_by_distance=False):
+    """
+    ``[(pk, distance_km)]`` for the apartments in ``queryset`` within
+    ``radius_km`` of the point, or inside ``box`` (south, west, north, east)
+    with distances measured from the point. Keeps the queryset's ordering
+    unless ``sort_by_distance``.
+    """
+    if box is None:
+        box = radius_box(latitude, longitude, radius_km)
+    south, west, north, east = box
+    candidates = queryset.filter(latitude__range=(south, north), longitude__range=(west, east))
+    cells = None
+    if (north - south) * KM_PER_DEGREE_LAT <= 2 * settings.GEO_PRUNING_MAX_RADIUS_KM:
+        cells = cells_for_box(south, west, north, east)
+    if cells:
+        # A subquery on the geohash index alone, so other indexed filters (status) don't drive the scan
+        in_cells = queryset.model.objects.filter(prefix_filter(cells))
+        candidates = candidates.filter(pk__in=in_cells.values('pk'))
+    candidates = list(candidates.values_list('pk', 'latitude', 'longitude'))
+    if not candidates:
+        return []
+    import numpy as np
+
+    pks, latitudes, longitudes = zip(*candidates)
+    distances = haversine_km(latitude, longitude, np.array(latitudes), np.array(longitudes))
+    keep = np.arange(len(pks))
+    if radius_km is not None:
+        keep = np.flatnonzero(distances <= radius_km)
+    if sort_by_distance:
+        keep = keep[np.argsort(distances[keep], kind='stable')]
+    # Converted in bulk: per-result indexing into the arrays dominated wide searches
+    return list(zip(np.array(pks)[keep].tolist(), distances[keep].tolist()))
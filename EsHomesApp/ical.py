@@ -0,0 +1,226 @@
+"""
+iCalendar export and import, for syncing availability with other channels.
+
+Export: ``render_feed()`` builds the .ics for one apartment from its
+confirmed bookings. The view caches the result under a version derived from
+the bookings table, so unchanged calendars are never rebuilt and polling
+clients get 304s.
+
+Import: ``sync_calendars()`` fetches every active ``ExternalCalendar``
+concurrently (network only, in a bounded thread pool) with conditional GET,
+then writes the parsed blocks from the calling thread.
+"""
+import hashlib
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, datetime, timedelta, timezone as dt_timezone
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Count, Max
+from django.utils import timezone
+
+from . import availability
+from .models import Booking, ExternalBlock, ExternalCalendar
+
+logger = logging.getLogger(__name__)
+
+PRODID = '-//ES Homes & Apartments//Bookings//EN'
+EXPORTED_STATUSES = ('confirmed', 'completed')
+
+
+def feed_bookings(apartment_id, today=None):
+    since = (today or timezone.localdate()) - timedelta(days=settings.ICAL_FEED_PAST_DAYS)
+    return Booking.objects.filter(
+        apartment_id=apartment_id,
+        status__in=EXPORTED_STATUSES,
+        check_out_date__gte=since,
+    )
+
+
+def feed_version(apartment_id):
+    """
+    Return ``(etag, last_modified)`` for an apartment's feed. The ETag changes
+    whenever a booking is added, edited or removed, and once a day as old
+    stays drop out of the window.
+    """
+    today = timezone.localdate()
+    stats = Booking.objects.filter(apartment_id=apartment_id).aggregate(
+        last_updated=Max('last_updated'), count=Count('id'),
+    )
+    last_updated = stats['last_updated']
+    raw = f"{apartment_id}:{last_updated and last_updated.isoformat()}:{stats['count']}:{today}"
+    return hashlib.md5(raw.encode()).hexdigest(), last_updated
+
+
+def render_feed(apartment, today=None):
+    lines = [
+        'BEGIN:VCALENDAR',
+        'VERSION:2.0',
+        f'PRODID:{PRODID}',
+        'CALSCALE:GREGORIAN',
+        'METHOD:PUBLISH',
+        f'X-WR-CALNAME:{_escape(apartment.name)}',
+    ]
+    bookings = feed_bookings(apartment.pk, today).order_by('check_in_date').values_list(
+        'pk', 'check_in_date', 'check_out_date', 'last_updated',
+    )
+    for pk, check_in_date, check_out_date, last_updated in bookings:
+        lines += [
+            'BEGIN:VEVENT',
+            f'UID:booking-{pk}@eshomes',
+            f'DTSTAMP:{last_updated.astimezone(dt_timezone.utc):%Y%m%dT%H%M%SZ}',
+            f'DTSTART;VALUE=DATE:{check_in_date:%Y%m%d}',
+            f'DTEND;VALUE=DATE:{check_out_date:%Y%m%d}',
+            # Never export guest details to other channels
+            'SUMMARY:Reserved',
+            'END:VEVENT',
+        ]
+    lines.append('END:VCALENDAR')
+    return ''.join(_fold(line) + '\r\n' for line in lines)
+
+
+def parse_events(text):
+    """Return ``[(uid, start_date, end_date, summary)]`` for the VEVENTs in an .ics document."""
+    events = []
+    event = None
+    for line in _unfold(text):
+        if line == 'BEGIN:VEVENT':
+            event = {}
+            continue
+        if line == 'END:VEVENT':
+            if event and 'DTSTART' in event:
+                start = event['DTSTART']
+                end = event.get('DTEND') or start + timedelta(days=1)
+                if end <= start:
+                    end = start + timedelta(days=1)
+                uid = event.get('UID') or f"{start:%Y%m%d}-{end:%Y%m%d}"
+                events.append((uid[:255], start, end, event.get('SUMMARY', '')[:200]))
+            event = None
+            continue
+        if event is None or ':' not in line:
+            continue
+        name_and_params, value = line.split(':', 1)
+        name = name_and_params.split(';', 1)[0].upper()
+        if name in ('DTSTART', 'DTEND'):
+            parsed = _parse_date(value)
+            if parsed:
+                event[name] = parsed
+        elif name in ('UID', 'SUMMARY'):
+            event[name] = _unescape(value)
+    return events
+
+
+def fetch_calendar(calendar):
+    """Conditional GET of one external feed. Touches the network only, not the DB."""
+    import requests
+
+    headers = {}
+    if calendar.etag:
+        headers['If-None-Match'] = calendar.etag
+    if calendar.last_modified:
+        headers['If-Modified-Since'] = calendar.last_modified
+    try:
+        response = requests.get(calendar.url, headers=headers, timeout=settings.ICAL_FETCH_TIMEOUT)
+    except requests.RequestException as exc:
+        return {'error': str(exc)}
+    if response.status_code == 304:
+        return {'not_modified': True}
+    if response.status_code != 200:
+        return {'error': f"HTTP {response.status_code}"}
+    return {
+        'text': response.text,
+        'etag': response.headers.get('ETag', ''),
+        'last_modified': response.headers.get('Last-Modified', ''),
+    }
+
+
+def apply_fetch_result(calendar, result):
+    now = timezone.now()
+    if 'error' in result:
+        logger.warning("Calendar sync failed for %s: %s", calendar, result['error'])
+        ExternalCalendar.objects.filter(pk=calendar.pk).update(last_error=result['error'])
+        return 'error'
+    if result.get('not_modified'):
+        ExternalCalendar.objects.filter(pk=calendar.pk).update(last_synced_at=now, last_error='')
+        return 'not modified'
+
+    events = parse_events(result['text'])
+    with transaction.atomic():
+        ExternalBlock.objects.filter(calendar=calendar).delete()
+        ExternalBlock.objects.bulk_create([
+            ExternalBlock(
+                calendar=calendar, apartment_id=calendar.apartment_id,
+                uid=uid, start_date=start, end_date=end, summary=summary,
+            )
+            for uid, start, end, summary in events
+        ])
+        ExternalCalendar.objects.filter(pk=calendar.pk).update(
+            etag=result['etag'][:255], last_modified=result['last_modified'][:100],
+            last_synced_at=now, last_error='',
+        )
+        availability.changed([calendar.apartment_id])
+    return 'updated'
+
+
+def sync_calendars(calendars=None):
+    """Sync the given (default: all active) calendars. Returns ``{calendar_pk: outcome}``."""
+    if calendars is None:
+        calendars = ExternalCalendar.objects.filter(active=True)
+    calendars = list(calendars)
+    if not calendars:
+        return {}
+    with ThreadPoolExecutor(max_workers=settings.ICAL_SYNC_WORKERS) as pool:
+        results = list(pool.map(fetch_calendar, calendars))
+    return {
+        calendar.pk: apply_fetch_result(calendar, result)
+        for calendar, result in zip(calendars, results)
+    }
+
+
+def _parse_date(value):
+    value = value.strip()
+    try:
+        day = date(int(value[0:4]), int(value[4:6]), int(value[6:8]))
+    except (ValueError, IndexError):
+        return None
+    if len(value) > 8 and value.endswith('Z'):
+        # A UTC timestamp: use the local calendar day it falls on
+        moment = datetime.strptime(value, '%Y%m%dT%H%M%SZ').replace(tzinfo=dt_timezone.utc)
+        day = timezone.localdate(moment)
+    return day
+
+
+def _unfold(text):
+    lines = []
+    for raw in text.replace('\r\n', '\n').replace('\r', '\n').split('\n'):
+        if raw[:1] in (' ', '\t') and lines:
+            lines[-1] += raw[1:]
+        elif raw:
+            lines.append(raw)
+    return lines
+
+
+def _fold(line):
+    # RFC 5545: lines longer than 75 octets continue on the next line after a space
+    encoded = line.encode('utf-8')
+    if len(encoded) <= 75:
+        return line
+    parts = []
+    while len(encoded) > 75:
+        cut = 75 if not parts else 74
+        # Don't split a multi-byte character
+        while cut and (encoded[cut] & 0xC0) == 0x80:
+            cut -= 1
+        parts.append(encoded[:cut].decode('utf-8'))
+        encoded = encoded[cut:]
+    parts.append(encoded.decode('utf-8'))
+    return '\r\n '.join(parts)
+
+
+def _escape(text):
+    return text.replace('\\', '\\\\').replace(';', '\\;').replace(',', '\\,').replace('\n', '\\n')
+
+
+def _unescape(text):
+    return text.replace('\\n', '\n').replace('\\N', '\n').replace('\\,', ',').replace('\\;', ';').replace('\\\\', '\\')
@@ -0,0 +1,304 @@
+"""
+A small DB-backed job queue.
+
+Jobs are rows in the ``Job`` table, so there is no broker to run: request
+handlers call ``some_task.delay(...)`` and ``manage.py runworker`` executes
+them in a thread pool, one pool per queue.
+
+    from EsHomesApp.jobs import task
+
+    @task(queue='emails', max_attempts=3)
+    def send_receipt(booking_id):
+        ...
+
+    @task(every=timedelta(minutes=5))
+    def sweep_something():
+        ...
+
+    send_receipt.delay(booking.id)
+    send_receipt.schedule(delay=timedelta(hours=1), args=[booking.id])
+
+Tasks live in ``<app>/tasks.py`` modules, which the worker imports on start.
+
+A running job is locked by its worker, which refreshes the lock every
+JOB_HEARTBEAT_INTERVAL; a job whose lock goes JOB_LOCK_TIMEOUT without a
+refresh belonged to a worker that died, and is queued again. However long a
+task takes, it isn't run twice while its worker is alive.
+"""
+import logging
+import os
+import random
+import socket
+import threading
+import time
+import traceback
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import IntegrityError, close_old_connections, connections, transaction
+from django.db.models import F
+from django.utils import timezone
+from django.utils.module_loading import autodiscover_modules
+
+from .models import Job
+
+logger = logging.getLogger(__name__)
+
+_registry = {}
+
+
+class Task:
+    def __init__(self, func, name, queue, max_attempts, every):
+        self.func = func
+        self.name = name
+        self.queue = queue
+        self.max_attempts = max_attempts
+        self.every = every
+
+    def __call__(self, *args, **kwargs):
+        return self.func(*args, **kwargs)
+
+    def delay(self, *args, **kwargs):
+        """Queue the task to run as soon as a worker is free."""
+        return enqueue(self.name, args=args, kwargs=kwargs)
+
+    def schedule(self, run_at=None, delay=None, args=(), kwargs=None, unique_key=None):
+        """Queue the task for later. ``unique_key`` drops duplicates that haven't started yet."""
+        if run_at is None:
+            run_at = timezone.now() + (delay or timedelta(0))
+        return enqueue(self.name, args=args, kwargs=kwargs, run_at=run_at, unique_key=unique_key)
+
+
+def task(func=None, *, name=None, queue='default', max_attempts=5, every=None):
+    """Register a function as a background task. ``every`` makes it periodic."""
+    def decorator(func):
+        task_name = name or f"{func.__module__}.{func.__name__}"
+        registered = Task(func, task_name, queue, max_attempts, every)
+        _registry[task_name] = registered
+        return registered
+
+    if func is not None:
+        return decorator(func)
+    return decorator
+
+
+def get_task(name):
+    return _registry.get(name)
+
+
+def enqueue(task_name, args=(), kwargs=None, run_at=None, queue=None, unique_key=None):
+    registered = _registry.get(task_name)
+    if registered is None:
+        raise LookupError(f"No task registered as {task_name!r}")
+
+    if unique_key:
+        existing = Job.objects.filter(unique_key=unique_key, status='queued').first()
+        if existing:
+            return existing
+        # A running job may already have read what this one is for, so it
+        # doesn't count; it releases the key, like a finished one. A periodic
+        # job keeps its key for good.
+        Job.objects.filter(unique_key=unique_key, interval__isnull=True).exclude(status='queued').update(
+            unique_key=None,
+        )
+
+    try:
+        # In a savepoint: losing the race below mustn't break the caller's transaction
+        with transaction.atomic():
+            return Job.objects.create(
+                task=task_name,
+                queue=queue or registered.queue,
+                args=list(args),
+                kwargs=kwargs or {},
+                run_at=run_at or timezone.now(),
+                max_attempts=registered.max_attempts,
+                unique_key=unique_key,
+            )
+    except IntegrityError:
+        # Someone else queued it between the check and the insert
+        existing = Job.objects.filter(unique_key=unique_key).first() if unique_key else None
+        if existing is None:
+            raise
+        return existing
+
+
+def schedule_periodic():
+    """Make sure every periodic task has its (single) row in the queue."""
+    for registered in _registry.values():
+        if registered.every is None:
+            continue
+        job, created = Job.objects.get_or_create(
+            unique_key=f"periodic:{registered.name}",
+            defaults={
+                'task': registered.name,
+                'queue': registered.queue,
+                'interval': registered.every,
+                'max_attempts': registered.max_attempts,
+            },
+        )
+        if not created and (job.interval != registered.every or job.queue != registered.queue):
+            Job.objects.filter(pk=job.pk).update(interval=registered.every, queue=registered.queue)
+
+
+def retry_delay(attempts):
+    """Exponential backoff with jitter: base * 2^(attempts - 1), capped."""
+    base = settings.JOB_RETRY_BACKOFF
+    delay = min(base * (2 ** (attempts - 1)), settings.JOB_RETRY_BACKOFF_MAX)
+    return timedelta(seconds=delay * random.uniform(0.8, 1.2))
+
+
+class Worker:
+    """
+    Polls the Job table and runs due jobs. Each queue gets its own thread
+    pool sized from ``settings.JOB_QUEUES``, so a backlog of slow jobs in one
+    queue cannot starve another. Limits apply per worker process.
+    """
+
+    def __init__(self, queues=None, poll_interval=None):
+        limits = settings.JOB_QUEUES
+        if queues:
+            limits = {queue: limits.get(queue, 1) for queue in queues}
+        self.limits = limits
+        self.poll_interval = poll_interval or settings.JOB_POLL_INTERVAL
+        self.name = f"{socket.gethostname()}:{os.getpid()}"
+        self.pools = {
+            queue: ThreadPoolExecutor(max_workers=limit, thread_name_prefix=f"job-{queue}")
+            for queue, limit in limits.items()
+        }
+        self.in_flight = {queue: 0 for queue in limits}
+        self.running = set()
+        self._beat_at = None
+        self._lock = threading.Lock()
+        self._stopping = threading.Event()
+
+    def stop(self):
+        self._stopping.set()
+
+    def run(self, burst=False):
+        """Run until ``stop()`` is called, or until the queues are drained if ``burst``."""
+        autodiscover_modules('tasks')
+        schedule_periodic()
+        logger.info("Worker %s started, queues: %s", self.name, self.limits)
+        try:
+            while not self._stopping.is_set():
+                self.heartbeat()
+                self.requeue_stale()
+                claimed = self.claim_and_submit()
+                if burst and not claimed and not any(self.in_flight.values()):
+                    break
+                if not claimed:
+                    self._stopping.wait(self.poll_interval)
+        finally:
+            for pool in self.pools.values():
+                pool.shutdown(wait=True)
+            connections.close_all()
+            logger.info("Worker %s stopped", self.name)
+
+    def heartbeat(self):
+        """Refresh the lock on this worker's running jobs, at most every JOB_HEARTBEAT_INTERVAL."""
+        if self._beat_at is not None and time.monotonic() - self._beat_at < settings.JOB_HEARTBEAT_INTERVAL:
+            return
+        self._beat_at = time.monotonic()
+        with self._lock:
+            running = list(self.running)
+        if running:
+            Job.objects.filter(pk__in=running, status='running', locked_by=self.name).update(
+                locked_at=timezone.now(),
+            )
+
+    def requeue_stale(self):
+        # Jobs left 'running' by a worker that died (no heartbeat) are handed out again
+        cutoff = timezone.now() - timedelta(seconds=settings.JOB_LOCK_TIMEOUT)
+        Job.objects.filter(status='running', locked_at__lt=cutoff).update(
+            status='queued', locked_by='', locked_at=None,
+        )
+
+    def claim_and_submit(self):
+        claimed = 0
+        for queue, limit in self.limits.items():
+            with self._lock:
+                free = limit - self.in_flight[queue]
+            if free <= 0:
+                continue
+            for job_id in self.claim(queue, free):
+                with self._lock:
+                    self.in_flight[queue] += 1
+                    self.running.add(job_id)
+                self.pools[queue].submit(self._execute, queue, job_id)
+                claimed += 1
+        return claimed
+
+    def claim(self, queue, count):
+        now = timezone.now()
+        candidates = list(
+            Job.objects.filter(queue=queue, status='queued', run_at__lte=now)
+            .order_by('run_at')
+            .values_list('pk', flat=True)[:count]
+        )
+        claimed = []
+        for job_id in candidates:
+            # The conditional UPDATE is the lock: only one worker sees rowcount 1
+            won = Job.objects.filter(pk=job_id, status='queued').update(
+                status='running', locked_by=self.name, locked_at=now, attempts=F('attempts') + 1,
+            )
+            if won:
+                claimed.append(job_id)
+        return claimed
+
+    def _execute(self, queue, job_id):
+        close_old_connections()
+        try:
+            job = Job.objects.get(pk=job_id)
+            self.run_job(job)
+        except Exception:
+            logger.exception("Worker failed to record the outcome of job %s", job_id)
+        finally:
+            with self._lock:
+                self.in_flight[queue] -= 1
+                self.running.discard(job_id)
+            connections.close_all()
+
+    def run_job(self, job):
+        registered = _registry.get(job.task)
+        started = time.monotonic()
+        try:
+            if registered is None:
+                raise LookupError(f"No task registered as {job.task!r}")
+            registered.func(*job.args, **job.kwargs)
+        except Exception:
+            self._failed(job, traceback.format_exc())
+        else:
+            self._succeeded(job)
+        logger.info("Job %s %s finished in %.3fs", job.pk, job.task, time.monotonic() - started)
+
+    def _succeeded(self, job):
+        now = timezone.now()
+        if job.interval:
+            Job.objects.filter(pk=job.pk).update(
+                status='queued', run_at=now + job.interval, attempts=0,
+                locked_by='', locked_at=None, last_error='', finished_at=now,
+            )
+        else:
+            Job.objects.filter(pk=job.pk).update(
+                status='succeeded', locked_by='', locked_at=None, finished_at=now,
+            )
+
+    def _failed(self, job, error):
+        now = timezone.now()
+        logger.warning("Job %s %s failed (attempt %s/%s)", job.pk, job.task, job.attempts, job.max_attempts)
+        if job.attempts < job.max_attempts:
+            Job.objects.filter(pk=job.pk).update(
+                status='queued', run_at=now + retry_delay(job.attempts),
+                locked_by='', locked_at=None, last_error=error,
+            )
+        elif job.interval:
+            # Periodic jobs never give up, they wait for their next slot
+            Job.objects.filter(pk=job.pk).update(
+                status='queued', run_at=now + job.interval, attempts=0,
+                locked_by='', locked_at=None, last_error=error, finished_at=now,
+            )
+        else:
+            Job.objects.filter(pk=job.pk).update(
+                status='failed', locked_by='', locked_at=None, last_error=error, finished_at=now,
+            )
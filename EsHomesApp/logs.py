@@ -0,0 +1,200 @@
+"""
+Structured logging that never makes a request wait for log I/O.
+
+``QueuedJsonHandler`` (wired up in settings.LOGGING) only puts records on an
+in-memory queue. A ``QueueListener`` thread takes them off, renders each as
+one JSON line and writes it to stderr or LOG_FILE. The listener is started
+lazily in every process that logs, so it also works under servers that
+import the app and then fork workers.
+
+Every line carries the request ID and view name of the request that logged
+it (set by ``RequestLogMiddleware`` and copied onto records by
+``RequestContextFilter``) plus whatever the caller passed as ``extra``:
+
+    logger.info("Booking created", extra={'booking_id': booking.pk, 'tx_ref': tx_ref})
+
+Values whose key is in LOG_REDACT_FIELDS are replaced with "[redacted]",
+however deeply they are nested. ``SamplingFilter`` keeps only a fraction
+(LOG_SAMPLE_RATES, by logger name) of the INFO and DEBUG records of
+high-volume loggers; warnings and errors are always kept.
+
+``RequestLogMiddleware`` logs one record per request to
+``EsHomesApp.requests``: method, path, view, status and duration in ms.
+Slow (LOG_SLOW_REQUEST_MS) and failed requests are logged as warnings, so
+they survive sampling.
+"""
+import atexit
+import contextvars
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import random
+import sys
+import threading
+import time
+import uuid
+from datetime import datetime, timezone
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+
+request_logger = logging.getLogger('EsHomesApp.requests')
+
+request_id = contextvars.ContextVar('request_id', default=None)
+view_name = contextvars.ContextVar('view_name', default=None)
+
+REDACTED = '[redacted]'
+
+# Attributes every LogRecord has; anything else on a record came from ``extra``
+_RECORD_ATTRS = set(vars(logging.LogRecord('', 0, '', 0, '', None, None))) | {'message', 'asctime', 'taskName'}
+
+
+def redact(value, fields=None):
+    fields = settings.LOG_REDACT_FIELDS if fields is None else fields
+    if isinstance(value, dict):
+        return {
+            key: REDACTED if str(key).lower() in fields else redact(item, fields)
+            for key, item in value.items()
+        }
+    if isinstance(value, (list, tuple)):
+        return [redact(item, fields) for item in value]
+    return value
+
+
+class JsonFormatter(logging.Formatter):
+    def format(self, record):
+        entry = {
+            'time': datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec='milliseconds'),
+            'level': record.levelname,
+            'logger': record.name,
+            'message': record.getMessage(),
+        }
+        entry.update(redact({key: value for key, value in vars(record).items() if key not in _RECORD_ATTRS}))
+        if record.exc_info:
+            entry['exception'] = self.formatException(record.exc_info)
+        elif record.exc_text:
+            entry['exception'] = record.exc_text
+        return json.dumps(entry, default=str)
+
+
+class RequestContextFilter(logging.Filter):
+    """Stamp records with the current request's ID and view (in the logging thread, before queueing)."""
+    def filter(self, record):
+        if not hasattr(record, 'request_id'):
+            record.request_id = request_id.get()
+        if not hasattr(record, 'view'):
+            record.view = view_name.get()
+        return True
+
+
+class SamplingFilter(logging.Filter):
+    def filter(self, record):
+        if record.levelno >= logging.WARNING:
+            return True
+        rate = settings.LOG_SAMPLE_RATES.get(record.name, 1.0)
+        return rate >= 1.0 or random.random() < rate
+
+
+class QueuedJsonHandler(logging.handlers.QueueHandler):
+    """Queue records for a background thread that writes them as JSON lines to ``filename`` (default stderr)."""
+
+    def __init__(self, filename=None):
+        super().__init__(queue.SimpleQueue())
+        self.filename = filename
+        self.listener = None
+        self._listener_pid = None
+        self._start_lock = threading.Lock()
+
+    def prepare(self, record):
+        # Resolve the message and traceback now, while the arguments are
+        # still what they were, but leave the JSON rendering to the listener
+        record = logging.makeLogRecord(vars(record))
+        record.msg, record.args = record.getMessage(), None
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+    def enqueue(self, record):
+        if self._listener_pid != os.getpid():
+            self._start_listener()
+        super().enqueue(record)
+
+    def _start_listener(self):
+        with self._start_lock:
+            if self._listener_pid == os.getpid():
+                return
+            # A forked child inherits the handler but not the parent's thread
+            if self.filename:
+                target = logging.FileHandler(self.filename, encoding='utf-8')
+            else:
+                target = logging.StreamHandler(sys.stderr)
+            target.setFormatter(JsonFormatter())
+            self.listener = logging.handlers.QueueListener(self.queue, target)
+            self.listener.start()
+            self._listener_pid = os.getpid()
+            atexit.register(self.flush_and_stop)
+
+    def flush_and_stop(self):
+        """Write out whatever is still queued and stop the listener thread."""
+        with self._start_lock:
+            if self.listener is not None and self._listener_pid == os.getpid():
+                self.listener.stop()
+                for handler in self.listener.handlers:
+                    handler.close()
+            self.listener = self._listener_pid = None
+
+
+class RequestLogMiddleware:
+    """Give each request an ID (echoed as X-Request-ID) and log its outcome and duration."""
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        started = self.start(request)
+        return self.finish(request, self.get_response(request), started)
+
+    async def __acall__(self, request):
+        started = self.start(request)
+        return self.finish(request, await self.get_response(request), started)
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        view_name.set(request.resolver_match.view_name if request.resolver_match else None)
+
+    def start(self, request):
+        # Trust an ID from the proxy in front of us, if it sent a sane one
+        incoming = request.headers.get('X-Request-ID', '')
+        request.request_id = incoming if 0 < len(incoming) <= 64 and incoming.isprintable() else uuid.uuid4().hex
+        # Not reset on the way out: Django logs error responses after the
+        # middleware has returned. The next request on the thread replaces it
+        # (and under ASGI every request runs in a context of its own).
+        request_id.set(request.request_id)
+        view_name.set(None)
+        return time.perf_counter()
+
+    def finish(self, request, response, started):
+        duration_ms = round((time.perf_counter() - started) * 1000, 2)
+        slow = duration_ms >= settings.LOG_SLOW_REQUEST_MS
+        request_logger.log(
+            logging.WARNING if slow or response.status_code >= 500 else logging.INFO,
+            "%s %s %s", request.method, request.path, response.status_code,
+            extra={
+                'request_id': request.request_id,
+                'view': request.resolver_match.view_name if request.resolver_match else None,
+                'method': request.method,
+                'path': request.path,
+                'status': response.status_code,
+                'duration_ms': duration_ms,
+            },
+        )
+        response['X-Request-ID'] = request.request_id
+        return response
@@ -0,0 +1,109 @@
+"""Helpers shared by the bench_* and loadtest commands."""
+import os
+import socket
+import subprocess
+import sys
+import time
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.db import connections
+
+SERVER_SETTINGS_TEMPLATE = """\
+from EsHomesProject.settings import *
+
+DEBUG = False
+DATABASES['default']['NAME'] = {db!r}
+FLUTTERWAVE_API_URL = {gateway!r}
+ASYNC_VIEWS = {async_views!r}
+RATE_LIMIT_ENABLED = False
+STORAGES['staticfiles'] = {{'BACKEND': 'django.contrib.staticfiles.storage.StaticFilesStorage'}}
+LOGGING['handlers']['json']['filename'] = {log_file!r}
+"""
+
+
+@contextmanager
+def scratch_database(path):
+    """Point the default connection at a freshly migrated SQLite file for the duration."""
+    connection = connections['default']
+    original = connection.settings_dict['NAME']
+    connection.close()
+    connection.settings_dict['NAME'] = str(path)
+    try:
+        call_command('migrate', verbosity=0)
+        yield connection
+    finally:
+        connection.close()
+        connection.settings_dict['NAME'] = original
+
+
+def percentile(values, fraction):
+    if not values:
+        return 0.0
+    values = sorted(values)
+    return values[min(len(values) - 1, int(fraction * len(values)))]
+
+
+def best_of(func, repeat):
+    """Fastest of ``repeat`` calls in seconds, and the last result."""
+    best, result = float('inf'), None
+    for _ in range(repeat):
+        started = time.perf_counter()
+        result = func()
+        best = min(best, time.perf_counter() - started)
+    return best, result
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def start_server(kind, port, workdir, settings_module, workers=1, threads=8):
+    """
+    Serve the site from a subprocess: uvicorn for ``kind`` 'asgi', gunicorn
+    (gthread) for 'wsgi'. ``settings_module`` must be importable from ``workdir``.
+    """
+    env = dict(
+        os.environ,
+        DJANGO_SETTINGS_MODULE=settings_module,
+        PYTHONPATH=os.pathsep.join([workdir, str(settings.BASE_DIR)]),
+    )
+    if kind == 'asgi':
+        command = [
+            sys.executable, '-m', 'uvicorn', 'EsHomesProject.asgi:application',
+            '--host', '127.0.0.1', '--port', str(port), '--workers', str(workers),
+            '--log-level', 'warning', '--no-access-log',
+        ]
+    else:
+        command = [
+            sys.executable, '-m', 'gunicorn', 'EsHomesProject.wsgi:application',
+            '--bind', f'127.0.0.1:{port}', '--workers', str(workers),
+            '--worker-class', 'gthread', '--threads', str(threads),
+            '--log-level', 'warning', '--preload',
+        ]
+    return subprocess.Popen(command, cwd=settings.BASE_DIR, env=env)
+
+
+def wait_ready(kind, port, process, timeout=30):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise CommandError(f'{kind} server exited with status {process.returncode}')
+        try:
+            socket.create_connection(('127.0.0.1', port), timeout=1).close()
+            return
+        except OSError:
+            time.sleep(0.2)
+    raise CommandError(f'{kind} server did not start listening on port {port}')
+
+
+def stop_server(process):
+    process.terminate()
+    try:
+        process.wait(10)
+    except subprocess.TimeoutExpired:
+        process.kill()
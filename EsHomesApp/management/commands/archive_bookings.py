@@ -0,0 +1,17 @@
+from django.core.management.base import BaseCommand
+
+from EsHomesApp import archive
+
+
+class Command(BaseCommand):
+    help = "Move completed and cancelled bookings past the retention window, with their transactions, to the archive."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--limit', type=int, help='Archive at most this many bookings')
+
+    def handle(self, *args, **options):
+        report = archive.archive(limit=options['limit'])
+        self.stdout.write(
+            f"{report['bookings']} booking(s), {report['transactions']} transaction(s) and "
+            f"{report['reviews']} review link(s) archived in {report['seconds']:.1f}s."
+        )
@@ -0,0 +1,97 @@
+import os
+import random
+import shutil
+import tempfile
+from decimal import Decimal
+
+from django.core.management.base import BaseCommand
+from django.db.models import Count, Q
+
+from EsHomesApp.models import Amenity, Apartment, amenity_mask
+
+from ._bench import best_of, scratch_database
+
+
+class Command(BaseCommand):
+    help = (
+        "Compare the amenity_mask filter against join-based amenity filtering "
+        "(one join per amenity, GROUP BY/HAVING, join + DISTINCT) on a scratch SQLite database."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--apartments', type=int, default=20000)
+        parser.add_argument('--amenities', type=int, default=24)
+        parser.add_argument('--per-apartment', type=int, default=8, help='Amenities per apartment (on average)')
+        parser.add_argument('--repeat', type=int, default=5, help='Runs per query, the fastest is reported')
+        parser.add_argument('--seed', type=int, default=42)
+
+    def handle(self, *args, **options):
+        workdir = tempfile.mkdtemp(prefix='bench_amenities_')
+        try:
+            with scratch_database(os.path.join(workdir, 'bench.sqlite3')):
+                amenities = self._seed(options)
+                self._run(amenities, options['repeat'])
+        finally:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+    def _seed(self, options):
+        rng = random.Random(options['seed'])
+        amenities = Amenity.objects.bulk_create([
+            Amenity(name=f'Amenity {bit}', slug=f'amenity-{bit}', icon='fas fa-check', bit=bit)
+            for bit in range(options['amenities'])
+        ])
+        # Some amenities are common (wifi), some rare (pool)
+        weights = [1 / (rank + 1) for rank in range(len(amenities))]
+        Through = Apartment.amenities.through
+        apartments, links = [], []
+        for i in range(options['apartments']):
+            count = max(1, min(len(amenities), int(rng.gauss(options['per_apartment'], 2))))
+            chosen = set()
+            while len(chosen) < count:
+                chosen.add(rng.choices(range(len(amenities)), weights)[0])
+            apartments.append(Apartment(
+                name=f'Bench Apartment {i}', apartment_type='studio', description='Benchmark apartment.',
+                price_per_night=Decimal(50000 + 10000 * (i % 20)), size_sqft=500, max_occupancy=4,
+                bedrooms=1 + i % 4, bathrooms=Decimal('1.0'), amenity_mask=amenity_mask(chosen),
+            ))
+            links.append(chosen)
+        apartments = Apartment.objects.bulk_create(apartments, batch_size=2000)
+        Through.objects.bulk_create(
+            [Through(apartment_id=apartment.pk, amenity_id=amenities[bit].pk)
+             for apartment, chosen in zip(apartments, links) for bit in chosen],
+            batch_size=5000,
+        )
+        self.stdout.write(
+            f"{len(apartments)} apartments, {len(amenities)} amenities, "
+            f"{Through.objects.count()} apartment-amenity rows\n"
+        )
+        return amenities
+
+    def _run(self, amenities, repeat):
+        base = Apartment.objects.filter(status='available')
+        # Common, mid and rare amenities
+        selections = [amenities[:2], amenities[:4], [amenities[0], amenities[5], amenities[12]]]
+
+        self.stdout.write(f"{'amenities':<14}{'match':<6}{'approach':<22}{'count ms':>10}{'page ms':>10}{'matches':>9}")
+        for selected in selections:
+            ids = [amenity.pk for amenity in selected]
+            mask = amenity_mask(amenity.bit for amenity in selected)
+            label = ','.join(str(amenity.bit) for amenity in selected)
+
+            chained = base
+            for pk in ids:
+                chained = chained.filter(amenities=pk)
+            approaches = [
+                ('all', 'bitmask', base.with_amenities(mask)),
+                ('all', 'join per amenity', chained),
+                ('all', 'group by / having', base.filter(amenities__in=ids).annotate(
+                    matched=Count('amenities', filter=Q(amenities__in=ids))).filter(matched=len(ids))),
+                ('any', 'bitmask', base.with_amenities(mask, match='any')),
+                ('any', 'join + distinct', base.filter(amenities__in=ids).distinct()),
+            ]
+            for match, approach, queryset in approaches:
+                count_time, matches = best_of(queryset.count, repeat)
+                page_time, _ = best_of(lambda: list(queryset[:6]), repeat)
+                self.stdout.write(
+                    f"{label:<14}{match:<6}{approach:<22}{count_time * 1000:>10.2f}{page_time * 1000:>10.2f}{matches:>9}"
+                )
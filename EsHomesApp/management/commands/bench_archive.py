@@ -0,0 +1,120 @@
+import os
+import random
+import shutil
+import tempfile
+from datetime import timedelta
+from decimal import Decimal
+
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.utils import timezone
+
+from EsHomesApp import archive
+from EsHomesApp.availability import booked_nights, is_available
+from EsHomesApp.models import Apartment, Booking, CustomUser, Transaction
+
+from ._bench import best_of, scratch_database
+
+
+class Command(BaseCommand):
+    help = (
+        "Time the hot-path booking queries (overlap checks, calendars, the hold "
+        "sweep, the admin changelist, a guest's history) on years of booking "
+        "history, before and after archiving it."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--apartments', type=int, default=200)
+        parser.add_argument('--years', type=int, default=5, help='Years of back-to-back stays per apartment')
+        parser.add_argument('--guests', type=int, default=2000)
+        parser.add_argument('--repeat', type=int, default=50, help='Runs per query; the fastest is reported')
+        parser.add_argument('--seed', type=int, default=3)
+
+    def handle(self, *args, **options):
+        workdir = tempfile.mkdtemp(prefix='bench_archive_')
+        try:
+            with scratch_database(os.path.join(workdir, 'bench.sqlite3')):
+                apartment_ids, guest_ids = self._seed(options)
+                self.stdout.write(f"{Booking.objects.count()} bookings, {Transaction.objects.count()} transactions\n")
+                before = self._measure(apartment_ids, guest_ids, options)
+
+                report = archive.archive()
+                connection.cursor().execute('ANALYZE')
+                self.stdout.write(
+                    f"Archived {report['bookings']} bookings and {report['transactions']} transactions in "
+                    f"{report['seconds']:.1f}s ({report['bookings'] / report['seconds']:.0f} bookings/s); "
+                    f"{Booking.objects.count()} bookings left\n"
+                )
+                after = self._measure(apartment_ids, guest_ids, options)
+
+                self.stdout.write(f"{'query':<34}{'before ms':>11}{'after ms':>10}{'speed-up':>10}")
+                for name in before:
+                    self.stdout.write(
+                        f"{name:<34}{before[name] * 1000:>11.3f}{after[name] * 1000:>10.3f}"
+                        f"{before[name] / after[name]:>9.1f}x"
+                    )
+        finally:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+    def _seed(self, options):
+        rng = random.Random(options['seed'])
+        guests = CustomUser.objects.bulk_create([
+            CustomUser(username=f'guest{i}', email=f'guest{i}@example.com', phone_number=f'guest{i}')
+            for i in range(options['guests'])
+        ])
+        apartments = Apartment.objects.bulk_create([
+            Apartment(name=f'Bench Apartment {i}', apartment_type='studio', description='Benchmark apartment.',
+                      price_per_night=Decimal('100.00'), size_sqft=500, max_occupancy=4, bedrooms=1,
+                      bathrooms=Decimal('1.0'))
+            for i in range(options['apartments'])
+        ])
+        today = timezone.localdate()
+        for apartment in apartments:
+            bookings, day = [], today - timedelta(days=365 * options['years'])
+            # Back-to-back stays up to a couple of months ahead
+            while day < today + timedelta(days=60):
+                nights = rng.randint(1, 6)
+                if day + timedelta(days=nights) < today:
+                    status = rng.choices(['completed', 'cancelled'], [85, 15])[0]
+                else:
+                    status = rng.choices(['confirmed', 'pending'], [90, 10])[0]
+                bookings.append(Booking(
+                    user=rng.choice(guests), apartment=apartment, check_in_date=day,
+                    check_out_date=day + timedelta(days=nights), guests=2, total_price=Decimal(100 * nights),
+                    status=status,
+                ))
+                day += timedelta(days=nights + rng.randint(0, 2))
+            Booking.objects.bulk_create(bookings)
+            Transaction.objects.bulk_create([
+                Transaction(user_id=booking.user_id, booking=booking, amount=booking.total_price,
+                            tx_ref=f'BENCH-{booking.pk}',
+                            transaction_status='declined' if booking.status == 'cancelled' else 'completed')
+                for booking in bookings
+            ])
+        # Spread booking dates out the way they'd really be: a few weeks before check-in
+        connection.cursor().execute(
+            "UPDATE EsHomesApp_booking SET booking_date = datetime(check_in_date, '-21 days'), "
+            "last_updated = datetime(check_out_date)"
+        )
+        connection.cursor().execute('ANALYZE')
+        return [apartment.pk for apartment in apartments], [guest.pk for guest in guests]
+
+    def _measure(self, apartment_ids, guest_ids, options):
+        today = timezone.localdate()
+        rng = random.Random(options['seed'])
+        apartments = [rng.choice(apartment_ids) for _ in range(options['repeat'])]
+        guests = iter([rng.choice(guest_ids) for _ in range(options['repeat'] * 10)])
+        stay = (today + timedelta(days=30), today + timedelta(days=33))
+        queries = {
+            'overlap check (is_available)': lambda: [is_available(pk, *stay) for pk in apartments[:10]],
+            'calendar, 3 months x 10 flats': lambda: booked_nights(apartments[:10], today, today + timedelta(days=90)),
+            'expired hold sweep': lambda: list(
+                Booking.objects.expired_holds().order_by('booking_date').values_list('pk', 'apartment_id')[:500]
+            ),
+            'admin changelist, page 1 + count': lambda: (
+                Booking.objects.count(),
+                list(Booking.objects.select_related('user', 'apartment').order_by('-booking_date', '-pk')[:100]),
+            ),
+            'guest booking history': lambda: archive.booking_history(CustomUser(pk=next(guests))),
+        }
+        return {name: best_of(query, options['repeat'])[0] for name, query in queries.items()}
@@ -0,0 +1,155 @@
+import asyncio
+import itertools
+import logging
+import os
+import shutil
+import tempfile
+import time
+from datetime import timedelta
+from decimal import Decimal
+from importlib.util import find_spec
+
+import httpx
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+
+from EsHomesApp.fake_flutterwave import FakeFlutterwave
+from EsHomesApp.models import Apartment, Booking, CustomUser, Transaction
+
+from ._bench import (
+    SERVER_SETTINGS_TEMPLATE, free_port, percentile, scratch_database, start_server, stop_server, wait_ready,
+)
+
+class Command(BaseCommand):
+    help = (
+        "Run the site under uvicorn (ASGI, async views) and gunicorn (WSGI, sync "
+        "views) side by side against a slow fake Flutterwave, and compare "
+        "throughput and latency of payment callbacks and page views."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--gateway-latency', type=float, default=0.5, help='Seconds the fake gateway takes to verify')
+        parser.add_argument('--duration', type=float, default=10, help='Seconds of load per server')
+        parser.add_argument('--callback-clients', type=int, default=32, help='Concurrent payment callback clients')
+        parser.add_argument('--browse-clients', type=int, default=8, help='Concurrent page view clients')
+        parser.add_argument('--workers', type=int, default=1, help='Server processes for each server')
+        parser.add_argument('--threads', type=int, default=8, help='Threads per gunicorn worker')
+        parser.add_argument('--apartments', type=int, default=30)
+        parser.add_argument('--transactions', type=int, default=5000, help='Pending payments to call back for')
+
+    def handle(self, *args, **options):
+        for module in ('uvicorn', 'gunicorn'):
+            if find_spec(module) is None:
+                raise CommandError(f'{module} is required: pip install uvicorn gunicorn')
+
+        # httpx logs every request at INFO
+        logging.getLogger('httpx').setLevel(logging.WARNING)
+        workdir = tempfile.mkdtemp(prefix='bench_asgi_')
+        servers = []
+        try:
+            with FakeFlutterwave(latency=options['gateway_latency']) as gateway:
+                seed_db = os.path.join(workdir, 'seed.sqlite3')
+                apartment_ids, charges = self._seed(seed_db, options['apartments'], options['transactions'])
+                for flw_id, amount, tx_ref in charges:
+                    gateway.charge(flw_id, amount=amount, tx_ref=tx_ref)
+
+                for kind, async_views in (('asgi', True), ('wsgi', False)):
+                    db = os.path.join(workdir, f'{kind}.sqlite3')
+                    shutil.copyfile(seed_db, db)
+                    with open(os.path.join(workdir, f'bench_{kind}_settings.py'), 'w') as f:
+                        f.write(SERVER_SETTINGS_TEMPLATE.format(
+                            db=db, gateway=gateway.url, async_views=async_views,
+                            log_file=os.path.join(workdir, f'{kind}.log'),
+                        ))
+                    port = free_port()
+                    servers.append((kind, port, start_server(
+                        kind, port, workdir, f'bench_{kind}_settings', options['workers'], options['threads'],
+                    )))
+                for kind, port, process in servers:
+                    wait_ready(kind, port, process)
+
+                self.stdout.write(
+                    f"gateway latency {options['gateway_latency']}s, {options['duration']}s per server, "
+                    f"{options['callback_clients']} callback + {options['browse_clients']} browse clients, "
+                    f"{options['workers']} worker(s), gunicorn threads {options['threads']}\n"
+                )
+                self.stdout.write(f"{'server':<8}{'step':<10}{'requests':>10}{'req/s':>10}{'p50 ms':>10}{'p99 ms':>10}{'errors':>8}")
+                # One server at a time so they don't compete for CPU
+                for kind, port, process in servers:
+                    results = asyncio.run(self._load(f'http://127.0.0.1:{port}', apartment_ids, charges, options))
+                    for step, (latencies, errors) in results.items():
+                        self.stdout.write(
+                            f"{kind:<8}{step:<10}{len(latencies):>10}{len(latencies) / options['duration']:>10.1f}"
+                            f"{percentile(latencies, 0.50) * 1000:>10.0f}{percentile(latencies, 0.99) * 1000:>10.0f}{errors:>8}"
+                        )
+        finally:
+            for kind, port, process in servers:
+                stop_server(process)
+            shutil.rmtree(workdir, ignore_errors=True)
+
+    def _seed(self, db, apartment_count, transaction_count):
+        """Create a fresh database at ``db`` with apartments and pending payments."""
+        with scratch_database(db):
+            user = CustomUser.objects.create_user(
+                username='bench', email='bench@example.com', phone_number='bench', password=None,
+            )
+            apartments = Apartment.objects.bulk_create([
+                Apartment(
+                    name=f'Bench Apartment {i}', apartment_type='studio', description='Benchmark apartment. ' * 10,
+                    price_per_night=Decimal(50000 + 10000 * (i % 20)), size_sqft=500, max_occupancy=4,
+                    bedrooms=1 + i % 4, bathrooms=Decimal('1.0'), featured=i < 3,
+                )
+                for i in range(apartment_count)
+            ])
+            first_day = timezone.localdate() + timedelta(days=1)
+            bookings = Booking.objects.bulk_create([
+                Booking(
+                    user=user, apartment=apartments[i % len(apartments)],
+                    check_in_date=first_day + timedelta(days=i), check_out_date=first_day + timedelta(days=i + 2),
+                    guests=1, total_price=Decimal('100000.00'), status='pending',
+                )
+                for i in range(transaction_count)
+            ])
+            Transaction.objects.bulk_create([
+                Transaction(user=user, booking=booking, amount=booking.total_price, tx_ref=f'BENCH-{i}')
+                for i, booking in enumerate(bookings)
+            ])
+            charges = [(str(i), booking.total_price, f'BENCH-{i}') for i, booking in enumerate(bookings)]
+            return [apartment.pk for apartment in apartments], charges
+
+    async def _load(self, base_url, apartment_ids, charges, options):
+        deadline = time.perf_counter() + options['duration']
+        pages = itertools.cycle(['/', '/apartments/'] + [f'/apartment/{pk}/' for pk in apartment_ids[:10]])
+        callbacks = itertools.cycle(
+            f'/payment-callback/?status=successful&tx_ref={tx_ref}&transaction_id={flw_id}'
+            for flw_id, amount, tx_ref in charges
+        )
+        results = {'callback': ([], [0]), 'browse': ([], [0])}
+
+        async def client_loop(client, urls, latencies, errors, expect):
+            while time.perf_counter() < deadline:
+                started = time.perf_counter()
+                try:
+                    response = await client.get(next(urls))
+                    ok = expect(response)
+                except httpx.HTTPError:
+                    ok = False
+                # Don't let flash-message cookies pile up across requests
+                client.cookies.clear()
+                if ok:
+                    latencies.append(time.perf_counter() - started)
+                else:
+                    errors[0] += 1
+
+        limits = httpx.Limits(max_connections=options['callback_clients'] + options['browse_clients'])
+        async with httpx.AsyncClient(base_url=base_url, timeout=120, limits=limits) as client:
+            await client.get('/')  # warm up
+            await asyncio.gather(
+                *[client_loop(client, callbacks, *results['callback'],
+                              lambda r: r.status_code == 302 and '/thank-you/' in r.headers.get('location', ''))
+                  for _ in range(options['callback_clients'])],
+                *[client_loop(client, pages, *results['browse'], lambda r: r.status_code == 200)
+                  for _ in range(options['browse_clients'])],
+            )
+        return {step: (latencies, errors[0]) for step, (latencies, errors) in results.items()}
+
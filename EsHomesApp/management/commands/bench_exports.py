@@ -0,0 +1,99 @@
+import os
+import shutil
+import tempfile
+import time
+import tracemalloc
+from datetime import timedelta
+from decimal import Decimal
+
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from EsHomesApp import exports
+from EsHomesApp.models import Apartment, Booking, CustomUser, Transaction
+
+from ._bench import scratch_database
+
+STATUSES = ['pending', 'confirmed', 'cancelled', 'completed']
+
+
+class Command(BaseCommand):
+    help = (
+        "Measure the time and peak Python memory of streaming booking and "
+        "transaction exports at growing sizes, against building the whole CSV "
+        "in memory the way paging through the admin effectively does."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rows', type=int, default=200000, help='Bookings (and transactions) at the largest size')
+        parser.add_argument('--steps', type=int, default=3, help='Sizes measured, each 4x the one before')
+
+    def handle(self, *args, **options):
+        workdir = tempfile.mkdtemp(prefix='bench_exports_')
+        try:
+            with scratch_database(os.path.join(workdir, 'bench.sqlite3')):
+                self._seed(options['rows'])
+                sizes = [options['rows'] // 4 ** step for step in reversed(range(options['steps']))]
+                self.stdout.write(f"{'export':<26}{'rows':>9}{'seconds':>9}{'rows/s':>10}{'peak MB':>9}")
+                for kind in exports.EXPORTS:
+                    for size in sizes:
+                        for label, fmt in (('stream', 'csv'), ('stream', 'xlsx'), ('in memory', 'csv')):
+                            self._measure(kind, size, label, fmt)
+        finally:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+    def _seed(self, count):
+        user = CustomUser.objects.create_user(
+            username='bench', email='bench@example.com', password=None, phone_number='bench',
+        )
+        apartments = Apartment.objects.bulk_create([
+            Apartment(name=f'Bench Apartment {i}', apartment_type='studio', description='Benchmark apartment.',
+                      price_per_night=Decimal('100.00'), size_sqft=500, max_occupancy=2, bedrooms=1,
+                      bathrooms=Decimal('1.0'))
+            for i in range(50)
+        ])
+        check_in = timezone.localdate()
+        for start in range(0, count, 10000):
+            bookings = Booking.objects.bulk_create([
+                Booking(user=user, apartment=apartments[i % len(apartments)],
+                        check_in_date=check_in + timedelta(days=i), check_out_date=check_in + timedelta(days=i + 2),
+                        guests=1, total_price=Decimal('200.00'), status=STATUSES[i % len(STATUSES)])
+                for i in range(start, min(start + 10000, count))
+            ])
+            Transaction.objects.bulk_create([
+                Transaction(user=user, booking=booking, amount=booking.total_price, tx_ref=f'BENCH-{booking.pk}',
+                            transaction_status='completed')
+                for booking in bookings
+            ])
+
+    def _measure(self, kind, size, label, fmt):
+        model = exports.EXPORTS[kind]['model']
+        last_pk = model.objects.order_by('pk').values_list('pk', flat=True)[size - 1]
+        queryset = exports.export_queryset(kind, model.objects.filter(pk__lte=last_pk))
+
+        # Timed untraced: tracemalloc slows every allocation down several times over
+        started = time.perf_counter()
+        self._export(kind, queryset, label, fmt)
+        elapsed = time.perf_counter() - started
+        tracemalloc.start()
+        self._export(kind, queryset, label, fmt)
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+        self.stdout.write(
+            f"{f'{kind} {fmt}, {label}':<26}{size:>9}{elapsed:>9.2f}{size / elapsed:>10.0f}{peak / 2 ** 20:>9.1f}"
+        )
+
+    def _export(self, kind, queryset, label, fmt):
+        if label == 'stream':
+            for chunk in exports.stream(kind, queryset, fmt):
+                pass
+        else:
+            objects = list(queryset.all())
+            b''.join(exports.stream_csv(exports.rows(kind, _Listed(objects))))
+
+
+class _Listed(list):
+    """Objects already in memory, passed where exports.rows() expects a queryset."""
+
+    def iterator(self, chunk_size=None):
+        return iter(self)
@@ -0,0 +1,73 @@
+import time
+
+from django.conf import settings
+from django.contrib.staticfiles.storage import staticfiles_storage
+from django.core.management.base import BaseCommand, CommandError
+from django.test import RequestFactory
+from django.views.static import serve as django_serve
+
+from EsHomesApp import fileserving
+
+
+class Command(BaseCommand):
+    help = (
+        "Compare fileserving.serve_static against django.views.static.serve "
+        "(the old static() path). Run collectstatic first."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, default=2000, help='Requests per scenario')
+        parser.add_argument('--path', default='css/style.css', help='Static file to request')
+
+    def handle(self, *args, **options):
+        name = options['path']
+        try:
+            hashed = staticfiles_storage.stored_name(name)
+        except ValueError:
+            raise CommandError(f'{name} is not in the staticfiles manifest, run collectstatic first')
+        n = options['requests']
+        factory = RequestFactory()
+
+        def old(path, **headers):
+            return django_serve(factory.get('/static/' + path, headers=headers), path, document_root=settings.STATIC_ROOT)
+
+        def new(path, **headers):
+            return fileserving.serve_static(factory.get('/static/' + path, headers=headers), path)
+
+        # Revalidate with whatever validator each implementation hands out
+        old_lm = old(hashed)['Last-Modified']
+        new_etag = new(hashed)['ETag']
+
+        scenarios = [
+            ('full GET', lambda: old(hashed), lambda: new(hashed)),
+            ('full GET, unhashed name', lambda: old(name), lambda: new(name)),
+            ('GET, Accept-Encoding: gzip, br',
+             lambda: old(hashed, accept_encoding='gzip, br'),
+             lambda: new(hashed, accept_encoding='gzip, br')),
+            ('conditional GET',
+             lambda: old(hashed, if_modified_since=old_lm),
+             lambda: new(hashed, if_none_match=new_etag)),
+            ('Range: bytes=0-1023',
+             lambda: old(hashed, range='bytes=0-1023'),
+             lambda: new(hashed, range='bytes=0-1023')),
+        ]
+
+        self.stdout.write(f'{hashed}, {n} requests per scenario\n')
+        self.stdout.write(f"{'scenario':<34}{'impl':<8}{'req/s':>10}{'status':>8}{'bytes':>10}")
+        for label, old_call, new_call in scenarios:
+            for impl, call in (('old', old_call), ('new', new_call)):
+                rate, status, size = self._run(call, n)
+                self.stdout.write(f'{label:<34}{impl:<8}{rate:>10.0f}{status:>8}{size:>10}')
+
+    def _run(self, call, n):
+        status = size = 0
+        start = time.perf_counter()
+        for _ in range(n):
+            response = call()
+            if response.streaming:
+                body = b''.join(response.streaming_content)
+            else:
+                body = response.content
+            status, size = response.status_code, len(body)
+        elapsed = time.perf_counter() - start
+        return n / elapsed, status, size
@@ -0,0 +1,121 @@
+import os
+import random
+import shutil
+import tempfile
+import time
+from decimal import Decimal
+
+import numpy as np
+from django.core.management.base import BaseCommand
+from django.db import connection
+
+from EsHomesApp import geo
+from EsHomesApp.models import Apartment
+
+from ._bench import scratch_database
+
+# (latitude, longitude, spread in degrees, share of the inventory)
+CITIES = [
+    (6.5244, 3.3792, 0.15, 0.45),   # Lagos
+    (9.0765, 7.3986, 0.12, 0.25),   # Abuja
+    (4.8156, 7.0498, 0.10, 0.10),   # Port Harcourt
+    (7.3775, 3.9470, 0.10, 0.08),   # Ibadan
+    (12.0022, 8.5920, 0.10, 0.07),  # Kano
+]
+
+
+class Command(BaseCommand):
+    help = (
+        "Compare geohash-pruned radius search against scanning every apartment, "
+        "on a scratch SQLite database (no spatial extensions)."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--apartments', type=int, default=100000)
+        parser.add_argument('--queries', type=int, default=20, help='Searches per radius')
+        parser.add_argument('--seed', type=int, default=7)
+
+    def handle(self, *args, **options):
+        rng = random.Random(options['seed'])
+        workdir = tempfile.mkdtemp(prefix='bench_geo_')
+        try:
+            with scratch_database(os.path.join(workdir, 'bench.sqlite3')):
+                points = self._seed(rng, options['apartments'])
+                self._run(rng, points, options['queries'])
+        finally:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+    def _seed(self, rng, count):
+        started = time.perf_counter()
+        points, apartments = [], []
+        weights = [share for *_, share in CITIES]
+        for i in range(count):
+            if rng.random() < 0.05:
+                # Scattered across the country
+                latitude, longitude = rng.uniform(4.3, 13.8), rng.uniform(2.7, 14.6)
+            else:
+                lat, lon, spread, _ = rng.choices(CITIES, weights)[0]
+                latitude, longitude = rng.gauss(lat, spread), rng.gauss(lon, spread)
+            points.append((latitude, longitude))
+            apartments.append(Apartment(
+                name=f'Bench Apartment {i}', apartment_type='studio', description='Benchmark apartment.',
+                price_per_night=Decimal('80000.00'), size_sqft=500, max_occupancy=2, bedrooms=1,
+                bathrooms=Decimal('1.0'), latitude=latitude, longitude=longitude,
+                geohash=geo.encode(latitude, longitude),
+            ))
+        Apartment.objects.bulk_create(apartments, batch_size=5000)
+        with connection.cursor() as cursor:
+            cursor.execute('ANALYZE')  # as after any bulk load; see the note in geo.py
+        self.stdout.write(f"{count} apartments seeded in {time.perf_counter() - started:.1f}s\n")
+        return points
+
+    def _run(self, rng, points, query_count):
+        base = Apartment.objects.filter(status='available')
+
+        def full_scan(latitude, longitude, radius):
+            pks, lats, lons = zip(*base.values_list('pk', 'latitude', 'longitude'))
+            distances = geo.haversine_km(latitude, longitude, np.array(lats), np.array(lons))
+            return len(pks), {pks[i] for i in np.flatnonzero(distances <= radius)}
+
+        def box_scan(latitude, longitude, radius):
+            south, west, north, east = geo.radius_box(latitude, longitude, radius)
+            rows = list(base.filter(latitude__range=(south, north), longitude__range=(west, east))
+                        .values_list('pk', 'latitude', 'longitude'))
+            if not rows:
+                return 0, set()
+            pks, lats, lons = zip(*rows)
+            distances = geo.haversine_km(latitude, longitude, np.array(lats), np.array(lons))
+            return len(pks), {pks[i] for i in np.flatnonzero(distances <= radius)}
+
+        def geohash_search(latitude, longitude, radius):
+            results = geo.search(base, latitude, longitude, radius_km=radius)
+            return None, {pk for pk, _ in results}
+
+        approaches = [
+            ('full scan + numpy', full_scan),
+            ('lat/lon box scan + numpy', box_scan),
+            ('geo.search', geohash_search),
+        ]
+        self.stdout.write(f"{'radius km':>10}  {'approach':<26}{'avg ms':>9}{'p95 ms':>9}{'rows read':>11}{'results':>9}")
+        for radius in (1, 5, 10, 25, 100):
+            centres = [rng.choice(points) for _ in range(query_count)]
+            expected = None
+            for label, search in approaches:
+                timings, read, found = [], [], []
+                for latitude, longitude in centres:
+                    started = time.perf_counter()
+                    rows_read, results = search(latitude, longitude, radius)
+                    timings.append(time.perf_counter() - started)
+                    read.append(rows_read)
+                    found.append(results)
+                if expected is None:
+                    expected = found
+                elif found != expected:
+                    self.stderr.write(f"{label} disagrees with the full scan at {radius} km")
+                timings.sort()
+                rows_read = '-' if read[0] is None else f"{sum(read) / len(read):.0f}"
+                self.stdout.write(
+                    f"{radius:>10}  {label:<26}{sum(timings) / len(timings) * 1000:>9.1f}"
+                    f"{timings[int(0.95 * (len(timings) - 1))] * 1000:>9.1f}{rows_read:>11}"
+                    f"{sum(len(r) for r in found) / len(found):>9.0f}"
+                )
@@ -0,0 +1,118 @@
+import logging
+import os
+import shutil
+import tempfile
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.test import Client, override_settings
+
+from EsHomesApp import logs
+
+from ._bench import percentile, scratch_database
+
+
+class SlowFileHandler(logging.FileHandler):
+    """A file handler on a disk (or log shipper) that takes ``delay`` seconds per write."""
+
+    def __init__(self, filename, delay):
+        super().__init__(filename, encoding='utf-8')
+        self.delay = delay
+
+    def emit(self, record):
+        time.sleep(self.delay)
+        super().emit(record)
+
+
+class Command(BaseCommand):
+    help = (
+        "Measure what logging costs the request thread: a synchronous JSON file "
+        "handler against the queued one, then whole requests with and without "
+        "the request log middleware."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--records', type=int, default=5000, help='Log calls per handler')
+        parser.add_argument('--requests', type=int, default=2000, help='Requests per middleware setup')
+        parser.add_argument('--slow-write-ms', type=float, default=1.0, help='Write latency of the slow sink')
+
+    def handle(self, *args, **options):
+        workdir = tempfile.mkdtemp(prefix='bench_logging_')
+        try:
+            self._bench_handlers(workdir, options)
+            with scratch_database(os.path.join(workdir, 'bench.sqlite3')):
+                self._bench_requests(options)
+        finally:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+    def _bench_handlers(self, workdir, options):
+        delay = options['slow_write_ms'] / 1000
+        n = options['records']
+        self.stdout.write(f"Per log call, {n} calls ({options['slow_write_ms']} ms sink for 'slow'):")
+        self.stdout.write(f"{'handler':<24}{'mean us':>10}{'p99 us':>10}{'total s':>10}")
+
+        def synchronous(path, slow):
+            handler = SlowFileHandler(path, delay) if slow else logging.FileHandler(path, encoding='utf-8')
+            handler.setFormatter(logs.JsonFormatter())
+            return handler, handler.close
+
+        def queued(path, slow):
+            handler = logs.QueuedJsonHandler(filename=path)
+            if slow:
+                # Swap in the slow sink once the listener is up
+                handler._start_listener()
+                handler.listener.handlers = (SlowFileHandler(path, delay),)
+                handler.listener.handlers[0].setFormatter(logs.JsonFormatter())
+            return handler, handler.flush_and_stop
+
+        for label, make, slow in (
+            ('sync file', synchronous, False),
+            ('queued file', queued, False),
+            ('sync file, slow', synchronous, True),
+            ('queued file, slow', queued, True),
+        ):
+            path = os.path.join(workdir, f"{label.replace(' ', '_').replace(',', '')}.log")
+            handler, close = make(path, slow)
+            handler.addFilter(logs.RequestContextFilter())
+            logger = logging.getLogger(f'bench.{label}')
+            logger.propagate = False
+            logger.handlers = [handler]
+            logger.setLevel(logging.INFO)
+
+            timings = []
+            started = time.perf_counter()
+            for i in range(n):
+                call_started = time.perf_counter()
+                logger.info(
+                    "Booking %s created", i,
+                    extra={'booking_id': i, 'tx_ref': f'ESHOMES-BKG-{i}', 'form': {'password': 'x', 'guests': 2}},
+                )
+                timings.append(time.perf_counter() - call_started)
+            in_thread = time.perf_counter() - started
+            close()
+            self.stdout.write(
+                f"{label:<24}{sum(timings) / n * 1e6:>10.1f}{percentile(timings, 0.99) * 1e6:>10.1f}{in_thread:>10.2f}"
+            )
+
+    def _bench_requests(self, options):
+        n = options['requests']
+        with_log = list(settings.MIDDLEWARE)
+        without_log = [path for path in with_log if path != 'EsHomesApp.logs.RequestLogMiddleware']
+        self.stdout.write(f"\nPer request to /about/, {n} requests:")
+        self.stdout.write(f"{'middleware':<32}{'mean us':>10}{'p99 us':>10}")
+
+        for label, middleware, rates in (
+            ('without request log', without_log, settings.LOG_SAMPLE_RATES),
+            ('request log, sampled', with_log, settings.LOG_SAMPLE_RATES),
+            ('request log, every request', with_log, {}),
+        ):
+            with override_settings(MIDDLEWARE=middleware, LOG_SAMPLE_RATES=rates):
+                client = Client()
+                client.get('/about/')
+                timings = []
+                for _ in range(n):
+                    started = time.perf_counter()
+                    client.get('/about/')
+                    timings.append(time.perf_counter() - started)
+            self.stdout.write(f"{label:<32}{sum(timings) / n * 1e6:>10.1f}{percentile(timings, 0.99) * 1e6:>10.1f}")
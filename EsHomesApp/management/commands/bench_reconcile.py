@@ -0,0 +1,82 @@
+import os
+import random
+import shutil
+import tempfile
+from datetime import timedelta
+from decimal import Decimal
+
+from django.core.management.base import BaseCommand
+from django.test import override_settings
+from django.utils import timezone
+
+from EsHomesApp import reconcile
+from EsHomesApp.fake_flutterwave import FakeFlutterwave
+from EsHomesApp.models import Apartment, Booking, CustomUser, Transaction
+
+from ._bench import scratch_database
+
+
+class Command(BaseCommand):
+    help = (
+        "Reconcile stale transactions against a local fake Flutterwave with "
+        "increasing worker counts, on a scratch SQLite database."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--transactions', type=int, default=400)
+        parser.add_argument('--latency', type=float, default=0.2, help='Gateway response time in seconds')
+        parser.add_argument('--workers', type=int, nargs='+', default=[1, 8, 32])
+        parser.add_argument('--seed', type=int, default=3)
+
+    def handle(self, *args, **options):
+        workdir = tempfile.mkdtemp(prefix='bench_reconcile_')
+        try:
+            with FakeFlutterwave(latency=options['latency']) as gateway, \
+                    scratch_database(os.path.join(workdir, 'bench.sqlite3')):
+                self._charge(gateway, options)
+                for workers in options['workers']:
+                    self._seed(options['transactions'])
+                    with override_settings(FLUTTERWAVE_API_URL=gateway.url, RECONCILE_WORKERS=workers):
+                        report = reconcile.reconcile()
+                    outcomes = ', '.join(f"{count} {outcome}" for outcome, count in sorted(report['outcomes'].items()))
+                    self.stdout.write(
+                        f"{workers:>3} worker(s): {report['checked']} checked in {report['seconds']:.2f}s, "
+                        f"{report['per_second']:.1f}/s ({outcomes}; {len(report['discrepancies'])} discrepancies)"
+                    )
+        finally:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+    def _charge(self, gateway, options):
+        # Mostly lost webhooks for paid bookings, some failures, a few short payments and abandoned checkouts
+        rng = random.Random(options['seed'])
+        for i in range(options['transactions']):
+            kind = rng.choices(['paid', 'failed', 'short', 'abandoned'], [70, 15, 5, 10])[0]
+            if kind == 'paid':
+                gateway.charge(str(10000 + i), 200, tx_ref=f'BENCH-{i}')
+            elif kind == 'failed':
+                gateway.charge(str(10000 + i), 200, status='failed', tx_ref=f'BENCH-{i}')
+            elif kind == 'short':
+                gateway.charge(str(10000 + i), 150, tx_ref=f'BENCH-{i}')
+
+    def _seed(self, count):
+        Transaction.objects.all().delete()
+        Booking.objects.all().delete()
+        user = CustomUser.objects.first() or CustomUser.objects.create_user(
+            username='bench', email='bench@example.com', password='bench-pass', phone_number='bench',
+        )
+        apartment = Apartment.objects.first() or Apartment.objects.create(
+            name='Bench Apartment', apartment_type='studio', description='Benchmark apartment.',
+            price_per_night=Decimal('100.00'), size_sqft=500, max_occupancy=2, bedrooms=1, bathrooms=Decimal('1.0'),
+        )
+        check_in = timezone.localdate() + timedelta(days=30)
+        bookings = Booking.objects.bulk_create([
+            Booking(user=user, apartment=apartment, check_in_date=check_in + timedelta(days=3 * i),
+                    check_out_date=check_in + timedelta(days=3 * i + 2), guests=1, total_price=Decimal('200.00'))
+            for i in range(count)
+        ])
+        created_at = timezone.now() - timedelta(hours=1)
+        Transaction.objects.bulk_create([
+            Transaction(user=user, booking=booking, amount=Decimal('200.00'), tx_ref=f'BENCH-{i}')
+            for i, booking in enumerate(bookings)
+        ])
+        Transaction.objects.update(created_at=created_at)
@@ -0,0 +1,42 @@
+import sys
+from datetime import date
+
+from django.core.management.base import BaseCommand, CommandError
+
+from EsHomesApp import exports
+
+
+class Command(BaseCommand):
+    help = (
+        "Export bookings or transactions as CSV or XLSX for accounting, streamed "
+        "to a file (or stdout) in constant memory."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('kind', choices=list(exports.EXPORTS))
+        parser.add_argument('--format', choices=list(exports.FORMATS), default='csv')
+        parser.add_argument('--from', dest='date_from', type=date.fromisoformat,
+                            help='First day (YYYY-MM-DD) of bookings made / transactions created')
+        parser.add_argument('--to', dest='date_to', type=date.fromisoformat, help='Last day, inclusive')
+        parser.add_argument('--status', action='append',
+                            help='Only this status; repeat for several (default: every status)')
+        parser.add_argument('--output', '-o', default='-', help="File to write, or '-' for stdout")
+
+    def handle(self, *args, **options):
+        kind = options['kind']
+        unknown = set(options['status'] or []) - set(exports.statuses(kind))
+        if unknown:
+            raise CommandError(f"Unknown status {', '.join(sorted(unknown))}; choose from {', '.join(exports.statuses(kind))}")
+        queryset = exports.export_queryset(
+            kind, date_from=options['date_from'], date_to=options['date_to'], status=options['status'],
+        )
+        chunks = exports.stream(kind, queryset, options['format'])
+        if options['output'] == '-':
+            for chunk in chunks:
+                sys.stdout.buffer.write(chunk)
+            sys.stdout.buffer.flush()
+            return
+        with open(options['output'], 'wb') as f:
+            for chunk in chunks:
+                f.write(chunk)
+        self.stderr.write(f"Wrote {options['output']}")
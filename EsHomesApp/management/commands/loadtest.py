@@ -0,0 +1,238 @@
+import asyncio
+import itertools
+import logging
+import os
+import re
+import shutil
+import tempfile
+import time
+from collections import defaultdict
+from datetime import timedelta
+from decimal import Decimal
+from importlib.util import find_spec
+
+import httpx
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+
+from EsHomesApp.fake_flutterwave import FakeFlutterwave
+from EsHomesApp.models import Apartment
+
+from ._bench import (
+    SERVER_SETTINGS_TEMPLATE, free_port, percentile, scratch_database, start_server, stop_server, wait_ready,
+)
+
+STEPS = [
+    'browse', 'detail', 'register', 'login', 'create_booking', 'initiate_payment', 'callback', 'webhook',
+]
+
+CSRF_TOKEN = re.compile(r'name="csrfmiddlewaretoken" value="([^"]+)"')
+TX_REF = re.compile(r'tx_ref: "([^"]+)"')
+AMOUNT = re.compile(r'amount: ([\d.]+)')
+
+
+class StepFailed(Exception):
+    pass
+
+
+class Command(BaseCommand):
+    help = (
+        "Load-test the booking journey end to end against a locally started server "
+        "and a fake Flutterwave: browse, view an apartment, register or log in, "
+        "book, pay (redirect and webhook). Reports throughput, p50/p95/p99 per "
+        "step and error rates."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--server', choices=['wsgi', 'asgi'], default='wsgi',
+                            help='gunicorn with the sync views, or uvicorn with the async ones')
+        parser.add_argument('--users', type=int, default=20, help='Concurrent virtual users')
+        parser.add_argument('--ramp-up', type=float, default=5, help='Seconds over which the users start')
+        parser.add_argument('--duration', type=float, default=30, help='Seconds of load, ramp-up included')
+        parser.add_argument('--workers', type=int, default=2, help='Server processes')
+        parser.add_argument('--threads', type=int, default=8, help='Threads per gunicorn worker')
+        parser.add_argument('--apartments', type=int, default=1000,
+                            help='Apartments to seed; a paid booking reserves its apartment, so each is booked once')
+        parser.add_argument('--gateway-latency', type=float, default=0.3, help='Seconds the fake gateway takes to verify')
+        parser.add_argument('--gateway-jitter', type=float, default=0.2, help='Up to this many seconds more, at random')
+        parser.add_argument('--gateway-failure-rate', type=float, default=0.02, help='Fraction of verifications that fail')
+        parser.add_argument('--seed', type=int, default=1)
+
+    def handle(self, *args, **options):
+        module = 'uvicorn' if options['server'] == 'asgi' else 'gunicorn'
+        if find_spec(module) is None:
+            raise CommandError(f'{module} is required: pip install {module}')
+
+        # httpx logs every request at INFO
+        logging.getLogger('httpx').setLevel(logging.WARNING)
+        workdir = tempfile.mkdtemp(prefix='loadtest_')
+        process = None
+        try:
+            gateway = FakeFlutterwave(
+                latency=options['gateway_latency'], jitter=options['gateway_jitter'],
+                failure_rate=options['gateway_failure_rate'], seed=options['seed'],
+            )
+            with gateway:
+                db = os.path.join(workdir, 'loadtest.sqlite3')
+                apartment_ids = self._seed(db, options['apartments'])
+                with open(os.path.join(workdir, 'loadtest_settings.py'), 'w') as f:
+                    f.write(SERVER_SETTINGS_TEMPLATE.format(
+                        db=db, gateway=gateway.url, async_views=options['server'] == 'asgi',
+                        log_file=os.path.join(workdir, 'server.log'),
+                    ))
+                port = free_port()
+                process = start_server(
+                    options['server'], port, workdir, 'loadtest_settings', options['workers'], options['threads'],
+                )
+                wait_ready(options['server'], port, process)
+
+                started = time.perf_counter()
+                results, journeys = asyncio.run(self._load(f'http://127.0.0.1:{port}', apartment_ids, gateway, options))
+                elapsed = time.perf_counter() - started
+                self._report(results, journeys, elapsed, gateway, options)
+        finally:
+            if process is not None:
+                stop_server(process)
+            shutil.rmtree(workdir, ignore_errors=True)
+
+    def _seed(self, db, count):
+        with scratch_database(db):
+            apartments = Apartment.objects.bulk_create([
+                Apartment(
+                    name=f'Load Test Apartment {i}', apartment_type='studio', description='Load test apartment. ' * 10,
+                    price_per_night=Decimal(50000 + 10000 * (i % 20)), size_sqft=500, max_occupancy=4,
+                    bedrooms=1 + i % 4, bathrooms=Decimal('1.0'), featured=i < 3,
+                )
+                for i in range(count)
+            ])
+            return [apartment.pk for apartment in apartments]
+
+    async def _load(self, base_url, apartment_ids, gateway, options):
+        deadline = time.perf_counter() + options['duration']
+        # Every journey books the next apartment, so journeys don't collide over dates
+        apartments = iter(apartment_ids)
+        charge_ids = itertools.count(1)
+        results = defaultdict(lambda: {'attempts': 0, 'latencies': [], 'errors': defaultdict(int)})
+        journeys = {'completed': 0, 'failed': 0}
+
+        async def step(name, request):
+            results[name]['attempts'] += 1
+            started = time.perf_counter()
+            try:
+                response = await request
+            except httpx.HTTPError as exc:
+                results[name]['errors'][type(exc).__name__] += 1
+                raise StepFailed(name)
+            results[name]['latencies'].append(time.perf_counter() - started)
+            return response
+
+        def expect(name, ok, reason):
+            if not ok:
+                results[name]['errors'][reason] += 1
+                raise StepFailed(name)
+
+        async def journey(client, user, state):
+            await step('browse', client.get('/apartments/'))
+            try:
+                pk = next(apartments)
+            except StopIteration:
+                expect('detail', False, 'out of apartments (raise --apartments)')
+            response = await step('detail', client.get(f'/apartment/{pk}/'))
+            expect('detail', response.status_code == 200, f'HTTP {response.status_code}')
+
+            if not state['registered']:
+                form = await client.get('/register/')
+                response = await step('register', client.post('/register/', data={
+                    'csrfmiddlewaretoken': _csrf_token(form), 'first_name': 'Load', 'last_name': f'User {user}',
+                    'username': f'load{user}', 'email': f'load{user}@example.com', 'phone_number': f'+234800{user:07d}',
+                    'password1': 'load-test-pass-1', 'password2': 'load-test-pass-1',
+                }))
+                expect('register', response.status_code == 302, f'HTTP {response.status_code}')
+                state['registered'] = True
+            else:
+                await client.get('/logout_user')
+                form = await client.get('/login/')
+                response = await step('login', client.post('/login/', data={
+                    'csrfmiddlewaretoken': _csrf_token(form), 'email': f'load{user}@example.com',
+                    'password': 'load-test-pass-1',
+                }))
+                expect('login', response.status_code == 302, f'HTTP {response.status_code}')
+
+            check_in = timezone.localdate() + timedelta(days=7)
+            form = await client.get(f'/apartment/{pk}/')
+            response = await step('create_booking', client.post(f'/apartment/{pk}/book/', data={
+                'csrfmiddlewaretoken': _csrf_token(form), 'check_in': check_in.isoformat(),
+                'check_out': (check_in + timedelta(days=2)).isoformat(), 'guests': 2,
+            }))
+            location = response.headers.get('location', '')
+            expect('create_booking', '/payment/initiate/' in location, 'rejected')
+
+            response = await step('initiate_payment', client.get(location))
+            tx_ref, amount = TX_REF.search(response.text), AMOUNT.search(response.text)
+            expect('initiate_payment', response.status_code == 200 and tx_ref and amount, f'HTTP {response.status_code}')
+
+            # The guest pays on Flutterwave's checkout, which redirects back and sends the webhook
+            flw_id = str(next(charge_ids))
+            gateway.charge(flw_id, amount=Decimal(amount[1]), tx_ref=tx_ref[1])
+            response = await step('callback', client.get(
+                f'/payment-callback/?status=successful&tx_ref={tx_ref[1]}&transaction_id={flw_id}',
+            ))
+            expect('callback', '/thank-you/' in response.headers.get('location', ''), 'payment not confirmed')
+            response = await step('webhook', client.post('/payment-callback/', json={
+                'event': 'charge.completed', 'data': {'tx_ref': tx_ref[1], 'id': flw_id, 'status': 'successful'},
+            }))
+            expect('webhook', response.status_code == 200, f'HTTP {response.status_code}')
+
+        async def virtual_user(user):
+            await asyncio.sleep(options['ramp_up'] * user / options['users'])
+            state = {'registered': False}
+            async with httpx.AsyncClient(base_url=base_url, timeout=120) as client:
+                while time.perf_counter() < deadline:
+                    try:
+                        await journey(client, user, state)
+                        journeys['completed'] += 1
+                    except StepFailed as failed:
+                        journeys['failed'] += 1
+                        if str(failed) in ('register', 'login'):
+                            # Start over with a fresh account
+                            user += options['users']
+                            state['registered'] = False
+                            client.cookies.clear()
+
+        await asyncio.gather(*[virtual_user(user) for user in range(options['users'])])
+        return results, journeys
+
+    def _report(self, results, journeys, elapsed, gateway, options):
+        self.stdout.write(
+            f"{options['server']} server, {options['workers']} worker(s); {options['users']} users over "
+            f"{options['ramp_up']}s ramp-up, {elapsed:.1f}s; gateway {options['gateway_latency']}s "
+            f"+ up to {options['gateway_jitter']}s, {options['gateway_failure_rate']:.0%} failures\n"
+        )
+        self.stdout.write(
+            f"{'step':<18}{'requests':>10}{'req/s':>9}{'p50 ms':>9}{'p95 ms':>9}{'p99 ms':>9}{'errors':>8}{'error %':>9}"
+        )
+        total_requests = 0
+        for name in STEPS:
+            latencies, errors = results[name]['latencies'], sum(results[name]['errors'].values())
+            attempts = max(results[name]['attempts'], errors)
+            if not attempts:
+                continue
+            total_requests += len(latencies)
+            self.stdout.write(
+                f"{name:<18}{len(latencies):>10}{len(latencies) / elapsed:>9.1f}"
+                f"{percentile(latencies, 0.50) * 1000:>9.0f}{percentile(latencies, 0.95) * 1000:>9.0f}"
+                f"{percentile(latencies, 0.99) * 1000:>9.0f}{errors:>8}{errors / attempts:>9.1%}"
+            )
+        self.stdout.write(
+            f"\n{journeys['completed']} journeys completed ({journeys['completed'] / elapsed:.2f}/s), "
+            f"{journeys['failed']} failed; {total_requests / elapsed:.1f} timed requests/s; "
+            f"gateway answered {gateway.requests} verifications, failed {gateway.failures}"
+        )
+        for name in STEPS:
+            for reason, count in sorted(results[name]['errors'].items()):
+                self.stdout.write(f"  {name}: {count} x {reason}")
+
+
+def _csrf_token(response):
+    match = CSRF_TOKEN.search(response.text)
+    return match[1] if match else ''
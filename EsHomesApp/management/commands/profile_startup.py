@@ -0,0 +1,122 @@
+import json
+import os
+import re
+import shutil
+import subprocess
+import sys
+import tempfile
+from collections import defaultdict
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from ._bench import SERVER_SETTINGS_TEMPLATE, scratch_database
+
+# Run in a fresh interpreter under -X importtime: loads the application the way
+# wsgi.py does, phase by phase, and prints the phase timings as JSON
+BOOT_SCRIPT = """\
+import json, sys, time
+from wsgiref.util import setup_testing_defaults
+
+timings, started = {}, time.perf_counter()
+def lap(name):
+    global started
+    now = time.perf_counter()
+    timings[name] = (now - started) * 1000
+    started = now
+
+import django
+django.setup(set_prefix=False)
+lap('django.setup()')
+from django.core.handlers.wsgi import WSGIHandler
+application = WSGIHandler()
+lap('load application')
+if sys.argv[1] == 'warm':
+    from EsHomesApp.warmup import warm_up
+    warm_up()
+    lap('warm_up()')
+for name in ('first request', 'second request'):
+    environ = {'PATH_INFO': sys.argv[2]}
+    setup_testing_defaults(environ)
+    status = []
+    b''.join(application(environ, lambda s, headers, exc_info=None: status.append(s)))
+    lap(f'{name} ({status[0]})')
+print(json.dumps(timings))
+"""
+
+# -X importtime itemises `import` statements only: modules Django loads through
+# importlib.import_module (apps, models, admin, urls) are left out, though what
+# they import is not. The phase timings cover them.
+IMPORT_LINE = re.compile(r'^import time:\s+(\d+) \|\s+(\d+) \|\s+(\S+)$')
+
+
+class Command(BaseCommand):
+    help = (
+        "Profile a worker's startup: time spent importing each module (python "
+        "-X importtime) and in each phase up to its second request, with and "
+        "without warm-up."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--path', default='/', help='Page to request')
+        parser.add_argument('--top', type=int, default=15, help='Top-level packages to list by import time')
+
+    def handle(self, *args, **options):
+        workdir = tempfile.mkdtemp(prefix='profile_startup_')
+        try:
+            db = os.path.join(workdir, 'startup.sqlite3')
+            with scratch_database(db):
+                pass
+            with open(os.path.join(workdir, 'startup_settings.py'), 'w') as f:
+                f.write(SERVER_SETTINGS_TEMPLATE.format(
+                    db=db, gateway=settings.FLUTTERWAVE_API_URL, async_views=False,
+                    log_file=os.path.join(workdir, 'app.log'),
+                ))
+                # The boot script warms up (or doesn't) itself
+                f.write('WARMUP_ON_LOAD = False\n')
+            env = dict(
+                os.environ,
+                DJANGO_SETTINGS_MODULE='startup_settings',
+                PYTHONPATH=os.pathsep.join([workdir, str(settings.BASE_DIR)]),
+            )
+            runs = {mode: self._boot(mode, options['path'], env) for mode in ('cold', 'warm')}
+        finally:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+        imports = runs['cold']['imports']
+        total = sum(self_us for self_us, _ in imports.values())
+        self.stdout.write(f"{len(imports)} modules imported in {total / 1000:.0f} ms (self time)\n")
+
+        self.stdout.write(f"{'project module':<48}{'self ms':>9}{'cumul. ms':>11}")
+        for name, (self_us, cumulative_us) in sorted(imports.items(), key=lambda item: -item[1][1]):
+            if name.split('.')[0] in ('EsHomesProject', 'EsHomesApp'):
+                self.stdout.write(f"{name:<48}{self_us / 1000:>9.1f}{cumulative_us / 1000:>11.1f}")
+
+        packages = defaultdict(lambda: [0, 0])
+        for name, (self_us, _) in imports.items():
+            packages[name.split('.')[0]][0] += self_us
+            packages[name.split('.')[0]][1] += 1
+        self.stdout.write(f"\n{'package':<48}{'self ms':>9}{'modules':>11}")
+        for name, (self_us, count) in sorted(packages.items(), key=lambda item: -item[1][0])[:options['top']]:
+            self.stdout.write(f"{name:<48}{self_us / 1000:>9.1f}{count:>11}")
+
+        self.stdout.write(f"\n{'phase':<40}{'cold ms':>12}{'warmed up ms':>14}")
+        for phase in dict.fromkeys([*runs['warm']['phases'], *runs['cold']['phases']]):
+            cold, warm = runs['cold']['phases'].get(phase), runs['warm']['phases'].get(phase)
+            self.stdout.write(
+                f"{phase:<40}{'-' if cold is None else f'{cold:.1f}':>12}{'-' if warm is None else f'{warm:.1f}':>14}"
+            )
+
+    def _boot(self, mode, path, env):
+        result = subprocess.run(
+            [sys.executable, '-X', 'importtime', '-c', BOOT_SCRIPT, mode, path],
+            cwd=settings.BASE_DIR, env=env, capture_output=True, text=True,
+        )
+        if result.returncode:
+            raise CommandError(f'Startup run failed:\n{result.stderr[-2000:]}')
+        imports = {}
+        for line in result.stderr.splitlines():
+            match = IMPORT_LINE.match(line)
+            if match:
+                imports[match[3]] = (int(match[1]), int(match[2]))
+        return {'imports': imports, 'phases': json.loads(result.stdout.splitlines()[-1])}
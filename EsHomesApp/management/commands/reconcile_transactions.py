@@ -0,0 +1,24 @@
+from django.core.management.base import BaseCommand
+
+from EsHomesApp import reconcile
+
+
+class Command(BaseCommand):
+    help = (
+        "Check transactions stuck in pending/processing, or declined when their booking's hold ran out, "
+        "against Flutterwave and settle them."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--limit', type=int, help='Check at most this many (oldest first)')
+        parser.add_argument('--dry-run', action='store_true', help='Report what would change without saving it')
+
+    def handle(self, *args, **options):
+        report = reconcile.reconcile(limit=options['limit'], dry_run=options['dry_run'])
+        outcomes = ', '.join(f"{count} {outcome}" for outcome, count in sorted(report['outcomes'].items()))
+        self.stdout.write(
+            f"{report['checked']} transaction(s) checked in {report['seconds']:.1f}s "
+            f"({report['per_second']:.1f}/s){': ' + outcomes if outcomes else ''}"
+        )
+        for discrepancy in report['discrepancies']:
+            self.stdout.write(self.style.WARNING(discrepancy))
@@ -0,0 +1,18 @@
+from django.core.management.base import BaseCommand
+
+from EsHomesApp import rollups
+
+
+class Command(BaseCommand):
+    help = "Update the occupancy/revenue rollups from bookings and transactions changed since the last run."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--full', action='store_true', help='Recompute every month from scratch')
+
+    def handle(self, *args, **options):
+        if options['full']:
+            rollups.rebuild()
+            self.stdout.write("Rollups rebuilt.")
+        else:
+            cells = rollups.refresh()
+            self.stdout.write(f"{cells} apartment-month cell(s) refreshed.")
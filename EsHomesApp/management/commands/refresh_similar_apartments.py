@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+
+from EsHomesApp import recommender
+
+
+class Command(BaseCommand):
+    help = "Rebuild the \"similar apartments\" nearest-neighbour table from the current inventory."
+
+    def add_arguments(self, parser):
+        parser.add_argument('-k', type=int, default=None, help='Neighbours per apartment (default SIMILAR_APARTMENTS_K)')
+
+    def handle(self, *args, **options):
+        rows = recommender.rebuild(options['k'])
+        self.stdout.write(f"{rows} neighbour row(s) written.")
@@ -0,0 +1,30 @@
+import signal
+
+from django.core.management.base import BaseCommand
+
+from EsHomesApp.jobs import Worker
+
+
+class Command(BaseCommand):
+    help = "Run queued background jobs (see EsHomesApp/jobs.py)."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--queue', action='append', dest='queues',
+            help='Only serve this queue (repeatable). Defaults to every queue in JOB_QUEUES.',
+        )
+        parser.add_argument('--poll-interval', type=float, help='Seconds to sleep when nothing is due')
+        parser.add_argument('--burst', action='store_true', help='Exit once no job is due')
+
+    def handle(self, *args, **options):
+        worker = Worker(queues=options['queues'], poll_interval=options['poll_interval'])
+
+        def shutdown(signum, frame):
+            self.stdout.write("Finishing running jobs before exit...")
+            worker.stop()
+
+        signal.signal(signal.SIGINT, shutdown)
+        signal.signal(signal.SIGTERM, shutdown)
+
+        self.stdout.write(f"Worker {worker.name} serving {', '.join(worker.limits)}")
+        worker.run(burst=options['burst'])
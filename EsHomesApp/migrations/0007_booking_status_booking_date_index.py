@@ -0,0 +1,17 @@
+# Generated by Django 5.2.18 on 2026-10-19 17:58
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('EsHomesApp', '0006_job'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='booking',
+            index=models.Index(fields=['status', 'booking_date'], name='EsHomesApp__status_e75d26_idx'),
+        ),
+    ]
@@ -0,0 +1,61 @@
+# Generated by Django 5.2.18 on 2026-10-19 17:59
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('EsHomesApp', '0007_booking_status_booking_date_index'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ApartmentMonthStats',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('month', models.DateField(help_text='First day of the month')),
+                ('nights_sold', models.PositiveIntegerField(default=0)),
+                ('confirmed_revenue', models.DecimalField(decimal_places=2, default=0, max_digits=12)),
+                ('cancellations', models.PositiveIntegerField(default=0)),
+                ('stays', models.PositiveIntegerField(default=0)),
+                ('stay_nights', models.PositiveIntegerField(default=0)),
+                ('refreshed_at', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'verbose_name': 'Apartment month stats',
+                'verbose_name_plural': 'Occupancy & revenue',
+                'ordering': ['-month', 'apartment'],
+            },
+        ),
+        migrations.CreateModel(
+            name='RollupWatermark',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=100, unique=True)),
+                ('value', models.DateTimeField()),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='booking',
+            index=models.Index(fields=['last_updated'], name='EsHomesApp__last_up_f2fede_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='transaction',
+            index=models.Index(fields=['updated_at'], name='EsHomesApp__updated_b54668_idx'),
+        ),
+        migrations.AddField(
+            model_name='apartmentmonthstats',
+            name='apartment',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='month_stats', to='EsHomesApp.apartment'),
+        ),
+        migrations.AddIndex(
+            model_name='apartmentmonthstats',
+            index=models.Index(fields=['month'], name='EsHomesApp__month_0e51ed_idx'),
+        ),
+        migrations.AddConstraint(
+            model_name='apartmentmonthstats',
+            constraint=models.UniqueConstraint(fields=('apartment', 'month'), name='unique_apartment_month_stats'),
+        ),
+    ]
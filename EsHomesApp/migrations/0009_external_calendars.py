@@ -0,0 +1,44 @@
+# Generated by Django 5.2.18 on 2026-10-19 18:01
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('EsHomesApp', '0008_month_stats_rollups'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ExternalCalendar',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(help_text='Channel name, e.g. Airbnb', max_length=100)),
+                ('url', models.URLField(max_length=500)),
+                ('active', models.BooleanField(default=True)),
+                ('etag', models.CharField(blank=True, max_length=255)),
+                ('last_modified', models.CharField(blank=True, max_length=100)),
+                ('last_synced_at', models.DateTimeField(blank=True, null=True)),
+                ('last_error', models.TextField(blank=True)),
+                ('apartment', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='external_calendars', to='EsHomesApp.apartment')),
+            ],
+        ),
+        migrations.CreateModel(
+            name='ExternalBlock',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('uid', models.CharField(max_length=255)),
+                ('start_date', models.DateField()),
+                ('end_date', models.DateField()),
+                ('summary', models.CharField(blank=True, max_length=200)),
+                ('apartment', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='external_blocks', to='EsHomesApp.apartment')),
+                ('calendar', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='blocks', to='EsHomesApp.externalcalendar')),
+            ],
+            options={
+                'ordering': ['start_date'],
+                'indexes': [models.Index(fields=['apartment', 'start_date', 'end_date'], name='EsHomesApp__apartme_2e9554_idx')],
+            },
+        ),
+    ]
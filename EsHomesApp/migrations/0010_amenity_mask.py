@@ -0,0 +1,67 @@
+from django.db import migrations, models
+from django.utils.text import slugify
+
+
+def assign_bits_and_masks(apps, schema_editor):
+    Amenity = apps.get_model('EsHomesApp', 'Amenity')
+    Apartment = apps.get_model('EsHomesApp', 'Apartment')
+
+    slugs = set()
+    for bit, amenity in enumerate(Amenity.objects.order_by('pk')):
+        if bit >= 63:
+            raise RuntimeError("Apartment.amenity_mask holds at most 63 amenities")
+        base = slugify(amenity.name)[:90] or 'amenity'
+        slug, n = base, 1
+        while slug in slugs:
+            n += 1
+            slug = f"{base}-{n}"
+        slugs.add(slug)
+        amenity.slug = slug
+        amenity.bit = bit
+        amenity.save(update_fields=['slug', 'bit'])
+
+    masks = {}
+    for apartment_id, bit in Apartment.amenities.through.objects.values_list('apartment_id', 'amenity__bit'):
+        masks[apartment_id] = masks.get(apartment_id, 0) | (1 << bit)
+    for apartment_id, mask in masks.items():
+        Apartment.objects.filter(pk=apartment_id).update(amenity_mask=mask)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('EsHomesApp', '0009_external_calendars'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='amenity',
+            name='slug',
+            field=models.SlugField(blank=True, max_length=100),
+        ),
+        migrations.AddField(
+            model_name='amenity',
+            name='bit',
+            field=models.PositiveSmallIntegerField(editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name='apartment',
+            name='amenity_mask',
+            field=models.BigIntegerField(default=0, editable=False),
+        ),
+        migrations.RunPython(assign_bits_and_masks, migrations.RunPython.noop),
+        migrations.AlterField(
+            model_name='amenity',
+            name='slug',
+            field=models.SlugField(blank=True, help_text='Used in the listing filter, e.g. ?amenities=wifi,pool', max_length=100, unique=True),
+        ),
+        migrations.AlterField(
+            model_name='amenity',
+            name='bit',
+            field=models.PositiveSmallIntegerField(editable=False, unique=True),
+        ),
+        migrations.AddIndex(
+            model_name='apartment',
+            index=models.Index(fields=['status', '-created_at'], name='apartment_status_created_idx'),
+        ),
+    ]
@@ -0,0 +1,28 @@
+# Generated by Django 5.2.18 on 2026-10-19 18:14
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('EsHomesApp', '0010_amenity_mask'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SimilarApartment',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('rank', models.PositiveSmallIntegerField(help_text='1 is the most similar')),
+                ('distance', models.FloatField()),
+                ('apartment', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='neighbours', to='EsHomesApp.apartment')),
+                ('similar', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='similar_to', to='EsHomesApp.apartment')),
+            ],
+            options={
+                'ordering': ['apartment', 'rank'],
+                'constraints': [models.UniqueConstraint(fields=('apartment', 'rank'), name='similar_apartment_rank_unique')],
+            },
+        ),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 5.2.18 on 2026-10-19 18:30
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('EsHomesApp', '0012_apartment_location'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='transaction',
+            index=models.Index(fields=['transaction_status', 'created_at'], name='transaction_status_created_idx'),
+        ),
+    ]
@@ -0,0 +1,49 @@
+# Generated by Django 5.2.18 on 2026-10-19 19:18
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('EsHomesApp', '0014_archive'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ReviewVote',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('applied', models.BooleanField(default=False)),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='review',
+            index=models.Index(fields=['apartment', 'created_at'], name='review_apartment_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='review',
+            index=models.Index(fields=['apartment', 'helpful_votes'], name='review_apartment_helpful_idx'),
+        ),
+        migrations.AddField(
+            model_name='reviewvote',
+            name='review',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='votes', to='EsHomesApp.review'),
+        ),
+        migrations.AddField(
+            model_name='reviewvote',
+            name='user',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='review_votes', to=settings.AUTH_USER_MODEL),
+        ),
+        migrations.AddIndex(
+            model_name='reviewvote',
+            index=models.Index(condition=models.Q(('applied', False)), fields=['id'], name='review_vote_pending_idx'),
+        ),
+        migrations.AddConstraint(
+            model_name='reviewvote',
+            constraint=models.UniqueConstraint(fields=('review', 'user'), name='review_vote_unique'),
+        ),
+    ]
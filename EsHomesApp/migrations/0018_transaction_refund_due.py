@@ -0,0 +1,23 @@
+# Generated by Django 5.2.18 on 2026-10-19 19:38
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('EsHomesApp', '0017_image_uploads'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='archivedtransaction',
+            name='transaction_status',
+            field=models.CharField(choices=[('pending', 'Pending'), ('processing', 'Processing'), ('completed', 'Completed'), ('declined', 'Declined'), ('refund_due', 'Paid, refund due')], max_length=20),
+        ),
+        migrations.AlterField(
+            model_name='transaction',
+            name='transaction_status',
+            field=models.CharField(choices=[('pending', 'Pending'), ('processing', 'Processing'), ('completed', 'Completed'), ('declined', 'Declined'), ('refund_due', 'Paid, refund due')], default='pending', max_length=20),
+        ),
+    ]
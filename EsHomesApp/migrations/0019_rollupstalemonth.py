@@ -0,0 +1,24 @@
+# Generated by Django 5.2.18 on 2026-10-19 19:58
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('EsHomesApp', '0018_transaction_refund_due'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RollupStaleMonth',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('apartment_id', models.BigIntegerField()),
+                ('month', models.DateField()),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('apartment_id', 'month'), name='rollup_stale_month_unique')],
+            },
+        ),
+    ]
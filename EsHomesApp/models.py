@@ -1,7 +1,15 @@
+from datetime import timedelta
+
+from django.conf import settings
 from django.db import models
+from django.db.models import F, Q
 from django.contrib.auth.models import AbstractUser
 from django.core.validators import MinValueValidator, MaxValueValidator
+from django.core.exceptions import ValidationError
 from django.utils import timezone
+from django.utils.text import slugify
+
+from . import geo
 
 class CustomUser(AbstractUser):
     first_name = models.CharField(max_length=20)
@@ -23,17 +31,62 @@ class CustomUser(AbstractUser):
         verbose_name = 'User'
         verbose_name_plural = 'Users'
 
+def amenity_mask(bits):
+    mask = 0
+    for bit in bits:
+        mask |= 1 << bit
+    return mask
+
 class Amenity(models.Model):
+    # Each amenity owns one bit of Apartment.amenity_mask, a signed 64-bit column
+    MAX_AMENITIES = 63
+
     name = models.CharField(max_length=100)
+    slug = models.SlugField(max_length=100, unique=True, blank=True, help_text="Used in the listing filter, e.g. ?amenities=wifi,pool")
     icon = models.CharField(max_length=50, help_text="Font Awesome icon class")
     description = models.TextField(blank=True)
+    bit = models.PositiveSmallIntegerField(unique=True, editable=False)
 
     def __str__(self):
         return self.name
 
+    def clean(self):
+        if self.bit is None and Amenity.objects.count() >= self.MAX_AMENITIES:
+            raise ValidationError(f"There can be at most {self.MAX_AMENITIES} amenities.")
+
+    def save(self, *args, **kwargs):
+        if not self.slug:
+            self.slug = self._unique_slug()
+        if self.bit is None:
+            used = set(Amenity.objects.values_list('bit', flat=True))
+            free = [bit for bit in range(self.MAX_AMENITIES) if bit not in used]
+            if not free:
+                raise ValueError(f"There can be at most {self.MAX_AMENITIES} amenities.")
+            self.bit = free[0]
+        super().save(*args, **kwargs)
+
+    def _unique_slug(self):
+        base = slugify(self.name)[:90] or 'amenity'
+        slug, n = base, 1
+        while Amenity.objects.filter(slug=slug).exclude(pk=self.pk).exists():
+            n += 1
+            slug = f"{base}-{n}"
+        return slug
+
     class Meta:
         verbose_name_plural = 'Amenities'
 
+class ApartmentQuerySet(models.QuerySet):
+    def with_amenities(self, mask, match='all'):
+        """
+        Apartments having all (or with ``match='any'``, at least one) of the
+        amenities in ``mask``. A single predicate on amenity_mask, no joins.
+        """
+        matched = F('amenity_mask').bitand(mask)
+        if match == 'any':
+            return self.alias(amenity_match=matched).exclude(amenity_match=0)
+        return self.alias(amenity_match=matched).filter(amenity_match=mask)
+
 class Apartment(models.Model):
     APARTMENT_TYPES = [
         ('studio', 'Studio'),
@@ -62,14 +115,39 @@ class Apartment(models.Model):
     status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='available')
     featured = models.BooleanField(default=False)
     amenities = models.ManyToManyField(Amenity)
+    # Bit n is set when the apartment has the amenity with bit n; kept in step
+    # with ``amenities`` by the m2m_changed receiver in signals.py
+    amenity_mask = models.BigIntegerField(default=0, editable=False)
+    address = models.CharField(max_length=255, blank=True)
+    latitude = models.FloatField(null=True, blank=True, validators=[MinValueValidator(-90), MaxValueValidator(90)])
+    longitude = models.FloatField(null=True, blank=True, validators=[MinValueValidator(-180), MaxValueValidator(180)])
+    # Derived from the coordinates on save, for prefix-pruned "near me" search (geo.py)
+    geohash = models.CharField(max_length=12, blank=True, editable=False)
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
+    objects = ApartmentQuerySet.as_manager()
+
     def __str__(self):
         return f"{self.name} - {self.get_apartment_type_display()}"
 
+    def save(self, *args, **kwargs):
+        if self.latitude is not None and self.longitude is not None:
+            self.geohash = geo.encode(self.latitude, self.longitude)
+        else:
+            self.geohash = ''
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None and ({'latitude', 'longitude'} & set(update_fields)):
+            kwargs['update_fields'] = set(update_fields) | {'geohash'}
+        super().save(*args, **kwargs)
+
     class Meta:
         ordering = ['-created_at']
+        indexes = [
+            # The listing: available apartments, newest first
+            models.Index(fields=['status', '-created_at'], name='apartment_status_created_idx'),
+            models.Index(fields=['geohash'], name='apartment_geohash_idx'),
+        ]
 
 class ApartmentImage(models.Model):
     apartment = models.ForeignKey(Apartment, on_delete=models.CASCADE, related_name='images')
@@ -84,6 +162,42 @@ class ApartmentImage(models.Model):
     class Meta:
         ordering = ['-is_primary', '-upload_date']
 
+class SimilarApartment(models.Model):
+    """Precomputed nearest neighbours of an apartment, rebuilt by recommender.rebuild()."""
+
+    apartment = models.ForeignKey(Apartment, on_delete=models.CASCADE, related_name='neighbours')
+    similar = models.ForeignKey(Apartment, on_delete=models.CASCADE, related_name='similar_to')
+    rank = models.PositiveSmallIntegerField(help_text="1 is the most similar")
+    distance = models.FloatField()
+
+    def __str__(self):
+        return f"{self.apartment_id} -> {self.similar_id} (#{self.rank})"
+
+    class Meta:
+        ordering = ['apartment', 'rank']
+        constraints = [
+            models.UniqueConstraint(fields=['apartment', 'rank'], name='similar_apartment_rank_unique'),
+        ]
+
+def booking_hold_cutoff(now=None):
+    """Pending bookings made before this moment have lost their hold."""
+    return (now or timezone.now()) - timedelta(minutes=settings.BOOKING_HOLD_MINUTES)
+
+
+class BookingQuerySet(models.QuerySet):
+    def blocking(self, now=None):
+        """Bookings that hold their dates: confirmed, or pending and not yet expired."""
+        return self.filter(
+            Q(status='confirmed') | Q(status='pending', booking_date__gte=booking_hold_cutoff(now))
+        )
+
+    def overlapping(self, check_in_date, check_out_date):
+        return self.filter(check_in_date__lt=check_out_date, check_out_date__gt=check_in_date)
+
+    def expired_holds(self, now=None):
+        return self.filter(status='pending', booking_date__lt=booking_hold_cutoff(now))
+
+
 class Booking(models.Model):
     STATUS_CHOICES = [
         ('pending', 'Pending'),
@@ -91,6 +205,8 @@ class Booking(models.Model):
         ('cancelled', 'Cancelled'),
         ('completed', 'Completed'),
     ]
+    # cancellation_reason of the bookings the hold sweeper cancels
+    HOLD_EXPIRED_REASON = 'Payment was not completed in time.'
 
     user = models.ForeignKey(CustomUser, on_delete=models.CASCADE, related_name='bookings')
     apartment = models.ForeignKey(Apartment, on_delete=models.CASCADE, related_name='bookings')
@@ -104,9 +220,17 @@ class Booking(models.Model):
     cancellation_reason = models.TextField(blank=True)
     last_updated = models.DateTimeField(auto_now=True)
 
+    objects = BookingQuerySet.as_manager()
+
     def __str__(self):
         return f"Booking #{self.id} - {self.apartment.name} by {self.user.username}"
 
+    @property
+    def hold_expires_at(self):
+        if self.status != 'pending' or self.booking_date is None:
+            return None
+        return self.booking_date + timedelta(minutes=settings.BOOKING_HOLD_MINUTES)
+
     def clean(self):
         from django.core.exceptions import ValidationError
         if self.check_out_date <= self.check_in_date:
@@ -121,6 +245,10 @@ class Booking(models.Model):
         indexes = [
             models.Index(fields=['check_in_date', 'check_out_date']),
             models.Index(fields=['status']),
+            # Hold expiry: availability checks and the expired-hold sweeper
+            models.Index(fields=['status', 'booking_date']),
+            # Incremental rollup refresh reads rows changed since a watermark
+            models.Index(fields=['last_updated']),
         ]
 
 class Review(models.Model):
@@ -135,6 +263,10 @@ class Review(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
     helpful_votes = models.IntegerField(default=0)
+    # Where ``booking`` points once archive.py has moved the booking out of Booking
+    archived_booking = models.OneToOneField(
+        'ArchivedBooking', on_delete=models.SET_NULL, null=True, blank=True, related_name='review',
+    )
     response = models.TextField(blank=True, null=True)
     response_date = models.DateTimeField(null=True, blank=True)
 
@@ -144,7 +276,32 @@ class Review(models.Model):
     class Meta:
         ordering = ['-created_at']
         unique_together = ['user', 'booking']  # One review per booking
-        
+        indexes = [
+            # The detail page's review list, newest or most helpful first (see reviews.py)
+            models.Index(fields=['apartment', 'created_at'], name='review_apartment_created_idx'),
+            models.Index(fields=['apartment', 'helpful_votes'], name='review_apartment_helpful_idx'),
+        ]
+
+
+class ReviewVote(models.Model):
+    """A user's "helpful" vote on a review, added to ``Review.helpful_votes`` by reviews.apply_votes()."""
+    review = models.ForeignKey(Review, on_delete=models.CASCADE, related_name='votes')
+    user = models.ForeignKey(CustomUser, on_delete=models.CASCADE, related_name='review_votes')
+    created_at = models.DateTimeField(auto_now_add=True)
+    applied = models.BooleanField(default=False)
+
+    def __str__(self):
+        return f"{self.user_id} found review {self.review_id} helpful"
+
+    class Meta:
+        constraints = [
+            # One vote per user and review, however many times (or at once) they click
+            models.UniqueConstraint(fields=['review', 'user'], name='review_vote_unique'),
+        ]
+        indexes = [
+            models.Index(fields=['id'], condition=Q(applied=False), name='review_vote_pending_idx'),
+        ]
+
 # Add this at the end of models.py
 import uuid
 
@@ -154,6 +311,8 @@ class Transaction(models.Model):
         ('processing', 'Processing'),
         ('completed', 'Completed'),
         ('declined', 'Declined'),
+        # Paid after the booking lost its dates (see views.settle_payment)
+        ('refund_due', 'Paid, refund due'),
     ]
 
     user = models.ForeignKey(CustomUser, on_delete=models.CASCADE, related_name='transactions')
@@ -169,4 +328,261 @@ class Transaction(models.Model):
         return f"Transaction {self.tx_ref} for {self.user.username}"
 
     class Meta:
-        ordering = ['-created_at']
\ No newline at end of file
+        ordering = ['-created_at']
+        indexes = [
+            models.Index(fields=['updated_at']),
+            # The reconciliation job's scan for old pending/processing transactions
+            models.Index(fields=['transaction_status', 'created_at'], name='transaction_status_created_idx'),
+        ]
+
+class Job(models.Model):
+    """A unit of background work, picked up by ``manage.py runworker``."""
+
+    STATUS_CHOICES = [
+        ('queued', 'Queued'),
+        ('running', 'Running'),
+        ('succeeded', 'Succeeded'),
+        ('failed', 'Failed'),
+    ]
+
+    queue = models.CharField(max_length=50, default='default')
+    task = models.CharField(max_length=200)
+    args = models.JSONField(default=list, blank=True)
+    kwargs = models.JSONField(default=dict, blank=True)
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='queued')
+    run_at = models.DateTimeField(default=timezone.now)
+    attempts = models.PositiveIntegerField(default=0)
+    max_attempts = models.PositiveIntegerField(default=5)
+    # Periodic jobs keep a single row that is re-queued after every run
+    interval = models.DurationField(null=True, blank=True)
+    unique_key = models.CharField(max_length=200, null=True, blank=True, unique=True)
+    locked_by = models.CharField(max_length=100, blank=True)
+    locked_at = models.DateTimeField(null=True, blank=True)
+    last_error = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+
+    def __str__(self):
+        return f"Job #{self.id} {self.task} ({self.status})"
+
+    class Meta:
+        ordering = ['run_at']
+        indexes = [
+            models.Index(fields=['queue', 'status', 'run_at']),
+            models.Index(fields=['status', 'locked_at']),
+        ]
+
+
+class ApartmentMonthStats(models.Model):
+    """Occupancy and revenue per apartment per month, kept up to date by rollups.refresh()."""
+
+    apartment = models.ForeignKey(Apartment, on_delete=models.CASCADE, related_name='month_stats')
+    month = models.DateField(help_text="First day of the month")
+    nights_sold = models.PositiveIntegerField(default=0)
+    confirmed_revenue = models.DecimalField(max_digits=12, decimal_places=2, default=0)
+    cancellations = models.PositiveIntegerField(default=0)
+    # Stays checking in this month, for the average length of stay
+    stays = models.PositiveIntegerField(default=0)
+    stay_nights = models.PositiveIntegerField(default=0)
+    refreshed_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"{self.apartment.name} - {self.month:%B %Y}"
+
+    @property
+    def days_in_month(self):
+        next_month = (self.month.replace(day=28) + timedelta(days=4)).replace(day=1)
+        return (next_month - self.month).days
+
+    @property
+    def occupancy_rate(self):
+        return self.nights_sold / self.days_in_month
+
+    @property
+    def average_stay(self):
+        return self.stay_nights / self.stays if self.stays else 0
+
+    class Meta:
+        ordering = ['-month', 'apartment']
+        verbose_name = 'Apartment month stats'
+        verbose_name_plural = 'Occupancy & revenue'
+        constraints = [
+            models.UniqueConstraint(fields=['apartment', 'month'], name='unique_apartment_month_stats'),
+        ]
+        indexes = [
+            models.Index(fields=['month']),
+        ]
+
+
+class RollupWatermark(models.Model):
+    """How far an incremental refresh has read a source table."""
+
+    name = models.CharField(max_length=100, unique=True)
+    value = models.DateTimeField()
+
+    def __str__(self):
+        return f"{self.name} @ {self.value}"
+
+
+class RollupStaleMonth(models.Model):
+    """
+    A month of ``ApartmentMonthStats`` a booking no longer covers (it moved or
+    was deleted), left for the next refresh, which can't see it otherwise.
+    """
+
+    # Not a foreign key: the apartment may be on its way out with its bookings
+    apartment_id = models.BigIntegerField()
+    month = models.DateField()
+
+    def __str__(self):
+        return f"Apartment #{self.apartment_id} - {self.month:%B %Y}"
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['apartment_id', 'month'], name='rollup_stale_month_unique'),
+        ]
+
+
+class ExternalCalendar(models.Model):
+    """An iCal feed from another channel (Airbnb, Booking.com...) listing the same apartment."""
+
+    apartment = models.ForeignKey(Apartment, on_delete=models.CASCADE, related_name='external_calendars')
+    name = models.CharField(max_length=100, help_text="Channel name, e.g. Airbnb")
+    url = models.URLField(max_length=500)
+    active = models.BooleanField(default=True)
+    # Validators from the last 200 response, sent back for conditional GET
+    etag = models.CharField(max_length=255, blank=True)
+    last_modified = models.CharField(max_length=100, blank=True)
+    last_synced_at = models.DateTimeField(null=True, blank=True)
+    last_error = models.TextField(blank=True)
+
+    def __str__(self):
+        return f"{self.name} calendar for {self.apartment.name}"
+
+
+class ExternalBlock(models.Model):
+    """Dates blocked on another channel. ``end_date`` is exclusive, like check-out."""
+
+    calendar = models.ForeignKey(ExternalCalendar, on_delete=models.CASCADE, related_name='blocks')
+    apartment = models.ForeignKey(Apartment, on_delete=models.CASCADE, related_name='external_blocks')
+    uid = models.CharField(max_length=255)
+    start_date = models.DateField()
+    end_date = models.DateField()
+    summary = models.CharField(max_length=200, blank=True)
+
+    def __str__(self):
+        return f"{self.apartment.name} blocked {self.start_date} - {self.end_date}"
+
+    class Meta:
+        ordering = ['start_date']
+        indexes = [
+            models.Index(fields=['apartment', 'start_date', 'end_date']),
+        ]
+
+
+class ArchivedBooking(models.Model):
+    """
+    A completed or cancelled booking moved out of Booking by archive.py, long
+    after the stay. Same id and fields as it had there.
+    """
+    is_archived = True
+
+    id = models.BigIntegerField(primary_key=True)
+    user = models.ForeignKey(CustomUser, on_delete=models.CASCADE, related_name='archived_bookings')
+    apartment = models.ForeignKey(Apartment, on_delete=models.CASCADE, related_name='archived_bookings')
+    check_in_date = models.DateField()
+    check_out_date = models.DateField()
+    guests = models.IntegerField()
+    total_price = models.DecimalField(max_digits=10, decimal_places=2)
+    status = models.CharField(max_length=20, choices=Booking.STATUS_CHOICES)
+    booking_date = models.DateTimeField()
+    special_requests = models.TextField(blank=True)
+    cancellation_reason = models.TextField(blank=True)
+    last_updated = models.DateTimeField()
+    archived_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return f"Archived booking #{self.id} - {self.apartment.name} by {self.user.username}"
+
+    class Meta:
+        ordering = ['-booking_date']
+        indexes = [
+            models.Index(fields=['status', 'booking_date']),
+            models.Index(fields=['apartment', 'check_in_date']),
+        ]
+
+
+class ArchivedTransaction(models.Model):
+    """The transaction of an ArchivedBooking, moved with it."""
+
+    id = models.BigIntegerField(primary_key=True)
+    user = models.ForeignKey(CustomUser, on_delete=models.CASCADE, related_name='archived_transactions')
+    booking = models.OneToOneField(ArchivedBooking, on_delete=models.CASCADE, related_name='transaction')
+    amount = models.DecimalField(max_digits=10, decimal_places=2)
+    tx_ref = models.CharField(max_length=100, unique=True)
+    flw_transaction_id = models.CharField(max_length=100, blank=True, null=True)
+    transaction_status = models.CharField(max_length=20, choices=Transaction.STATUS_CHOICES)
+    created_at = models.DateTimeField()
+    updated_at = models.DateTimeField()
+    archived_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return f"Archived transaction {self.tx_ref}"
+
+    class Meta:
+        ordering = ['-created_at']
+        indexes = [
+            models.Index(fields=['transaction_status', 'created_at']),
+        ]
+
+
+class ExchangeRate(models.Model):
+    """Units of ``currency`` per unit of BASE_CURRENCY, for displaying prices (see currency.py)."""
+
+    currency = models.CharField(max_length=3, unique=True)
+    rate = models.DecimalField(max_digits=20, decimal_places=10)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"{self.currency} {self.rate}"
+
+    class Meta:
+        ordering = ['currency']
+
+
+class ImageUpload(models.Model):
+    """
+    A photo on its way in, chunk by chunk (see uploads.py). The chunks received
+    so far are files in its directory under UPLOAD_TEMP_DIR; the row goes once
+    the photo has become an ApartmentImage.
+    """
+
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    apartment = models.ForeignKey(Apartment, on_delete=models.CASCADE, related_name='image_uploads')
+    filename = models.CharField(max_length=255)
+    size = models.PositiveBigIntegerField()
+    sha256 = models.CharField(max_length=64)
+    chunk_size = models.PositiveIntegerField()
+    created_by = models.ForeignKey(
+        settings.AUTH_USER_MODEL, on_delete=models.SET_NULL, null=True, blank=True, related_name='+',
+    )
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return f"{self.filename} for {self.apartment_id}"
+
+    @property
+    def chunk_count(self):
+        return -(-self.size // self.chunk_size)
+
+    def chunk_length(self, index):
+        """Bytes in chunk ``index``: chunk_size, except for a short last chunk."""
+        return min(self.chunk_size, self.size - index * self.chunk_size)
+
+    class Meta:
+        ordering = ['created_at']
+        constraints = [
+            # The same photo dropped again (another tab, after a crash) resumes the first upload
+            models.UniqueConstraint(fields=['apartment', 'sha256'], name='image_upload_unique'),
+        ]
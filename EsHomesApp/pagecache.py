@@ -0,0 +1,108 @@
+"""
+Full-page cache for the pages every anonymous visitor sees the same way
+(PAGE_CACHE_VIEWS: home, about, contact).
+
+PageCacheMiddleware stores the first anonymous rendering of such a page and
+serves the following ones from the cache before URL resolution, the view or
+the template run. A request skips the cache, both for reading and storing,
+when it:
+
+- isn't a GET or HEAD without a query string,
+- belongs to a logged-in session,
+- has messages waiting to be displayed (in the cookie or the session), or
+- has picked a display currency (currency.py).
+
+Only plain 200 responses that set no cookies are stored. Keys embed the
+inventory version from caching.py, so home's featured apartments are
+re-rendered as soon as the inventory changes. Hits and misses both carry
+``Vary: Cookie``, because a session cookie can change what the page shows.
+"""
+from functools import lru_cache
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction, sync_to_async
+from django.conf import settings
+from django.contrib.auth import SESSION_KEY
+from django.contrib.messages.storage.cookie import CookieStorage
+from django.contrib.messages.storage.session import SessionStorage
+from django.http import HttpResponse
+from django.urls import reverse
+from django.utils.cache import patch_vary_headers
+
+from . import caching, currency
+
+
+@lru_cache(maxsize=None)
+def cacheable_paths(view_names):
+    return frozenset(reverse(name) for name in view_names)
+
+
+def bypass(request):
+    if request.method not in ('GET', 'HEAD') or request.META.get('QUERY_STRING'):
+        return True
+    if request.path not in cacheable_paths(tuple(settings.PAGE_CACHE_VIEWS)):
+        return True
+    if CookieStorage.cookie_name in request.COOKIES:
+        return True
+    if settings.SESSION_COOKIE_NAME in request.COOKIES:
+        # Loads the session, which visitors without one never pay for
+        return any(key in request.session for key in (SESSION_KEY, SessionStorage.session_key, currency.SESSION_KEY))
+    return False
+
+
+def cache_key(request):
+    version = caching.namespace_version(caching.INVENTORY)
+    return f"page:{version}:{request.get_host()}{request.path}"
+
+
+def lookup(request):
+    """A response for the request from the cache, or None."""
+    entry = caching.get_cache().get(cache_key(request))
+    if entry is None:
+        return None
+    status, content, headers = entry
+    response = HttpResponse(content, status=status, headers=headers)
+    response['X-Page-Cache'] = 'hit'
+    return response
+
+
+def store(request, response):
+    cache_control = response.get('Cache-Control', '')
+    if (response.status_code != 200 or response.streaming or response.cookies
+            or any(directive in cache_control for directive in ('private', 'no-store', 'no-cache'))):
+        return
+    patch_vary_headers(response, ('Cookie',))
+    entry = (response.status_code, response.content, list(response.items()))
+    caching.get_cache().set(cache_key(request), entry, settings.PAGE_CACHE_SECONDS)
+    response['X-Page-Cache'] = 'miss'
+
+
+class PageCacheMiddleware:
+    """Serve cached anonymous pages. Goes after SessionMiddleware, which it needs to spot logged-in users."""
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        if bypass(request):
+            return self.get_response(request)
+        response = lookup(request)
+        if response is None:
+            response = self.get_response(request)
+            store(request, response)
+        return response
+
+    async def __acall__(self, request):
+        # The session and cache backends may both be the database
+        if await sync_to_async(bypass)(request):
+            return await self.get_response(request)
+        response = await sync_to_async(lookup)(request)
+        if response is None:
+            response = await self.get_response(request)
+            await sync_to_async(store)(request, response)
+        return response
@@ -0,0 +1,231 @@
+"""
+Request throttling backed by the cache.
+
+Each rule allows ``count`` requests per ``period``, counted per key of what
+the rule names:
+
+    ip            client address
+    user          logged-in user id, falling back to the address
+    post:<field>  a submitted form field, e.g. the email being logged into
+    endpoint      one count shared by every caller of the view
+
+Requests are counted in fixed windows of one period, with counters updated
+by ``cache.add()`` + ``cache.incr()`` (atomic on the local-memory, Redis and
+Memcached backends). The previous window's count is added in, weighted by
+how much of the last ``period`` it still covers: an estimate of a sliding
+window, so a burst straddling a window boundary can't get twice the
+allowance. To hold limits across worker processes RATE_LIMIT_CACHE must
+point at a shared cache (Redis or Memcached).
+
+Per-route rules are declared in urls.py with the ``ratelimit`` decorator:
+
+    path('login/', ratelimit('ip:20/m', failures=['post:email:5/15m'])(views.login_user))
+
+``failures`` rules only count failed logins (Django's user_login_failed
+signal), so nobody can lock an account out by spending its allowance with
+attempts that would have succeeded; once they are used up, they reject
+like any other rule. ``exempt`` is a predicate on the request that waives
+every limit, e.g. for a webhook that proves it comes from the gateway.
+
+``RateLimitMiddleware`` adds a site-wide per-address ceiling on POST/PUT/
+PATCH/DELETE, which views exempt themselves from with ``exempt`` (the
+decorator's, or a ``ratelimit_exempt`` attribute of their own). Both run
+before the view, so a rejected request never reaches the session, the
+database or the password hasher. Both work with sync and async views.
+"""
+import hashlib
+import time
+from functools import lru_cache, wraps
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction, sync_to_async
+from django.conf import settings
+from django.core.cache import caches
+from django.http import HttpResponse
+
+PERIODS = {'s': 1, 'm': 60, 'h': 60 * 60, 'd': 60 * 60 * 24}
+
+UNSAFE_METHODS = ('POST', 'PUT', 'PATCH', 'DELETE')
+
+
+@lru_cache(maxsize=None)
+def parse_rate(rate):
+    """'5/15m' -> (5, 900)"""
+    count, period = rate.split('/')
+    unit = period[-1]
+    multiplier = int(period[:-1]) if len(period) > 1 else 1
+    return int(count), multiplier * PERIODS[unit]
+
+
+@lru_cache(maxsize=None)
+def parse_rule(rule):
+    """'post:email:5/15m' -> ('post:email', 5, 900)"""
+    key, rate = rule.rsplit(':', 1)
+    return (key,) + parse_rate(rate)
+
+
+def client_ip(request):
+    proxies = settings.RATE_LIMIT_PROXY_COUNT
+    if proxies:
+        forwarded = [part.strip() for part in request.META.get('HTTP_X_FORWARDED_FOR', '').split(',') if part.strip()]
+        if len(forwarded) >= proxies:
+            return forwarded[-proxies]
+    return request.META.get('REMOTE_ADDR', '')
+
+
+def identify(request, key):
+    if key == 'ip':
+        return client_ip(request)
+    if key == 'user':
+        user = getattr(request, 'user', None)
+        if user is not None and user.is_authenticated:
+            return f"user:{user.pk}"
+        return client_ip(request)
+    if key == 'endpoint':
+        return ''
+    if key.startswith('post:'):
+        value = request.POST.get(key[5:], '').strip().lower()
+        return value or None
+    raise ValueError(f"Unknown rate limit key {key!r}")
+
+
+def hit(scope, identity, limit, period, now=None, count_it=True):
+    """
+    Count a request. Returns 0 if it is allowed, else the number of seconds
+    until it would be. With ``count_it`` False, only checks whether it would be.
+    """
+    cache = caches[settings.RATE_LIMIT_CACHE]
+    now = time.time() if now is None else now
+    window, offset = divmod(now, period)
+    window = int(window)
+    digest = hashlib.md5(f"{scope}|{identity}".encode()).hexdigest()
+    key = f"rl:{digest}:{period}:{window}"
+
+    if count_it:
+        cache.add(key, 0, period * 2)
+        try:
+            count = cache.incr(key)
+        except ValueError:
+            # Evicted between add() and incr()
+            cache.set(key, 1, period * 2)
+            count = 1
+    else:
+        count = cache.get(key, 0) + 1
+    previous = cache.get(f"rl:{digest}:{period}:{window - 1}", 0)
+
+    weighted = previous * (1 - offset / period) + count
+    if weighted <= limit:
+        return 0
+    return max(1, int(period - offset))
+
+
+def check(request, scope, rules, failures=()):
+    """
+    Apply ``rules`` to the request, and make sure ``failures`` aren't used up
+    yet. Returns a 429 response, or None if allowed.
+    """
+    if not settings.RATE_LIMIT_ENABLED:
+        return None
+    for rule in rules:
+        key, limit, period = parse_rule(rule)
+        identity = identify(request, key)
+        if identity is None:
+            continue
+        retry_after = hit(f"{scope}:{key}", identity, limit, period)
+        if retry_after:
+            return too_many_requests(retry_after)
+    for rule in failures:
+        key, limit, period = parse_rule(rule)
+        identity = identify(request, key)
+        if identity is None:
+            continue
+        retry_after = hit(f"{scope}:failed:{key}", identity, limit, period, count_it=False)
+        if retry_after:
+            return too_many_requests(retry_after)
+    if failures:
+        # Counted by count_failure() if the view's login attempt fails
+        request.ratelimit_failures = (scope, failures)
+    return None
+
+
+def count_failure(request):
+    """Count a failed login against the ``failures`` rules of the view handling ``request``."""
+    if not settings.RATE_LIMIT_ENABLED:
+        return
+    scope, failures = getattr(request, 'ratelimit_failures', (None, ()))
+    for rule in failures:
+        key, limit, period = parse_rule(rule)
+        identity = identify(request, key)
+        if identity is not None:
+            hit(f"{scope}:failed:{key}", identity, limit, period)
+
+
+def too_many_requests(retry_after):
+    response = HttpResponse(
+        f"Too many requests. Please try again in {retry_after} seconds.",
+        status=429, content_type='text/plain',
+    )
+    response['Retry-After'] = str(retry_after)
+    return response
+
+
+def ratelimit(*rules, failures=(), exempt=None, methods=UNSAFE_METHODS):
+    """
+    Throttle a view. ``rules`` and ``failures`` are 'key:rate' strings and
+    ``exempt`` a predicate on the request, see the module docstring.
+    """
+    for rule in (*rules, *failures):
+        parse_rule(rule)  # fail at import time on a typo
+
+    def applies(request):
+        return request.method in methods and not (exempt is not None and exempt(request))
+
+    def decorator(view_func):
+        scope = f"{view_func.__module__}.{view_func.__name__}"
+
+        if iscoroutinefunction(view_func):
+            @wraps(view_func)
+            async def wrapper(request, *args, **kwargs):
+                # The cache backend may be the database, so not on the event loop
+                if await sync_to_async(applies)(request):
+                    rejected = await sync_to_async(check)(request, scope, rules, failures)
+                    if rejected is not None:
+                        return rejected
+                return await view_func(request, *args, **kwargs)
+        else:
+            @wraps(view_func)
+            def wrapper(request, *args, **kwargs):
+                if applies(request):
+                    rejected = check(request, scope, rules, failures)
+                    if rejected is not None:
+                        return rejected
+                return view_func(request, *args, **kwargs)
+
+        if exempt is not None:
+            # For RateLimitMiddleware
+            wrapper.ratelimit_exempt = exempt
+        return wrapper
+
+    return decorator
+
+
+class RateLimitMiddleware:
+    """Site-wide ceiling on state-changing requests per client address."""
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        # Checked in process_view(), once the view (and whether it's exempt) is known
+        return self.get_response(request)
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        if request.method not in UNSAFE_METHODS:
+            return None
+        exempt = getattr(view_func, 'ratelimit_exempt', None)
+        if exempt is not None and exempt(request):
+            return None
+        return check(request, 'site', [f"ip:{settings.RATE_LIMIT_UNSAFE_PER_IP}"])
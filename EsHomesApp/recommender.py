@@ -0,0 +1,117 @@
+"""
+"Similar apartments" from feature vectors.
+
+Each apartment becomes a vector of standardized numeric features (price,
+size, bedrooms, bathrooms, occupancy), a one-hot apartment type and its
+amenity bits (unpacked from ``amenity_mask``). ``rebuild()`` finds every
+apartment's k nearest neighbours by weighted Euclidean distance with NumPy
+and stores them in ``SimilarApartment``, so the detail page reads its
+recommendations with one indexed lookup and filters them by availability at
+read time. A change to any apartment's features (a save that touches FIELDS,
+an amenity change, a new or deleted apartment) queues a debounced rebuild
+(see signals.py). NumPy is only imported once a rebuild runs: the
+web processes that merely read the table never need it.
+"""
+import math
+
+from django.conf import settings
+from django.db import transaction
+
+from .models import Amenity, Apartment, SimilarApartment
+
+# Relative importance of each feature group in the distance
+WEIGHTS = {
+    'price': 2.0,
+    'size': 1.0,
+    'bedrooms': 1.5,
+    'bathrooms': 0.5,
+    'occupancy': 1.0,
+    'type': 1.0,
+    'amenities': 1.0,
+}
+
+FIELDS = ('pk', 'price_per_night', 'size_sqft', 'bedrooms', 'bathrooms', 'max_occupancy', 'apartment_type', 'amenity_mask')
+
+
+def feature_matrix(rows, amenity_bits):
+    """One weighted feature vector per row of ``FIELDS`` values."""
+    import numpy as np
+
+    numeric = np.array([
+        # Prices are compared as ratios, not differences
+        [math.log(max(float(price), 1.0)), size, bedrooms, float(bathrooms), occupancy]
+        for _, price, size, bedrooms, bathrooms, occupancy, _, _ in rows
+    ], dtype=np.float64)
+    std = numeric.std(axis=0)
+    numeric = (numeric - numeric.mean(axis=0)) / np.where(std > 0, std, 1.0)
+    numeric *= [WEIGHTS['price'], WEIGHTS['size'], WEIGHTS['bedrooms'], WEIGHTS['bathrooms'], WEIGHTS['occupancy']]
+
+    type_index = {code: i for i, (code, _) in enumerate(Apartment.APARTMENT_TYPES)}
+    types = np.zeros((len(rows), len(type_index)))
+    for i, row in enumerate(rows):
+        if row[6] in type_index:
+            types[i, type_index[row[6]]] = WEIGHTS['type'] / math.sqrt(2)
+
+    # Scaled so that having none vs all of the amenities counts as much as a full weight
+    masks = np.array([row[7] for row in rows], dtype=np.int64)
+    bits = np.array(sorted(amenity_bits), dtype=np.int64)
+    amenities = ((masks[:, None] >> bits[None, :]) & 1).astype(np.float64)
+    amenities *= WEIGHTS['amenities'] / math.sqrt(max(len(bits), 1))
+
+    return np.hstack([numeric, types, amenities])
+
+
+def nearest_neighbours(matrix, k, block_size=1024):
+    """
+    ``(indices, distances)``, each ``(n, k)``: for every row its k nearest
+    other rows, closest first. Works in blocks so memory stays O(block * n).
+    """
+    import numpy as np
+
+    n = len(matrix)
+    k = min(k, n - 1)
+    indices = np.empty((n, k), dtype=np.int64)
+    distances = np.empty((n, k), dtype=np.float64)
+    if k <= 0:
+        return indices, distances
+    norms = np.einsum('ij,ij->i', matrix, matrix)
+    for start in range(0, n, block_size):
+        block = matrix[start:start + block_size]
+        # |a - b|^2 = |a|^2 + |b|^2 - 2ab
+        squared = norms[start:start + block_size, None] + norms[None, :] - 2 * block @ matrix.T
+        np.maximum(squared, 0, out=squared)
+        rows = np.arange(len(block))
+        squared[rows, rows + start] = np.inf  # not your own neighbour
+        nearest = np.argpartition(squared, k - 1, axis=1)[:, :k]
+        nearest_sq = np.take_along_axis(squared, nearest, axis=1)
+        order = np.argsort(nearest_sq, axis=1, kind='stable')
+        indices[start:start + len(block)] = np.take_along_axis(nearest, order, axis=1)
+        distances[start:start + len(block)] = np.sqrt(np.take_along_axis(nearest_sq, order, axis=1))
+    return indices, distances
+
+
+def rebuild(k=None):
+    """Recompute the neighbour table for the whole inventory. Returns the number of rows written."""
+    k = k or settings.SIMILAR_APARTMENTS_K
+    rows = list(Apartment.objects.order_by('pk').values_list(*FIELDS))
+    neighbours = []
+    if len(rows) > 1:
+        matrix = feature_matrix(rows, Amenity.objects.values_list('bit', flat=True))
+        indices, distances = nearest_neighbours(matrix, k)
+        pks = [row[0] for row in rows]
+        neighbours = [
+            SimilarApartment(apartment_id=pk, similar_id=pks[j], rank=rank, distance=float(distance))
+            for pk, row_indices, row_distances in zip(pks, indices, distances)
+            for rank, (j, distance) in enumerate(zip(row_indices, row_distances), start=1)
+        ]
+    with transaction.atomic():
+        SimilarApartment.objects.all().delete()
+        SimilarApartment.objects.bulk_create(neighbours, batch_size=2000)
+    return len(neighbours)
+
+
+def similar_apartments(apartment_id):
+    """Bookable neighbours of an apartment, most similar first (one indexed lookup)."""
+    return Apartment.objects.filter(
+        similar_to__apartment_id=apartment_id, status='available',
+    ).order_by('similar_to__rank')
@@ -0,0 +1,233 @@
+"""
+Reconciliation of transactions whose payment result never reached us.
+
+A lost webhook, or a guest closing the browser before Flutterwave redirects
+back, leaves a Transaction ``pending`` (and its booking holding the dates).
+``reconcile()`` takes the transactions that have been pending or processing
+for longer than RECONCILE_AFTER_MINUTES, oldest first via the
+(transaction_status, created_at) index, and asks Flutterwave about them:
+RECONCILE_WORKERS verification requests at a time, by Flutterwave id or, if
+the redirect never brought us one, by tx_ref. Each batch's results are then
+applied with a handful of bulk updates in one DB transaction:
+
+- paid in full: transaction completed, booking confirmed, apartment reserved
+  (what payment_callback does)
+- failed or cancelled, or paid a different amount/currency: transaction
+  declined, booking cancelled
+- still pending, unknown to Flutterwave or unreachable: left for the next
+  run, or for the hold sweeper once the hold runs out
+
+The sweeper declines a transaction when its booking's hold runs out, without
+asking Flutterwave, so a guest can still pay after it. Transactions declined
+that way are checked too, every RECONCILE_SWEPT_RECHECK_MINUTES for
+RECONCILE_SWEPT_WINDOW_HOURS. A payment found there, or any payment for a
+booking that is no longer pending, goes through ``views.settle_payment()``:
+the booking is confirmed again if its dates are still free, otherwise the
+transaction is marked refund_due.
+
+Payments that don't match what we expected (wrong amount, or paid after the
+booking lost its hold) are reported as discrepancies and logged.
+"""
+import logging
+import threading
+import time
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from . import availability, caching
+from .models import Apartment, Booking, Transaction, booking_hold_cutoff
+from .views import payment_verified, reference_verification_request, settle_payment, verification_request
+
+logger = logging.getLogger(__name__)
+
+STALE_STATUSES = ['pending', 'processing']
+
+_local = threading.local()
+
+
+def swept(now=None):
+    """Transactions the hold sweeper declined that are due another check."""
+    now = now or timezone.now()
+    return Q(
+        transaction_status='declined',
+        created_at__gte=now - timedelta(hours=settings.RECONCILE_SWEPT_WINDOW_HOURS),
+        updated_at__lt=now - timedelta(minutes=settings.RECONCILE_SWEPT_RECHECK_MINUTES),
+        booking__status='cancelled',
+        booking__cancellation_reason=Booking.HOLD_EXPIRED_REASON,
+    )
+
+
+def stale_transactions(now=None):
+    now = now or timezone.now()
+    cutoff = now - timedelta(minutes=settings.RECONCILE_AFTER_MINUTES)
+    return Transaction.objects.filter(
+        Q(transaction_status__in=STALE_STATUSES, created_at__lt=cutoff) | swept(now)
+    )
+
+
+def fetch_verification(tx):
+    """Flutterwave's verification payload for a transaction, or None if it couldn't be reached."""
+    import requests
+
+    if tx.flw_transaction_id:
+        url, headers = verification_request(tx.flw_transaction_id)
+    else:
+        url, headers = reference_verification_request(tx.tx_ref)
+    # One keep-alive session per worker thread
+    if not hasattr(_local, 'session'):
+        _local.session = requests.Session()
+    try:
+        return _local.session.get(url, headers=headers, timeout=settings.FLUTTERWAVE_TIMEOUT).json()
+    except (requests.RequestException, ValueError) as exc:
+        logger.warning("Could not verify transaction %s: %s", tx.tx_ref, exc)
+        return None
+
+
+def classify(tx, payload):
+    """What the gateway says happened: completed, mismatch, declined, pending, unknown or error."""
+    if payload is None:
+        return 'error'
+    if payload.get('status') != 'success' or not payload.get('data'):
+        return 'unknown'
+    status = payload['data'].get('status')
+    if status in ('successful', 'completed'):
+        return 'completed' if payment_verified(payload, tx) else 'mismatch'
+    if status in ('failed', 'cancelled'):
+        return 'declined'
+    return 'pending'
+
+
+def reconcile(limit=None, dry_run=False):
+    """
+    Check every stale transaction (or the oldest ``limit``). Returns a report
+    dict: ``checked``, ``outcomes`` (a Counter), ``discrepancies``,
+    ``seconds`` and ``per_second``.
+    """
+    started = time.monotonic()
+    now = timezone.now()
+    outcomes, discrepancies = Counter(), []
+    batch_size = settings.RECONCILE_BATCH
+    checked, after = 0, None
+
+    with ThreadPoolExecutor(max_workers=settings.RECONCILE_WORKERS) as pool:
+        while limit is None or checked < limit:
+            batch = stale_transactions(now).select_related('booking').order_by('created_at', 'pk')
+            if after is not None:
+                # Keyset pagination: transactions left unchanged don't come round again
+                batch = batch.filter(created_at__gte=after[0]).exclude(created_at=after[0], pk__lte=after[1])
+            batch = list(batch[:batch_size if limit is None else min(batch_size, limit - checked)])
+            if not batch:
+                break
+            results = []
+            for tx, payload in zip(batch, pool.map(fetch_verification, batch)):
+                outcome = classify(tx, payload)
+                if outcome in ('completed', 'mismatch') and not tx.flw_transaction_id:
+                    tx.flw_transaction_id = str(payload['data']['id'])
+                outcomes[outcome] += 1
+                results.append((tx, outcome))
+            discrepancies += find_discrepancies(results)
+            if dry_run:
+                discrepancies += [
+                    f"{tx.tx_ref}: paid after booking #{tx.booking_id} lost its hold"
+                    for tx, outcome in results if outcome == 'completed' and is_late(tx, now)
+                ]
+            else:
+                discrepancies += apply_results(results)
+            checked += len(batch)
+            after = (batch[-1].created_at, batch[-1].pk)
+
+    for discrepancy in discrepancies:
+        logger.warning("Reconciliation discrepancy: %s", discrepancy)
+    seconds = time.monotonic() - started
+    return {
+        'checked': checked,
+        'outcomes': outcomes,
+        'discrepancies': discrepancies,
+        'seconds': seconds,
+        'per_second': checked / seconds if seconds else 0.0,
+    }
+
+
+def is_late(tx, now=None):
+    """Paid for a booking that no longer holds its dates: its hold ran out, or it moved on."""
+    return tx.booking is not None and (
+        tx.booking.status != 'pending' or tx.booking.booking_date < booking_hold_cutoff(now)
+    )
+
+
+def find_discrepancies(results):
+    found = []
+    for tx, outcome in results:
+        if outcome == 'mismatch':
+            found.append(
+                f"{tx.tx_ref}: Flutterwave reports a payment that doesn't match "
+                f"the expected {tx.amount} {settings.BASE_CURRENCY}"
+            )
+    return found
+
+
+def apply_results(results):
+    """Save what the gateway reported. Returns the discrepancies found on the way."""
+    now = timezone.now()
+    found = []
+    for tx, outcome in results:
+        if outcome == 'completed' and is_late(tx, now):
+            status = settle_payment(tx, tx.flw_transaction_id)
+            found.append(
+                f"{tx.tx_ref}: paid after booking #{tx.booking_id} was {tx.booking.status}; "
+                + ('booking confirmed, its dates were still free' if status == 'completed' else 'refund due')
+            )
+    # Checked, nothing new: not due again for RECONCILE_SWEPT_RECHECK_MINUTES
+    Transaction.objects.filter(
+        pk__in=[tx.pk for tx, outcome in results if tx.transaction_status == 'declined' and outcome != 'completed'],
+    ).update(updated_at=now)
+
+    completed = [tx for tx, outcome in results if outcome == 'completed' and not is_late(tx, now)]
+    declined = [tx for tx, outcome in results if outcome in ('declined', 'mismatch')]
+    if not completed and not declined:
+        return found
+
+    with transaction.atomic():
+        # A callback may have settled some of them while we were asking
+        still_stale = set(Transaction.objects.filter(
+            pk__in=[tx.pk for tx in completed + declined], transaction_status__in=STALE_STATUSES,
+        ).values_list('pk', flat=True))
+        # and a hold may have run out: those are settled as late payments by the next run
+        holding = set(Booking.objects.blocking(now).filter(
+            pk__in=[tx.booking_id for tx in completed], status='pending',
+        ).values_list('pk', flat=True))
+        completed = [
+            tx for tx in completed if tx.pk in still_stale and (tx.booking_id is None or tx.booking_id in holding)
+        ]
+        declined = [tx for tx in declined if tx.pk in still_stale]
+
+        for tx in completed:
+            tx.transaction_status = 'completed'
+            tx.updated_at = now
+        for tx in declined:
+            tx.transaction_status = 'declined'
+            tx.updated_at = now
+        Transaction.objects.bulk_update(completed + declined, ['transaction_status', 'flw_transaction_id', 'updated_at'])
+
+        confirmed = Booking.objects.filter(pk__in=[tx.booking_id for tx in completed], status='pending')
+        apartment_ids = list(confirmed.values_list('apartment_id', flat=True))
+        confirmed.update(status='confirmed', last_updated=now)
+        Booking.objects.filter(pk__in=[tx.booking_id for tx in declined], status='pending').update(
+            status='cancelled',
+            cancellation_reason='Payment was not completed.',
+            last_updated=now,
+        )
+        # update() skips the signals that normally invalidate these
+        availability.changed(Booking.objects.filter(
+            pk__in=[tx.booking_id for tx in completed + declined],
+        ).values_list('apartment_id', flat=True))
+        if apartment_ids:
+            Apartment.objects.filter(pk__in=apartment_ids).update(status='reserved')
+            caching.changed(caching.INVENTORY)
+    return found
@@ -0,0 +1,121 @@
+"""
+Apartment reviews: the paginated list on the detail page, its summary, and
+"helpful" votes.
+
+Pages are read through the (apartment, created_at) and (apartment,
+helpful_votes) indexes, newest or most helpful first, with the id as the
+tie-breaker so a page boundary never splits or repeats a review. The summary
+(count, averages, star histogram) is one aggregate query, cached per
+apartment (caching.py) until one of its reviews changes; its count also
+spares the paginator a COUNT query.
+
+A vote is a ``ReviewVote`` row, unique per (review, user), so a second click,
+or two at once, counts once. ``Review.helpful_votes`` isn't touched when the
+vote is cast: ``apply_votes()`` (the apply_review_votes task, every minute)
+adds up the pending votes per review and applies them as
+``helpful_votes = helpful_votes + n``, one UPDATE per distinct n. A popular
+review costs one row write per run rather than one per vote, and no vote is
+lost to a read-modify-write race.
+"""
+from collections import Counter, defaultdict
+
+from django.conf import settings
+from django.core.paginator import Paginator
+from django.db import IntegrityError, transaction
+from django.db.models import Avg, Count, F, Q
+
+from . import caching
+from .models import Review, ReviewVote
+
+# ?review_sort= values; the id breaks ties within the index order
+SORTS = {
+    'recent': ('-created_at', '-pk'),
+    'helpful': ('-helpful_votes', '-pk'),
+}
+
+RATINGS = ('rating', 'cleanliness_rating', 'location_rating', 'value_rating')
+
+
+def namespace(apartment_id):
+    return f'reviews:{apartment_id}'
+
+
+def summary(apartment_id):
+    """``count``, the average of each rating (None without reviews) and ``stars``, a 5-to-1 histogram."""
+    return caching.get_or_compute(namespace(apartment_id), 'summary', lambda: _summarise(apartment_id))
+
+
+def _summarise(apartment_id):
+    row = Review.objects.filter(apartment_id=apartment_id).aggregate(
+        count=Count('pk'),
+        **{f'{name}_avg': Avg(name) for name in RATINGS},
+        **{f'stars_{stars}': Count('pk', filter=Q(rating=stars)) for stars in range(1, 6)},
+    )
+    count = row['count']
+    return {
+        'count': count,
+        **{name: None if row[f'{name}_avg'] is None else round(row[f'{name}_avg'], 1) for name in RATINGS},
+        'stars': [
+            {'stars': stars, 'count': row[f'stars_{stars}'], 'percent': round(100 * row[f'stars_{stars}'] / (count or 1))}
+            for stars in range(5, 0, -1)
+        ],
+    }
+
+
+def page(apartment_id, sort='recent', number=1, user=None):
+    """
+    The template context for one page of the apartment's reviews. Each review
+    on it has ``voted`` set if ``user`` found it helpful.
+    """
+    sort = sort if sort in SORTS else 'recent'
+    stats = summary(apartment_id)
+    paginator = Paginator(
+        Review.objects.filter(apartment_id=apartment_id).select_related('user').order_by(*SORTS[sort]),
+        settings.REVIEWS_PER_PAGE,
+    )
+    # Already counted, in the cached summary
+    paginator.count = stats['count']
+    page_obj = paginator.get_page(number)
+    page_obj.object_list = list(page_obj.object_list)
+
+    voted = set()
+    if user is not None and user.is_authenticated and page_obj.object_list:
+        voted = set(ReviewVote.objects.filter(user=user, review__in=page_obj.object_list)
+                    .values_list('review_id', flat=True))
+    for review in page_obj.object_list:
+        review.voted = review.pk in voted
+    return {'review_summary': stats, 'reviews': page_obj, 'review_sort': sort}
+
+
+def vote(review, user):
+    """Record ``user``'s helpful vote. False if they wrote the review or had already voted for it."""
+    if review.user_id == user.pk:
+        return False
+    try:
+        with transaction.atomic():
+            ReviewVote.objects.create(review=review, user=user)
+    except IntegrityError:
+        return False
+    return True
+
+
+def apply_votes():
+    """Add the pending votes to ``Review.helpful_votes``. Returns how many were applied."""
+    batch_size = settings.REVIEW_VOTE_BATCH
+    applied = 0
+    while True:
+        with transaction.atomic():
+            # Locked, so two workers never apply the same votes (skipped where the database can't lock rows)
+            pending = list(
+                ReviewVote.objects.filter(applied=False).select_for_update(skip_locked=True)
+                .order_by('pk').values_list('pk', 'review_id')[:batch_size]
+            )
+            reviews_by_increment = defaultdict(list)
+            for review_id, votes in Counter(review_id for _, review_id in pending).items():
+                reviews_by_increment[votes].append(review_id)
+            for votes, review_ids in reviews_by_increment.items():
+                Review.objects.filter(pk__in=review_ids).update(helpful_votes=F('helpful_votes') + votes)
+            ReviewVote.objects.filter(pk__in=[pk for pk, _ in pending]).update(applied=True)
+        applied += len(pending)
+        if len(pending) < batch_size:
+            return applied
@@ -0,0 +1,189 @@
+"""
+Monthly occupancy/revenue rollups (``ApartmentMonthStats``).
+
+``refresh()`` reads only the bookings and transactions that changed since the
+last run (``Booking.last_updated`` / ``Transaction.updated_at`` watermarks),
+works out which (apartment, month) cells they touch and recomputes just
+those cells. A changed row only shows where a booking is now; the months it
+used to cover (before its dates or apartment changed, or before it was
+deleted) are recorded by ``mark_stale()`` from signals.py as
+``RollupStaleMonth`` rows, which refresh recomputes and clears too.
+``rebuild()`` recomputes everything, e.g. after changing how a
+metric is defined.
+
+Metric definitions for a given apartment and month:
+
+- nights_sold: nights of confirmed/completed stays falling in the month
+- confirmed_revenue: completed payments, spread evenly over the stay's nights
+- cancellations: cancelled bookings checking in during the month
+- stays / stay_nights: confirmed/completed stays checking in during the month
+
+Archived bookings (archive.py) count like live ones, so archiving never
+changes a cell.
+"""
+from datetime import timedelta
+from decimal import Decimal
+from itertools import chain
+
+from django.db import transaction
+from django.db.models import Max
+from django.utils import timezone
+
+from .models import ApartmentMonthStats, ArchivedBooking, Booking, RollupStaleMonth, RollupWatermark, Transaction
+
+SOLD_STATUSES = ('confirmed', 'completed')
+
+BOOKING_WATERMARK = 'month_stats.booking'
+TRANSACTION_WATERMARK = 'month_stats.transaction'
+
+# Re-read a little before the watermark: a row saved just before the last
+# refresh may have committed after it. Recomputing a cell is idempotent.
+WATERMARK_OVERLAP = timedelta(seconds=60)
+
+
+def month_start(day):
+    return day.replace(day=1)
+
+
+def next_month(day):
+    return (day.replace(day=28) + timedelta(days=4)).replace(day=1)
+
+
+def months_spanned(check_in_date, check_out_date):
+    """First-of-month dates for every month holding at least one night of the stay."""
+    month = month_start(check_in_date)
+    last_night = check_out_date - timedelta(days=1)
+    while month <= last_night:
+        yield month
+        month = next_month(month)
+
+
+def mark_stale(apartment_id, check_in_date, check_out_date):
+    """Have the next refresh recompute the months a stay covered before it moved or went."""
+    RollupStaleMonth.objects.bulk_create(
+        [RollupStaleMonth(apartment_id=apartment_id, month=month)
+         for month in months_spanned(check_in_date, check_out_date)],
+        ignore_conflicts=True,
+    )
+
+
+def refresh():
+    """Bring the rollups up to date with rows changed since the last refresh."""
+    booking_mark = _get_watermark(BOOKING_WATERMARK)
+    transaction_mark = _get_watermark(TRANSACTION_WATERMARK)
+
+    changed_bookings = Booking.objects.all()
+    if booking_mark:
+        changed_bookings = changed_bookings.filter(last_updated__gt=booking_mark - WATERMARK_OVERLAP)
+    changed_transactions = Transaction.objects.filter(booking__isnull=False)
+    if transaction_mark:
+        changed_transactions = changed_transactions.filter(updated_at__gt=transaction_mark - WATERMARK_OVERLAP)
+
+    cells = set()
+    new_booking_mark = booking_mark
+    for apartment_id, check_in_date, check_out_date, last_updated in changed_bookings.values_list(
+        'apartment_id', 'check_in_date', 'check_out_date', 'last_updated',
+    ).iterator(chunk_size=2000):
+        cells.update((apartment_id, month) for month in months_spanned(check_in_date, check_out_date))
+        if new_booking_mark is None or last_updated > new_booking_mark:
+            new_booking_mark = last_updated
+
+    new_transaction_mark = transaction_mark
+    for apartment_id, check_in_date, check_out_date, updated_at in changed_transactions.values_list(
+        'booking__apartment_id', 'booking__check_in_date', 'booking__check_out_date', 'updated_at',
+    ).iterator(chunk_size=2000):
+        cells.update((apartment_id, month) for month in months_spanned(check_in_date, check_out_date))
+        if new_transaction_mark is None or updated_at > new_transaction_mark:
+            new_transaction_mark = updated_at
+
+    stale = list(RollupStaleMonth.objects.values_list('pk', 'apartment_id', 'month'))
+    cells.update((apartment_id, month) for _, apartment_id, month in stale)
+
+    with transaction.atomic():
+        for apartment_id, month in sorted(cells):
+            _recompute_cell(apartment_id, month)
+        # Only the rows read: a month marked meanwhile waits for the next run
+        RollupStaleMonth.objects.filter(pk__in=[pk for pk, _, _ in stale]).delete()
+        _set_watermark(BOOKING_WATERMARK, new_booking_mark)
+        _set_watermark(TRANSACTION_WATERMARK, new_transaction_mark)
+    return len(cells)
+
+
+def rebuild():
+    """Recompute every cell from scratch and reset the watermarks."""
+    booking_mark = Booking.objects.aggregate(mark=Max('last_updated'))['mark']
+    transaction_mark = Transaction.objects.aggregate(mark=Max('updated_at'))['mark']
+    with transaction.atomic():
+        ApartmentMonthStats.objects.all().delete()
+        RollupStaleMonth.objects.all().delete()
+        cells = set()
+        for apartment_id, check_in_date, check_out_date in chain(*(
+            model.objects.values_list('apartment_id', 'check_in_date', 'check_out_date').iterator(chunk_size=2000)
+            for model in (Booking, ArchivedBooking)
+        )):
+            cells.update((apartment_id, month) for month in months_spanned(check_in_date, check_out_date))
+        for apartment_id, month in sorted(cells):
+            _recompute_cell(apartment_id, month)
+        _set_watermark(BOOKING_WATERMARK, booking_mark)
+        _set_watermark(TRANSACTION_WATERMARK, transaction_mark)
+
+
+def _recompute_cell(apartment_id, month):
+    start, end = month, next_month(month)
+    stats = {
+        'nights_sold': 0,
+        'confirmed_revenue': Decimal('0'),
+        'cancellations': 0,
+        'stays': 0,
+        'stay_nights': 0,
+    }
+    bookings = chain(*(
+        model.objects.filter(
+            apartment_id=apartment_id, check_in_date__lt=end, check_out_date__gt=start,
+        ).values_list(
+            'status', 'check_in_date', 'check_out_date',
+            'transaction__transaction_status', 'transaction__amount',
+        )
+        for model in (Booking, ArchivedBooking)
+    ))
+    for status, check_in_date, check_out_date, payment_status, amount in bookings:
+        checks_in_this_month = start <= check_in_date < end
+        if status == 'cancelled':
+            if checks_in_this_month:
+                stats['cancellations'] += 1
+            continue
+        if status not in SOLD_STATUSES:
+            continue
+        nights = (check_out_date - check_in_date).days
+        nights_here = (min(check_out_date, end) - max(check_in_date, start)).days
+        stats['nights_sold'] += nights_here
+        if checks_in_this_month:
+            stats['stays'] += 1
+            stats['stay_nights'] += nights
+        if payment_status == 'completed' and amount and nights:
+            stats['confirmed_revenue'] += (amount * nights_here / nights).quantize(Decimal('0.01'))
+
+    if any(stats.values()):
+        ApartmentMonthStats.objects.update_or_create(apartment_id=apartment_id, month=month, defaults=stats)
+    else:
+        ApartmentMonthStats.objects.filter(apartment_id=apartment_id, month=month).delete()
+
+
+def _get_watermark(name):
+    row = RollupWatermark.objects.filter(name=name).first()
+    return row.value if row else None
+
+
+def _set_watermark(name, value):
+    if value is not None:
+        RollupWatermark.objects.update_or_create(name=name, defaults={'value': value})
+
+
+def months_back(count, today=None):
+    """The first-of-month dates for the current month and the ``count - 1`` before it."""
+    month = month_start(today or timezone.localdate())
+    months = []
+    for _ in range(count):
+        months.append(month)
+        month = month_start(month - timedelta(days=1))
+    return list(reversed(months))
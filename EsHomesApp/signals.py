@@ -0,0 +1,132 @@
+from datetime import timedelta
+
+from django.conf import settings
+from django.contrib.auth.signals import user_login_failed
+from django.db import transaction
+from django.db.models import F
+from django.db.models.signals import m2m_changed, post_delete, post_save, pre_save
+from django.dispatch import receiver
+
+from . import availability, caching, currency, ratelimit, recommender, reviews, rollups
+from .models import Amenity, Apartment, ApartmentImage, Booking, ExchangeRate, Review, amenity_mask
+from .tasks import refresh_similar_apartments
+
+
+@receiver(m2m_changed, sender=Apartment.amenities.through)
+def update_amenity_mask(sender, instance, action, reverse, pk_set, **kwargs):
+    if action not in ('post_add', 'post_remove', 'post_clear'):
+        return
+    if not reverse:
+        # apartment.amenities.add/remove/set/clear(): rebuild the mask from the join table
+        bits = instance.amenities.values_list('bit', flat=True)
+        instance.amenity_mask = amenity_mask(bits)
+        Apartment.objects.filter(pk=instance.pk).update(amenity_mask=instance.amenity_mask)
+        return
+
+    # amenity.apartment_set.add/remove/clear(): flip the amenity's bit on the apartments
+    bit = 1 << instance.bit
+    if action == 'post_add':
+        Apartment.objects.filter(pk__in=pk_set).update(amenity_mask=F('amenity_mask').bitor(bit))
+    elif action == 'post_remove':
+        Apartment.objects.filter(pk__in=pk_set).update(amenity_mask=F('amenity_mask').bitand(~bit))
+    else:
+        Apartment.objects.with_amenities(bit).update(amenity_mask=F('amenity_mask').bitand(~bit))
+
+
+@receiver(post_delete, sender=Amenity)
+def clear_deleted_amenity_bit(sender, instance, **kwargs):
+    # The join rows go with the amenity without an m2m_changed signal
+    bit = 1 << instance.bit
+    Apartment.objects.with_amenities(bit).update(amenity_mask=F('amenity_mask').bitand(~bit))
+
+
+# What the neighbour table is computed from
+RECOMMENDER_FIELDS = frozenset(recommender.FIELDS) - {'pk'}
+
+
+@receiver(pre_save, sender=Apartment)
+def note_recommender_changes(sender, instance, update_fields=None, raw=False, **kwargs):
+    # Most saves (the status flip on payment, a new description) leave the
+    # neighbours as they were, and don't need a rebuild
+    if raw or instance.pk is None:
+        instance._recommender_changed = True
+    elif update_fields is not None and not RECOMMENDER_FIELDS & set(update_fields):
+        instance._recommender_changed = False
+    else:
+        stored = Apartment.objects.filter(pk=instance.pk).values(*RECOMMENDER_FIELDS).first()
+        instance._recommender_changed = stored is None or any(
+            getattr(instance, field) != stored[field] for field in RECOMMENDER_FIELDS
+        )
+
+
+@receiver(post_save, sender=Apartment)
+@receiver(post_delete, sender=Apartment)
+@receiver(m2m_changed, sender=Apartment.amenities.through)
+def queue_similar_apartments_refresh(sender, instance, signal, action=None, **kwargs):
+    if action is not None and not action.startswith('post_'):
+        return
+    if signal is post_save and not instance._recommender_changed:
+        return
+    # One rebuild for a burst of edits: the job is only queued if none is pending
+    transaction.on_commit(lambda: refresh_similar_apartments.schedule(
+        delay=timedelta(seconds=settings.SIMILAR_APARTMENTS_REFRESH_DELAY),
+        unique_key='similar-apartments',
+    ))
+
+
+@receiver(post_save, sender=Apartment)
+@receiver(post_delete, sender=Apartment)
+@receiver(post_save, sender=ApartmentImage)
+@receiver(post_delete, sender=ApartmentImage)
+def invalidate_inventory_cache(sender, **kwargs):
+    caching.changed(caching.INVENTORY)
+
+
+@receiver(post_save, sender=Booking)
+@receiver(post_delete, sender=Booking)
+def invalidate_availability_cache(sender, instance, **kwargs):
+    # Bulk updates (hold sweeper, reconciliation) and calendar syncs call availability.changed() themselves
+    availability.changed([instance.apartment_id])
+
+
+# What decides which ApartmentMonthStats cells a booking counts in
+STAY_FIELDS = ('apartment_id', 'check_in_date', 'check_out_date')
+
+
+@receiver(pre_save, sender=Booking)
+def mark_vacated_months(sender, instance, update_fields=None, raw=False, **kwargs):
+    # refresh() finds the booking where it is now; the months it leaves are only known here
+    if raw or instance.pk is None:
+        return
+    moved = {'apartment', 'apartment_id', 'check_in_date', 'check_out_date'}
+    if update_fields is not None and not moved & set(update_fields):
+        return
+    stored = Booking.objects.filter(pk=instance.pk).values_list(*STAY_FIELDS).first()
+    if stored is not None and stored != tuple(getattr(instance, field) for field in STAY_FIELDS):
+        rollups.mark_stale(*stored)
+
+
+@receiver(post_delete, sender=Booking)
+def mark_deleted_booking_months(sender, instance, **kwargs):
+    rollups.mark_stale(instance.apartment_id, instance.check_in_date, instance.check_out_date)
+
+
+@receiver(post_save, sender=Review)
+@receiver(post_delete, sender=Review)
+def invalidate_review_summary(sender, instance, **kwargs):
+    # apply_votes() updates helpful_votes without a signal; the summary doesn't include them
+    caching.changed(reviews.namespace(instance.apartment_id))
+
+
+@receiver(post_save, sender=ExchangeRate)
+@receiver(post_delete, sender=ExchangeRate)
+def reload_exchange_rates(sender, **kwargs):
+    # This process only; the others pick the change up within FX_CACHE_SECONDS
+    currency.clear()
+
+
+@receiver(user_login_failed)
+def count_failed_login(sender, credentials, request=None, **kwargs):
+    # Only failed attempts spend a login view's per-account allowance
+    if request is not None:
+        ratelimit.count_failure(request)
@@ -0,0 +1,156 @@
+// ES Homes - drag-and-drop photo uploads on the apartment admin page
+//
+// Each photo is checksummed, declared, then sent as raw chunks, a few at a
+// time, skipping the chunks the server already has (so dropping a photo again
+// resumes it), and finally completed. See EsHomesApp/uploads.py.
+
+(function () {
+    'use strict';
+
+    // Photos uploading at once, and chunks in flight per photo
+    const PARALLEL_FILES = 2;
+    const PARALLEL_CHUNKS = 3;
+    // Attempts per request; network errors and 5xx are retried with backoff
+    const ATTEMPTS = 4;
+    // A 429 waits out its Retry-After (seconds) instead, this many times at most
+    const THROTTLED_WAITS = 20;
+
+    function csrfToken() {
+        const input = document.querySelector('input[name=csrfmiddlewaretoken]');
+        return input ? input.value : '';
+    }
+
+    async function sha256(file) {
+        const digest = await crypto.subtle.digest('SHA-256', await file.arrayBuffer());
+        return Array.from(new Uint8Array(digest), byte => byte.toString(16).padStart(2, '0')).join('');
+    }
+
+    async function send(method, url, body, contentType) {
+        const headers = {'X-CSRFToken': csrfToken()};
+        if (contentType) {
+            headers['Content-Type'] = contentType;
+        }
+        let throttled = 0;
+        for (let attempt = 1; ; attempt++) {
+            let response;
+            let delay = 500 * 2 ** attempt;
+            try {
+                response = await fetch(url, {method, body, headers, credentials: 'same-origin'});
+            } catch (error) {
+                if (attempt >= ATTEMPTS) {
+                    throw error;
+                }
+            }
+            if (response) {
+                const data = await response.json().catch(() => ({}));
+                if (response.ok) {
+                    return data;
+                }
+                if (response.status === 429 && throttled < THROTTLED_WAITS) {
+                    // Rate limited: not a failure, so it doesn't use up an attempt
+                    throttled++;
+                    attempt--;
+                    delay = 1000 * (parseInt(response.headers.get('Retry-After'), 10) || 1);
+                } else if (response.status < 500 || attempt >= ATTEMPTS) {
+                    // Other 4xx won't get better by asking again
+                    throw new Error(data.error || `${response.status} ${response.statusText}`);
+                }
+            }
+            await new Promise(resolve => setTimeout(resolve, delay));
+        }
+    }
+
+    function addRow(list, file) {
+        const item = document.createElement('li');
+        const name = document.createElement('span');
+        const bar = document.createElement('progress');
+        const status = document.createElement('span');
+        name.className = 'photo-upload-name';
+        name.textContent = file.name;
+        bar.max = 1;
+        bar.value = 0;
+        status.className = 'photo-upload-status';
+        item.append(name, bar, status);
+        list.append(item);
+        return {
+            status(text) { status.textContent = text; },
+            progress(fraction) { bar.value = fraction; },
+            done(text) { item.classList.add('done'); bar.value = 1; status.textContent = text; },
+            failed(text) { item.classList.add('failed'); status.textContent = text; },
+        };
+    }
+
+    async function uploadFile(startUrl, file, row) {
+        row.status('Checking…');
+        const upload = await send('POST', startUrl, JSON.stringify({
+            filename: file.name, size: file.size, sha256: await sha256(file),
+        }), 'application/json');
+
+        const have = new Set(upload.received);
+        const pending = [];
+        for (let index = 0; index < upload.chunks; index++) {
+            if (!have.has(index)) {
+                pending.push(index);
+            }
+        }
+        let sent = have.size;
+        row.progress(sent / upload.chunks);
+        row.status(sent ? 'Resuming…' : 'Uploading…');
+
+        async function worker() {
+            while (pending.length) {
+                const index = pending.shift();
+                const start = index * upload.chunk_size;
+                await send('PUT', `${upload.url}chunks/${index}/`,
+                           file.slice(start, start + upload.chunk_size), 'application/octet-stream');
+                sent++;
+                row.progress(sent / upload.chunks);
+            }
+        }
+        await Promise.all(Array.from({length: Math.min(PARALLEL_CHUNKS, pending.length)}, worker));
+
+        row.status('Finishing…');
+        await send('POST', `${upload.url}complete/`);
+        row.done('Uploaded');
+    }
+
+    function uploadAll(zone, files) {
+        const list = zone.querySelector('.photo-upload-list');
+        const queue = Array.from(files, file => ({file, row: addRow(list, file)}));
+        async function worker() {
+            while (queue.length) {
+                const {file, row} = queue.shift();
+                try {
+                    await uploadFile(zone.dataset.uploadUrl, file, row);
+                } catch (error) {
+                    row.failed(`${error.message} Drop the photo again to resume.`);
+                }
+            }
+        }
+        for (let i = 0; i < Math.min(PARALLEL_FILES, queue.length); i++) {
+            worker();
+        }
+    }
+
+    document.addEventListener('DOMContentLoaded', function () {
+        document.querySelectorAll('.photo-dropzone').forEach(function (zone) {
+            const input = zone.querySelector('input[type=file]');
+            zone.addEventListener('dragover', function (event) {
+                event.preventDefault();
+                zone.classList.add('dragging');
+            });
+            zone.addEventListener('dragleave', function () {
+                zone.classList.remove('dragging');
+            });
+            zone.addEventListener('drop', function (event) {
+                event.preventDefault();
+                zone.classList.remove('dragging');
+                uploadAll(zone, event.dataTransfer.files);
+            });
+            input.addEventListener('change', function () {
+                uploadAll(zone, input.files);
+                input.value = '';
+            });
+        });
+    });
+})();
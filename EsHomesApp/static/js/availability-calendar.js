@@ -0,0 +1,50 @@
+// Flags stays that include an already-booked night before the form is submitted,
+// using the month-by-month calendar from /availability/ (one request per apartment,
+// revalidated by ETag).
+function watchAvailability(form, apartmentInput, checkInInput, checkOutInput) {
+    const url = form && form.dataset.calendarUrl;
+    if (!url || !apartmentInput || !checkInInput || !checkOutInput) return;
+
+    const calendars = {};
+
+    function loadCalendar(apartmentId) {
+        if (!calendars[apartmentId]) {
+            const params = new URLSearchParams({ apartments: apartmentId, format: 'bits' });
+            calendars[apartmentId] = fetch(`${url}?${params}`, { credentials: 'omit' })
+                .then(response => response.json())
+                .then(data => ({ start: new Date(data.start + 'T00:00:00Z'), nights: data.apartments[apartmentId] || '' }))
+                .catch(error => {
+                    console.error('Error loading availability:', error);
+                    delete calendars[apartmentId];
+                    return null;
+                });
+        }
+        return calendars[apartmentId];
+    }
+
+    function dayIndex(calendar, value) {
+        return Math.round((new Date(value + 'T00:00:00Z') - calendar.start) / (1000 * 60 * 60 * 24));
+    }
+
+    function check() {
+        const apartmentId = apartmentInput.value;
+        checkInInput.setCustomValidity('');
+        checkOutInput.setCustomValidity('');
+        if (!apartmentId || !checkInInput.value) return;
+
+        loadCalendar(apartmentId).then(calendar => {
+            if (!calendar || apartmentInput.value !== apartmentId) return;
+            const first = dayIndex(calendar, checkInInput.value);
+            const last = checkOutInput.value ? dayIndex(calendar, checkOutInput.value) : first + 1;
+            // Nights beyond the calendar are left for the server to check
+            const booked = calendar.nights.slice(Math.max(first, 0), Math.max(last, 0)).includes('1');
+            const input = calendar.nights[first] === '1' ? checkInInput : checkOutInput;
+            if (booked) {
+                input.setCustomValidity('Some of these nights are already booked. Please choose other dates.');
+                input.reportValidity();
+            }
+        });
+    }
+
+    [apartmentInput, checkInInput, checkOutInput].forEach(input => input.addEventListener('change', check));
+}
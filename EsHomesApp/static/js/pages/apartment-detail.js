@@ -0,0 +1,134 @@
+document.addEventListener('DOMContentLoaded', function() {
+    const bookingForm = document.getElementById('booking-form');
+    const checkInDate = document.getElementById(bookingForm.dataset.checkIn);
+    const checkOutDate = document.getElementById(bookingForm.dataset.checkOut);
+    const totalPrice = document.getElementById('total-price');
+    const apartmentPrice = parseFloat(totalPrice.dataset.pricePerNight);
+
+    // Set minimum dates
+    const today = new Date();
+    const tomorrow = new Date(today);
+    tomorrow.setDate(tomorrow.getDate() + 1);
+
+    const formatDate = (date) => {
+        const year = date.getFullYear();
+        const month = String(date.getMonth() + 1).padStart(2, '0');
+        const day = String(date.getDate()).padStart(2, '0');
+        return `${year}-${month}-${day}`;
+    };
+
+    checkInDate.min = formatDate(today);
+    checkOutDate.min = formatDate(tomorrow);
+
+    // Warn about booked nights before the form goes to the server
+    watchAvailability(bookingForm, bookingForm.querySelector('input[name="apartment"]'), checkInDate, checkOutDate);
+
+    // Calculate total price when dates change
+    function calculateTotal() {
+        if (checkInDate.value && checkOutDate.value) {
+            const startDate = new Date(checkInDate.value);
+            const endDate = new Date(checkOutDate.value);
+
+            if (endDate > startDate) {
+                const nights = Math.floor((endDate - startDate) / (1000 * 60 * 60 * 24));
+                const total = nights * apartmentPrice;
+                totalPrice.textContent = `₦${total.toLocaleString()}`;
+            } else {
+                totalPrice.textContent = '₦0';
+            }
+        } else {
+            totalPrice.textContent = '₦0';
+        }
+    }
+
+    // Ensure check-out date is after check-in date
+    checkInDate.addEventListener('change', function() {
+        const startDate = new Date(this.value);
+        const nextDay = new Date(startDate);
+        nextDay.setDate(nextDay.getDate() + 1);
+        checkOutDate.min = formatDate(nextDay);
+
+        // If check-out date is before new check-in date, reset it
+        if (checkOutDate.value && new Date(checkOutDate.value) <= startDate) {
+            checkOutDate.value = formatDate(nextDay);
+        }
+
+        calculateTotal();
+    });
+
+    checkOutDate.addEventListener('change', calculateTotal);
+});
+
+document.addEventListener('DOMContentLoaded', function() {
+    // Image Gallery
+    const galleryThumbs = document.querySelectorAll('.gallery-thumb');
+    const mainImage = document.querySelector('.gallery-main-image');
+
+    galleryThumbs.forEach(thumb => {
+        thumb.addEventListener('click', function() {
+            // Remove active class from all thumbnails
+            galleryThumbs.forEach(t => t.classList.remove('active'));
+
+            // Add active class to clicked thumbnail
+            this.classList.add('active');
+
+            // Update main image
+            const imgSrc = this.getAttribute('data-src');
+            mainImage.src = imgSrc;
+
+            // Add fade animation
+            mainImage.classList.remove('fadeIn');
+            void mainImage.offsetWidth; // Trigger reflow
+            mainImage.classList.add('fadeIn');
+        });
+    });
+
+    // Booking Form
+    const checkInInput = document.getElementById('check-in');
+    const checkOutInput = document.getElementById('check-out');
+    const totalPriceElement = document.getElementById('total-price');
+    const pricePerNight = parseFloat(totalPriceElement.dataset.pricePerNight); // Rendered onto #total-price by the template
+
+    function calculateTotal() {
+        const checkInDate = new Date(checkInInput.value);
+        const checkOutDate = new Date(checkOutInput.value);
+
+        if (checkInDate && checkOutDate && checkOutDate > checkInDate) {
+            const nights = Math.ceil((checkOutDate - checkInDate) / (1000 * 60 * 60 * 24));
+            const totalPrice = nights * pricePerNight;
+            totalPriceElement.textContent = `₦${totalPrice.toLocaleString()}`;
+        } else {
+            totalPriceElement.textContent = '₦0';
+        }
+    }
+
+    // Set minimum dates
+    const today = new Date();
+    const tomorrow = new Date(today);
+    tomorrow.setDate(tomorrow.getDate() + 1);
+
+    const formatDate = date => {
+        const year = date.getFullYear();
+        const month = String(date.getMonth() + 1).padStart(2, '0');
+        const day = String(date.getDate()).padStart(2, '0');
+        return `${year}-${month}-${day}`;
+    };
+
+    checkInInput.min = formatDate(today);
+    checkOutInput.min = formatDate(tomorrow);
+
+    // Event listeners
+    checkInInput.addEventListener('change', function() {
+        const nextDay = new Date(this.value);
+        nextDay.setDate(nextDay.getDate() + 1);
+        checkOutInput.min = formatDate(nextDay);
+
+        if (checkOutInput.value && new Date(checkOutInput.value) <= new Date(this.value)) {
+            checkOutInput.value = formatDate(nextDay);
+        }
+
+        calculateTotal();
+    });
+
+    checkOutInput.addEventListener('change', calculateTotal);
+});
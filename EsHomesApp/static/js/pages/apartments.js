@@ -0,0 +1,121 @@
+// Apartment Filtering
+document.addEventListener('DOMContentLoaded', function() {
+    const filterForm = document.getElementById('filter-form');
+    const apartments = document.querySelectorAll('.apartment-card');
+    const noResults = document.querySelector('.no-results');
+    const resetButton = document.getElementById('reset-filters');
+
+    if (filterForm) {
+        filterForm.addEventListener('submit', function(e) {
+            // Amenities and location aren't on the cards, so those filters go to the server
+            if (filterForm.querySelector('input[name="amenities"]:checked') || document.getElementById('near-filter').value) {
+                return;
+            }
+            e.preventDefault();
+
+            const bedroomFilter = document.getElementById('bedroom-filter').value;
+            const priceFilter = document.getElementById('price-filter').value;
+
+            let visibleCount = 0;
+
+            apartments.forEach(apartment => {
+                let showApartment = true;
+
+                // Filter by bedrooms
+                if (bedroomFilter !== 'all') {
+                    const bedrooms = apartment.getAttribute('data-bedrooms');
+                    if (bedrooms !== bedroomFilter) {
+                        showApartment = false;
+                    }
+                }
+
+                // Filter by price
+                if (priceFilter !== 'all' && showApartment) {
+                    const price = parseInt(apartment.getAttribute('data-price'));
+
+                    switch (priceFilter) {
+                        case 'low':
+                            if (price > 100000) showApartment = false;
+                            break;
+                        case 'medium':
+                            if (price < 100000 || price > 200000) showApartment = false;
+                            break;
+                        case 'high':
+                            if (price < 200000) showApartment = false;
+                            break;
+                    }
+                }
+
+                // Show or hide apartment
+                if (showApartment) {
+                    apartment.style.display = 'block';
+                    visibleCount++;
+                } else {
+                    apartment.style.display = 'none';
+                }
+            });
+
+            // Show or hide no results message
+            if (visibleCount === 0) {
+                noResults.style.display = 'block';
+            } else {
+                noResults.style.display = 'none';
+            }
+        });
+    }
+
+    // Near me: search around the visitor's position, or switch the search off again
+    const nearMe = document.getElementById('near-me');
+    if (nearMe && filterForm) {
+        const nearInput = document.getElementById('near-filter');
+        nearMe.addEventListener('click', function() {
+            if (nearInput.value) {
+                nearInput.value = '';
+                filterForm.submit();
+                return;
+            }
+            if (!navigator.geolocation) {
+                alert('Your browser cannot share your location.');
+                return;
+            }
+            nearMe.disabled = true;
+            navigator.geolocation.getCurrentPosition(function(position) {
+                nearInput.value = position.coords.latitude.toFixed(5) + ',' + position.coords.longitude.toFixed(5);
+                document.getElementById('sort-filter').value = 'distance';
+                filterForm.submit();
+            }, function() {
+                nearMe.disabled = false;
+                alert('We could not get your location.');
+            });
+        });
+    }
+
+    // Reset filters
+    if (resetButton) {
+        resetButton.addEventListener('click', function() {
+            document.getElementById('bedroom-filter').value = 'all';
+            document.getElementById('price-filter').value = 'all';
+
+            apartments.forEach(apartment => {
+                apartment.style.display = 'block';
+            });
+
+            noResults.style.display = 'none';
+        });
+    }
+
+    // Pagination
+    const paginationItems = document.querySelectorAll('.pagination-item');
+
+    paginationItems.forEach(item => {
+        item.addEventListener('click', function() {
+            paginationItems.forEach(i => i.classList.remove('active'));
+            this.classList.add('active');
+
+            // Scroll to top of apartments section
+            document.querySelector('.apartments-section').scrollIntoView({
+                behavior: 'smooth'
+            });
+        });
+    });
+});
@@ -0,0 +1,512 @@
+document.addEventListener('DOMContentLoaded', function() {
+            // Set minimum dates for check-in and check-out
+            const today = new Date().toISOString().split('T')[0];
+            // Variables already defined elsewhere
+             // const checkInInput = document.getElementById('check-in-date');
+             // const checkOutInput = document.getElementById('check-out-date');
+            // apartmentSelect is already defined elsewhere
+// const apartmentSelect = document.getElementById('id_apartment');
+            // Using id_guests instead of guests
+// const guestsSelect = document.getElementById('guests');
+
+            // Function to validate form field
+            function validateField(field) {
+                if (field.value.trim() === '') {
+                    field.classList.remove('field-valid');
+                    field.classList.add('field-error');
+                    return false;
+                } else {
+                    field.classList.remove('field-error');
+                    field.classList.add('field-valid');
+                    return true;
+                }
+            }
+
+            // Add event listeners
+            const guestsSelect = document.getElementById('id_guests');
+            if (guestsSelect) {
+                guestsSelect.addEventListener('change', updateGuestsSummary);
+            }
+
+            const apartmentSelect = document.getElementById('id_apartment');
+            if (apartmentSelect) {
+                apartmentSelect.addEventListener('change', updateApartmentSummary);
+            }
+
+            // Date input handling
+            const checkInInput = document.getElementById('id_check_in_date');
+            const checkOutInput = document.getElementById('id_check_out_date');
+
+            // Function to calculate and update total price
+            function updateTotalPrice() {
+                const checkInDate = new Date(checkInInput.value);
+                const checkOutDate = new Date(checkOutInput.value);
+                const apartmentId = apartmentSelect.value;
+
+                if (checkInDate && checkOutDate && apartmentId && checkOutDate > checkInDate) {
+                    // Calculate number of nights
+                    const nights = Math.floor((checkOutDate - checkInDate) / (1000 * 60 * 60 * 24));
+
+                    // Get price per night from the selected option
+                    const selectedOption = apartmentSelect.options[apartmentSelect.selectedIndex];
+                    // Extract price from the option text instead of summary-price
+                    const priceText = selectedOption.text;
+                    const priceMatch = priceText.match(/₦([\d,]+)/);
+                    const pricePerNight = priceMatch ? parseFloat(priceMatch[1].replace(/,/g, '')) : 0;
+
+                    // Calculate total price
+                    const totalPrice = nights * pricePerNight;
+
+                    // Update summary
+                    document.getElementById('summary-nights').textContent = nights;
+                    document.getElementById('summary-price-per-night').textContent = '₦' + pricePerNight.toLocaleString();
+                    document.getElementById('summary-total-price').textContent = '₦' + totalPrice.toLocaleString();
+                    document.getElementById('summary-duration').textContent = nights + (nights === 1 ? ' night' : ' nights');
+
+                    // Calculate service fee (5% of total)
+                    const serviceFee = Math.round(totalPrice * 0.05);
+                    document.getElementById('summary-fee').textContent = '₦' + serviceFee.toLocaleString();
+                    document.getElementById('summary-rate').textContent = '₦' + totalPrice.toLocaleString();
+
+                    // Update grand total
+                    const grandTotal = totalPrice + serviceFee;
+                    document.getElementById('summary-total').textContent = '₦' + grandTotal.toLocaleString();
+
+                    // Update hidden field for form submission
+                    const totalPriceInput = document.getElementById('id_total_price');
+                    if (totalPriceInput) {
+                        totalPriceInput.value = grandTotal;
+                    } else {
+                        // Create hidden field if it doesn't exist
+                        const hiddenInput = document.createElement('input');
+                        hiddenInput.type = 'hidden';
+                        hiddenInput.id = 'id_total_price';
+                        hiddenInput.name = 'total_price';
+                        hiddenInput.value = grandTotal;
+                        document.getElementById('booking-form').appendChild(hiddenInput);
+                    }
+                }
+            }
+
+            // Add validation to required fields
+            document.querySelectorAll('input[required], select[required], textarea[required]').forEach(field => {
+                field.addEventListener('blur', () => validateField(field));
+                field.addEventListener('change', () => validateField(field));
+            });
+
+            // Add price calculation events
+            if (checkInInput && checkOutInput && apartmentSelect) {
+                checkInInput.addEventListener('change', updateTotalPrice);
+                checkOutInput.addEventListener('change', updateTotalPrice);
+                apartmentSelect.addEventListener('change', updateTotalPrice);
+
+                checkInInput.min = today;
+
+                checkInInput.addEventListener('change', function() {
+                    // Set check-out minimum date to day after check-in
+                    const checkInDate = new Date(this.value);
+                    const minCheckOutDate = new Date(checkInDate);
+                    minCheckOutDate.setDate(checkInDate.getDate() + 1);
+                    checkOutInput.min = minCheckOutDate.toISOString().split('T')[0];
+
+                    // If check-out date is before new minimum, clear it
+                    if (checkOutInput.value && new Date(checkOutInput.value) <= checkInDate) {
+                        checkOutInput.value = '';
+                        checkOutInput.classList.remove('field-valid');
+                        checkOutInput.classList.add('field-error');
+                    }
+
+                    // Update summary check-in date
+                    const formattedDate = checkInDate.toLocaleDateString('en-GB');
+                    document.getElementById('summary-check-in').textContent = formattedDate;
+
+                    // Update total price calculation
+                    updateTotalPrice();
+                });
+
+                checkOutInput.addEventListener('change', function() {
+                    // Update summary check-out date
+                    const checkOutDate = new Date(this.value);
+                    const formattedDate = checkOutDate.toLocaleDateString('en-GB');
+                    document.getElementById('summary-check-out').textContent = formattedDate;
+
+                    // Update total price calculation
+                    updateTotalPrice();
+                });
+
+                // Update guests in summary when changed
+                if (guestsSelect) {
+                    guestsSelect.addEventListener('change', function() {
+                        document.getElementById('summary-guests').textContent = this.value || '--';
+                    });
+                }
+
+                // Update apartment details in summary when apartment changes
+                if (apartmentSelect) {
+                    apartmentSelect.addEventListener('change', function() {
+                        const selectedOption = this.options[this.selectedIndex];
+                        const apartmentId = this.value;
+
+                        if (selectedOption && apartmentId) {
+                            // Get apartment data from data attribute
+                            const apartmentsData = JSON.parse(this.getAttribute('data-apartments') || '{}');
+                            const apartmentData = apartmentsData[apartmentId];
+
+                            if (apartmentData) {
+                                // Update apartment name
+                                document.getElementById('summary-apartment-name').textContent = apartmentData.name;
+
+                                // Update price per night in summary
+                                document.getElementById('summary-price').textContent = `₦${apartmentData.price.toLocaleString()} per day`;
+
+                                // Update apartment metadata (bedrooms, bathrooms)
+                                document.getElementById('summary-meta').textContent =
+                                    `${apartmentData.bedrooms} Bedroom${apartmentData.bedrooms !== 1 ? 's' : ''} • ${apartmentData.bathrooms} Bathroom${apartmentData.bathrooms !== 1 ? 's' : ''}`;
+
+                                // Update apartment image if available
+                                if (apartmentData.image_url) {
+                                    document.getElementById('summary-image').src = apartmentData.image_url;
+                                }
+
+                                // Update total price calculation
+                                updateTotalPrice();
+                            }
+                        } else {
+                            document.getElementById('summary-apartment-name').textContent = 'Select an Apartment';
+                            document.getElementById('summary-price').textContent = '₦0 per day';
+                            document.getElementById('summary-meta').textContent = '-- Bedrooms • -- Bathrooms';
+                        }
+
+                        // Update total price calculation
+                        updateTotalPrice();
+                    });
+                }
+
+            if (checkInInput) {
+                checkInInput.min = today;
+                checkInInput.addEventListener('change', function() {
+                    if (checkOutInput) {
+                        const nextDay = new Date(this.value);
+                        nextDay.setDate(nextDay.getDate() + 1);
+                        checkOutInput.min = nextDay.toISOString().split('T')[0];
+
+                        // Calculate price when dates change
+                        updateTotalPrice();
+
+                        // If check-out date is before check-in date, reset it
+                        if (checkOutInput.value && new Date(checkOutInput.value) <= new Date(this.value)) {
+                            checkOutInput.value = nextDay.toISOString().split('T')[0];
+                            updateTotalPrice();
+                        }
+                    }
+                });
+            }
+
+            // Multi-step form navigation
+            const nextButtons = document.querySelectorAll('.next-step');
+            const prevButtons = document.querySelectorAll('.prev-step');
+            const formSections = document.querySelectorAll('.form-section');
+            const steps = document.querySelectorAll('.booking-step');
+
+            let currentStep = 1;
+
+            nextButtons.forEach(button => {
+                button.addEventListener('click', () => {
+                    const step = parseInt(button.getAttribute('data-step'));
+                    if (validateStep(step)) {
+                        showStep(step + 1);
+                    }
+                });
+            });
+
+            prevButtons.forEach(button => {
+                button.addEventListener('click', () => {
+                    const step = parseInt(button.getAttribute('data-step'));
+                    showStep(step - 1);
+                });
+            });
+
+            function showStep(step) {
+                formSections.forEach(section => section.classList.remove('active'));
+                steps.forEach(s => s.classList.remove('active'));
+
+                document.getElementById(`section-${step}`).classList.add('active');
+                document.getElementById(`step-${step}`).classList.add('active');
+                currentStep = step;
+            }
+
+            // Function to update apartment details in summary
+            function updateApartmentSummary() {
+                const apartmentSelect = document.getElementById('id_apartment');
+                const apartmentId = apartmentSelect.value;
+
+                if (apartmentId) {
+                    try {
+                        // Get apartment data from data-apartments attribute
+                        const apartmentsData = JSON.parse(apartmentSelect.getAttribute('data-apartments') || '{}');
+                        const apartmentData = apartmentsData[apartmentId];
+
+                        if (apartmentData) {
+                            // Update apartment name
+                            document.getElementById('summary-apartment-name').textContent = apartmentData.name;
+
+                            // Update apartment meta details (bedrooms, bathrooms)
+                            document.getElementById('summary-meta').textContent =
+                                `${apartmentData.bedrooms} Bedroom${apartmentData.bedrooms !== 1 ? 's' : ''} • ${apartmentData.bathrooms} Bathroom${apartmentData.bathrooms !== 1 ? 's' : ''}`;
+
+                            // Update price per night
+                            document.getElementById('summary-price').textContent = `₦${apartmentData.price.toLocaleString()} per day`;
+
+                            // Update apartment image if image_url is available
+                            if (apartmentData.image_url) {
+                                document.getElementById('summary-image').src = apartmentData.image_url;
+                                document.getElementById('summary-image').alt = apartmentData.name;
+                            }
+
+                            // Update total price calculation
+                            updateTotalPrice();
+                        }
+                    } catch (error) {
+                        console.error('Error updating apartment summary:', error);
+                    }
+                }
+            }
+
+            // Function to update dates in summary
+            function updateDateSummary() {
+                const checkInDate = document.getElementById('id_check_in_date').value;
+                const checkOutDate = document.getElementById('id_check_out_date').value;
+
+                if (checkInDate) {
+                    document.getElementById('summary-check-in').textContent = formatDate(checkInDate);
+                }
+
+                if (checkOutDate) {
+                    document.getElementById('summary-check-out').textContent = formatDate(checkOutDate);
+                }
+
+                if (checkInDate && checkOutDate) {
+                    const nights = calculateNights(checkInDate, checkOutDate);
+                    document.getElementById('summary-duration').textContent = nights + (nights === 1 ? ' night' : ' nights');
+
+                    // Update total price calculation
+                    updateTotalPrice();
+                }
+            }
+
+            // Function to update guests in summary
+            function updateGuestsSummary() {
+                const guests = document.getElementById('id_guests').value;
+                if (guests) {
+                    document.getElementById('summary-guests').textContent = guests + (guests === '1' ? ' guest' : ' guests');
+
+                    // Update total price when guests change
+                    updateTotalPrice();
+                }
+            }
+
+            // Helper function to format date
+            function formatDate(dateString) {
+                const date = new Date(dateString);
+                return date.toLocaleDateString('en-NG', { day: 'numeric', month: 'short', year: 'numeric' });
+            }
+
+            // Helper function to calculate nights
+            function calculateNights(checkIn, checkOut) {
+                const startDate = new Date(checkIn);
+                const endDate = new Date(checkOut);
+                const timeDiff = endDate.getTime() - startDate.getTime();
+                return Math.ceil(timeDiff / (1000 * 3600 * 24));
+            }
+
+            // Function to update total price
+            function updateTotalPrice() {
+                const checkInDate = document.getElementById('id_check_in_date').value;
+                const checkOutDate = document.getElementById('id_check_out_date').value;
+                const apartmentSelect = document.getElementById('id_apartment');
+
+                if (checkInDate && checkOutDate && apartmentSelect.value) {
+                    // Calculate nights
+                    const startDate = new Date(checkInDate);
+                    const endDate = new Date(checkOutDate);
+                    const timeDiff = endDate.getTime() - startDate.getTime();
+                    const nights = Math.ceil(timeDiff / (1000 * 3600 * 24));
+
+                    // Get apartment data
+                    const apartmentsData = JSON.parse(apartmentSelect.getAttribute('data-apartments') || '{}');
+                    const apartmentData = apartmentsData[apartmentSelect.value];
+
+                    if (apartmentData && nights > 0) {
+                        const pricePerNight = apartmentData.price;
+                        const totalPrice = pricePerNight * nights;
+
+                        // Update nights in summary
+                        document.getElementById('summary-nights').textContent = nights;
+
+                        // Update price per night
+                        document.getElementById('summary-price-per-night').textContent = '₦' + pricePerNight.toLocaleString();
+
+                        // Update apartment rate (subtotal)
+                        document.getElementById('summary-rate').textContent = '₦' + totalPrice.toLocaleString();
+
+                        // Calculate service fee (5% of total)
+                        const serviceFee = Math.round(totalPrice * 0.05);
+                        document.getElementById('summary-fee').textContent = '₦' + serviceFee.toLocaleString();
+
+                        // Update grand total
+                        const grandTotal = totalPrice + serviceFee;
+                        document.getElementById('summary-total').textContent = '₦' + grandTotal.toLocaleString();
+
+                        // Update hidden total price field
+                        document.getElementById('id_total_price').value = grandTotal;
+                    }
+                }
+            }
+
+            // Validate form section
+            function validateSection(step) {
+                const section = document.getElementById(`section-${step}`);
+                const requiredFields = section.querySelectorAll('[required]');
+                let isValid = true;
+
+                requiredFields.forEach(field => {
+                    if (!field.value.trim()) {
+                        field.classList.add('error');
+                        isValid = false;
+                    } else {
+                        field.classList.remove('error');
+                    }
+
+                    // Email validation
+                    if (field.type === 'email' && field.value.trim()) {
+                        const emailPattern = /^[^\s@]+@[^\s@]+\.[^\s@]+$/;
+                        if (!emailPattern.test(field.value)) {
+                            field.classList.add('error');
+                            isValid = false;
+                        }
+                    }
+
+                    // Date validation
+                    if (field.type === 'date' && field.id === 'check-in-date') {
+                        const today = new Date();
+                        today.setHours(0, 0, 0, 0);
+                        const checkInDate = new Date(field.value);
+
+                        if (checkInDate < today) {
+                            field.classList.add('error');
+                            isValid = false;
+                        }
+                    }
+
+                    if (field.type === 'date' && field.id === 'check-out-date') {
+                        const checkInDate = new Date(document.getElementById('check-in-date').value);
+                        const checkOutDate = new Date(field.value);
+
+                        if (checkOutDate <= checkInDate) {
+                            field.classList.add('error');
+                            isValid = false;
+                        }
+                    }
+                });
+
+                return isValid;
+            }
+
+            // Payment method selection
+            const paymentMethods = document.querySelectorAll('.payment-method');
+            const paymentForms = document.querySelectorAll('.payment-form');
+
+            paymentMethods.forEach(method => {
+                method.addEventListener('click', function() {
+                    const selectedMethod = this.getAttribute('data-method');
+
+                    // Update active class
+                    paymentMethods.forEach(m => m.classList.remove('active'));
+                    this.classList.add('active');
+
+                    // Show selected payment form
+                    paymentForms.forEach(form => form.style.display = 'none');
+                    document.getElementById(`${selectedMethod}-form`).style.display = 'block';
+                });
+            });
+
+            // Live price and availability from the server, as soon as the stay is filled in
+            const quoteForm = document.getElementById('booking-form');
+            const quoteFields = {
+                apartment: document.getElementById('id_apartment'),
+                check_in: document.getElementById('check-in-date') || document.getElementById('id_check_in_date'),
+                check_out: document.getElementById('check-out-date') || document.getElementById('id_check_out_date'),
+                guests: document.getElementById('guests') || document.getElementById('id_guests'),
+            };
+            let quoteRequest = 0;
+
+            function showQuote(quote) {
+                const message = document.getElementById('availability-message');
+                if (!message) return;
+                if (quote.errors.length) {
+                    message.textContent = quote.errors[0];
+                } else if (!quote.available) {
+                    message.textContent = 'This apartment is not available for the selected dates.';
+                } else {
+                    message.textContent = `Available: ${quote.nights.length} night${quote.nights.length !== 1 ? 's' : ''}, ₦${quote.total.toLocaleString()}`;
+                }
+                message.className = 'form-group ' + (quote.available ? 'success-message' : 'error-message');
+                message.style.display = 'block';
+            }
+
+            function updateQuote() {
+                const url = quoteForm && quoteForm.dataset.quoteUrl;
+                const { apartment, check_in, check_out, guests } = quoteFields;
+                if (!url || !apartment || !apartment.value || !check_in.value || !check_out.value) return;
+
+                const params = new URLSearchParams({
+                    apartment: apartment.value,
+                    check_in: check_in.value,
+                    check_out: check_out.value,
+                    guests: (guests && guests.value) || 1,
+                });
+                // Only the latest answer counts if the guest changes dates quickly
+                const request = ++quoteRequest;
+                fetch(`${url}?${params}`, { credentials: 'omit' })
+                    .then(response => response.json())
+                    .then(quote => {
+                        if (request === quoteRequest && quote.nights) showQuote(quote);
+                    })
+                    .catch(error => console.error('Error fetching quote:', error));
+            }
+
+            Object.values(quoteFields).forEach(field => {
+                if (field) field.addEventListener('change', updateQuote);
+            });
+
+            watchAvailability(quoteForm, quoteFields.apartment, quoteFields.check_in, quoteFields.check_out);
+
+            // Form submission
+            const bookingForm = document.getElementById('booking-form');
+
+            // Update form submission to use Django URL
+            bookingForm.addEventListener('submit', function(e) {
+                e.preventDefault();
+
+                // Validate all sections before submitting
+                let isValid = true;
+
+                // Check all required fields in the form
+                const requiredFields = bookingForm.querySelectorAll('[required]');
+                requiredFields.forEach(field => {
+                    if (!field.value.trim()) {
+                        field.classList.add('error');
+                        isValid = false;
+                    } else {
+                        field.classList.remove('error');
+                    }
+                });
+
+                if (isValid) {
+                    // Submit form to Django view
+                    this.submit();
+                } else {
+                    alert("Please fill in all required fields");
+                }
+            });
+        });
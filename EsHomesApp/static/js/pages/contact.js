@@ -0,0 +1,41 @@
+document.addEventListener('DOMContentLoaded', function() {
+    // Contact Form Submission
+    const contactForm = document.getElementById('contact-form');
+
+    if (contactForm) {
+        contactForm.addEventListener('submit', function(e) {
+            e.preventDefault();
+
+            // Simulate form submission
+            const submitButton = this.querySelector('button[type="submit"]');
+            submitButton.disabled = true;
+            submitButton.textContent = 'Sending...';
+
+            setTimeout(function() {
+                alert('Thank you for your message! We will get back to you shortly.');
+                contactForm.reset();
+                submitButton.disabled = false;
+                submitButton.textContent = 'Send Message';
+            }, 1500);
+        });
+    }
+
+    // FAQ Accordion
+    const faqItems = document.querySelectorAll('.faq-item');
+
+    faqItems.forEach(item => {
+        const question = item.querySelector('.faq-question');
+
+        question.addEventListener('click', function() {
+            // Toggle active class on clicked item
+            item.classList.toggle('active');
+
+            // Close other items
+            faqItems.forEach(otherItem => {
+                if (otherItem !== item) {
+                    otherItem.classList.remove('active');
+                }
+            });
+        });
+    });
+});
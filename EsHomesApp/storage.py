@@ -0,0 +1,64 @@
+import gzip
+import os
+
+from django.contrib.staticfiles.storage import ManifestStaticFilesStorage
+
+try:
+    import brotli
+except ImportError:  # brotli is optional, gzip variants are always written
+    brotli = None
+
+COMPRESSIBLE_EXTENSIONS = {'.css', '.js', '.svg', '.html', '.txt', '.json', '.xml', '.map', '.ico'}
+
+# Skip variants that barely save anything; serving them only costs a stat()
+MIN_COMPRESSION_RATIO = 0.95
+
+
+class ManifestStaticStorage(ManifestStaticFilesStorage):
+    manifest_strict = False
+
+    def stored_name(self, name):
+        # A few templates still point at files that were never added to
+        # static/ (default-avatar.jpg, intro vid.mp4...). Serve those under
+        # their plain name instead of failing the whole page render.
+        try:
+            return super().stored_name(name)
+        except ValueError:
+            return name
+
+
+class CompressedManifestStaticStorage(ManifestStaticStorage):
+    """
+    Write ``.gz`` (and ``.br`` when brotli is installed) siblings for text
+    assets at collectstatic time so they never have to be compressed per
+    request. ``fileserving.serve_static`` picks them by Accept-Encoding.
+    """
+
+    def post_process(self, paths, dry_run=False, **options):
+        names = set()
+        for name, hashed_name, processed in super().post_process(paths, dry_run, **options):
+            yield name, hashed_name, processed
+            if not isinstance(processed, Exception):
+                names.add(name)
+                if hashed_name:
+                    names.add(hashed_name)
+        if dry_run:
+            return
+        for name in sorted(names):
+            if os.path.splitext(name)[1].lower() in COMPRESSIBLE_EXTENSIONS:
+                self._write_compressed(name)
+
+    def _write_compressed(self, name):
+        path = self.path(name)
+        with open(path, 'rb') as f:
+            content = f.read()
+        variants = [('.gz', lambda data: gzip.compress(data, compresslevel=9, mtime=0))]
+        if brotli is not None:
+            variants.append(('.br', lambda data: brotli.compress(data, quality=11)))
+        for suffix, compress in variants:
+            compressed = compress(content)
+            if len(compressed) < len(content) * MIN_COMPRESSION_RATIO:
+                with open(path + suffix, 'wb') as f:
+                    f.write(compressed)
+            elif os.path.exists(path + suffix):
+                os.remove(path + suffix)
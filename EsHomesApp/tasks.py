@@ -0,0 +1,109 @@
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+
+from . import archive, availability, currency, ical, recommender, reconcile, reviews, rollups, uploads
+from .jobs import task
+from .models import ApartmentImage, Booking, ExternalCalendar, Job, Transaction
+
+
+@task(every=timedelta(hours=6))
+def purge_finished_jobs():
+    """Keep the Job table small: drop finished one-off jobs past retention."""
+    cutoff = timezone.now() - timedelta(days=settings.JOB_RETENTION_DAYS)
+    Job.objects.filter(
+        status__in=['succeeded', 'failed'],
+        interval__isnull=True,
+        finished_at__lt=cutoff,
+    ).delete()
+
+
+@task(every=timedelta(minutes=1))
+def expire_booking_holds():
+    """Cancel pending bookings whose hold ran out, with their pending transactions."""
+    batch_size = settings.BOOKING_HOLD_SWEEP_BATCH
+    now = timezone.now()
+    while True:
+        # Served by the (status, booking_date) index, oldest holds first
+        expired = list(
+            Booking.objects.expired_holds(now)
+            .order_by('booking_date')
+            .values_list('pk', 'apartment_id')[:batch_size]
+        )
+        if not expired:
+            break
+        ids = [pk for pk, _ in expired]
+        with transaction.atomic():
+            Booking.objects.filter(pk__in=ids, status='pending').update(
+                status='cancelled',
+                cancellation_reason=Booking.HOLD_EXPIRED_REASON,
+                last_updated=now,
+            )
+            Transaction.objects.filter(booking_id__in=ids, transaction_status='pending').update(
+                transaction_status='declined',
+                updated_at=now,
+            )
+            availability.changed([apartment_id for _, apartment_id in expired])
+        if len(ids) < batch_size:
+            break
+
+
+@task(every=timedelta(minutes=5))
+def reconcile_transactions():
+    """Settle transactions whose payment callback never arrived."""
+    reconcile.reconcile()
+
+
+@task(every=timedelta(hours=1))
+def refresh_exchange_rates():
+    """Pull the display currencies' rates from FX_RATES_URL."""
+    currency.refresh_rates()
+
+
+@task(every=timedelta(minutes=15))
+def refresh_month_stats():
+    rollups.refresh()
+
+
+@task(every=timedelta(minutes=1))
+def apply_review_votes():
+    """Count new helpful votes into Review.helpful_votes."""
+    reviews.apply_votes()
+
+
+@task(every=timedelta(days=1))
+def archive_bookings():
+    """Move long-finished bookings and their transactions to the archive tables."""
+    archive.archive()
+
+
+@task(every=timedelta(minutes=15))
+def sync_external_calendars(calendar_ids=None):
+    """Pull blocked dates from the other channels' iCal feeds."""
+    calendars = ExternalCalendar.objects.filter(active=True).select_related('apartment')
+    if calendar_ids is not None:
+        calendars = calendars.filter(pk__in=calendar_ids)
+    ical.sync_calendars(calendars)
+
+
+@task
+def refresh_similar_apartments():
+    """Rebuild the nearest-neighbour table after the inventory changed."""
+    recommender.rebuild()
+
+
+@task
+def process_apartment_image(image_id):
+    """Straighten and scale down a freshly uploaded apartment photo."""
+    image = ApartmentImage.objects.filter(pk=image_id).first()
+    # Deleted before its turn came
+    if image is not None:
+        uploads.process(image)
+
+
+@task(every=timedelta(hours=1))
+def purge_stale_uploads():
+    """Discard photo uploads that were never finished."""
+    uploads.purge_stale()
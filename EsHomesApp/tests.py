@@ -1,3 +1,1865 @@
-from django.test import TestCase
+import gc
+import hashlib
+import importlib
+import io
+import json
+import os
+import logging
+import shutil
+import sys
+import tempfile
+import threading
+import time
+from datetime import date, timedelta
+from decimal import Decimal
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from unittest import mock
 
-# Create your tests here.
+from asgiref.sync import iscoroutinefunction
+from django.conf import settings
+from django.contrib.staticfiles.storage import staticfiles_storage
+from django.core.cache import cache
+from django.core.files.base import ContentFile
+from django.core.management import call_command
+from django.db import transaction
+from django.template import engines
+from django.test import TestCase, override_settings
+from django.urls import clear_url_caches, resolve, reverse
+from django.utils import timezone
+
+from . import (
+    archive, availability, budgets, caching, currency, geo, ical, jobs, logs, recommender, reconcile, reviews, rollups,
+    tasks, uploads, views, warmup,
+)
+from .availability import is_available
+from .fake_flutterwave import FakeFlutterwave
+from .forms import booking_errors
+from .models import (
+    Amenity, Apartment, ApartmentImage, ApartmentMonthStats, ArchivedBooking, ArchivedTransaction, Booking, CustomUser,
+    ExchangeRate, ExternalBlock, ExternalCalendar, ImageUpload, Job, Review, ReviewVote, RollupStaleMonth,
+    SimilarApartment, Transaction,
+)
+from .storage import CompressedManifestStaticStorage
+
+
+def setUpModule():
+    # Keep the JSON log lines (expected 4xx responses and so on) out of the
+    # test output; assertLogs() installs handlers of its own
+    for handler in logging.getLogger().handlers:
+        handler.setLevel(logging.CRITICAL + 1)
+
+
+def tearDownModule():
+    for handler in logging.getLogger().handlers:
+        handler.setLevel(logging.NOTSET)
+
+
+def make_apartment(**kwargs):
+    fields = {
+        'name': 'Test Apartment',
+        'apartment_type': 'studio',
+        'description': 'A test apartment.',
+        'price_per_night': Decimal('100.00'),
+        'size_sqft': 500,
+        'max_occupancy': 2,
+        'bedrooms': 1,
+        'bathrooms': Decimal('1.0'),
+    }
+    fields.update(kwargs)
+    return Apartment.objects.create(**fields)
+
+
+def make_user(username='guest', **kwargs):
+    return CustomUser.objects.create_user(
+        username=username, email=f'{username}@example.com', password='s3cret-pass',
+        phone_number=kwargs.pop('phone_number', username), **kwargs,
+    )
+
+
+class ChannelHandler(BaseHTTPRequestHandler):
+    """Stands in for another channel's iCal export, with ETag support."""
+    body = b''
+    etag = '"v1"'
+    requests_seen = []
+
+    def do_GET(self):
+        ChannelHandler.requests_seen.append(dict(self.headers))
+        if self.headers.get('If-None-Match') == self.etag:
+            self.send_response(304)
+            self.end_headers()
+            return
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/calendar')
+        self.send_header('ETag', self.etag)
+        self.send_header('Content-Length', str(len(self.body)))
+        self.end_headers()
+        self.wfile.write(self.body)
+
+    def log_message(self, *args):
+        pass
+
+
+class ICalFeedTests(TestCase):
+    def setUp(self):
+        self.apartment = make_apartment()
+        self.user = make_user()
+        check_in = timezone.localdate() + timedelta(days=10)
+        self.booking = Booking.objects.create(
+            user=self.user, apartment=self.apartment, check_in_date=check_in,
+            check_out_date=check_in + timedelta(days=3), guests=1,
+            total_price=Decimal('300.00'), status='confirmed',
+        )
+        self.url = reverse('apartment_calendar', args=[self.apartment.pk])
+
+    def test_feed_lists_confirmed_bookings(self):
+        response = self.client.get(self.url)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Content-Type'], 'text/calendar; charset=utf-8')
+        body = response.content.decode()
+        self.assertIn(f'DTSTART;VALUE=DATE:{self.booking.check_in_date:%Y%m%d}', body)
+        self.assertIn(f'UID:booking-{self.booking.pk}@eshomes', body)
+        self.assertNotIn(self.user.email, body)
+
+    def test_unchanged_feed_returns_304(self):
+        etag = self.client.get(self.url)['ETag']
+        response = self.client.get(self.url, headers={'If-None-Match': etag})
+        self.assertEqual(response.status_code, 304)
+
+        self.booking.status = 'cancelled'
+        self.booking.save()
+        response = self.client.get(self.url, headers={'If-None-Match': etag})
+        self.assertEqual(response.status_code, 200)
+        self.assertNotIn('BEGIN:VEVENT', response.content.decode())
+
+
+class ExternalCalendarSyncTests(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.server = ThreadingHTTPServer(('127.0.0.1', 0), ChannelHandler)
+        cls.thread = threading.Thread(target=cls.server.serve_forever, daemon=True)
+        cls.thread.start()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.shutdown()
+        cls.server.server_close()
+        super().tearDownClass()
+
+    def setUp(self):
+        self.apartment = make_apartment()
+        self.start = date.today() + timedelta(days=20)
+        ChannelHandler.body = (
+            "BEGIN:VCALENDAR\r\nVERSION:2.0\r\n"
+            "BEGIN:VEVENT\r\nUID:abc-123@channel\r\n"
+            f"DTSTART;VALUE=DATE:{self.start:%Y%m%d}\r\n"
+            f"DTEND;VALUE=DATE:{self.start + timedelta(days=4):%Y%m%d}\r\n"
+            "SUMMARY:Not available\r\nEND:VEVENT\r\n"
+            "END:VCALENDAR\r\n"
+        ).encode()
+        ChannelHandler.requests_seen = []
+        port = self.server.server_address[1]
+        self.calendar = ExternalCalendar.objects.create(
+            apartment=self.apartment, name='Channel', url=f'http://127.0.0.1:{port}/feed.ics',
+        )
+
+    def test_sync_imports_blocks_and_revalidates(self):
+        self.assertEqual(ical.sync_calendars(), {self.calendar.pk: 'updated'})
+        block = ExternalBlock.objects.get()
+        self.assertEqual(block.uid, 'abc-123@channel')
+        self.assertEqual((block.end_date - block.start_date).days, 4)
+
+        self.assertEqual(ical.sync_calendars(), {self.calendar.pk: 'not modified'})
+        self.assertEqual(ChannelHandler.requests_seen[-1].get('If-None-Match'), '"v1"')
+        self.assertEqual(ExternalBlock.objects.count(), 1)
+
+    def test_external_blocks_make_dates_unavailable(self):
+        ical.sync_calendars()
+        self.assertFalse(is_available(self.apartment.pk, self.start + timedelta(days=1), self.start + timedelta(days=2)))
+        self.assertTrue(is_available(self.apartment.pk, self.start + timedelta(days=4), self.start + timedelta(days=6)))
+
+    def test_unreachable_channel_records_error(self):
+        self.calendar.url = 'http://127.0.0.1:1/feed.ics'
+        self.calendar.save()
+        with self.assertLogs('EsHomesApp.ical', 'WARNING'):
+            self.assertEqual(ical.sync_calendars(), {self.calendar.pk: 'error'})
+        self.calendar.refresh_from_db()
+        self.assertTrue(self.calendar.last_error)
+
+
+class StaticBundleTests(TestCase):
+    BUNDLES = ['css/style.css', 'css/pages/about.css', 'js/pages/about.js']
+    # Referenced from about.css
+    IMAGES = ['media/IMG-20250918-WA0018.jpg', 'media/IMG-20250918-WA0019.jpg']
+
+    def setUp(self):
+        root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, root)
+        override = self.settings(STATIC_ROOT=root)
+        override.enable()
+        self.addCleanup(override.disable)
+        cache.clear()
+
+    def collect(self):
+        storage = CompressedManifestStaticStorage()
+        source = os.path.join(settings.BASE_DIR, 'EsHomesApp', 'static')
+        for name in self.BUNDLES + self.IMAGES:
+            os.makedirs(os.path.dirname(storage.path(name)), exist_ok=True)
+            shutil.copyfile(os.path.join(source, name), storage.path(name))
+        processed = list(storage.post_process({name: (storage, name) for name in self.BUNDLES + self.IMAGES}))
+        self.assertFalse([error for _, _, error in processed if isinstance(error, Exception)])
+        return CompressedManifestStaticStorage()
+
+    def test_bundles_are_hashed_and_precompressed(self):
+        import gzip
+
+        storage = self.collect()
+        hashed = storage.stored_name('css/pages/about.css')
+        self.assertRegex(hashed, r'^css/pages/about\.[0-9a-f]{12}\.css$')
+        with open(storage.path(hashed + '.gz'), 'rb') as f, open(storage.path(hashed), 'rb') as original:
+            self.assertEqual(gzip.decompress(f.read()), original.read())
+        # Images are neither compressible nor worth a variant
+        self.assertFalse(os.path.exists(storage.path(storage.stored_name(self.IMAGES[0]) + '.gz')))
+        with open(storage.path(hashed), encoding='utf-8') as f:
+            self.assertIn(storage.stored_name(self.IMAGES[0]).split('/')[-1], f.read())
+
+        page = self.client.get(reverse('about')).content.decode()
+        self.assertIn(f'/static/{hashed}"', page)
+        self.assertIn(f'/static/{storage.stored_name("js/pages/about.js")}"', page)
+        self.assertNotIn('<style', page)
+
+    def test_files_missing_from_static_keep_their_plain_name(self):
+        storage = self.collect()
+        self.assertEqual(storage.stored_name('img/default-avatar.jpg'), 'img/default-avatar.jpg')
+        self.assertEqual(storage.url('img/default-avatar.jpg'), '/static/img/default-avatar.jpg')
+        # The about page points at images that were never collected here
+        self.assertContains(self.client.get(reverse('about')), '/static/media/logo.jpg"')
+
+
+class FileServingTests(TestCase):
+    HASHED = 'css/site.0123456789ab.css'
+
+    def setUp(self):
+        root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, root)
+        override = self.settings(STATIC_ROOT=os.path.join(root, 'static'), MEDIA_ROOT=os.path.join(root, 'media'))
+        override.enable()
+        self.addCleanup(override.disable)
+        self.css = b'body { color: teal; }\n' * 200
+        for name, content in [
+            (self.HASHED, self.css), (self.HASHED + '.gz', b'gzipped'), (self.HASHED + '.br', b'brotli'),
+            ('css/site.css', self.css),
+        ]:
+            os.makedirs(os.path.dirname(os.path.join(settings.STATIC_ROOT, name)), exist_ok=True)
+            with open(os.path.join(settings.STATIC_ROOT, name), 'wb') as f:
+                f.write(content)
+        os.makedirs(settings.MEDIA_ROOT)
+        with open(os.path.join(settings.MEDIA_ROOT, 'tour.mp4'), 'wb') as f:
+            f.write(bytes(range(256)) * 4)
+
+    def get(self, path, **headers):
+        response = self.client.get(path, headers=headers)
+        body = b''.join(response.streaming_content) if response.streaming else response.content
+        return response, body
+
+    def test_hashed_files_are_immutable_and_revalidate(self):
+        response, body = self.get(f'/static/{self.HASHED}')
+        self.assertEqual(body, self.css)
+        self.assertEqual(response['Cache-Control'], f'public, max-age={settings.STATIC_CACHE_MAX_AGE}, immutable')
+        self.assertEqual(response['Vary'], 'Accept-Encoding')
+        plain, _ = self.get('/static/css/site.css')
+        self.assertEqual(plain['Cache-Control'], f'public, max-age={settings.STATIC_CACHE_MAX_AGE_UNHASHED}')
+
+        etag, last_modified = response['ETag'], response['Last-Modified']
+        for headers in ({'if_none_match': etag}, {'if_none_match': f'"other", W/{etag}'}, {'if_none_match': '*'},
+                        {'if_modified_since': last_modified}):
+            not_modified, body = self.get(f'/static/{self.HASHED}', **headers)
+            self.assertEqual((not_modified.status_code, body), (304, b''), headers)
+            self.assertEqual(not_modified['ETag'], etag)
+        self.assertEqual(self.get(f'/static/{self.HASHED}', if_none_match='"other"')[0].status_code, 200)
+        self.assertEqual(self.get(f'/static/{self.HASHED}', if_match='"other"')[0].status_code, 412)
+        self.assertEqual(self.get('/static/css/../../etc/passwd')[0].status_code, 404)
+
+    def test_precompressed_variants_follow_accept_encoding(self):
+        for accept, expected in [
+            ('gzip, deflate, br', 'br'), ('br;q=0.5, gzip', 'gzip'), ('gzip;q=0, *', 'br'), ('br;q=0, gzip;q=0', None),
+            ('*;q=0.1', 'br'), ('x-gzip', 'gzip'), ('identity', None), ('brotli-ish, gzipped', None),
+        ]:
+            response, body = self.get(f'/static/{self.HASHED}', accept_encoding=accept)
+            self.assertEqual(response.get('Content-Encoding'), expected, accept)
+            self.assertEqual(body, {'br': b'brotli', 'gzip': b'gzipped', None: self.css}[expected])
+        gzipped, _ = self.get(f'/static/{self.HASHED}', accept_encoding='gzip')
+        plain, _ = self.get(f'/static/{self.HASHED}')
+        self.assertNotEqual(gzipped['ETag'], plain['ETag'])
+        self.assertNotIn('Accept-Ranges', gzipped)
+
+    def test_byte_ranges(self):
+        response, body = self.get('/media/tour.mp4', range='bytes=10-19')
+        self.assertEqual(response.status_code, 206)
+        self.assertEqual(body, bytes(range(10, 20)))
+        self.assertEqual(response['Content-Range'], 'bytes 10-19/1024')
+        self.assertEqual(response['Content-Length'], '10')
+        self.assertEqual(self.get('/media/tour.mp4', range='bytes=-4')[1], bytes(range(252, 256)))
+        self.assertEqual(self.get('/media/tour.mp4', range='bytes=1000-')[1], bytes(range(232, 256)))
+
+        unsatisfiable, _ = self.get('/media/tour.mp4', range='bytes=2000-')
+        self.assertEqual(unsatisfiable.status_code, 416)
+        self.assertEqual(unsatisfiable['Content-Range'], 'bytes */1024')
+        # Several ranges, or a stale If-Range: the whole file
+        self.assertEqual(self.get('/media/tour.mp4', range='bytes=0-1,5-6')[0].status_code, 200)
+        self.assertEqual(self.get('/media/tour.mp4', range='bytes=0-1', if_range='"stale"')[0].status_code, 200)
+        etag = self.get('/media/tour.mp4')[0]['ETag']
+        self.assertEqual(self.get('/media/tour.mp4', range='bytes=0-1', if_range=etag)[0].status_code, 206)
+
+    @override_settings(MEDIA_SENDFILE_BACKEND='x-accel-redirect')
+    def test_media_can_be_offloaded(self):
+        response, body = self.get('/media/tour.mp4')
+        self.assertEqual(response['X-Accel-Redirect'], '/_protected_media/tour.mp4')
+        self.assertEqual(body, b'')
+
+
+class JobQueueTests(TestCase):
+    def setUp(self):
+        self.calls = []
+        self.flaky = self.register('tests.flaky', self.run_flaky, max_attempts=2)
+        self.worker = self.make_worker()
+
+    def register(self, name, func, **options):
+        self.addCleanup(jobs._registry.pop, name, None)
+        return jobs.task(func, name=name, **options)
+
+    def make_worker(self):
+        worker = jobs.Worker(queues=['default'])
+        self.addCleanup(lambda: [pool.shutdown() for pool in worker.pools.values()])
+        return worker
+
+    def run_flaky(self, fail):
+        self.calls.append(fail)
+        if fail:
+            raise RuntimeError('flaky')
+
+    def test_unique_jobs_are_queued_once_but_not_behind_a_running_one(self):
+        first = self.flaky.schedule(args=[False], unique_key='flaky')
+        self.assertEqual(self.flaky.schedule(args=[False], unique_key='flaky'), first)
+
+        self.assertEqual(self.worker.claim('default', 5), [first.pk])
+        # Running already: it may have missed whatever prompted this one
+        second = self.flaky.schedule(args=[False], unique_key='flaky')
+        self.assertNotEqual(second, first)
+        first.refresh_from_db()
+        self.assertIsNone(first.unique_key)
+
+        # Losing the insert race hands back the winner, in a usable transaction
+        self.register('tests.periodic', lambda: None, every=timedelta(minutes=5))
+        jobs.schedule_periodic()
+        periodic = Job.objects.get(unique_key='periodic:tests.periodic')
+        Job.objects.filter(pk=periodic.pk).update(status='running')
+        self.assertEqual(jobs.enqueue('tests.periodic', unique_key='periodic:tests.periodic'), periodic)
+        self.assertEqual(Job.objects.filter(task='tests.periodic').count(), 1)
+
+    def test_each_job_is_claimed_by_one_worker(self):
+        job = self.flaky.delay(False)
+        later = self.flaky.schedule(delay=timedelta(hours=1), args=[False])
+        other = self.make_worker()
+        other.name = 'elsewhere'
+        self.assertEqual(self.worker.claim('default', 5), [job.pk])
+        self.assertEqual(other.claim('default', 5), [])
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.locked_by, job.attempts), ('running', self.worker.name, 1))
+        later.refresh_from_db()
+        self.assertEqual(later.status, 'queued')
+
+    def test_failures_are_retried_with_backoff_then_given_up(self):
+        job = self.flaky.delay(True)
+        self.worker.claim('default', 1)
+        self.worker.run_job(Job.objects.get(pk=job.pk))
+        job.refresh_from_db()
+        self.assertEqual(job.status, 'queued')
+        self.assertGreater(job.run_at, timezone.now() + timedelta(seconds=settings.JOB_RETRY_BACKOFF * 0.7))
+        self.assertIn('RuntimeError: flaky', job.last_error)
+
+        Job.objects.filter(pk=job.pk).update(run_at=timezone.now())
+        self.worker.claim('default', 1)
+        self.worker.run_job(Job.objects.get(pk=job.pk))
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.attempts), ('failed', 2))
+        self.assertEqual(self.calls, [True, True])
+
+    def test_periodic_jobs_keep_one_row_and_come_round_again(self):
+        periodic = self.register('tests.periodic', lambda: self.calls.append('tick'), every=timedelta(minutes=5))
+        jobs.schedule_periodic()
+        jobs.schedule_periodic()
+        job = Job.objects.get(task=periodic.name)
+        self.assertEqual(job.unique_key, f'periodic:{periodic.name}')
+
+        self.worker.claim('default', 5)
+        self.worker.run_job(Job.objects.get(pk=job.pk))
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.attempts), ('queued', 0))
+        self.assertAlmostEqual(job.run_at, timezone.now() + timedelta(minutes=5), delta=timedelta(seconds=5))
+        self.assertEqual(self.calls, ['tick'])
+
+        # A new interval is picked up when the worker starts
+        periodic.every = timedelta(minutes=1)
+        jobs.schedule_periodic()
+        job.refresh_from_db()
+        self.assertEqual(job.interval, timedelta(minutes=1))
+
+    def test_long_jobs_keep_their_lock_and_orphans_are_requeued(self):
+        alive, orphaned = self.flaky.delay(False), self.flaky.delay(False)
+        self.worker.claim('default', 5)
+        self.worker.running.add(alive.pk)
+        Job.objects.update(locked_at=timezone.now() - timedelta(seconds=settings.JOB_LOCK_TIMEOUT + 1))
+
+        self.worker.heartbeat()
+        self.worker.requeue_stale()
+        alive.refresh_from_db()
+        orphaned.refresh_from_db()
+        self.assertEqual((alive.status, alive.locked_by), ('running', self.worker.name))
+        self.assertEqual((orphaned.status, orphaned.locked_at), ('queued', None))
+
+
+@override_settings(
+    PASSWORD_HASHERS=['django.contrib.auth.hashers.MD5PasswordHasher'], FLUTTERWAVE_WEBHOOK_HASH='webhook-secret',
+)
+class RateLimitTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = make_user()
+
+    def test_login_is_limited_per_account_before_authenticating(self):
+        url = reverse('user_login')
+        with mock.patch('EsHomesApp.views.authenticate', wraps=views.authenticate) as authenticate:
+            for i in range(5):
+                response = self.client.post(url, {'email': 'Guest@example.com', 'password': f'wrong{i}'}, REMOTE_ADDR=f'10.0.0.{i}')
+                self.assertEqual(response.status_code, 200)
+            response = self.client.post(url, {'email': 'guest@example.com', 'password': 's3cret-pass'}, REMOTE_ADDR='10.0.1.1')
+        self.assertEqual(response.status_code, 429)
+        self.assertIn('Retry-After', response)
+        self.assertEqual(authenticate.call_count, 5)
+
+    def test_other_accounts_are_not_affected(self):
+        url = reverse('user_login')
+        for i in range(6):
+            self.client.post(url, {'email': 'victim@example.com', 'password': 'wrong'})
+        response = self.client.post(url, {'email': 'guest@example.com', 'password': 's3cret-pass'})
+        self.assertEqual(response.status_code, 302)
+
+    def test_only_failed_logins_count_against_the_account(self):
+        url = reverse('user_login')
+        for i in range(8):
+            response = self.client.post(url, {'email': 'guest@example.com', 'password': 's3cret-pass'}, REMOTE_ADDR=f'10.0.0.{i}')
+            self.assertEqual(response.status_code, 302)
+            self.client.logout()
+        for i in range(4):
+            self.client.post(url, {'email': 'guest@example.com', 'password': 'wrong'}, REMOTE_ADDR=f'10.0.2.{i}')
+        response = self.client.post(url, {'email': 'guest@example.com', 'password': 's3cret-pass'})
+        self.assertEqual(response.status_code, 302)
+
+    def test_a_flood_cannot_block_signed_webhooks(self):
+        url = reverse('payment_callback')
+        junk = {'event': 'charge.completed', 'data': {'tx_ref': 'nope'}}
+        statuses = {
+            self.client.post(url, junk, content_type='application/json', REMOTE_ADDR=f'10.1.{i % 4}.1').status_code
+            for i in range(250)
+        }
+        self.assertEqual(statuses, {400, 429})
+        # From a flooded address too, and past the site-wide ceiling
+        response = self.client.post(url, junk, content_type='application/json', REMOTE_ADDR='10.1.0.1')
+        self.assertEqual(response.status_code, 429)
+        response = self.client.post(url, junk, content_type='application/json', REMOTE_ADDR='10.1.0.1',
+                                    HTTP_VERIF_HASH='webhook-secret')
+        self.assertEqual(response.status_code, 400)
+        # Other callers still get through: there's no shared allowance to spend
+        response = self.client.get(url, {'tx_ref': 'nope'}, REMOTE_ADDR='10.2.0.1')
+        self.assertRedirects(response, reverse('profile'), fetch_redirect_response=False)
+
+
+def reload_urlconf():
+    for module in ('EsHomesApp.urls', settings.ROOT_URLCONF):
+        if module in sys.modules:
+            importlib.reload(sys.modules[module])
+    clear_url_caches()
+
+
+@override_settings(ASYNC_VIEWS=True)
+class AsyncViewTests(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        reload_urlconf()
+        cls.gateway = FakeFlutterwave().start()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.gateway.stop()
+        super().tearDownClass()
+        reload_urlconf()
+
+    def setUp(self):
+        self.apartment = make_apartment(featured=True, latitude=6.45, longitude=3.47)
+        ApartmentImage.objects.create(apartment=self.apartment, image='apartment_images/test.jpg', is_primary=True)
+        make_apartment(name='Similar')
+        self.user = make_user()
+        check_in = timezone.localdate() + timedelta(days=10)
+        booking = Booking.objects.create(
+            user=self.user, apartment=self.apartment, check_in_date=check_in,
+            check_out_date=check_in + timedelta(days=2), guests=1, total_price=Decimal('200.00'),
+        )
+        self.transaction = Transaction.objects.create(
+            user=self.user, booking=booking, amount=Decimal('200.00'), tx_ref='ESHOMES-TEST-1',
+        )
+        Review.objects.create(
+            user=make_user('reviewer'), apartment=self.apartment, rating=4, comment='Quiet and clean.',
+            cleanliness_rating=5, location_rating=4, value_rating=4,
+        )
+
+    async def test_pages_render_without_sync_queries(self):
+        self.assertTrue(iscoroutinefunction(resolve('/').func))
+        for url in ('/', '/apartments/?bedrooms=1', '/apartments/?near=6.46,3.48', f'/apartment/{self.apartment.pk}/'):
+            response = await self.async_client.get(url)
+            self.assertEqual(response.status_code, 200, url)
+            self.assertContains(response, 'apartment_images/test.jpg')
+        await self.async_client.aforce_login(self.user)
+        response = await self.async_client.get(reverse('initiate_payment', args=[self.transaction.pk]))
+        self.assertContains(response, 'ESHOMES-TEST-1')
+        response = await self.async_client.get(f'/apartment/{self.apartment.pk}/')
+        self.assertContains(response, 'Quiet and clean.')
+
+    async def test_callback_verifies_with_gateway(self):
+        self.gateway.charge('9001', amount=200)
+        with override_settings(FLUTTERWAVE_API_URL=self.gateway.url):
+            response = await self.async_client.get(reverse('payment_callback'), {
+                'status': 'successful', 'tx_ref': 'ESHOMES-TEST-1', 'transaction_id': '9001',
+            })
+            self.assertRedirects(response, reverse('thank_you', args=[self.transaction.pk]), fetch_redirect_response=False)
+            transaction = await Transaction.objects.select_related('booking').aget(pk=self.transaction.pk)
+            self.assertEqual(transaction.transaction_status, 'completed')
+            self.assertEqual(transaction.booking.status, 'confirmed')
+
+            # An underpaid charge is declined
+            self.gateway.charge('9002', amount=150)
+            response = await self.async_client.post(
+                reverse('payment_callback'),
+                {'event': 'charge.completed', 'data': {'id': '9002', 'tx_ref': 'ESHOMES-TEST-1', 'status': 'successful'}},
+                content_type='application/json',
+            )
+            self.assertEqual(response.status_code, 400)
+            transaction = await Transaction.objects.aget(pk=self.transaction.pk)
+            self.assertEqual(transaction.transaction_status, 'declined')
+
+
+class AmenityFilterTests(TestCase):
+    def setUp(self):
+        self.wifi = Amenity.objects.create(name='WiFi', icon='fas fa-wifi')
+        self.pool = Amenity.objects.create(name='Pool', icon='fas fa-swimming-pool')
+        self.gym = Amenity.objects.create(name='Gym', icon='fas fa-dumbbell')
+        self.both = make_apartment(name='Both')
+        self.both.amenities.set([self.wifi, self.pool])
+        self.wifi_only = make_apartment(name='WiFi only')
+        self.wifi_only.amenities.add(self.wifi)
+        self.bare = make_apartment(name='Bare')
+
+    def listed(self, query):
+        response = self.client.get(reverse('apartments') + query)
+        return sorted(apartment.name for apartment in response.context['apartments'])
+
+    def test_mask_follows_both_sides_of_the_relation(self):
+        self.assertEqual(self.wifi.slug, 'wifi')
+        self.both.refresh_from_db()
+        self.assertEqual(self.both.amenity_mask, (1 << self.wifi.bit) | (1 << self.pool.bit))
+
+        self.gym.apartment_set.add(self.bare, self.wifi_only)
+        self.wifi.apartment_set.remove(self.wifi_only)
+        self.pool.apartment_set.clear()
+        self.assertEqual(
+            dict(Apartment.objects.values_list('name', 'amenity_mask')),
+            {'Both': 1 << self.wifi.bit, 'WiFi only': 1 << self.gym.bit, 'Bare': 1 << self.gym.bit},
+        )
+
+        self.gym.delete()
+        self.assertEqual(Apartment.objects.filter(amenity_mask=0).count(), 2)
+        self.assertEqual(Amenity.objects.create(name='Sauna', icon='fas fa-hot-tub').bit, self.gym.bit)
+
+    def test_listing_filter(self):
+        self.assertEqual(self.listed('?amenities=wifi,pool'), ['Both'])
+        self.assertEqual(self.listed('?amenities=wifi&amenities=pool&amenity_match=any'), ['Both', 'WiFi only'])
+        self.assertEqual(self.listed('?amenities=pool,gym&amenity_match=any'), ['Both'])
+        self.assertEqual(self.listed('?amenities=wifi,sauna'), [])
+        self.assertEqual(len(self.listed('')), 3)
+
+
+class SimilarApartmentTests(TestCase):
+    def setUp(self):
+        self.pool = Amenity.objects.create(name='Pool', icon='fas fa-swimming-pool')
+        self.studio = make_apartment(name='Studio', price_per_night=Decimal('50000'), size_sqft=400)
+        self.studio_twin = make_apartment(name='Studio twin', price_per_night=Decimal('55000'), size_sqft=420)
+        self.penthouse = make_apartment(
+            name='Penthouse', apartment_type='penthouse', price_per_night=Decimal('400000'),
+            size_sqft=2500, bedrooms=4, max_occupancy=8, bathrooms=Decimal('3.5'),
+        )
+        self.penthouse.amenities.add(self.pool)
+        self.duplex = make_apartment(
+            name='Duplex', apartment_type='duplex', price_per_night=Decimal('300000'),
+            size_sqft=2000, bedrooms=3, max_occupancy=6, bathrooms=Decimal('2.5'),
+        )
+        self.duplex.amenities.add(self.pool)
+
+    def test_inventory_changes_queue_one_rebuild(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            self.studio.price_per_night = Decimal('52000')
+            self.studio.save()
+            self.duplex.amenities.clear()
+        self.assertEqual(Job.objects.filter(task='EsHomesApp.tasks.refresh_similar_apartments').count(), 1)
+
+    def test_saves_that_leave_the_features_alone_queue_nothing(self):
+        Job.objects.all().delete()
+        with self.captureOnCommitCallbacks(execute=True):
+            self.studio.status = 'reserved'
+            self.studio.save(update_fields=['status', 'updated_at'])
+            self.duplex.description = 'Two floors, freshly painted.'
+            self.duplex.price_per_night = Decimal('300000.00')
+            self.duplex.save()
+        self.assertFalse(Job.objects.exists())
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.duplex.bedrooms = 4
+            self.duplex.save()
+        self.assertEqual(Job.objects.filter(task='EsHomesApp.tasks.refresh_similar_apartments').count(), 1)
+
+    def test_neighbours_are_nearest_first_and_filtered_by_status(self):
+        self.assertEqual(recommender.rebuild(k=3), 12)
+        ranked = SimilarApartment.objects.filter(apartment=self.penthouse).values_list('similar__name', flat=True)
+        self.assertEqual(list(ranked), ['Duplex', 'Studio twin', 'Studio'])
+        self.assertEqual(list(recommender.similar_apartments(self.studio.pk))[0], self.studio_twin)
+
+        self.studio_twin.status = 'maintenance'
+        self.studio_twin.save()
+        response = self.client.get(reverse('apartment_detail', args=[self.studio.pk]))
+        self.assertEqual([a.name for a in response.context['similar_apartments']], ['Duplex', 'Penthouse'])
+
+
+class GeoSearchTests(TestCase):
+    # Around Lekki, Lagos
+    CENTRE = (6.4474, 3.4723)
+
+    def setUp(self):
+        self.close = make_apartment(name='Close', latitude=6.4500, longitude=3.4750)  # ~0.4 km
+        self.nearby = make_apartment(name='Nearby', latitude=6.4300, longitude=3.4300)  # ~5 km
+        self.ikeja = make_apartment(name='Ikeja', latitude=6.6018, longitude=3.3515)  # ~22 km
+        self.abuja = make_apartment(name='Abuja', latitude=9.0765, longitude=7.3986)
+        make_apartment(name='Nowhere')
+
+    def test_geohash_is_kept_on_save(self):
+        self.assertEqual(geo.encode(57.64911, 10.40744), 'u4pruydqq')
+        self.assertTrue(self.close.geohash.startswith('s1'))
+        self.close.latitude, self.close.longitude = None, None
+        self.close.save(update_fields=['latitude', 'longitude'])
+        self.close.refresh_from_db()
+        self.assertEqual(self.close.geohash, '')
+
+    def test_radius_search_prunes_and_measures(self):
+        results = geo.search(Apartment.objects.all(), *self.CENTRE, radius_km=10, sort_by_distance=True)
+        self.assertEqual([pk for pk, _ in results], [self.close.pk, self.nearby.pk])
+        self.assertAlmostEqual(results[0][1], 0.41, places=1)
+        self.assertEqual(len(geo.search(Apartment.objects.all(), *self.CENTRE, radius_km=30)), 3)
+
+        # A box spanning cell boundaries still finds everything in it
+        box = (6.40, 3.30, 6.65, 3.50)
+        found = geo.search(Apartment.objects.all(), *self.CENTRE, box=box)
+        self.assertEqual({pk for pk, _ in found}, {self.close.pk, self.nearby.pk, self.ikeja.pk})
+
+    def test_wide_searches_scan_the_box(self):
+        from django.db import connection
+        from django.test.utils import CaptureQueriesContext
+
+        with CaptureQueriesContext(connection) as queries:
+            geo.search(Apartment.objects.all(), *self.CENTRE, radius_km=2)
+        self.assertIn('geohash', queries[0]['sql'])
+        with CaptureQueriesContext(connection) as queries:
+            found = geo.search(Apartment.objects.all(), *self.CENTRE, radius_km=30)
+        self.assertNotIn('geohash', queries[0]['sql'])
+        self.assertEqual(len(found), 3)
+
+    def test_page_skips_apartments_gone_since_the_search(self):
+        located = [(self.close.pk, 0.4), (self.nearby.pk, 5.0)]
+        page = views.with_distances(located, {self.nearby.pk: self.nearby})
+        self.assertEqual(page, [self.nearby])
+        self.assertEqual(page[0].distance_km, 5.0)
+
+    def test_listing_near_me(self):
+        response = self.client.get(reverse('apartments'), {'near': '6.4474,3.4723', 'radius': '25', 'sort': 'distance'})
+        names = [(a.name, round(a.distance_km)) for a in response.context['apartments']]
+        self.assertEqual(names, [('Close', 0), ('Nearby', 5), ('Ikeja', 22)])
+        self.assertContains(response, 'km away')
+
+        response = self.client.get(reverse('apartments'), {'near': 'nonsense'})
+        self.assertEqual(len(response.context['apartments']), 5)
+
+
+class CachingTests(TestCase):
+    def setUp(self):
+        self.events = []
+        receiver = lambda sender, event, **kwargs: self.events.append(event)
+        caching.cache_event.connect(receiver, weak=False)
+        self.addCleanup(caching.cache_event.disconnect, receiver)
+        self.cache_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.cache_dir, ignore_errors=True)
+
+    def backends(self):
+        yield 'locmem', {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache', 'LOCATION': 'caching-tests'}
+        yield 'file', {'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache', 'LOCATION': self.cache_dir}
+        yield 'database', {'BACKEND': 'django.core.cache.backends.db.DatabaseCache', 'LOCATION': 'caching_tests'}
+
+    def test_backends(self):
+        for name, backend in self.backends():
+            with self.subTest(name), override_settings(CACHES={'default': backend}):
+                if name == 'database':
+                    call_command('createcachetable', verbosity=0)
+                calls = []
+                compute = lambda: calls.append(1) or len(calls)
+                get = lambda: caching.get_or_compute('tests', 'value', compute, timeout=60, beta=0)
+                self.events.clear()
+
+                self.assertEqual((get(), get()), (1, 1))
+                caching.invalidate('tests')
+                self.assertEqual(get(), 2)
+                self.assertEqual(self.events, ['miss', 'recompute', 'hit', 'miss', 'recompute'])
+
+                # Past its timeout it is served stale while the lock is held, then refreshed
+                caching.get_or_compute('tests', 'short', compute, timeout=0.01, beta=0)
+                time.sleep(0.02)
+                cache_key = f"c:tests:{caching.namespace_version('tests')}:short"
+                release = caching._acquire(caching.get_cache(), cache_key, wait=False)
+                self.assertEqual(caching.get_or_compute('tests', 'short', compute, timeout=60, beta=0), 3)
+                self.assertEqual(self.events[-1], 'stale')
+                release()
+                self.assertEqual(caching.get_or_compute('tests', 'short', compute, timeout=60, beta=0), 4)
+
+    def test_concurrent_misses_compute_once(self):
+        calls = []
+        def compute():
+            calls.append(1)
+            time.sleep(0.2)
+            return 'value'
+        results = []
+        threads = [
+            threading.Thread(target=lambda: results.append(caching.get_or_compute('tests', 'herd', compute)))
+            for _ in range(8)
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(results, ['value'] * 8)
+        self.assertEqual(len(calls), 1)
+
+    def test_misses_on_other_keys_do_not_wait(self):
+        started, finish = threading.Event(), threading.Event()
+        def slow():
+            started.set()
+            finish.wait(5)
+            return 'slow'
+        thread = threading.Thread(target=lambda: caching.get_or_compute('tests', 'slow', slow))
+        thread.start()
+        self.addCleanup(thread.join)
+        self.addCleanup(finish.set)
+        started.wait(5)
+        # Whichever lock stripe 'slow' would have shared, these don't queue behind it
+        began = time.monotonic()
+        for i in range(100):
+            self.assertEqual(caching.get_or_compute('tests', f'quick-{i}', lambda: i), i)
+        self.assertLess(time.monotonic() - began, 1)
+        finish.set()
+        thread.join()
+        gc.collect()
+        self.assertEqual(len(caching._LOCKS), 0)
+
+    def test_inventory_changes_invalidate(self):
+        make_apartment(name='First', featured=True)
+        self.assertContains(self.client.get(reverse('home')), 'First')
+        with self.assertNumQueries(0):
+            self.client.get(reverse('home'))
+        make_apartment(name='Second', featured=True)
+        self.assertContains(self.client.get(reverse('home')), 'Second')
+
+
+class PageCacheTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        make_apartment(name='Harbour View', featured=True)
+
+    def test_anonymous_hits_skip_the_view(self):
+        first = self.client.get(reverse('home'))
+        self.assertEqual(first['X-Page-Cache'], 'miss')
+        with self.assertNumQueries(0):
+            second = self.client.get(reverse('home'))
+        self.assertEqual(second['X-Page-Cache'], 'hit')
+        self.assertEqual(second.content, first.content)
+        self.assertIn('Cookie', second['Vary'])
+
+        make_apartment(name='Lagoon Loft', featured=True)
+        self.assertContains(self.client.get(reverse('home')), 'Lagoon Loft')
+
+    def test_logged_in_and_pending_messages_bypass(self):
+        self.client.get(reverse('about'))
+        self.client.cookies['messages'] = 'pending'
+        self.assertNotIn('X-Page-Cache', self.client.get(reverse('about')))
+        del self.client.cookies['messages']
+
+        self.client.force_login(make_user())
+        response = self.client.get(reverse('about'))
+        self.assertNotIn('X-Page-Cache', response)
+        self.assertIn('Cookie', response['Vary'])
+
+
+class ReconciliationTests(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.gateway = FakeFlutterwave(latency=0.05).start()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.gateway.stop()
+        super().tearDownClass()
+
+    def setUp(self):
+        self.apartment = make_apartment()
+        self.user = make_user()
+        self.override = override_settings(FLUTTERWAVE_API_URL=self.gateway.url)
+        self.override.enable()
+        self.addCleanup(self.override.disable)
+
+    def make_transaction(self, tx_ref, age=timedelta(hours=1), **kwargs):
+        check_in = timezone.localdate() + timedelta(days=10 + Transaction.objects.count() * 3)
+        booking = Booking.objects.create(
+            user=self.user, apartment=self.apartment, check_in_date=check_in,
+            check_out_date=check_in + timedelta(days=2), guests=1, total_price=Decimal('200.00'),
+        )
+        tx = Transaction.objects.create(user=self.user, booking=booking, amount=Decimal('200.00'), tx_ref=tx_ref, **kwargs)
+        Transaction.objects.filter(pk=tx.pk).update(created_at=timezone.now() - age)
+        return tx
+
+    def test_stale_transactions_are_settled(self):
+        paid = self.make_transaction('RC-PAID')
+        self.gateway.charge('9001', 200, tx_ref='RC-PAID')
+        failed = self.make_transaction('RC-FAILED', transaction_status='processing', flw_transaction_id='9002')
+        self.gateway.charge('9002', 200, status='failed', tx_ref='RC-FAILED')
+        short = self.make_transaction('RC-SHORT')
+        self.gateway.charge('9003', 150, tx_ref='RC-SHORT')
+        abandoned = self.make_transaction('RC-ABANDONED')
+        recent = self.make_transaction('RC-RECENT', age=timedelta(minutes=1))
+        self.gateway.charge('9004', 200, tx_ref='RC-RECENT')
+
+        with self.assertLogs('EsHomesApp.reconcile', 'WARNING'):
+            report = reconcile.reconcile()
+
+        self.assertEqual(report['checked'], 4)
+        self.assertEqual(report['outcomes'], {'completed': 1, 'declined': 1, 'mismatch': 1, 'unknown': 1})
+        self.assertEqual(len(report['discrepancies']), 1)
+        self.assertIn('RC-SHORT', report['discrepancies'][0])
+        self.assertIn(f'expected 200.00 {settings.BASE_CURRENCY}', report['discrepancies'][0])
+        expected = {
+            paid: ('completed', 'confirmed'),
+            failed: ('declined', 'cancelled'),
+            short: ('declined', 'cancelled'),
+            abandoned: ('pending', 'pending'),
+            recent: ('pending', 'pending'),
+        }
+        for tx, (tx_status, booking_status) in expected.items():
+            tx.refresh_from_db()
+            tx.booking.refresh_from_db()
+            self.assertEqual((tx.transaction_status, tx.booking.status), (tx_status, booking_status), tx.tx_ref)
+        self.assertEqual(paid.flw_transaction_id, '9001')
+        self.apartment.refresh_from_db()
+        self.assertEqual(self.apartment.status, 'reserved')
+
+    def test_payments_after_the_hold_sweep_are_caught(self):
+        free = self.make_transaction('RC-SWEPT-FREE')
+        taken = self.make_transaction('RC-SWEPT-TAKEN')
+        unpaid = self.make_transaction('RC-SWEPT-UNPAID')
+        Booking.objects.update(booking_date=timezone.now() - timedelta(hours=2))
+        tasks.expire_booking_holds()
+        Booking.objects.create(
+            user=make_user('other'), apartment=self.apartment, check_in_date=taken.booking.check_in_date,
+            check_out_date=taken.booking.check_out_date, guests=1, total_price=Decimal('200.00'), status='confirmed',
+        )
+        # Paid after the sweep, and the callbacks were lost
+        self.gateway.charge('9301', 200, tx_ref='RC-SWEPT-FREE')
+        self.gateway.charge('9302', 200, tx_ref='RC-SWEPT-TAKEN')
+        # Only checked once the sweep is RECONCILE_SWEPT_RECHECK_MINUTES old
+        self.assertEqual(reconcile.reconcile()['checked'], 0)
+        Transaction.objects.update(updated_at=timezone.now() - timedelta(hours=2))
+
+        with self.assertLogs('EsHomesApp.reconcile', 'WARNING'):
+            report = reconcile.reconcile()
+        self.assertEqual(report['outcomes'], {'completed': 2, 'unknown': 1})
+        self.assertEqual(len(report['discrepancies']), 2)
+        self.assertIn('RC-SWEPT-FREE: paid after booking', report['discrepancies'][0])
+        self.assertIn('refund due', report['discrepancies'][1])
+        expected = {
+            free: ('completed', 'confirmed'),
+            taken: ('refund_due', 'cancelled'),
+            unpaid: ('declined', 'cancelled'),
+        }
+        for tx, (tx_status, booking_status) in expected.items():
+            tx.refresh_from_db()
+            tx.booking.refresh_from_db()
+            self.assertEqual((tx.transaction_status, tx.booking.status), (tx_status, booking_status), tx.tx_ref)
+        # The unpaid one waits for its next recheck
+        self.assertEqual(reconcile.reconcile()['checked'], 0)
+
+    def test_dry_run_changes_nothing(self):
+        tx = self.make_transaction('RC-DRY')
+        self.gateway.charge('9101', 200, tx_ref='RC-DRY')
+        report = reconcile.reconcile(dry_run=True)
+        self.assertEqual(report['outcomes'], {'completed': 1})
+        tx.refresh_from_db()
+        self.assertEqual(tx.transaction_status, 'pending')
+
+    def test_gateway_outages_leave_transactions_for_the_next_run(self):
+        tx = self.make_transaction('RC-OUTAGE')
+        self.gateway.charge('9201', 200, tx_ref='RC-OUTAGE')
+        self.gateway.failure_rate = 1.0
+        self.addCleanup(setattr, self.gateway, 'failure_rate', 0.0)
+        report = reconcile.reconcile()
+        self.assertEqual(report['outcomes'], {'unknown': 1})
+        self.assertEqual(self.gateway.failures, 1)
+        tx.refresh_from_db()
+        self.assertEqual(tx.transaction_status, 'pending')
+
+
+class BookingHoldTests(TestCase):
+    def setUp(self):
+        self.apartment = make_apartment()
+        self.user = make_user()
+        self.check_in = timezone.localdate() + timedelta(days=10)
+        self.stale = timezone.now() - timedelta(minutes=settings.BOOKING_HOLD_MINUTES + 1)
+
+    def book(self, status='pending', nights=(0, 2), booked_at=None, paid=None):
+        booking = Booking.objects.create(
+            user=self.user, apartment=self.apartment, status=status, guests=1, total_price=Decimal('200.00'),
+            check_in_date=self.check_in + timedelta(days=nights[0]),
+            check_out_date=self.check_in + timedelta(days=nights[1]),
+        )
+        if booked_at:
+            Booking.objects.filter(pk=booking.pk).update(booking_date=booked_at)
+        if paid:
+            Transaction.objects.create(
+                user=self.user, booking=booking, amount=Decimal('200.00'), tx_ref=f'HOLD-{booking.pk}',
+                transaction_status=paid,
+            )
+        return booking
+
+    def test_only_confirmed_and_live_holds_block_dates(self):
+        confirmed = self.book('confirmed')
+        fresh = self.book()
+        expired = self.book(booked_at=self.stale)
+        self.book('cancelled')
+        self.book('completed')
+        bookings = Booking.objects.all()
+        self.assertCountEqual(bookings.blocking(), [confirmed, fresh])
+        self.assertCountEqual(bookings.expired_holds(), [expired])
+        later = timezone.now() + timedelta(minutes=settings.BOOKING_HOLD_MINUTES + 1)
+        self.assertCountEqual(bookings.blocking(later), [confirmed])
+        self.assertCountEqual(bookings.expired_holds(later), [fresh, expired])
+
+        # Check-out day is the next guest's check-in day
+        self.assertTrue(bookings.overlapping(self.check_in + timedelta(days=1), self.check_in + timedelta(days=3)))
+        self.assertFalse(bookings.overlapping(self.check_in + timedelta(days=2), self.check_in + timedelta(days=4)))
+        self.assertFalse(bookings.overlapping(self.check_in - timedelta(days=2), self.check_in))
+
+    @override_settings(BOOKING_HOLD_SWEEP_BATCH=2)
+    def test_the_sweeper_cancels_expired_holds_in_batches(self):
+        expired = [self.book(nights=(3 * i, 3 * i + 2), booked_at=self.stale, paid='pending') for i in range(3)]
+        fresh = self.book(nights=(20, 22), paid='pending')
+        confirmed = self.book('confirmed', nights=(30, 32), booked_at=self.stale, paid='completed')
+
+        tasks.expire_booking_holds()
+        for booking in expired:
+            booking.refresh_from_db()
+            self.assertEqual((booking.status, booking.cancellation_reason), ('cancelled', Booking.HOLD_EXPIRED_REASON))
+            self.assertEqual(Transaction.objects.get(booking=booking).transaction_status, 'declined')
+        self.assertEqual(Booking.objects.get(pk=fresh.pk).status, 'pending')
+        self.assertEqual(Transaction.objects.get(booking=fresh).transaction_status, 'pending')
+        self.assertEqual(Booking.objects.get(pk=confirmed.pk).status, 'confirmed')
+        self.assertEqual(Transaction.objects.get(booking=confirmed).transaction_status, 'completed')
+        self.assertFalse(Booking.objects.expired_holds().exists())
+
+
+class LatePaymentTests(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.gateway = FakeFlutterwave().start()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.gateway.stop()
+        super().tearDownClass()
+
+    def setUp(self):
+        self.override = override_settings(FLUTTERWAVE_API_URL=self.gateway.url)
+        self.override.enable()
+        self.addCleanup(self.override.disable)
+        self.apartment = make_apartment()
+        self.user = make_user()
+        self.check_in = timezone.localdate() + timedelta(days=10)
+        self.booking = Booking.objects.create(
+            user=self.user, apartment=self.apartment, check_in_date=self.check_in,
+            check_out_date=self.check_in + timedelta(days=2), guests=1, total_price=Decimal('200.00'),
+        )
+        self.transaction = Transaction.objects.create(
+            user=self.user, booking=self.booking, amount=Decimal('200.00'), tx_ref='LATE-1',
+        )
+        # The guest sat on the payment page past the hold, and the sweeper ran
+        Booking.objects.filter(pk=self.booking.pk).update(
+            booking_date=timezone.now() - timedelta(minutes=settings.BOOKING_HOLD_MINUTES + 5),
+        )
+        tasks.expire_booking_holds()
+        self.booking.refresh_from_db()
+        self.assertEqual(self.booking.status, 'cancelled')
+        self.gateway.charge('7001', 200, tx_ref='LATE-1')
+
+    def redirect_back(self):
+        self.client.force_login(self.user)
+        return self.client.get(reverse('payment_callback'), {
+            'status': 'successful', 'tx_ref': 'LATE-1', 'transaction_id': '7001',
+        })
+
+    def test_paid_after_the_sweep_confirms_if_the_dates_are_still_free(self):
+        response = self.redirect_back()
+        self.assertRedirects(response, reverse('thank_you', args=[self.transaction.pk]), fetch_redirect_response=False)
+        self.transaction.refresh_from_db()
+        self.booking.refresh_from_db()
+        self.assertEqual(self.transaction.transaction_status, 'completed')
+        self.assertEqual((self.booking.status, self.booking.cancellation_reason), ('confirmed', ''))
+        self.assertFalse(is_available(self.apartment.pk, self.check_in, self.check_in + timedelta(days=1)))
+
+    def test_paid_after_someone_else_booked_the_dates_is_a_refund(self):
+        Booking.objects.create(
+            user=make_user('other'), apartment=self.apartment, check_in_date=self.check_in + timedelta(days=1),
+            check_out_date=self.check_in + timedelta(days=3), guests=1, total_price=Decimal('200.00'),
+            status='confirmed',
+        )
+        with self.assertLogs('EsHomesApp.views', 'WARNING') as logs:
+            response = self.client.post(
+                reverse('payment_callback'),
+                {'event': 'charge.completed', 'data': {'id': '7001', 'tx_ref': 'LATE-1', 'status': 'successful'}},
+                content_type='application/json',
+            )
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('refund due', logs.output[0])
+        self.transaction.refresh_from_db()
+        self.booking.refresh_from_db()
+        self.assertEqual(self.transaction.transaction_status, 'refund_due')
+        self.assertEqual(self.transaction.flw_transaction_id, '7001')
+        self.assertEqual(self.booking.status, 'cancelled')
+
+        # The redirect reports the same payment: nothing changes, and the guest is told
+        response = self.redirect_back()
+        self.assertRedirects(response, reverse('profile'), fetch_redirect_response=False)
+        self.assertIn('refund', str(list(response.wsgi_request._messages)[0]))
+        self.transaction.refresh_from_db()
+        self.assertEqual(self.transaction.transaction_status, 'refund_due')
+
+
+class RollupTests(TestCase):
+    def setUp(self):
+        self.apartment = make_apartment()
+        self.user = make_user()
+        # Three nights: two at the end of this month, one at the start of the next
+        self.month = rollups.month_start(timezone.localdate())
+        self.next = rollups.next_month(self.month)
+        self.booking = Booking.objects.create(
+            user=self.user, apartment=self.apartment, check_in_date=self.next - timedelta(days=2),
+            check_out_date=self.next + timedelta(days=1), guests=1, total_price=Decimal('300.00'), status='confirmed',
+        )
+        Transaction.objects.create(
+            user=self.user, booking=self.booking, amount=Decimal('300.00'), tx_ref='ROLL-1',
+            transaction_status='completed',
+        )
+
+    def cells(self):
+        return {
+            month: (nights, revenue, stays)
+            for month, nights, revenue, stays in ApartmentMonthStats.objects.values_list(
+                'month', 'nights_sold', 'confirmed_revenue', 'stays',
+            )
+        }
+
+    def age(self, hours=1):
+        earlier = timezone.now() - timedelta(hours=hours)
+        Booking.objects.update(last_updated=earlier)
+        Transaction.objects.update(updated_at=earlier)
+
+    def test_refresh_reads_only_what_changed_since_its_watermark(self):
+        self.assertEqual(rollups.refresh(), 2)
+        self.assertEqual(self.cells(), {
+            self.month: (2, Decimal('200.00'), 1),
+            self.next: (1, Decimal('100.00'), 0),
+        })
+        # Rows from before the watermark (less the overlap) aren't read again
+        self.age()
+        self.assertEqual(rollups.refresh(), 0)
+
+        # A cancellation made since is picked up, and only its cells are redone
+        other = Booking.objects.create(
+            user=self.user, apartment=self.apartment, check_in_date=self.month,
+            check_out_date=self.month + timedelta(days=1), guests=1, total_price=Decimal('100.00'), status='cancelled',
+        )
+        self.assertEqual(rollups.refresh(), 1)
+        self.assertEqual(ApartmentMonthStats.objects.get(month=self.month).cancellations, 1)
+        other.delete()
+        self.age()
+        rollups.refresh()
+        self.assertEqual(ApartmentMonthStats.objects.get(month=self.month).cancellations, 0)
+
+    def test_months_a_booking_leaves_are_recomputed(self):
+        rollups.refresh()
+        self.booking.check_in_date = self.next + timedelta(days=5)
+        self.booking.check_out_date = self.next + timedelta(days=8)
+        self.booking.save()
+        self.age()
+        rollups.refresh()
+        self.assertEqual(self.cells(), {self.next: (3, Decimal('300.00'), 1)})
+
+        # Moved to another apartment, then deleted
+        self.booking.apartment = make_apartment(name='Other')
+        self.booking.save()
+        # The old apartment's month, and the new one's
+        self.assertEqual(rollups.refresh(), 2)
+        self.assertEqual(list(ApartmentMonthStats.objects.values_list('apartment__name', flat=True)), ['Other'])
+        self.booking.delete()
+        rollups.refresh()
+        self.assertFalse(ApartmentMonthStats.objects.exists())
+        self.assertFalse(RollupStaleMonth.objects.exists())
+
+    def test_dashboard_reads_only_the_rollups(self):
+        from django.db import connection
+        from django.test.utils import CaptureQueriesContext
+
+        rollups.refresh()
+        self.client.force_login(CustomUser.objects.create_superuser(
+            username='owner', email='owner@example.com', password='s3cret-pass', phone_number='owner',
+        ))
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(reverse('admin:EsHomesApp_apartmentmonthstats_changelist'))
+        self.assertEqual(response.status_code, 200)
+        tables = ('"EsHomesApp_booking"', '"EsHomesApp_transaction"')
+        self.assertFalse([q['sql'] for q in queries if any(table in q['sql'] for table in tables)])
+        chart = response.context['chart']
+        self.assertEqual(len(chart), 12)
+        self.assertEqual(chart[-1]['month'], self.month)
+        self.assertEqual((chart[-1]['revenue'], chart[-1]['revenue_pct']), (Decimal('200.00'), 100))
+        days = (self.next - self.month).days
+        self.assertEqual(chart[-1]['occupancy_pct'], round(2 / days * 100))
+        self.assertEqual(chart[0]['revenue'], 0)
+
+
+class BookingQuoteTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.apartment = make_apartment(price_per_night=Decimal('150.00'))
+        self.check_in = timezone.localdate() + timedelta(days=10)
+
+    def quote(self, nights=2, guests=1, **headers):
+        return self.client.get(reverse('booking_quote'), {
+            'apartment': self.apartment.pk,
+            'check_in': self.check_in.isoformat(),
+            'check_out': (self.check_in + timedelta(days=nights)).isoformat(),
+            'guests': guests,
+        }, **headers)
+
+    def test_breakdown_and_form_errors(self):
+        response = self.quote()
+        quote = response.json()
+        self.assertTrue(quote['available'])
+        self.assertEqual([night['price'] for night in quote['nights']], [150.0, 150.0])
+        self.assertEqual(quote['total'], 300.0)
+        self.assertEqual(quote['errors'], [])
+        self.assertNotIn('sessionid', response.cookies)
+
+        quote = self.quote(nights=0, guests=5).json()
+        self.assertFalse(quote['available'])
+        self.assertEqual(quote['errors'], [
+            "Check-out date must be after check-in date.",
+            "Number of guests cannot exceed 2 for this apartment.",
+        ])
+        self.assertEqual(self.client.get(reverse('booking_quote'), {'apartment': 'x'}).status_code, 400)
+
+    def test_bad_guests_and_unknown_apartments_are_json_errors(self):
+        for guests in (0, -3):
+            response = self.quote(guests=guests)
+            self.assertEqual(response.status_code, 400)
+            self.assertEqual(response.json(), {'errors': ["guests must be at least 1."]})
+        self.assertEqual(booking_errors(self.apartment, None, None, 0), ["A booking needs at least one guest."])
+
+        Apartment.objects.filter(pk=self.apartment.pk).delete()
+        response = self.quote()
+        self.assertEqual(response.status_code, 404)
+        self.assertEqual(response.json(), {'errors': ["No such apartment."]})
+
+    def test_booking_changes_the_quote(self):
+        first = self.quote()
+        self.assertEqual(self.quote(HTTP_IF_NONE_MATCH=first['ETag']).status_code, 304)
+
+        Booking.objects.create(
+            user=make_user(), apartment=self.apartment, check_in_date=self.check_in + timedelta(days=1),
+            check_out_date=self.check_in + timedelta(days=3), guests=1, total_price=Decimal('300.00'),
+        )
+        second = self.quote(HTTP_IF_NONE_MATCH=first['ETag'])
+        self.assertEqual(second.status_code, 200)
+        self.assertFalse(second.json()['available'])
+
+
+    def book(self, nights=2):
+        return self.client.post(reverse('booking'), {
+            'apartment': self.apartment.pk,
+            'check_in_date': self.check_in.isoformat(),
+            'check_out_date': (self.check_in + timedelta(days=nights)).isoformat(),
+            'guests': 1,
+        })
+
+    def test_booking_form_refuses_what_the_quote_does(self):
+        Booking.objects.create(
+            user=make_user(), apartment=self.apartment, check_in_date=self.check_in + timedelta(days=1),
+            check_out_date=self.check_in + timedelta(days=3), guests=1, total_price=Decimal('300.00'),
+            status='confirmed',
+        )
+        self.client.force_login(make_user(username='booker'))
+        self.assertEqual(self.quote().json()['errors'], ["This apartment is not available for the selected dates."])
+        response = self.book()
+        self.assertEqual(response.status_code, 200)
+        self.assertContains(response, "This apartment is not available for the selected dates.")
+        self.assertEqual(Booking.objects.count(), 1)
+        self.assertFalse(Transaction.objects.exists())
+
+    def test_booking_form_refuses_dates_blocked_on_another_channel(self):
+        ExternalBlock.objects.create(
+            calendar=ExternalCalendar.objects.create(apartment=self.apartment, name='Airbnb', url='http://example.com/a.ics'),
+            apartment=self.apartment, uid='x', start_date=self.check_in + timedelta(days=1),
+            end_date=self.check_in + timedelta(days=4),
+        )
+        self.client.force_login(make_user(username='booker'))
+        response = self.book()
+        self.assertContains(response, "This apartment is not available for the selected dates.")
+        self.assertFalse(Booking.objects.exists())
+
+        # The night before the block is still free
+        self.assertRedirects(self.book(nights=1), reverse('initiate_payment', args=[Transaction.objects.get().pk]),
+                             fetch_redirect_response=False)
+
+class AvailabilityCalendarTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.today = date.today()
+        self.start = self.today.replace(day=1)
+        self.first, self.second = make_apartment(name='First'), make_apartment(name='Second')
+        Booking.objects.create(
+            user=make_user(), apartment=self.first, check_in_date=self.today + timedelta(days=2),
+            check_out_date=self.today + timedelta(days=5), guests=1, total_price=Decimal('300.00'), status='confirmed',
+        )
+
+    def calendar(self, output='bits', **headers):
+        return self.client.get(reverse('availability_calendar'), {
+            'apartments': f'{self.first.pk},{self.second.pk},999', 'format': output,
+        }, **headers)
+
+    def test_months_of_nights_per_apartment(self):
+        with self.assertNumQueries(3):
+            data = self.calendar().json()
+        self.assertEqual(data['start'], self.start.isoformat())
+        self.assertEqual(set(data['apartments']), {str(self.first.pk), str(self.second.pk)})
+        days = (date.fromisoformat(data['end']) - self.start).days
+        past = (self.today - self.start).days
+        self.assertEqual(data['apartments'][str(self.first.pk)], '1' * past + '00111' + '0' * (days - past - 5))
+        self.assertEqual(data['apartments'][str(self.second.pk)], '1' * past + '0' * (days - past))
+
+        runs = self.calendar('rle').json()['apartments'][str(self.first.pk)]
+        self.assertEqual(runs, [0, past, 2, 3, days - past - 5] if past else [2, 3, days - 5])
+        self.assertEqual(self.client.get(reverse('availability_calendar'), {'apartments': '1', 'months': 13}).status_code, 400)
+
+    def test_etag_follows_bookings(self):
+        first = self.calendar()
+        self.assertEqual(self.calendar(HTTP_IF_NONE_MATCH=first['ETag']).status_code, 304)
+        ExternalBlock.objects.create(
+            calendar=ExternalCalendar.objects.create(apartment=self.second, name='Airbnb', url='http://example.com/a.ics'),
+            apartment=self.second, uid='x', start_date=self.today, end_date=self.today + timedelta(days=1),
+        )
+        availability.changed([self.second.pk])
+        second = self.calendar(HTTP_IF_NONE_MATCH=first['ETag'])
+        self.assertEqual(second.status_code, 200)
+        self.assertEqual(second.json()['apartments'][str(self.second.pk)][(self.today - self.start).days], '1')
+
+
+class StructuredLoggingTests(TestCase):
+    def test_requests_are_logged_with_id_and_view(self):
+        make_apartment()
+        with self.assertLogs('EsHomesApp.requests', 'INFO') as logged:
+            response = self.client.get(reverse('apartments'), HTTP_X_REQUEST_ID='abc123')
+        self.assertEqual(response['X-Request-ID'], 'abc123')
+        record = logged.records[0]
+        self.assertEqual((record.request_id, record.view, record.status), ('abc123', 'apartments', 200))
+        self.assertGreater(record.duration_ms, 0)
+
+    @override_settings(LOG_SAMPLE_RATES={'sampled': 0.0})
+    def test_queued_json_lines_are_redacted_and_sampled(self):
+        workdir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, workdir)
+        handler = logs.QueuedJsonHandler(filename=f"{workdir}/app.log")
+        handler.addFilter(logs.RequestContextFilter())
+        handler.addFilter(logs.SamplingFilter())
+        logger = logging.getLogger('sampled')
+        logger.addHandler(handler)
+        self.addCleanup(logger.removeHandler, handler)
+
+        logs.request_id.set('req-1')
+        self.addCleanup(logs.request_id.set, None)
+        logger.info("dropped by sampling")
+        logger.warning("Payment for %s failed", 'TX-1', extra={'tx_ref': 'TX-1', 'form': {'password': 'hunter2', 'guests': 2}})
+        handler.flush_and_stop()
+
+        with open(f"{workdir}/app.log") as f:
+            lines = [json.loads(line) for line in f]
+        self.assertEqual(len(lines), 1)
+        self.assertEqual(lines[0]['message'], "Payment for TX-1 failed")
+        self.assertEqual(lines[0]['request_id'], 'req-1')
+        self.assertEqual(lines[0]['tx_ref'], 'TX-1')
+        self.assertEqual(lines[0]['form'], {'password': '[redacted]', 'guests': 2})
+
+
+class PerformanceBudgetTests(TestCase):
+    """Every named route stays within its budgets (budgets.py) and doesn't grow with the data."""
+
+    def test_every_route_has_a_budget(self):
+        from .urls import urlpatterns
+        named = {pattern.name for pattern in urlpatterns if pattern.name}
+        self.assertEqual(named - set(budgets.BUDGETS), set(), "routes without a budget")
+        self.assertEqual(set(budgets.BUDGETS) - named, set(), "budgets for routes that no longer exist")
+
+    def test_routes_stay_within_budget_at_every_scale(self):
+        measured = {}
+        for scale, size in budgets.SCALES.items():
+            with transaction.atomic():
+                objects = budgets.seed(size)
+                measured[scale] = {name: budgets.measure(self.client, name, objects) for name in budgets.BUDGETS}
+                transaction.set_rollback(True)
+
+        factor = budgets.time_factor()
+        for name, budget in budgets.BUDGETS.items():
+            small, large = measured['small'][name], measured['large'][name]
+            with self.subTest(route=name):
+                self.assertEqual(large['status'], budget.get('status', 200))
+                grown = budgets.growth(small['sites'], large['sites'])
+                self.assertFalse(grown, (
+                    f"{name}: {len(small['sites'])} queries at scale {budgets.SCALES['small']}, "
+                    f"{len(large['sites'])} at {budgets.SCALES['large']}. Growing sites:\n"
+                    + budgets.describe_sites(list(grown.elements()))
+                ))
+                self.assertLessEqual(len(large['sites']), budget['queries'], (
+                    f"{name}: {len(large['sites'])} queries, budget {budget['queries']}:\n"
+                    + budgets.describe_sites(large['sites'])
+                ))
+                self.assertLessEqual(large['kb'], budget['kb'], f"{name}: {large['kb']:.1f} KB, budget {budget['kb']}")
+                self.assertLessEqual(large['ms'], budget['ms'] * factor, f"{name}: {large['ms']:.0f} ms, budget {budget['ms']}")
+
+
+@override_settings(EXPORT_CHUNK_SIZE=2)
+class ExportTests(TestCase):
+    def setUp(self):
+        self.apartment = make_apartment(name='Ikoyi, "Loft"')
+        self.user = make_user()
+        self.admin = CustomUser.objects.create_superuser(
+            username='finance', email='finance@example.com', password='s3cret-pass', phone_number='finance',
+        )
+        check_in = timezone.localdate() + timedelta(days=10)
+        for i, status in enumerate(['confirmed', 'cancelled', 'confirmed', 'pending', 'completed']):
+            booking = Booking.objects.create(
+                user=self.user, apartment=self.apartment, check_in_date=check_in + timedelta(days=3 * i),
+                check_out_date=check_in + timedelta(days=3 * i + 2), guests=1, total_price=Decimal('200.00'),
+                status=status,
+            )
+            Transaction.objects.create(
+                user=self.user, booking=booking, amount=Decimal('200.00'), tx_ref=f'EXP-{i}',
+                transaction_status='completed' if status in ('confirmed', 'completed') else 'declined',
+            )
+        self.old = Booking.objects.get(status='pending')
+        Booking.objects.filter(pk=self.old.pk).update(booking_date=timezone.now() - timedelta(days=40))
+
+    def export(self, model, action, **filters):
+        self.client.force_login(self.admin)
+        url = reverse(f'admin:EsHomesApp_{model}_changelist')
+        if filters:
+            url += '?' + '&'.join(f'{key}={value}' for key, value in filters.items())
+        return self.client.post(url, {'action': action, 'select_across': '1', 'index': '0', '_selected_action': ['0']})
+
+    def test_admin_csv_follows_the_changelist_filters(self):
+        response = self.export('booking', 'export_csv', status__exact='confirmed')
+        self.assertTrue(response.streaming)
+        self.assertIn('attachment; filename="bookings-', response['Content-Disposition'])
+        with self.assertNumQueries(1):
+            content = b''.join(response.streaming_content).decode('utf-8-sig')
+        lines = content.splitlines()
+        self.assertEqual(lines[0].split(',')[:3], ['Booking ID', 'Booked at', 'Status'])
+        self.assertEqual(len(lines), 3)
+        self.assertTrue(all(',confirmed,' in line for line in lines[1:]))
+        self.assertIn('"Ikoyi, ""Loft"""', lines[1])
+
+    def test_admin_xlsx_is_a_workbook(self):
+        import zipfile
+        from io import BytesIO
+        from xml.etree import ElementTree
+
+        response = self.export('transaction', 'export_xlsx')
+        workbook = zipfile.ZipFile(BytesIO(b''.join(response.streaming_content)))
+        self.assertIsNone(workbook.testzip())
+        sheet = ElementTree.fromstring(workbook.read('xl/worksheets/sheet1.xml'))
+        ns = {'x': 'http://schemas.openxmlformats.org/spreadsheetml/2006/main'}
+        rows = sheet.findall('x:sheetData/x:row', ns)
+        self.assertEqual(len(rows), 6)
+        texts = [t.text for t in rows[1].iterfind('.//x:t', ns)]
+        self.assertIn('completed', texts)
+        self.assertIn('Ikoyi, "Loft"', texts)
+        # Created at: a styled date-time serial
+        self.assertEqual(rows[1].findall('x:c', ns)[1].get('s'), '2')
+
+    def test_text_that_looks_like_a_formula_is_not_run(self):
+        import zipfile
+
+        Booking.objects.filter(pk=self.old.pk).update(cancellation_reason='=HYPERLINK("http://evil.example","Refund")')
+        response = self.export('booking', 'export_csv', status__exact='pending')
+        row = b''.join(response.streaming_content).decode('utf-8-sig').splitlines()[1]
+        self.assertIn('"\'=HYPERLINK(""http://evil.example"",""Refund"")"', row)
+
+        response = self.export('booking', 'export_xlsx', status__exact='pending')
+        with zipfile.ZipFile(io.BytesIO(b''.join(response.streaming_content))) as workbook:
+            sheet = workbook.read('xl/worksheets/sheet1.xml').decode()
+        self.assertIn('<c t="inlineStr"><is><t xml:space="preserve">=HYPERLINK(', sheet)
+        self.assertNotIn('<f>', sheet)
+
+    def test_command_filters_by_date_and_status(self):
+        workdir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, workdir)
+        output = f'{workdir}/bookings.csv'
+        today = timezone.localdate()
+        call_command(
+            'export_records', 'bookings', '--from', (today - timedelta(days=7)).isoformat(), '--to', today.isoformat(),
+            '--status', 'confirmed', '--status', 'pending', '--output', output, stderr=mock.Mock(),
+        )
+        with open(output, encoding='utf-8-sig') as f:
+            lines = f.read().splitlines()
+        self.assertEqual(len(lines), 3)
+        self.assertNotIn(str(self.old.pk), [line.split(',')[0] for line in lines])
+
+        call_command(
+            'export_records', 'bookings', '--to', (today - timedelta(days=30)).isoformat(), '--output', output,
+            stderr=mock.Mock(),
+        )
+        with open(output, encoding='utf-8-sig') as f:
+            self.assertEqual([line.split(',')[0] for line in f.read().splitlines()[1:]], [str(self.old.pk)])
+
+
+@override_settings(ARCHIVE_AFTER_DAYS=365, ARCHIVE_BATCH=2)
+class ArchiveTests(TestCase):
+    def setUp(self):
+        self.apartment = make_apartment(name='Lekki Flat')
+        self.user = make_user()
+        today = timezone.localdate()
+        self.bookings = {}
+        for name, status, days_ago in [
+            ('old_completed', 'completed', 500), ('old_cancelled', 'cancelled', 450), ('old_completed_2', 'completed', 400),
+            ('old_confirmed', 'confirmed', 420), ('recent_completed', 'completed', 100),
+        ]:
+            check_in = today - timedelta(days=days_ago)
+            booking = self.bookings[name] = Booking.objects.create(
+                user=self.user, apartment=self.apartment, check_in_date=check_in,
+                check_out_date=check_in + timedelta(days=3), guests=1, total_price=Decimal('300.00'), status=status,
+            )
+            Transaction.objects.create(
+                user=self.user, booking=booking, amount=booking.total_price, tx_ref=f'ARC-{name}',
+                transaction_status='declined' if status == 'cancelled' else 'completed',
+            )
+        self.review = Review.objects.create(
+            user=self.user, apartment=self.apartment, booking=self.bookings['old_completed'], rating=5,
+            comment='Great.', cleanliness_rating=5, location_rating=5, value_rating=5,
+        )
+
+    def test_finished_bookings_move_with_their_transactions_and_reviews(self):
+        rollups.rebuild()
+        stats_before = list(ApartmentMonthStats.objects.order_by('month').values_list(
+            'month', 'nights_sold', 'confirmed_revenue', 'cancellations',
+        ))
+
+        report = archive.archive()
+
+        self.assertEqual((report['bookings'], report['transactions'], report['reviews']), (3, 3, 1))
+        moved = [self.bookings[name].pk for name in ('old_completed', 'old_cancelled', 'old_completed_2')]
+        self.assertFalse(Booking.objects.filter(pk__in=moved).exists())
+        self.assertEqual(set(Booking.objects.values_list('pk', flat=True)),
+                         {self.bookings['old_confirmed'].pk, self.bookings['recent_completed'].pk})
+        archived = ArchivedBooking.objects.select_related('transaction').get(pk=self.bookings['old_completed'].pk)
+        self.assertEqual((archived.status, archived.total_price), ('completed', Decimal('300.00')))
+        self.assertEqual(archived.transaction.tx_ref, 'ARC-old_completed')
+        self.assertEqual(ArchivedTransaction.objects.count(), 3)
+        self.review.refresh_from_db()
+        self.assertIsNone(self.review.booking)
+        self.assertEqual(self.review.archived_booking, archived)
+
+        # The rollups count archived stays as before, even rebuilt from scratch
+        rollups.rebuild()
+        self.assertEqual(list(ApartmentMonthStats.objects.order_by('month').values_list(
+            'month', 'nights_sold', 'confirmed_revenue', 'cancellations',
+        )), stats_before)
+        self.assertEqual(archive.archive()['bookings'], 0)
+
+    def test_archived_bookings_stay_readable(self):
+        archive.archive(limit=1)
+        self.assertEqual(ArchivedBooking.objects.count(), 1)
+
+        self.client.force_login(self.user)
+        response = self.client.get(reverse('profile'))
+        self.assertEqual(response.context['total_bookings'], 5)
+        self.assertEqual([booking.pk for booking in response.context['bookings']],
+                         [booking.pk for booking in sorted(self.bookings.values(), key=lambda b: b.booking_date, reverse=True)])
+        self.assertContains(response, f"Booking #{self.bookings['old_completed'].pk}")
+
+        admin_user = CustomUser.objects.create_superuser(
+            username='admin', email='admin@example.com', password='s3cret-pass', phone_number='admin',
+        )
+        self.client.force_login(admin_user)
+        archived = ArchivedBooking.objects.get()
+        self.assertContains(self.client.get(reverse('admin:EsHomesApp_archivedbooking_changelist')), 'Lekki Flat')
+        self.assertContains(self.client.get(reverse('admin:EsHomesApp_archivedbooking_change', args=[archived.pk])),
+                            archived.transaction.tx_ref)
+
+
+class WarmupTests(TestCase):
+    def test_warm_up_does_the_first_requests_work(self):
+        make_apartment(name='Warm Flat', featured=True)
+        cache.clear()
+        self.addCleanup(gc.unfreeze)
+        loader = engines['django'].engine.template_loaders[0]
+        loader.reset()
+
+        timings = warmup.warm_up()
+        self.assertEqual(set(timings), {name for name, _ in warmup.STEPS})
+        self.assertIn('EsHomesApp/apartment-detail.html', warmup.app_templates())
+        self.assertTrue(set(warmup.app_templates()) <= set(loader.get_template_cache))
+        self.assertGreater(warmup.prime_urls(), 10)
+        with self.assertNumQueries(0):
+            self.assertEqual([apartment.name for apartment in views.featured_apartments()], ['Warm Flat'])
+            views.bedroom_choices()
+            views.booking_catalog_json()
+
+    def test_a_failing_step_is_skipped(self):
+        self.addCleanup(gc.unfreeze)
+        with mock.patch.object(warmup, 'STEPS', [('broken', mock.Mock(side_effect=RuntimeError)),
+                                                 ('urls', warmup.prime_urls)]):
+            with self.assertLogs('EsHomesApp.warmup', 'WARNING'):
+                self.assertEqual(set(warmup.warm_up()), {'urls'})
+
+
+@override_settings(REVIEWS_PER_PAGE=3)
+class ReviewTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.apartment = make_apartment()
+        self.author = make_user('author')
+        self.reviews = []
+        for i, (rating, helpful) in enumerate([(5, 0), (4, 7), (5, 2), (3, 7), (1, 0)]):
+            review = Review.objects.create(
+                user=self.author, apartment=self.apartment, rating=rating, comment=f'Review {i}',
+                cleanliness_rating=4, location_rating=5, value_rating=3, helpful_votes=helpful,
+            )
+            Review.objects.filter(pk=review.pk).update(created_at=timezone.now() - timedelta(days=10 - i))
+            self.reviews.append(review)
+
+    def ids(self, context):
+        return [review.pk for review in context['reviews']]
+
+    def test_pages_sorted_by_recency_or_helpfulness(self):
+        r = self.reviews
+        with self.assertNumQueries(2):
+            context = reviews.page(self.apartment.pk)
+        self.assertEqual(self.ids(context), [r[4].pk, r[3].pk, r[2].pk])
+        self.assertEqual(self.ids(reviews.page(self.apartment.pk, number=2)), [r[1].pk, r[0].pk])
+        self.assertEqual(self.ids(reviews.page(self.apartment.pk, 'helpful')), [r[3].pk, r[1].pk, r[2].pk])
+        self.assertEqual(self.ids(reviews.page(self.apartment.pk, 'helpful', 2)), [r[4].pk, r[0].pk])
+        self.assertEqual(reviews.page(self.apartment.pk, 'bogus')['review_sort'], 'recent')
+
+        summary = context['review_summary']
+        self.assertEqual((summary['count'], summary['rating'], summary['value_rating']), (5, 3.6, 3))
+        self.assertEqual([row['count'] for row in summary['stars']], [2, 1, 1, 0, 1])
+        # The summary is cached until a review of the apartment changes
+        with self.assertNumQueries(0):
+            reviews.summary(self.apartment.pk)
+        r[4].delete()
+        self.assertEqual(reviews.summary(self.apartment.pk)['count'], 4)
+
+        response = self.client.get(reverse('apartment_detail', args=[self.apartment.pk]), {'review_sort': 'helpful'})
+        self.assertContains(response, 'Review 3')
+        self.assertNotContains(response, 'Review 0')
+
+    def test_helpful_votes_are_deduplicated_and_applied_in_batches(self):
+        review = self.reviews[0]
+        voters = [make_user(f'voter{i}') for i in range(3)]
+        self.assertTrue(reviews.vote(review, voters[0]))
+        self.assertFalse(reviews.vote(review, voters[0]))
+        self.assertFalse(reviews.vote(review, self.author))
+        self.assertTrue(reviews.vote(review, voters[1]))
+        self.assertTrue(reviews.vote(self.reviews[1], voters[1]))
+
+        self.client.force_login(voters[2])
+        response = self.client.post(reverse('review_helpful', args=[review.pk]), {'review_sort': 'helpful', 'review_page': '2'})
+        self.assertRedirects(
+            response, f"{reverse('apartment_detail', args=[self.apartment.pk])}?review_sort=helpful&review_page=2#review-{review.pk}",
+            fetch_redirect_response=False,
+        )
+        self.assertEqual(ReviewVote.objects.filter(review=review).count(), 3)
+        # Counted by apply_votes(), not when cast
+        review.refresh_from_db()
+        self.assertEqual(review.helpful_votes, 0)
+
+        with override_settings(REVIEW_VOTE_BATCH=2):
+            self.assertEqual(reviews.apply_votes(), 4)
+        self.assertEqual(reviews.apply_votes(), 0)
+        self.assertEqual(
+            list(Review.objects.filter(pk__in=[review.pk, self.reviews[1].pk]).order_by('pk').values_list('helpful_votes', flat=True)),
+            [3, 8],
+        )
+
+        response = self.client.get(reverse('apartment_detail', args=[self.apartment.pk]), {'review_page': 2})
+        self.assertContains(response, 'You found this helpful', count=1)
+
+
+class RatesHandler(BaseHTTPRequestHandler):
+    """Stands in for the FX rates provider."""
+    rates = {}
+
+    def do_GET(self):
+        body = json.dumps({'base': 'NGN', 'rates': RatesHandler.rates}).encode()
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+class CurrencyTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        currency.clear()
+        self.addCleanup(currency.clear)
+        self.apartment = make_apartment(name='Ikoyi Loft', featured=True, price_per_night=Decimal('150000.00'))
+        ExchangeRate.objects.create(currency='USD', rate=Decimal('0.00065'))
+
+    def test_prices_shown_in_the_sessions_currency(self):
+        response = self.client.get(reverse('set_currency', args=['USD']), {'next': reverse('apartments')})
+        self.assertRedirects(response, reverse('apartments'))
+        self.assertContains(self.client.get(reverse('apartments')), '$97.50')
+        response = self.client.get(reverse('apartment_detail', args=[self.apartment.pk]))
+        self.assertContains(response, '$97.50')
+        # The booking form still shows (and booking.js still totals) the naira price
+        self.assertIn((self.apartment.pk, 'Ikoyi Loft - ₦150000.00/night (≈ $97.50)'),
+                      list(views.BookingForm(display_currency='USD').fields['apartment'].choices))
+        # A visitor with a currency of their own doesn't get, or fill, the shared page cache
+        response = self.client.get(reverse('home'))
+        self.assertNotIn('X-Page-Cache', response)
+        self.assertContains(response, '$97.50')
+
+        # No rate: naira it is. Unknown codes and off-site redirects are ignored
+        self.client.get(reverse('set_currency', args=['EUR']))
+        self.assertContains(self.client.get(reverse('apartments')), '₦150,000')
+        response = self.client.get(reverse('set_currency', args=['XYZ']), {'next': 'https://example.com/'})
+        self.assertRedirects(response, reverse('home'), fetch_redirect_response=False)
+        self.assertEqual(self.client.session[currency.SESSION_KEY], 'EUR')
+
+    def test_conversion_is_one_lookup_per_page_and_never_touches_settlement(self):
+        apartments = [make_apartment(name=f'Flat {i}', price_per_night=Decimal(100000 + i)) for i in range(5)]
+        with self.assertNumQueries(1):
+            currency.convert(apartments, 'USD')
+        with self.assertNumQueries(0):
+            currency.convert(apartments, 'USD')
+            currency.convert(apartments, settings.BASE_CURRENCY)
+        self.assertEqual([a.display_price for a in apartments[:2]], ['₦100,000', '₦100,001'])
+        self.assertEqual(apartments[0].price_per_night, Decimal('100000'))
+
+        self.client.get(reverse('set_currency', args=['USD']))
+        check_in = timezone.localdate() + timedelta(days=10)
+        quote = self.client.get(reverse('booking_quote'), {
+            'apartment': self.apartment.pk, 'check_in': check_in, 'check_out': check_in + timedelta(days=2),
+        }).json()
+        self.assertEqual((quote['total'], quote['currency']), (300000.0, 'NGN'))
+
+    def test_refresh_pulls_rates_into_the_table(self):
+        server = ThreadingHTTPServer(('127.0.0.1', 0), RatesHandler)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        self.addCleanup(server.server_close)
+        self.addCleanup(server.shutdown)
+
+        with override_settings(FX_RATES_URL=f'http://127.0.0.1:{server.server_port}/latest'):
+            RatesHandler.rates = {'USD': 0.0007, 'GBP': 0.0005, 'JPY': 0.1, 'EUR': 0}
+            self.assertEqual(currency.rates()['USD'], Decimal('0.00065'))
+            self.assertEqual(currency.refresh_rates(), 2)
+        self.assertEqual(dict(ExchangeRate.objects.values_list('currency', 'rate')),
+                         {'USD': Decimal('0.0007'), 'GBP': Decimal('0.0005')})
+        # This process's copy is reloaded straight away
+        self.assertEqual(currency.rates()['USD'], Decimal('0.0007'))
+        self.assertEqual(currency.refresh_rates(), 0)
+
+
+class UploadTests(TestCase):
+    def setUp(self):
+        workdir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, workdir)
+        override = self.settings(
+            MEDIA_ROOT=os.path.join(workdir, 'media'), UPLOAD_TEMP_DIR=os.path.join(workdir, 'uploads'),
+            UPLOAD_CHUNK_SIZE=4096, UPLOAD_IMAGE_MAX_SIDE=500,
+        )
+        override.enable()
+        self.addCleanup(override.disable)
+        self.apartment = make_apartment()
+        self.client.force_login(CustomUser.objects.create_superuser(
+            username='staff', email='staff@example.com', password='s3cret-pass', phone_number='staff',
+        ))
+        from PIL import Image
+
+        # Noise, so it doesn't compress to a single chunk; shot with the phone on its side
+        exif = Image.Exif()
+        exif[uploads.ORIENTATION] = 6
+        photo = io.BytesIO()
+        Image.effect_noise((1200, 300), 64).convert('RGB').save(photo, 'JPEG', exif=exif)
+        self.photo = photo.getvalue()
+
+    def start(self, photo=None, **declared):
+        photo = self.photo if photo is None else photo
+        declared = {'filename': 'lounge.jpg', 'size': len(photo), 'sha256': hashlib.sha256(photo).hexdigest(), **declared}
+        return self.client.post(reverse('admin:EsHomesApp_apartment_upload_start', args=[self.apartment.pk]),
+                                json.dumps(declared), content_type='application/json')
+
+    def send(self, upload, index, data=None):
+        data = self.photo[index * 4096:(index + 1) * 4096] if data is None else data
+        return self.client.put(f"{upload['url']}chunks/{index}/", data, content_type='application/octet-stream')
+
+    def test_chunks_resume_assemble_and_are_processed(self):
+        page = self.client.get(reverse('admin:EsHomesApp_apartment_change', args=[self.apartment.pk]))
+        self.assertContains(page, f'data-upload-url="/admin/EsHomesApp/apartment/{self.apartment.pk}/uploads/"')
+        self.assertContains(page, staticfiles_storage.url('js/admin/photo-uploads.js'))
+        upload = self.start().json()
+        chunks = upload['chunks']
+        self.assertGreater(chunks, 3)
+        self.assertEqual(upload['received'], [])
+        for index in reversed(range(1, chunks)):
+            self.assertEqual(self.send(upload, index).status_code, 200)
+
+        response = self.client.post(f"{upload['url']}complete/")
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('missing: 0', response.json()['error'])
+
+        # Dropped again: the same upload, with what it already has
+        resumed = self.start().json()
+        self.assertEqual(resumed['id'], upload['id'])
+        self.assertEqual(resumed['received'], list(range(1, chunks)))
+        self.assertEqual(self.client.get(upload['url']).json()['received'], list(range(1, chunks)))
+        self.send(upload, 0)
+        self.send(upload, 0)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post(f"{upload['url']}complete/")
+        self.assertEqual(response.status_code, 201)
+        image = ApartmentImage.objects.get(pk=response.json()['id'])
+        self.assertEqual(image.apartment, self.apartment)
+        with image.image.open('rb') as f:
+            self.assertEqual(f.read(), self.photo)
+        self.assertFalse(ImageUpload.objects.exists())
+        self.assertEqual(os.listdir(settings.UPLOAD_TEMP_DIR), [])
+        job = Job.objects.get(task='EsHomesApp.tasks.process_apartment_image')
+        self.assertEqual(job.args, [image.pk])
+
+        from PIL import Image
+
+        original = image.image.path
+        tasks.process_apartment_image(image.pk)
+        image.refresh_from_db()
+        with Image.open(image.image.path) as processed:
+            self.assertEqual(processed.size, (125, 500))
+            self.assertNotIn(uploads.ORIENTATION, processed.getexif())
+        self.assertFalse(os.path.exists(original))
+        # Nothing more to do the second time
+        self.assertFalse(uploads.process(image))
+
+    def test_small_upright_photos_still_lose_their_location(self):
+        from PIL import Image
+
+        exif = Image.Exif()
+        exif.get_ifd(0x8825)[2] = (6.0, 27.0, 0.0)  # GPS IFD: GPSLatitude
+        photo = io.BytesIO()
+        Image.new('RGB', (40, 30), 'teal').save(photo, 'JPEG', exif=exif)
+        image = ApartmentImage.objects.create(
+            apartment=self.apartment, image=ContentFile(photo.getvalue(), name='balcony.jpg'),
+        )
+        self.assertTrue(uploads.process(image))
+        with Image.open(image.image.path) as processed:
+            self.assertEqual(processed.size, (40, 30))
+            self.assertFalse(processed.getexif().get_ifd(0x8825))
+            self.assertFalse(uploads.has_metadata(processed))
+        self.assertFalse(uploads.process(image))
+
+    def test_files_that_are_not_photos_are_refused(self):
+        junk = os.urandom(5000)
+        upload = self.start(junk).json()
+        for index in range(upload['chunks']):
+            self.send(upload, index, junk[index * 4096:(index + 1) * 4096])
+        response = self.client.post(f"{upload['url']}complete/")
+        self.assertEqual(response.status_code, 400)
+        self.assertIn("isn't a photo", response.json()['error'])
+        self.assertFalse(ImageUpload.objects.exists())
+        self.assertFalse(ApartmentImage.objects.exists())
+
+    @override_settings(RATE_LIMIT_UNSAFE_PER_IP='3/m')
+    def test_staff_uploads_are_not_held_to_the_site_limit(self):
+        cache.clear()
+        upload = self.start().json()
+        for index in range(upload['chunks']):
+            self.assertEqual(self.send(upload, index).status_code, 200)
+        self.assertEqual(self.client.post(f"{upload['url']}complete/").status_code, 201)
+        # Everyone else still is
+        self.client.logout()
+        for _ in range(3):
+            self.client.post(reverse('user_login'))
+        self.assertEqual(self.client.post(reverse('user_login')).status_code, 429)
+
+    def test_bad_chunks_and_checksums_are_refused(self):
+        upload = self.start().json()
+        self.assertEqual(self.send(upload, 0, b'short').status_code, 400)
+        self.assertEqual(self.send(upload, 0, self.photo[:4097]).status_code, 400)
+        self.assertEqual(self.send(upload, upload['chunks']).status_code, 400)
+        self.assertEqual(self.client.post(upload['url']).status_code, 405)
+        self.assertEqual(self.start(filename='notes.pdf').status_code, 400)
+        self.assertEqual(self.start(size=len(self.photo) + 1).status_code, 400)
+
+        # Declared with the wrong checksum: caught once assembled, and discarded
+        corrupt = self.start(self.photo[::-1], sha256=hashlib.sha256(self.photo).hexdigest()[::-1]).json()
+        for index in range(corrupt['chunks']):
+            self.send(corrupt, index, self.photo[index * 4096:(index + 1) * 4096])
+        response = self.client.post(f"{corrupt['url']}complete/")
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('checksum', response.json()['error'])
+        self.assertFalse(ImageUpload.objects.filter(pk=corrupt['id']).exists())
+        self.assertFalse(ApartmentImage.objects.exists())
+
+        self.client.logout()
+        self.assertEqual(self.client.get(upload['url']).status_code, 302)
+
+    def test_stale_uploads_are_purged(self):
+        upload = self.start().json()
+        self.send(upload, 0)
+        ImageUpload.objects.update(created_at=timezone.now() - timedelta(hours=settings.UPLOAD_EXPIRY_HOURS + 1))
+        self.assertEqual(uploads.purge_stale(), 1)
+        self.assertFalse(ImageUpload.objects.exists())
+        self.assertFalse(os.path.exists(os.path.join(settings.UPLOAD_TEMP_DIR, upload['id'])))
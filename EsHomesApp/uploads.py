@@ -0,0 +1,249 @@
+"""
+Resumable, chunked photo uploads for apartments, and the processing that
+follows them.
+
+A gallery posted through the admin inline arrives as one multipart request:
+a dozen phone photos is a long request that times out, fails all or nothing,
+and is spooled to temp files by Django before the view even runs. Here each
+photo travels on its own, in UPLOAD_CHUNK_SIZE pieces:
+
+1. ``start()`` declares it (name, size, SHA-256) as an ``ImageUpload``. The
+   same photo declared again for the apartment gets the existing upload back,
+   with the chunks it already has, so an interrupted upload resumes.
+2. ``write_chunk()`` streams one chunk's request body to its own file in
+   blocks, never holding the chunk in memory, and renames it into place once
+   it's complete. Chunks can arrive in any order, in parallel, and be sent
+   again; what has arrived is simply what's on disk, so a chunk costs no
+   database write.
+3. ``finish()`` concatenates the chunks into one file, block by block,
+   hashing as it goes, checks the result against the declared SHA-256 and
+   that Pillow can read it as an image. The file is then moved into
+   MEDIA_ROOT as a new ``ApartmentImage``, not copied, and the
+   process_apartment_image task is queued.
+
+``process()``, run by that task, turns the photo upright (phones record
+rotation in EXIF rather than in the pixels), scales it down to
+UPLOAD_IMAGE_MAX_SIDE and re-encodes it without EXIF or XMP, so the camera's
+GPS position isn't published with the listing. Only a photo that is already
+small enough and carries no metadata is left as it is.
+"""
+import hashlib
+import logging
+import os
+import shutil
+import tempfile
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.files import File
+from django.db import transaction
+from django.utils import timezone
+
+from .models import ApartmentImage, ImageUpload
+
+logger = logging.getLogger(__name__)
+
+# Read and write in blocks this big
+COPY_BUFFER = 64 * 1024
+
+# EXIF tag holding the camera's rotation
+ORIENTATION = 0x0112
+
+
+class UploadError(Exception):
+    """The upload can't go on as asked; the message says why."""
+
+
+class LocalFile(File):
+    """
+    A file on local disk that storage may take over: FileSystemStorage moves
+    anything with a ``temporary_file_path()`` into place instead of copying it.
+    """
+
+    def temporary_file_path(self):
+        return self.file.name
+
+
+def directory(upload):
+    return os.path.join(settings.UPLOAD_TEMP_DIR, str(upload.pk))
+
+
+def received(upload):
+    """Indexes of the chunks on disk, in order."""
+    try:
+        names = os.listdir(directory(upload))
+    except FileNotFoundError:
+        return []
+    return sorted(int(name) for name in names if name.isdigit())
+
+
+def describe(upload):
+    return {
+        'id': str(upload.pk),
+        'chunk_size': upload.chunk_size,
+        'chunks': upload.chunk_count,
+        'received': received(upload),
+    }
+
+
+def start(apartment, filename, size, sha256, user=None):
+    """The ``ImageUpload`` for this photo: a new one, or the unfinished one already declared."""
+    filename = os.path.basename(str(filename or '')).strip()
+    if os.path.splitext(filename)[1].lower() not in settings.UPLOAD_EXTENSIONS:
+        raise UploadError(f"Only {', '.join(settings.UPLOAD_EXTENSIONS)} photos can be uploaded.")
+    if not isinstance(size, int) or not 0 < size <= settings.UPLOAD_MAX_SIZE:
+        raise UploadError(f"Photos must be between 1 byte and {settings.UPLOAD_MAX_SIZE // (1024 * 1024)} MB.")
+    sha256 = str(sha256 or '').lower()
+    if len(sha256) != 64 or any(c not in '0123456789abcdef' for c in sha256):
+        raise UploadError("sha256 must be the file's SHA-256, in hex.")
+
+    upload, created = ImageUpload.objects.get_or_create(
+        apartment=apartment, sha256=sha256,
+        defaults={
+            'filename': filename[-255:], 'size': size, 'chunk_size': settings.UPLOAD_CHUNK_SIZE,
+            'created_by': user if user is not None and user.is_authenticated else None,
+        },
+    )
+    if not created and upload.size != size:
+        raise UploadError("A different size was declared for this photo before.")
+    return upload
+
+
+def write_chunk(upload, index, stream):
+    """Store chunk ``index``, read from the file-like ``stream``. Sending a chunk twice is harmless."""
+    if not 0 <= index < upload.chunk_count:
+        raise UploadError(f"Chunk {index} is out of range (0-{upload.chunk_count - 1}).")
+    expected = upload.chunk_length(index)
+    os.makedirs(directory(upload), exist_ok=True)
+    # Written under a temporary name: a chunk cut off halfway never counts as received
+    with tempfile.NamedTemporaryFile(dir=directory(upload), prefix=f'{index}.', suffix='.part', delete=False) as out:
+        written = 0
+        while written <= expected:
+            block = stream.read(COPY_BUFFER)
+            if not block:
+                break
+            written += len(block)
+            out.write(block)
+    if written != expected:
+        os.unlink(out.name)
+        raise UploadError(f"Chunk {index} should be {expected} bytes, got {written if written <= expected else 'more'}.")
+    os.replace(out.name, os.path.join(directory(upload), str(index)))
+
+
+def assemble(upload):
+    """
+    Concatenate the chunks into one file and check its SHA-256, then that it's
+    an image. Returns the file's path. A mismatch discards the upload, since a
+    chunk is corrupt and there's no telling which; so does a file that isn't a
+    photo, since sending it again won't help.
+    """
+    missing = sorted(set(range(upload.chunk_count)) - set(received(upload)))
+    if missing:
+        raise UploadError(f"Chunks still missing: {', '.join(map(str, missing[:20]))}.")
+    digest = hashlib.sha256()
+    path = os.path.join(directory(upload), 'assembled')
+    with open(path, 'wb') as out:
+        for index in range(upload.chunk_count):
+            with open(os.path.join(directory(upload), str(index)), 'rb') as chunk:
+                while block := chunk.read(COPY_BUFFER):
+                    digest.update(block)
+                    out.write(block)
+    if digest.hexdigest() != upload.sha256:
+        discard(upload)
+        raise UploadError("The uploaded file doesn't match its checksum; send it again.")
+    if not is_image(path):
+        discard(upload)
+        raise UploadError("The uploaded file isn't a photo that can be read.")
+    return path
+
+
+def is_image(path):
+    """True if Pillow can read ``path`` as an image (headers and structure, without decoding it)."""
+    from PIL import Image
+
+    try:
+        with Image.open(path) as photo:
+            photo.verify()
+    # Pillow reports a broken file with whatever its parser tripped on, and DecompressionBombError
+    except Exception:
+        return False
+    return True
+
+
+def finish(upload):
+    """Turn a fully received upload into an ``ApartmentImage`` and queue its processing."""
+    from .tasks import process_apartment_image
+
+    path = assemble(upload)
+    staging = directory(upload)
+    with transaction.atomic():
+        image = ApartmentImage(apartment_id=upload.apartment_id)
+        with open(path, 'rb') as f:
+            image.image.save(upload.filename, LocalFile(f), save=False)
+        image.save()
+        upload.delete()
+        transaction.on_commit(lambda: process_apartment_image.delay(image.pk))
+    shutil.rmtree(staging, ignore_errors=True)
+    logger.info("Uploaded %s for apartment %s", image.image.name, image.apartment_id,
+                extra={'bytes': upload.size, 'chunks': upload.chunk_count})
+    return image
+
+
+def discard(upload):
+    shutil.rmtree(directory(upload), ignore_errors=True)
+    upload.delete()
+
+
+def purge_stale():
+    """Discard uploads left unfinished for UPLOAD_EXPIRY_HOURS. Returns how many."""
+    cutoff = timezone.now() - timedelta(hours=settings.UPLOAD_EXPIRY_HOURS)
+    stale = list(ImageUpload.objects.filter(created_at__lt=cutoff))
+    for upload in stale:
+        discard(upload)
+    return len(stale)
+
+
+def has_metadata(photo):
+    """True if ``photo`` (an open PIL image) carries EXIF, XMP or other camera metadata."""
+    if photo.getexif() or any(key in photo.info for key in ('xmp', 'XML:com.adobe.xmp', 'exif')):
+        return True
+    # JPEG: EXIF/XMP (APP1) and Photoshop (APP13) segments, whatever Pillow made of them
+    return any(marker in ('APP1', 'APP13') for marker, _ in getattr(photo, 'applist', ()))
+
+
+def process(image):
+    """
+    Turn ``image``'s photo upright, bound its longest side by
+    UPLOAD_IMAGE_MAX_SIDE and strip its metadata, re-encoding it. Returns
+    False if it was fine as it was.
+    """
+    from PIL import Image, ImageOps
+
+    max_side = settings.UPLOAD_IMAGE_MAX_SIDE
+    with image.image.open('rb') as f, Image.open(f) as photo:
+        if not has_metadata(photo) and max(photo.size) <= max_side:
+            return False
+        # A phone's multi-picture JPEG keeps just its main picture
+        fmt = 'JPEG' if photo.format == 'MPO' else photo.format
+        icc_profile = photo.info.get('icc_profile')
+        upright = ImageOps.exif_transpose(photo)
+        upright.thumbnail((max_side, max_side), Image.Resampling.LANCZOS)
+        if fmt == 'JPEG' and upright.mode not in ('RGB', 'L'):
+            upright = upright.convert('RGB')
+        # Pillow writes back some of what it read (XMP, for one); only the colour profile is kept
+        upright.info = {}
+        os.makedirs(settings.UPLOAD_TEMP_DIR, exist_ok=True)
+        with tempfile.NamedTemporaryFile(dir=settings.UPLOAD_TEMP_DIR, suffix='.processed', delete=False) as out:
+            upright.save(out, format=fmt, quality=settings.UPLOAD_IMAGE_QUALITY, optimize=True,
+                         icc_profile=icc_profile, exif=b'')
+
+    original = image.image.name
+    try:
+        with open(out.name, 'rb') as f:
+            image.image.save(os.path.basename(original), LocalFile(f), save=False)
+    finally:
+        if os.path.exists(out.name):
+            os.unlink(out.name)
+    image.save(update_fields=['image'])
+    image.image.storage.delete(original)
+    return True
@@ -1,25 +1,48 @@
+from django.conf import settings
 from django.urls import path
 from . import views
 from django.contrib.auth import views as auth_views
+from .ratelimit import ratelimit
+
+# Throttling for the endpoints that are expensive or attractive to abuse
+# (see ratelimit.py for the rule syntax). Login is limited per address and,
+# counting failed attempts only, per account, so that credential stuffing
+# never reaches the password hasher. Webhooks signed by Flutterwave are never
+# throttled: junk requests to the callback only use up their sender's limit.
+login_limit = ratelimit('ip:20/m', 'ip:100/h', failures=['post:email:5/15m'])
+register_limit = ratelimit('ip:5/m', 'ip:20/h')
+payment_callback_limit = ratelimit('ip:60/m', exempt=views.flutterwave_signed, methods=['GET', 'POST'])
+
+# The hot pages are served by their async versions under ASGI (see async_views.py)
+if settings.ASYNC_VIEWS:
+    from . import async_views as hot_views
+else:
+    hot_views = views
 
 
 # Create your views here.
 urlpatterns = [
-    path('', views.home, name='home'),
+    path('', hot_views.home, name='home'),
     path('about/', views.about, name='about'),
-    path('apartments/', views.apartments, name='apartments'),
-    path('apartment/<int:pk>/', views.apartment_detail, name='apartment_detail'),
+    path('apartments/', hot_views.apartments, name='apartments'),
+    path('apartment/<int:pk>/', hot_views.apartment_detail, name='apartment_detail'),
     path('booking/', views.booking, name='booking'),
+    path('booking/quote/', views.booking_quote, name='booking_quote'),
+    path('availability/', views.availability_calendar, name='availability_calendar'),
     path('contact/', views.contact, name='contact'),
-    path('login/', views.login_user, name='user_login'),
+    # A plain link, not a form: a CSRF token would keep the home page out of the page cache
+    path('currency/<str:code>/', views.set_currency, name='set_currency'),
+    path('login/', login_limit(views.login_user), name='user_login'),
     path('profile/', views.profile, name='profile'),
-    path('register/', views.register, name='register'),
+    path('register/', register_limit(views.register), name='register'),
     path('logout_user', views.logout_user, name='logout_user'),
-    path('login_user', views.login_user, name='login_user'),
+    path('login_user', login_limit(views.login_user), name='login_user'),
     path('apartment/<int:pk>/book/', views.create_booking, name='create_booking'),
-    path('payment/initiate/<int:transaction_id>/', views.initiate_payment, name='initiate_payment'),
-    path('payment-callback/', views.payment_callback, name='payment_callback'),
+    path('payment/initiate/<int:transaction_id>/', hot_views.initiate_payment, name='initiate_payment'),
+    path('payment-callback/', payment_callback_limit(hot_views.payment_callback), name='payment_callback'),
     path('thank-you/<int:transaction_id>/', views.thank_you, name='thank_you'),
+    path('apartment/<int:pk>/calendar.ics', views.apartment_calendar, name='apartment_calendar'),
+    path('review/<int:pk>/helpful/', views.review_helpful, name='review_helpful'),
 
 
 ]
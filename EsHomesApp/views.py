@@ -2,25 +2,45 @@ from django.shortcuts import render
 from django.contrib.auth import authenticate, login, logout
 from django.contrib.auth.decorators import login_required
 from django.shortcuts import render, redirect, get_object_or_404
-from .forms import RegisterForm, BookingForm
+from .forms import RegisterForm, BookingForm, booking_errors
 from django.contrib import messages
-from .models import Apartment, Transaction, Booking
-from datetime import date
-from django.http import HttpResponse
+from .models import Amenity, Apartment, Transaction, Booking, Review, amenity_mask, booking_hold_cutoff
+from .availability import is_available
+from . import archive, availability, caching, currency, geo, ical, recommender, reviews
+from datetime import date, timedelta
+from django.http import HttpResponse, JsonResponse
 from django.views.decorators.csrf import csrf_exempt
-from django.views.decorators.http import require_http_methods
+from django.views.decorators.http import require_http_methods, condition
+from django.core.cache import cache
+from django.db import transaction as db_transaction
+import hashlib
+import hmac
 import json
-import requests
+import logging
+import math
 import uuid
+from urllib.parse import urlencode
 import decimal
 from django.conf import settings
 from django.urls import reverse
+from django.utils.http import url_has_allowed_host_and_scheme
 
+logger = logging.getLogger(__name__)
+
+
+def featured_apartments():
+    return caching.get_or_compute(caching.INVENTORY, 'featured', lambda: list(
+        Apartment.objects.filter(featured=True, status='available').prefetch_related('images')[:3]
+    ))
+
+def bedroom_choices():
+    return caching.get_or_compute(caching.INVENTORY, 'bedroom-choices', lambda: sorted(
+        Apartment.objects.values_list('bedrooms', flat=True).distinct()
+    ))
 
 def home(request):
-    featured_apartments = Apartment.objects.filter(featured=True, status='available')[:3]
     context = {
-        'featured_apartments': featured_apartments
+        'featured_apartments': currency.convert(featured_apartments(), currency.selected(request)),
     }
     return render(request, 'EsHomesApp/index.html', context)
 
@@ -29,11 +49,14 @@ def about(request):
 
 from django.core.paginator import Paginator
 
-def apartments(request):
-    # Get filter parameters from request
+def filter_apartments(request):
+    """The available apartments matching the listing page's filters, plus the filters applied."""
     bedroom_filter = request.GET.get('bedrooms', 'all')
     price_filter = request.GET.get('price', 'all')
-    
+    # ?amenities=wifi,pool (or repeated) with ?amenity_match=all|any
+    amenity_filter = [slug for value in request.GET.getlist('amenities') for slug in value.split(',') if slug]
+    amenity_match = 'any' if request.GET.get('amenity_match') == 'any' else 'all'
+
     # Start with all available apartments
     apartments = Apartment.objects.filter(status='available')
     
@@ -49,65 +72,190 @@ def apartments(request):
             apartments = apartments.filter(price_per_night__gt=100000, price_per_night__lte=200000)
         elif price_filter == 'high':
             apartments = apartments.filter(price_per_night__gt=200000)
+
+    # Apply amenity filter: one bitwise test on the apartment row, no joins
+    if amenity_filter:
+        bits = dict(Amenity.objects.filter(slug__in=amenity_filter).values_list('slug', 'bit'))
+        if not bits or (amenity_match == 'all' and len(bits) < len(set(amenity_filter))):
+            apartments = apartments.none()
+        else:
+            apartments = apartments.with_amenities(amenity_mask(bits.values()), amenity_match)
+
+    # The current filters as a query string, for the pagination links
+    query = request.GET.copy()
+    query.pop('page', None)
+
+    filters = {
+        'current_bedroom_filter': bedroom_filter,
+        'current_price_filter': price_filter,
+        'current_amenities': amenity_filter,
+        'current_amenity_match': amenity_match,
+        'filter_query': query.urlencode(),
+    }
+    return apartments, filters
+
+def _floats(value, count):
+    try:
+        numbers = [float(part) for part in (value or '').split(',')]
+    except ValueError:
+        return None
+    return numbers if len(numbers) == count and all(map(math.isfinite, numbers)) else None
+
+def locate_apartments(request, apartments):
+    """
+    The "near me" search: ?near=lat,lon&radius=km, or ?bbox=south,west,north,east
+    (distances then measured from ?near, or the middle of the box), and
+    ?sort=distance. Returns ``[(pk, distance_km)]``, or None if no location was given,
+    plus the location filters applied.
+    """
+    near = _floats(request.GET.get('near'), 2)
+    box = _floats(request.GET.get('bbox'), 4)
+    if near and not (-90 <= near[0] <= 90 and -180 <= near[1] <= 180):
+        near = None
+    if box and not (-90 <= box[0] <= box[2] <= 90 and -180 <= box[1] <= box[3] <= 180):
+        box = None
+    try:
+        radius = float(request.GET.get('radius', settings.GEO_DEFAULT_RADIUS_KM))
+    except ValueError:
+        radius = settings.GEO_DEFAULT_RADIUS_KM
+    radius = min(max(radius, 0.1), settings.GEO_MAX_RADIUS_KM) if math.isfinite(radius) else settings.GEO_DEFAULT_RADIUS_KM
+    sort = 'distance' if request.GET.get('sort') == 'distance' else ''
+
+    filters = {
+        'current_near': ','.join(f'{value:g}' for value in near) if near else '',
+        'current_radius': radius,
+        'current_sort': sort,
+        'radius_choices': [1, 5, 10, 25, 50],
+        'located': bool(near or box),
+    }
+    if not (near or box):
+        return None, filters
+    latitude, longitude = near or ((box[0] + box[2]) / 2, (box[1] + box[3]) / 2)
+    results = geo.search(
+        apartments, latitude, longitude,
+        radius_km=None if box else radius, box=box, sort_by_distance=sort == 'distance',
+    )
+    return results, filters
+
+def with_distances(located, apartments_by_pk):
+    """
+    The apartments of a page of ``(pk, distance_km)``, in order, with
+    ``distance_km`` set. An apartment gone since the search (deleted, or no
+    longer available) is left out.
+    """
+    page = []
+    for pk, distance in located:
+        apartment = apartments_by_pk.get(pk)
+        if apartment is None:
+            continue
+        apartment.distance_km = distance
+        page.append(apartment)
+    return page
+
+def apartments(request):
+    # Get filter parameters from request
+    apartments, filters = filter_apartments(request)
+    
+    # Get unique bedroom counts and amenities for filter options
+    amenity_choices = Amenity.objects.order_by('name')
     
-    # Get unique bedroom counts for filter options
-    bedroom_choices = sorted(Apartment.objects.values_list('bedrooms', flat=True).distinct())
+    # Narrow down to the searched area, if any
+    located, location_filters = locate_apartments(request, apartments)
     
     # Set up pagination
-    paginator = Paginator(apartments, 6)  # Show 6 apartments per page
+    paginator = Paginator(apartments.prefetch_related('images') if located is None else located, 6)  # Show 6 apartments per page
     page_number = request.GET.get('page', 1)
     page_obj = paginator.get_page(page_number)
+    if located is not None:
+        page_obj.object_list = with_distances(
+            page_obj.object_list,
+            apartments.prefetch_related('images').in_bulk([pk for pk, _ in page_obj.object_list]),
+        )
+    # The whole page at once
+    page_obj.object_list = currency.convert(list(page_obj.object_list), currency.selected(request))
     
     context = {
         'apartments': page_obj,
-        'bedroom_choices': bedroom_choices,
-        'current_bedroom_filter': bedroom_filter,
-        'current_price_filter': price_filter,
-        'page_obj': page_obj
+        'bedroom_choices': bedroom_choices(),
+        'amenity_choices': amenity_choices,
+        'page_obj': page_obj,
+        **filters,
+        **location_filters,
     }
     return render(request, 'EsHomesApp/apartments.html', context)
 
 def apartment_detail(request, pk):
-    apartment = get_object_or_404(Apartment, pk=pk)
+    apartment = get_object_or_404(Apartment.objects.prefetch_related('images', 'amenities'), pk=pk)
     
-    # Get similar apartments (same number of bedrooms, excluding current apartment)
-    similar_apartments = Apartment.objects.filter(
-        bedrooms=apartment.bedrooms,
-        status='available'
-    ).exclude(pk=pk)[:2]
+    # Get similar apartments from the precomputed neighbour table, falling
+    # back to the same number of bedrooms until it has been built
+    similar_apartments = list(recommender.similar_apartments(pk).prefetch_related('images')[:2])
+    if not similar_apartments:
+        similar_apartments = list(Apartment.objects.filter(
+            bedrooms=apartment.bedrooms,
+            status='available'
+        ).exclude(pk=pk).prefetch_related('images')[:2])
+    display_currency = currency.selected(request)
+    currency.convert([apartment, *similar_apartments], display_currency)
     
     # Initialize booking form with the current apartment
-    form = BookingForm(initial={'apartment': apartment})
+    form = BookingForm(initial={'apartment': apartment}, display_currency=display_currency)
     
     # Add apartment data for JavaScript
-    apartments_data = {}
-    image_url = apartment.images.first().image.url if apartment.images.exists() else None
-    apartments_data[str(apartment.id)] = {
-        'price': float(apartment.price_per_night),
-        'name': apartment.name,
-        'bedrooms': apartment.bedrooms,
-        'bathrooms': apartment.bathrooms,
-        'image_url': image_url
-    }
-    
-    # Create a custom JSON encoder to handle Decimal objects
-    class DecimalEncoder(json.JSONEncoder):
-        def default(self, obj):
-            if isinstance(obj, decimal.Decimal):
-                return float(obj)
-            return super(DecimalEncoder, self).default(obj)
-    
-    form.fields['apartment'].widget.attrs['data-apartments'] = json.dumps(apartments_data, cls=DecimalEncoder)
+    form.fields['apartment'].widget.attrs['data-apartments'] = apartment_data_json(apartment)
     
     context = {
         'apartment': apartment,
         'similar_apartments': similar_apartments,
         'form': form,
+        **reviews.page(pk, request.GET.get('review_sort'), request.GET.get('review_page', 1), request.user),
     }
     
     return render(request, 'EsHomesApp/apartment-detail.html', context)
 
 
+@login_required(login_url='/login_user')
+@require_http_methods(["POST"])
+def review_helpful(request, pk):
+    review = get_object_or_404(Review.objects.only('pk', 'apartment_id', 'user_id'), pk=pk)
+    reviews.vote(review, request.user)
+    # Back to the same page of reviews
+    query = urlencode({
+        key: request.POST[key] for key in ('review_sort', 'review_page') if request.POST.get(key)
+    })
+    url = reverse('apartment_detail', args=[review.apartment_id])
+    return redirect(f"{url}?{query}#review-{review.pk}" if query else f"{url}#review-{review.pk}")
+
+
+# Create a custom JSON encoder to handle Decimal objects
+class DecimalEncoder(json.JSONEncoder):
+    def default(self, obj):
+        if isinstance(obj, decimal.Decimal):
+            return float(obj)
+        return super(DecimalEncoder, self).default(obj)
+
+def apartment_data(apartment):
+    """The booking widget's price/summary data for an apartment (uses prefetched images if present)."""
+    image = apartment.images.first()
+    return {
+        'price': float(apartment.price_per_night),
+        'name': apartment.name,
+        'bedrooms': apartment.bedrooms,
+        'bathrooms': apartment.bathrooms,
+        'image_url': image.image.url if image else None
+    }
+
+def apartment_data_json(apartment):
+    return json.dumps({str(apartment.id): apartment_data(apartment)}, cls=DecimalEncoder)
+
+def booking_catalog_json():
+    """The booking widget's data for every apartment."""
+    return caching.get_or_compute(caching.INVENTORY, 'booking-catalog', lambda: json.dumps({
+        str(apartment.id): apartment_data(apartment)
+        for apartment in Apartment.objects.prefetch_related('images')
+    }, cls=DecimalEncoder))
+
+
 def booking(request):
     apartment_id = request.GET.get('apartment')
     initial_data = {}
@@ -120,8 +268,7 @@ def booking(request):
             pass
 
     if request.method == 'POST':
-        form = BookingForm(request.POST)
-        print(request.POST)
+        form = BookingForm(request.POST, display_currency=currency.selected(request))
         if form.is_valid():
             booking = form.save(commit=False)
             booking.user = request.user
@@ -141,7 +288,10 @@ def booking(request):
                 tx_ref=tx_ref,
                 transaction_status='pending'
             )
-            print(request.POST)
+            logger.info(
+                "Booking %s created", booking.id,
+                extra={'booking_id': booking.id, 'apartment_id': booking.apartment_id, 'tx_ref': tx_ref},
+            )
 
             messages.success(request, "Booking created. Proceeding to payment.")
             return redirect('initiate_payment', transaction_id=transaction.id)
@@ -152,28 +302,10 @@ def booking(request):
     else:
         if not request.user.is_authenticated:
             return redirect('login_user')
-        form = BookingForm(initial=initial_data)
+        form = BookingForm(initial=initial_data, display_currency=currency.selected(request))
         
         # Add apartment data for JavaScript
-        apartments_data = {}
-        for apartment in Apartment.objects.all():
-            image_url = apartment.images.first().image.url if apartment.images.exists() else None
-            apartments_data[str(apartment.id)] = {
-                'price': float(apartment.price_per_night),
-                'name': apartment.name,
-                'bedrooms': apartment.bedrooms,
-                'bathrooms': apartment.bathrooms,
-                'image_url': image_url
-            }
-            
-        # Create a custom JSON encoder to handle Decimal objects
-        class DecimalEncoder(json.JSONEncoder):
-            def default(self, obj):
-                if isinstance(obj, decimal.Decimal):
-                    return float(obj)
-                return super(DecimalEncoder, self).default(obj)
-        
-        form.fields['apartment'].widget.attrs['data-apartments'] = json.dumps(apartments_data, cls=DecimalEncoder)
+        form.fields['apartment'].widget.attrs['data-apartments'] = booking_catalog_json()
     
     context = {
         'form': form,
@@ -182,15 +314,164 @@ def booking(request):
     return render(request, 'EsHomesApp/booking.html', context)
   
 
+QUOTE_MAX_NIGHTS = 366
+
+
+def _quote_params(request):
+    """(apartment_id, check_in, check_out, guests) from the query string, or an error message."""
+    try:
+        apartment_id = int(request.GET['apartment'])
+        check_in = date.fromisoformat(request.GET['check_in'])
+        check_out = date.fromisoformat(request.GET['check_out'])
+        guests = int(request.GET.get('guests') or 1)
+    except (KeyError, ValueError):
+        return "Give apartment, check_in and check_out (YYYY-MM-DD), and optionally guests."
+    if guests < 1:
+        return "guests must be at least 1."
+    if (check_out - check_in).days > QUOTE_MAX_NIGHTS:
+        return f"Stays are limited to {QUOTE_MAX_NIGHTS} nights."
+    return apartment_id, check_in, check_out, guests
+
+
+def _quote_version(request):
+    # Everything a quote depends on: prices (inventory), bookings and blocks
+    # (the apartment's availability) and today's date (past check-ins)
+    if not hasattr(request, '_quote_version'):
+        params = _quote_params(request)
+        if isinstance(params, str):
+            request._quote_version = None
+        else:
+            apartment_id, check_in, check_out, guests = params
+            key = (
+                f"{apartment_id}:{check_in}:{check_out}:{guests}:{date.today()}:"
+                f"{caching.namespace_version(caching.INVENTORY)}:{availability.version(apartment_id)}"
+            )
+            request._quote_version = hashlib.md5(key.encode()).hexdigest()
+    return request._quote_version
+
+
+def build_quote(apartment, check_in, check_out, guests):
+    errors = booking_errors(apartment, check_in, check_out, guests)
+    nights = [check_in + timedelta(days=i) for i in range(max((check_out - check_in).days, 0))]
+    return {
+        'apartment': apartment.pk,
+        'check_in': check_in.isoformat(),
+        'check_out': check_out.isoformat(),
+        'guests': guests,
+        'available': not errors,
+        'nights': [{'date': night.isoformat(), 'price': float(apartment.price_per_night)} for night in nights],
+        'total': float(apartment.price_per_night * len(nights)),
+        'currency': settings.BASE_CURRENCY,
+        'errors': errors,
+    }
+
+
+@condition(etag_func=lambda request: _quote_version(request))
+def booking_quote(request):
+    """
+    Live price and availability for the booking form, as JSON. Reads no
+    session, so it is the same for everyone and cached per version.
+    """
+    params = _quote_params(request)
+    if isinstance(params, str):
+        return JsonResponse({'errors': [params]}, status=400)
+    apartment_id, check_in, check_out, guests = params
+    try:
+        apartment = Apartment.objects.get(pk=apartment_id)
+    except Apartment.DoesNotExist:
+        return JsonResponse({'errors': ["No such apartment."]}, status=404)
+    quote = caching.get_or_compute(
+        availability.namespace(apartment_id), f"quote:{_quote_version(request)}",
+        lambda: build_quote(apartment, check_in, check_out, guests),
+    )
+    response = JsonResponse(quote)
+    response['Cache-Control'] = 'public, no-cache'
+    return response
+
+
+def _calendar_params(request):
+    """(apartment_ids, start month, months, format) from the query string, or an error message."""
+    try:
+        apartment_ids = sorted({int(pk) for pk in request.GET['apartments'].split(',')})
+        start = date.fromisoformat(request.GET['start'] + '-01') if 'start' in request.GET else date.today()
+        months = int(request.GET.get('months') or settings.AVAILABILITY_CALENDAR_MAX_MONTHS)
+    except (KeyError, ValueError):
+        return "Give apartments (comma-separated ids), and optionally start (YYYY-MM) and months."
+    output = request.GET.get('format') or 'bits'
+    if output not in ('bits', 'rle'):
+        return "format must be bits or rle."
+    if not 0 < len(apartment_ids) <= settings.AVAILABILITY_CALENDAR_MAX_APARTMENTS:
+        return f"Ask for between 1 and {settings.AVAILABILITY_CALENDAR_MAX_APARTMENTS} apartments."
+    if not 0 < months <= settings.AVAILABILITY_CALENDAR_MAX_MONTHS:
+        return f"months must be between 1 and {settings.AVAILABILITY_CALENDAR_MAX_MONTHS}."
+    return apartment_ids, start.replace(day=1), months, output
+
+def _availability_calendar_version(request):
+    if not hasattr(request, '_availability_calendar_version'):
+        params = _calendar_params(request)
+        if isinstance(params, str):
+            request._availability_calendar_version = None
+        else:
+            apartment_ids, start, months, output = params
+            # Inventory too, so ids of apartments that didn't exist yet don't stay missing
+            versions = [caching.namespace_version(caching.INVENTORY)] + [availability.version(pk) for pk in apartment_ids]
+            key = f"{apartment_ids}:{start}:{months}:{output}:{date.today()}:{versions}"
+            request._availability_calendar_version = hashlib.md5(key.encode()).hexdigest()
+    return request._availability_calendar_version
+
+def build_availability_calendar(apartment_ids, start, months, output):
+    end = availability.add_months(start, months)
+    apartment_ids = list(Apartment.objects.filter(pk__in=apartment_ids).values_list('pk', flat=True))
+    encode = availability.encode_bits if output == 'bits' else availability.encode_runs
+    return json.dumps({
+        'start': start.isoformat(),
+        'end': end.isoformat(),
+        'format': output,
+        'apartments': {
+            str(pk): encode(nights)
+            for pk, nights in availability.booked_nights(apartment_ids, start, end).items()
+        },
+    }, separators=(',', ':'))
+
+@condition(etag_func=lambda request: _availability_calendar_version(request))
+def availability_calendar(request):
+    """
+    Which nights are unavailable, month by month, for several apartments at
+    once: a '0'/'1' string per apartment (``format=bits``, one character per
+    night from ``start``) or alternating free/booked run lengths (``rle``).
+    """
+    params = _calendar_params(request)
+    if isinstance(params, str):
+        return JsonResponse({'errors': [params]}, status=400)
+    cache_key = f"availability-calendar:{_availability_calendar_version(request)}"
+    body = cache.get(cache_key)
+    if body is None:
+        body = build_availability_calendar(*params)
+        cache.set(cache_key, body, settings.AVAILABILITY_CALENDAR_CACHE_SECONDS)
+    response = HttpResponse(body, content_type='application/json')
+    response['Cache-Control'] = 'public, no-cache'
+    return response
+
+
 def contact(request):
     return render(request, 'EsHomesApp/contact.html')
 
+def set_currency(request, code):
+    """Show prices in ``code`` for the rest of the session, then go back to ?next."""
+    next_url = request.GET.get('next')
+    if not url_has_allowed_host_and_scheme(next_url, allowed_hosts={request.get_host()}, require_https=request.is_secure()):
+        next_url = reverse('home')
+    if code in settings.DISPLAY_CURRENCIES:
+        request.session[currency.SESSION_KEY] = code
+    return redirect(next_url)
+
 @login_required(login_url='/login_user')
 def profile(request):
-    bookings = Booking.objects.filter(user=request.user).order_by('-booking_date')
+    bookings = archive.booking_history(request.user)
     context = {
         'user': request.user,
         'bookings': bookings,
+        'total_bookings': len(bookings),
     }
     return render(request, 'EsHomesApp/profile.html', context)
 
@@ -271,15 +552,9 @@ def create_booking(request, pk):
             messages.error(request, f"Number of guests must be between 1 and {apartment.max_occupancy}.")
             return redirect('apartment_detail', pk=pk)
 
-        # Check for overlapping bookings
-        overlapping_bookings = Booking.objects.filter(
-            apartment=apartment,
-            status__in=['pending', 'confirmed'],
-            check_in_date__lt=check_out_date,
-            check_out_date__gt=check_in_date
-        ).exists()
-
-        if overlapping_bookings:
+        # Check for overlapping bookings and dates blocked on other channels.
+        # Pending bookings only block the dates until their hold expires.
+        if not is_available(apartment.pk, check_in_date, check_out_date):
             messages.error(request, "This apartment is not available for the selected dates.")
             return redirect('apartment_detail', pk=pk)
 
@@ -317,7 +592,10 @@ def create_booking(request, pk):
 
 @login_required(login_url='/login_user')
 def initiate_payment(request, transaction_id):
-    transaction = get_object_or_404(Transaction, id=transaction_id, user=request.user)
+    transaction = get_object_or_404(
+        Transaction.objects.select_related('booking__apartment').prefetch_related('booking__apartment__images'),
+        id=transaction_id, user=request.user,
+    )
     booking = transaction.booking
 
     context = {
@@ -337,6 +615,7 @@ def initiate_payment(request, transaction_id):
 def payment_callback(request):
     if request.method == "POST":
         # Handle webhook
+        tx_ref = None
         try:
             webhook_data = json.loads(request.body)
             event_type = webhook_data.get('event')
@@ -349,23 +628,9 @@ def payment_callback(request):
 
             if event_type == 'charge.completed' and status in ['successful', 'completed']:
                 verification_response = verify_transaction(flw_transaction_id)
-                if (verification_response.get('status') == 'success' and
-                    verification_response['data']['status'] in ['successful', 'completed'] and
-                    verification_response['data']['amount'] == float(transaction.amount) and
-                    verification_response['data']['currency'] == 'NGN'):
-
-                    transaction.flw_transaction_id = flw_transaction_id
-                    transaction.transaction_status = 'completed'
-                    transaction.save()
-
-                    booking = transaction.booking
-                    booking.status = 'confirmed'
-                    booking.save()
-
-                    # Optionally update apartment status to 'reserved'
-                    booking.apartment.status = 'reserved'
-                    booking.apartment.save()
-
+                if payment_verified(verification_response, transaction):
+                    # Acknowledged either way: a refund due is for staff, not for Flutterwave to retry
+                    settle_payment(transaction, flw_transaction_id)
                     return HttpResponse(status=200)
                 else:
                     transaction.transaction_status = 'declined'
@@ -377,7 +642,7 @@ def payment_callback(request):
                 return HttpResponse(status=200)
             return HttpResponse(status=400)
         except Exception as e:
-            print(f"Webhook error: {str(e)}")
+            logger.warning("Webhook error: %s", e, extra={'tx_ref': tx_ref}, exc_info=True)
             return HttpResponse(status=400)
 
     elif request.method == "GET":
@@ -394,23 +659,10 @@ def payment_callback(request):
 
         if status in ['successful', 'completed']:
             verification_response = verify_transaction(flw_transaction_id)
-            if (verification_response.get('status') == 'success' and
-                verification_response['data']['status'] in ['successful', 'completed'] and
-                verification_response['data']['amount'] == float(transaction.amount) and
-                verification_response['data']['currency'] == 'NGN'):
-
-                transaction.flw_transaction_id = flw_transaction_id
-                transaction.transaction_status = 'completed'
-                transaction.save()
-
-                booking = transaction.booking
-                booking.status = 'confirmed'
-                booking.save()
-
-                # Optionally update apartment status to 'reserved'
-                booking.apartment.status = 'reserved'
-                booking.apartment.save()
-
+            if payment_verified(verification_response, transaction):
+                if settle_payment(transaction, flw_transaction_id) == 'refund_due':
+                    messages.error(request, REFUND_DUE_MESSAGE)
+                    return redirect('profile')
                 messages.success(request, "Payment successful! Your booking is confirmed.")
                 return redirect('thank_you', transaction_id=transaction.id)
             else:
@@ -431,15 +683,91 @@ def payment_callback(request):
 
         return redirect('profile')
 
-def verify_transaction(flw_transaction_id):
-    url = f"https://api.flutterwave.com/v3/transactions/{flw_transaction_id}/verify"
-    headers = {
+def gateway_headers():
+    return {
         'Authorization': f'Bearer {settings.FLUTTERWAVE_SECRET_KEY}',
         'Content-Type': 'application/json',
     }
-    response = requests.get(url, headers=headers)
+
+def verification_request(flw_transaction_id):
+    """URL and headers for Flutterwave's transaction verification endpoint."""
+    url = f"{settings.FLUTTERWAVE_API_URL}/transactions/{flw_transaction_id}/verify"
+    return url, gateway_headers()
+
+def reference_verification_request(tx_ref):
+    """The same, by our tx_ref, for payments whose Flutterwave id never reached us."""
+    url = f"{settings.FLUTTERWAVE_API_URL}/transactions/verify_by_reference?{urlencode({'tx_ref': tx_ref})}"
+    return url, gateway_headers()
+
+def verify_transaction(flw_transaction_id):
+    # Imported here, not at the top: most processes never call out (see WARMUP_IMPORTS)
+    import requests
+
+    url, headers = verification_request(flw_transaction_id)
+    response = requests.get(url, headers=headers, timeout=settings.FLUTTERWAVE_TIMEOUT)
     return response.json()
 
+def payment_verified(verification_response, transaction):
+    """True if Flutterwave confirms the full amount of ``transaction`` was paid."""
+    return (verification_response.get('status') == 'success' and
+            verification_response['data']['status'] in ['successful', 'completed'] and
+            verification_response['data']['amount'] == float(transaction.amount) and
+            verification_response['data']['currency'] == settings.BASE_CURRENCY)
+
+def flutterwave_signed(request):
+    """True for a webhook carrying FLUTTERWAVE_WEBHOOK_HASH, the secret hash set on Flutterwave's dashboard."""
+    secret = settings.FLUTTERWAVE_WEBHOOK_HASH
+    return bool(secret) and request.method == 'POST' and hmac.compare_digest(
+        request.headers.get('verif-hash', '').encode(), secret.encode(),
+    )
+
+REFUND_DUE_MESSAGE = (
+    "Your payment went through, but your booking's hold had run out and the dates are no longer "
+    "available. We'll refund the full amount."
+)
+
+def settle_payment(transaction, flw_transaction_id):
+    """
+    Record a verified payment for ``transaction`` and confirm its booking, if
+    the booking can still have its dates: it is pending within its hold, or
+    it lost the hold (expired, or cancelled by the sweeper) but nobody has
+    taken the dates since. Otherwise the payment is kept as ``refund_due``
+    and logged for staff to refund. Returns the transaction's new status.
+    """
+    with db_transaction.atomic():
+        tx = Transaction.objects.select_for_update().get(pk=transaction.pk)
+        if tx.transaction_status in ('completed', 'refund_due'):
+            # The webhook and the redirect both report the same payment
+            return tx.transaction_status
+        tx.flw_transaction_id = flw_transaction_id
+        booking = None
+        if tx.booking_id:
+            # The apartment row too: two late payments for the same nights are settled one at a time
+            booking = Booking.objects.select_for_update(of=('self', 'apartment')).select_related('apartment').get(
+                pk=tx.booking_id,
+            )
+        if booking is None or booking.status in ('confirmed', 'completed'):
+            tx.transaction_status = 'completed'
+        elif (booking.status == 'pending' and booking.booking_date >= booking_hold_cutoff()) or is_available(
+                booking.apartment_id, booking.check_in_date, booking.check_out_date):
+            tx.transaction_status = 'completed'
+            booking.status = 'confirmed'
+            booking.cancellation_reason = ''
+            booking.save()
+            # Optionally update apartment status to 'reserved'
+            booking.apartment.status = 'reserved'
+            booking.apartment.save(update_fields=['status', 'updated_at'])
+        else:
+            tx.transaction_status = 'refund_due'
+            logger.warning(
+                "Payment %s arrived after booking #%s lost its dates; refund due", tx.tx_ref, booking.pk,
+                extra={'tx_ref': tx.tx_ref, 'booking': booking.pk, 'amount': str(tx.amount)},
+            )
+        tx.save()
+    transaction.transaction_status = tx.transaction_status
+    transaction.flw_transaction_id = tx.flw_transaction_id
+    return tx.transaction_status
+
 @login_required(login_url='/login_user')
 def thank_you(request, transaction_id):
     transaction = get_object_or_404(Transaction, id=transaction_id, user=request.user)
@@ -449,4 +777,32 @@ def thank_you(request, transaction_id):
         'transaction': transaction,
         'booking': booking,
     }
-    return render(request, 'EsHomesApp/thank_you.html', context)
\ No newline at end of file
+    return render(request, 'EsHomesApp/thank_you.html', context)
+
+
+def _calendar_version(request, pk):
+    # Shared by the ETag and Last-Modified callbacks so the version query runs once
+    if not hasattr(request, '_calendar_version'):
+        request._calendar_version = ical.feed_version(pk)
+    return request._calendar_version
+
+@condition(
+    etag_func=lambda request, pk: _calendar_version(request, pk)[0],
+    last_modified_func=lambda request, pk: _calendar_version(request, pk)[1],
+)
+def apartment_calendar(request, pk):
+    apartment = get_object_or_404(Apartment, pk=pk)
+    etag, _ = _calendar_version(request, pk)
+
+    # The feed only changes when its version does, so build it once per version
+    cache_key = f"ical:{pk}:{etag}"
+    body = cache.get(cache_key)
+    if body is None:
+        body = ical.render_feed(apartment)
+        cache.set(cache_key, body, settings.ICAL_FEED_CACHE_SECONDS)
+
+    response = HttpResponse(body, content_type='text/calendar; charset=utf-8')
+    response['Content-Disposition'] = f'inline; filename="apartment-{pk}.ics"'
+    # Let pollers keep a copy but revalidate (cheaply, via 304) every time
+    response['Cache-Control'] = 'public, no-cache'
+    return response
@@ -0,0 +1,112 @@
+"""
+Worker warm-up: do the first request's one-off work before there is one.
+
+A fresh process otherwise pays on its first requests for compiling every
+template it renders, building the URL resolver's lookup tables and compiling
+its regexes, filling the computed-value caches, and importing what the app
+only imports on first use (WARMUP_IMPORTS). ``warm_up()`` does all of that
+up front. wsgi.py and asgi.py call it as soon as the application is loaded
+(WARMUP_ON_LOAD), so a worker has done it before it accepts a connection.
+
+Under a preloading server (``gunicorn --preload``) the application is loaded,
+and so warmed up, once in the master before it forks: every worker starts
+with the compiled templates, resolver, caches and modules already in memory,
+shared copy-on-write. For that, warm-up closes its database connections
+(a connection must not be shared across a fork) and finishes with
+``gc.freeze()``, which keeps the children's garbage collector from writing
+to, and so un-sharing, the pages holding everything loaded so far.
+
+Nothing here is needed for correctness: a step that fails (say the database
+isn't migrated yet) is logged and skipped, and the worker starts anyway.
+"""
+import gc
+import importlib
+import logging
+import os
+import time
+
+from django.apps import apps
+from django.conf import settings
+from django.db import connections
+from django.template import engines
+from django.urls import URLPattern, URLResolver, get_resolver
+
+logger = logging.getLogger(__name__)
+
+
+def app_templates():
+    """Names of the EsHomesApp templates, as passed to get_template()."""
+    root = os.path.join(apps.get_app_config('EsHomesApp').path, 'templates')
+    names = []
+    for directory, _, files in os.walk(root):
+        names += [
+            os.path.relpath(os.path.join(directory, name), root).replace(os.sep, '/')
+            for name in files if name.endswith(('.html', '.txt', '.xml'))
+        ]
+    return sorted(names)
+
+
+def compile_templates():
+    # The cached loader keeps what get_template() compiles for the life of the process
+    engine = engines['django']
+    names = app_templates()
+    for name in names:
+        engine.get_template(name)
+    return len(names)
+
+
+def prime_urls(resolver=None):
+    """Build the reverse lookup tables and compile every pattern's regex."""
+    resolver = resolver or get_resolver()
+    # Populating the root populates every included resolver's tables too
+    resolver.reverse_dict
+    count = 0
+    for pattern in resolver.url_patterns:
+        # Compiled on first access, then kept
+        pattern.pattern.regex
+        if isinstance(pattern, URLResolver):
+            count += prime_urls(pattern)
+        elif isinstance(pattern, URLPattern):
+            count += 1
+    return count
+
+
+def fill_caches():
+    from . import views
+
+    views.featured_apartments()
+    views.bedroom_choices()
+    views.booking_catalog_json()
+
+
+def import_modules():
+    for name in settings.WARMUP_IMPORTS:
+        importlib.import_module(name)
+    return len(settings.WARMUP_IMPORTS)
+
+
+STEPS = [
+    ('imports', import_modules),
+    ('urls', prime_urls),
+    ('templates', compile_templates),
+    ('caches', fill_caches),
+]
+
+
+def warm_up():
+    """Run every warm-up step. Returns ``{step: seconds}`` for the steps that succeeded."""
+    timings = {}
+    for name, step in STEPS:
+        started = time.perf_counter()
+        try:
+            step()
+        except Exception:
+            logger.warning("Warm-up step %s failed", name, exc_info=True)
+            continue
+        timings[name] = time.perf_counter() - started
+    connections.close_all()
+    gc.collect()
+    gc.freeze()
+    logger.info("Warmed up in %.0f ms", sum(timings.values()) * 1000,
+                extra={'steps_ms': {name: round(seconds * 1000, 1) for name, seconds in timings.items()}})
+    return timings
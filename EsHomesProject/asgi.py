@@ -9,8 +9,15 @@ https://docs.djangoproject.com/en/5.2/howto/deployment/asgi/
 
 import os
 
+from django.conf import settings
 from django.core.asgi import get_asgi_application
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'EsHomesProject.settings')
 
 application = get_asgi_application()
+
+if settings.WARMUP_ON_LOAD:
+    # Before the server takes traffic; once in the master under --preload
+    from EsHomesApp.warmup import warm_up
+
+    warm_up()
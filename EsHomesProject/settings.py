@@ -42,7 +42,10 @@ INSTALLED_APPS = [
 
 MIDDLEWARE = [
     'django.middleware.security.SecurityMiddleware',
+    'EsHomesApp.logs.RequestLogMiddleware',
+    'EsHomesApp.ratelimit.RateLimitMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
+    'EsHomesApp.pagecache.PageCacheMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
@@ -56,12 +59,19 @@ TEMPLATES = [
     {
         'BACKEND': 'django.template.backends.django.DjangoTemplates',
         'DIRS': [],
-        'APP_DIRS': True,
         'OPTIONS': {
             'context_processors': [
                 'django.template.context_processors.request',
                 'django.contrib.auth.context_processors.auth',
                 'django.contrib.messages.context_processors.messages',
+                'EsHomesApp.currency.context_processor',
+            ],
+            # Compile each template once per process instead of on every render
+            'loaders': [
+                ('django.template.loaders.cached.Loader', [
+                    'django.template.loaders.filesystem.Loader',
+                    'django.template.loaders.app_directories.Loader',
+                ]),
             ],
         },
     },
@@ -77,6 +87,11 @@ DATABASES = {
     'default': {
         'ENGINE': 'django.db.backends.sqlite3',
         'NAME': BASE_DIR / 'db.sqlite3',
+        'OPTIONS': {
+            # Wait for the write lock instead of failing straight away when
+            # the job worker and the web process write at the same time
+            'timeout': 20,
+        },
     }
 }
 
@@ -124,6 +139,28 @@ STATIC_ROOT = os.path.join(BASE_DIR, 'static')
 MEDIA_URL = '/media/'
 MEDIA_ROOT = BASE_DIR / 'media'
 
+# collectstatic writes content-hashed copies (style.3f2a1c9e8b7d.css) plus a
+# manifest, so every static URL changes when its content does and can be
+# cached by browsers for a year. Text assets also get .gz/.br siblings.
+STORAGES = {
+    'default': {
+        'BACKEND': 'django.core.files.storage.FileSystemStorage',
+    },
+    'staticfiles': {
+        'BACKEND': 'EsHomesApp.storage.CompressedManifestStaticStorage',
+    },
+}
+
+STATIC_CACHE_MAX_AGE = 60 * 60 * 24 * 365  # hashed files, one year
+STATIC_CACHE_MAX_AGE_UNHASHED = 60 * 60  # anything else under STATIC_URL
+MEDIA_CACHE_MAX_AGE = 60 * 60 * 24
+
+# Hand media downloads to the front-end web server instead of streaming them
+# through Python: None, 'x-sendfile' (Apache mod_xsendfile) or
+# 'x-accel-redirect' (nginx, with an internal location at the prefix below).
+MEDIA_SENDFILE_BACKEND = None
+MEDIA_ACCEL_REDIRECT_PREFIX = '/_protected_media/'
+
 
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 AUTH_USER_MODEL = 'EsHomesApp.CustomUser'
@@ -132,6 +169,200 @@ AUTH_USER_MODEL = 'EsHomesApp.CustomUser'
 # Flutterwave settings
 FLUTTERWAVE_PUBLIC_KEY = 'FLWPUBK_TEST-0c263aa893f1806f8cd034e48b84cac7-X'
 FLUTTERWAVE_SECRET_KEY = 'FLWSECK_TEST-1dd9790e78eaa3e82b79d85de0dd351e-X'
+FLUTTERWAVE_API_URL = 'https://api.flutterwave.com/v3'
+FLUTTERWAVE_TIMEOUT = 30  # seconds to wait for transaction verification
+# The "secret hash" set for webhooks on Flutterwave's dashboard, sent back in
+# their verif-hash header. Webhooks carrying it skip rate limiting.
+FLUTTERWAVE_WEBHOOK_HASH = ''
+
+# What prices are stored, charged and verified in. Display conversion
+# (EsHomesApp/currency.py) never changes an amount that is paid or checked.
+BASE_CURRENCY = 'NGN'
+
+
+# Serve the hot pages (home, listings, detail, payment) from the async views
+# in EsHomesApp/async_views.py. Turn on when running under an ASGI server
+# (EsHomesProject.asgi); under WSGI the sync views are cheaper.
+ASYNC_VIEWS = False
+
+
+# Rate limiting (EsHomesApp/ratelimit.py). Per-route rules live in
+# EsHomesApp/urls.py. For limits shared by all worker processes, point
+# RATE_LIMIT_CACHE at a Redis or Memcached cache; the default local-memory
+# cache counts per process.
+RATE_LIMIT_ENABLED = True
+RATE_LIMIT_CACHE = 'default'
+RATE_LIMIT_UNSAFE_PER_IP = '120/m'  # any POST/PUT/PATCH/DELETE, site-wide
+RATE_LIMIT_PROXY_COUNT = 0  # reverse proxies in front of Django that set X-Forwarded-For
+
+
+# Unpaid (pending) bookings hold their dates for this long, then the
+# expire_booking_holds job cancels them in batches
+BOOKING_HOLD_MINUTES = 30
+BOOKING_HOLD_SWEEP_BATCH = 500
+
+
+# Transactions still pending/processing this long after they were created
+# are checked against Flutterwave by the reconcile_transactions job
+# (EsHomesApp/reconcile.py), before their booking hold runs out
+RECONCILE_AFTER_MINUTES = 10
+RECONCILE_WORKERS = 8  # verification requests in flight at once
+RECONCILE_BATCH = 200  # transactions verified, then updated in one DB transaction
+# Transactions the hold sweeper declined (the guest may still have paid
+# after it) are checked this often, for this long after they were created
+RECONCILE_SWEPT_RECHECK_MINUTES = 60
+RECONCILE_SWEPT_WINDOW_HOURS = 24
+
+
+# iCal feeds (/apartment/<pk>/calendar.ics) and external channel calendars
+ICAL_FEED_PAST_DAYS = 30  # keep recently finished stays in the feed
+ICAL_FEED_CACHE_SECONDS = 60 * 60 * 24
+ICAL_SYNC_WORKERS = 4  # channels fetched in parallel
+ICAL_FETCH_TIMEOUT = 15
+
+
+# Month-by-month availability for date pickers (/availability/)
+AVAILABILITY_CALENDAR_MAX_APARTMENTS = 20
+AVAILABILITY_CALENDAR_MAX_MONTHS = 12
+AVAILABILITY_CALENDAR_CACHE_SECONDS = 60 * 60  # bookings change the version, so this only bounds memory
+
+
+# "Similar apartments" neighbour table (EsHomesApp/recommender.py), rebuilt
+# by a background job this long after the inventory last changed
+SIMILAR_APARTMENTS_K = 10  # neighbours kept per apartment, before availability filtering
+SIMILAR_APARTMENTS_REFRESH_DELAY = 60
+
+
+# "Near me" search on /apartments/ (EsHomesApp/geo.py)
+GEO_DEFAULT_RADIUS_KM = 10
+GEO_MAX_RADIUS_KM = 500
+GEO_MAX_CELLS = 16  # geohash prefixes a search may scan, more cells = tighter pruning
+GEO_PRUNING_MAX_RADIUS_KM = 5  # wider searches scan the lat/lon box, which bench_geo found faster from 10km
+
+
+# Hot computed values (featured apartments, filter choices, the booking
+# catalog) cached with EsHomesApp/caching.py. Entries are fresh for
+# COMPUTED_CACHE_TIMEOUT seconds, then served stale for up to
+# COMPUTED_CACHE_STALE_TIMEOUT more while one request recomputes them.
+# Inventory changes invalidate them straight away.
+COMPUTED_CACHE = 'default'
+COMPUTED_CACHE_TIMEOUT = 60 * 5
+COMPUTED_CACHE_STALE_TIMEOUT = 60
+COMPUTED_CACHE_LOCK_TIMEOUT = 10  # longest a recompute may hold its key's lock
+COMPUTED_CACHE_BETA = 1.0  # early-refresh eagerness; 0 turns early refreshes off
+
+
+# Full-page cache for anonymous visitors (EsHomesApp/pagecache.py), by URL
+# name. Logged-in users and requests with pending messages always get a
+# fresh render, and inventory changes expire the cached pages at once.
+PAGE_CACHE_VIEWS = ['home', 'about', 'contact']
+PAGE_CACHE_SECONDS = 60 * 10
+
+
+# Booking/transaction exports for accounting (EsHomesApp/exports.py): admin
+# actions and `manage.py export_records`. Rows are read and written this
+# many at a time, so memory stays flat however big the export.
+EXPORT_CHUNK_SIZE = 2000
+
+
+# Archival (EsHomesApp/archive.py): a daily job moves completed and cancelled
+# bookings whose stay ended more than ARCHIVE_AFTER_DAYS ago, with their
+# transactions, into the archive tables, ARCHIVE_BATCH per DB transaction.
+ARCHIVE_AFTER_DAYS = 365
+ARCHIVE_BATCH = 500
+
+
+# Worker warm-up (EsHomesApp/warmup.py): wsgi.py and asgi.py compile the
+# templates, build the URL resolver, fill the hot caches and import the
+# modules below as soon as the application is loaded, before the worker takes
+# traffic. Under `gunicorn --preload` that happens once, in the master, and
+# the workers share the result copy-on-write.
+WARMUP_ON_LOAD = True
+WARMUP_IMPORTS = ['requests', 'numpy']  # imported on first use by the app, so commands and jobs skip them
+
+# Reviews on the apartment detail page (EsHomesApp/reviews.py). Helpful votes
+# are recorded per user and counted into Review.helpful_votes by the
+# apply_review_votes task, up to REVIEW_VOTE_BATCH votes per transaction.
+REVIEWS_PER_PAGE = 5
+REVIEW_VOTE_BATCH = 1000
+
+# Display currencies (EsHomesApp/currency.py). Visitors pick one per session;
+# prices are converted with the ExchangeRate table, which the
+# refresh_exchange_rates task pulls hourly from FX_RATES_URL (a JSON
+# {"rates": {code: units per BASE_CURRENCY}} endpoint; leave empty to keep
+# rates by hand in the admin). Each process caches the table for
+# FX_CACHE_SECONDS.
+DISPLAY_CURRENCIES = {
+    'NGN': {'symbol': '₦', 'decimals': 0},
+    'USD': {'symbol': '$', 'decimals': 2},
+    'GBP': {'symbol': '£', 'decimals': 2},
+    'EUR': {'symbol': '€', 'decimals': 2},
+}
+FX_RATES_URL = ''
+FX_FETCH_TIMEOUT = 15
+FX_CACHE_SECONDS = 60 * 5
+
+# Resumable photo uploads (EsHomesApp/uploads.py), from the drag-and-drop
+# box on the apartment admin page. Photos arrive in UPLOAD_CHUNK_SIZE pieces
+# (keep it under the front-end proxy's request body limit), are staged in
+# UPLOAD_TEMP_DIR (on the same filesystem as MEDIA_ROOT, so the finished file
+# is moved into place rather than copied) and are then straightened and
+# scaled down to UPLOAD_IMAGE_MAX_SIDE pixels by a background job. Uploads
+# left unfinished for UPLOAD_EXPIRY_HOURS are discarded.
+UPLOAD_CHUNK_SIZE = 1024 * 1024 * 2
+UPLOAD_MAX_SIZE = 1024 * 1024 * 50
+UPLOAD_EXTENSIONS = ['.jpg', '.jpeg', '.png', '.webp']
+UPLOAD_TEMP_DIR = BASE_DIR / 'tmp' / 'uploads'
+UPLOAD_EXPIRY_HOURS = 24
+UPLOAD_IMAGE_MAX_SIDE = 2560
+UPLOAD_IMAGE_QUALITY = 85
+
+
+# Logging (EsHomesApp/logs.py): JSON lines written by a background thread,
+# so requests never wait on log I/O. Every line carries the request ID and
+# view; INFO records of the loggers in LOG_SAMPLE_RATES are sampled.
+LOG_FILE = None  # None writes to stderr
+LOG_LEVEL = 'INFO'
+LOG_SAMPLE_RATES = {  # logger -> fraction of INFO/DEBUG records kept
+    'EsHomesApp.requests': 0.1,
+}
+LOG_SLOW_REQUEST_MS = 500  # always logged, as a warning
+LOG_REDACT_FIELDS = {  # keys (lowercase) whose values never reach the logs
+    'password', 'password1', 'password2', 'csrfmiddlewaretoken', 'authorization', 'cookie',
+    'card_number', 'cvv', 'pin', 'otp', 'secret', 'secret_key', 'token',
+}
+
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'filters': {
+        'request_context': {'()': 'EsHomesApp.logs.RequestContextFilter'},
+        'sampling': {'()': 'EsHomesApp.logs.SamplingFilter'},
+    },
+    'handlers': {
+        'json': {
+            'class': 'EsHomesApp.logs.QueuedJsonHandler',
+            'filename': LOG_FILE,
+            'filters': ['request_context', 'sampling'],
+        },
+    },
+    'root': {
+        'handlers': ['json'],
+        'level': LOG_LEVEL,
+    },
+}
+
+
+# Background jobs (EsHomesApp/jobs.py, run with `manage.py runworker`)
+JOB_QUEUES = {  # queue name -> threads per worker process
+    'default': 4,
+}
+JOB_POLL_INTERVAL = 1.0
+JOB_HEARTBEAT_INTERVAL = 60  # seconds between a worker's refreshes of its running jobs' locks
+JOB_LOCK_TIMEOUT = 5 * 60  # running jobs not refreshed for this long are assumed orphaned
+JOB_RETRY_BACKOFF = 30  # seconds before the first retry, doubled each attempt
+JOB_RETRY_BACKOFF_MAX = 60 * 60
+JOB_RETENTION_DAYS = 7
 
 
 # Default primary key field type
@@ -14,15 +14,19 @@ Including another URLconf
     1. Import the include() function: from django.urls import include, path
     2. Add a URL to urlpatterns:  path('blog/', include('blog.urls'))
 """
+import re
+
 from django.contrib import admin
-from django.urls import path, include 
+from django.urls import path, re_path, include 
 from django.conf import settings
-from django.conf.urls.static import static
+from EsHomesApp import fileserving
 
 urlpatterns = [
     path('admin/', admin.site.urls),           
     path('', include("EsHomesApp.urls")),
 ]
 
-urlpatterns += static(settings.MEDIA_URL,document_root=settings.MEDIA_ROOT)
-urlpatterns += static(settings.STATIC_URL,document_root=settings.STATIC_ROOT)
\ No newline at end of file
+urlpatterns += [
+    re_path(r'^%s(?P<path>.*)$' % re.escape(settings.MEDIA_URL.lstrip('/')), fileserving.serve_media),
+    re_path(r'^%s(?P<path>.*)$' % re.escape(settings.STATIC_URL.lstrip('/')), fileserving.serve_static),
+]
\ No newline at end of file
@@ -2,6 +2,8 @@
 WSGI config for EsHomesProject project.
 
 It exposes the WSGI callable as a module-level variable named ``application``.
+Loading it warms the process up (EsHomesApp/warmup.py); serve with
+``gunicorn --preload EsHomesProject.wsgi`` to do that once for all workers.
 
 For more information on this file, see
 https://docs.djangoproject.com/en/5.2/howto/deployment/wsgi/
@@ -9,8 +11,15 @@ https://docs.djangoproject.com/en/5.2/howto/deployment/wsgi/
 
 import os
 
+from django.conf import settings
 from django.core.wsgi import get_wsgi_application
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'EsHomesProject.settings')
 
 application = get_wsgi_application()
+
+if settings.WARMUP_ON_LOAD:
+    # Before the server takes traffic; once in the master under --preload
+    from EsHomesApp.warmup import warm_up
+
+    warm_up()